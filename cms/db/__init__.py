@@ -76,6 +76,10 @@ __all__ = [
     "UserTestExecutable",
     # printjob
     "PrintJob",
+    # compilationcache
+    "CompilationCacheEntry",
+    # taskscore
+    "ParticipationTaskScore",
     # init
     "init_db",
     # drop
@@ -89,7 +93,7 @@ __all__ = [
 
 # Instantiate or import these objects.
 
-version = 39
+version = 45
 
 engine = create_engine(config.database, echo=config.database_debug,
                        pool_timeout=60, pool_recycle=120)
@@ -113,6 +117,8 @@ from .submission import Submission, File, Token, SubmissionResult, \
 from .usertest import UserTest, UserTestFile, UserTestManager, \
     UserTestResult, UserTestExecutable
 from .printjob import PrintJob
+from .compilationcache import CompilationCacheEntry
+from .taskscore import ParticipationTaskScore
 
 from .init import init_db
 from .drop import drop_db
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compilation-cache-related database interface for SQLAlchemy.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+from sqlalchemy.schema import Column
+from sqlalchemy.types import Boolean, DateTime, String, Unicode
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+
+from . import Filename, Digest, Base
+
+
+class CompilationCacheEntry(Base):
+    """Class to store the outcome of a compilation, so that the
+    Workers can reuse it for identical compilations.
+
+    Entries are not tied to submissions or datasets: the key only
+    depends on what the compiler sees (see
+    cms.grading.tasktypes.util.compilation_cache_key).
+
+    """
+    __tablename__ = 'compilation_cache_entries'
+
+    # Hex SHA1 of the language, of the names and digests of the files
+    # in the sandbox, and of the compilation commands.
+    key = Column(
+        String,
+        primary_key=True)
+
+    # Name of the language (only informative, it is part of the key).
+    language = Column(
+        Unicode,
+        nullable=False)
+
+    # Time of creation of the entry.
+    timestamp = Column(
+        DateTime,
+        nullable=False)
+
+    # Whether the compilation succeeded, and the text and statistics
+    # of the compilation, as returned by compilation_step.
+    compilation_success = Column(
+        Boolean,
+        nullable=False)
+    text = Column(
+        ARRAY(String),
+        nullable=False,
+        default=[])
+    stats = Column(
+        JSONB,
+        nullable=False,
+        default={})
+
+    # Filename and digest of the executable, if the compilation
+    # succeeded.
+    executable_filename = Column(
+        Filename,
+        nullable=True)
+    executable_digest = Column(
+        Digest,
+        nullable=True)
@@ -33,17 +33,30 @@ from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
 
 import atexit
+import gzip
 import io
 import logging
 import os
+import random
+import re
 import tempfile
+from collections import OrderedDict
+
+try:
+    import lzma
+except ImportError:
+    # Python 2.
+    lzma = None
 
 import gevent
+import gevent.pool
+from six import iteritems, itervalues
 
 from sqlalchemy.exc import IntegrityError
 
+from cmscommon.binary import b64_to_bin
 from cmscommon.digest import Digester
-from cms import config, mkdir, rmtree
+from cms import ServiceCoord, config, get_service_shards, mkdir, rmtree
 from cms.db import SessionGen, Digest, FSObject, LargeObject
 
 
@@ -80,6 +93,120 @@ def copyfileobj(source_fobj, destination_fobj,
         gevent.sleep(0)
 
 
+# Compression methods for the files stored by the backends, mapped to
+# the extension used by FSBackend for files compressed that way.
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_LZMA = "lzma"
+COMPRESSION_EXTENSIONS = {
+    COMPRESSION_GZIP: ".gz",
+    COMPRESSION_LZMA: ".xz",
+}
+
+
+class CompressedFile(io.RawIOBase):
+    """A file-like object that transparently compresses what is written
+    to it, or decompresses what is read from it, streaming the result
+    from or to another file-like object.
+
+    The wrapped file object is owned by this one, that is, it is
+    closed when this one is. The number of uncompressed bytes written
+    is kept in the size attribute.
+
+    """
+
+    def __init__(self, fobj, compression, mode='rb'):
+        """Wrap a file object.
+
+        fobj (fileobj): the binary file-like object holding the
+            compressed data.
+        compression (unicode): the compression method, one of the
+            COMPRESSION_* constants.
+        mode (string): either 'rb' or 'wb'.
+
+        raise (ValueError): if the compression method is not
+            supported.
+
+        """
+        io.RawIOBase.__init__(self)
+        self.fobj = fobj
+        self.size = 0
+        if compression == COMPRESSION_GZIP:
+            # A fixed mtime makes the output deterministic.
+            self._file = gzip.GzipFile(fileobj=fobj, mode=mode, mtime=0)
+        elif compression == COMPRESSION_LZMA and lzma is not None:
+            self._file = lzma.LZMAFile(fobj, mode=mode)
+        else:
+            raise ValueError("Unsupported compression %r." % compression)
+
+    def readable(self):
+        return self._file.readable()
+
+    def writable(self):
+        return self._file.writable()
+
+    def readinto(self, b):
+        return self._file.readinto(b)
+
+    def write(self, b):
+        written = self._file.write(b)
+        self.size += written
+        return written
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._file.close()
+            finally:
+                self.fobj.close()
+                io.RawIOBase.close(self)
+
+
+# Mode of the files of the local cache: never modified, they are
+# readable by everybody so that they can be hard-linked in the
+# sandboxes (see Sandbox.create_file_from_storage).
+CACHE_FILE_MODE = 0o444
+
+
+# The digests of the files that can be in a local cache (the
+# tombstone never is).
+_DIGEST_RE = re.compile(r"[0-9a-f]{40}\Z")
+
+
+def _is_file_digest(digest):
+    """Return whether a value is the digest of a file.
+
+    Used to validate the digests received from outside (e.g., over
+    RPC) before using them to build paths.
+
+    digest (object): the value to check.
+
+    return (bool): whether the value is a string of 40 lowercase
+        hexadecimal digits.
+
+    """
+    return isinstance(digest, str) and _DIGEST_RE.match(digest) is not None
+
+
+def _stream_size(fobj, buffer_size=io.DEFAULT_BUFFER_SIZE * 8):
+    """Return the number of bytes that can be read from a file object.
+
+    Used for compressed files, whose size is not known in advance.
+
+    fobj (fileobj): a readable binary file-like object.
+    buffer_size (int): the size of the read buffer.
+
+    return (int): the number of bytes read until the end of the file.
+
+    """
+    size = 0
+    while True:
+        buffer = fobj.read(buffer_size)
+        if len(buffer) == 0:
+            return size
+        size += len(buffer)
+        gevent.sleep(0)
+
+
 class TombstoneError(RuntimeError):
     """An error that represents the file cacher trying to read
     files that have been deleted from the database.
@@ -166,6 +293,63 @@ class FileCacherBackend(object):
         """
         raise NotImplementedError("Please subclass this class.")
 
+    def get_files(self, digests):
+        """Retrieve many files from the storage.
+
+        Backends that can locate many files at once should override
+        this, the default implementation just calls get_file() for
+        each digest.
+
+        digests ([unicode]): the digests of the files to retrieve.
+
+        return (iterable of (unicode, fileobj)): the digest and a
+            readable binary file-like object for each file that can be
+            found, in the given order. The objects are opened lazily,
+            and the caller must close them.
+
+        """
+        for digest in digests:
+            try:
+                fobj = self.get_file(digest)
+            except KeyError:
+                continue
+            yield digest, fobj
+
+    def get_descriptions(self, digests):
+        """Return the descriptions of many files given their digests.
+
+        digests ([unicode]): the digests of the files to describe.
+
+        return ({unicode: unicode}): the description of each file that
+            can be found, indexed by digest.
+
+        """
+        descriptions = dict()
+        for digest in digests:
+            try:
+                descriptions[digest] = self.describe(digest)
+            except KeyError:
+                pass
+        return descriptions
+
+    def get_sizes(self, digests):
+        """Return the sizes of many files given their digests.
+
+        digests ([unicode]): the digests of the files to calculate the
+            size of.
+
+        return ({unicode: int}): the size in bytes of each file that
+            can be found, indexed by digest.
+
+        """
+        sizes = dict()
+        for digest in digests:
+            try:
+                sizes[digest] = self.get_size(digest)
+            except KeyError:
+                pass
+        return sizes
+
     def delete(self, digest):
         """Delete a file from the storage.
 
@@ -190,6 +374,12 @@ class FSBackend(FileCacherBackend):
     course this directory can be shared, for example with NFS, acting
     as an actual remote file storage.
 
+    Files can be stored compressed, in which case the extension of the
+    compression method is appended to their name, and their size is
+    written next to them in a file with the SIZE_EXTENSION extension.
+    Files stored with any method (or none) can be read, regardless of
+    the one in use.
+
     TODO: Actually store the descriptions, that get discarded at the
     moment.
 
@@ -199,13 +389,20 @@ class FSBackend(FileCacherBackend):
 
     """
 
-    def __init__(self, path):
+    # Extension of the files holding the size of the compressed ones.
+    SIZE_EXTENSION = ".size"
+
+    def __init__(self, path, compression=None):
         """Initialize the backend.
 
         path (string): the base path for the storage.
+        compression (unicode|None): the compression method for the new
+            files (one of the COMPRESSION_* constants), or None to
+            store them as they are.
 
         """
         self.path = path
+        self.compression = compression
 
         # Create the directory if it doesn't exist
         try:
@@ -213,16 +410,37 @@ class FSBackend(FileCacherBackend):
         except OSError:
             pass
 
+    def _find(self, digest):
+        """Look for the stored file with the given digest.
+
+        digest (unicode): the digest of the file.
+
+        return ((string, unicode|None)|None): the path of the file and
+            its compression method, or None if the file is not stored.
+
+        """
+        file_path = os.path.join(self.path, digest)
+        if os.path.exists(file_path):
+            return file_path, None
+        for compression, extension in iteritems(COMPRESSION_EXTENSIONS):
+            if os.path.exists(file_path + extension):
+                return file_path + extension, compression
+        return None
+
     def get_file(self, digest):
         """See FileCacherBackend.get_file().
 
         """
-        file_path = os.path.join(self.path, digest)
+        found = self._find(digest)
 
-        if not os.path.exists(file_path):
+        if found is None:
             raise KeyError("File not found.")
 
-        return io.open(file_path, 'rb')
+        file_path, compression = found
+        fobj = io.open(file_path, 'rb')
+        if compression is not None:
+            fobj = CompressedFile(fobj, compression, 'rb')
+        return fobj
 
     def create_file(self, digest):
         """See FileCacherBackend.create_file().
@@ -230,9 +448,7 @@ class FSBackend(FileCacherBackend):
         """
         # Check if the file already exists. Return None if so, to inform the
         # caller they don't need to store the file.
-        file_path = os.path.join(self.path, digest)
-
-        if os.path.exists(file_path):
+        if self._find(digest) is not None:
             return None
 
         # Create a temporary file in the same directory
@@ -240,6 +456,8 @@ class FSBackend(FileCacherBackend):
                                                 prefix=".tmp.",
                                                 suffix=digest,
                                                 dir=self.path)
+        if self.compression is not None:
+            return CompressedFile(temp_file, self.compression, 'wb')
         return temp_file
 
     def commit_file(self, fobj, digest, desc=""):
@@ -249,9 +467,17 @@ class FSBackend(FileCacherBackend):
         fobj.close()
 
         file_path = os.path.join(self.path, digest)
+        size = None
+        if isinstance(fobj, CompressedFile):
+            size = fobj.size
+            fobj = fobj.fobj
+            file_path += COMPRESSION_EXTENSIONS[self.compression]
         # Move it into place in the cache. Skip if it already exists, and
         # delete the temporary file instead.
-        if not os.path.exists(file_path):
+        if self._find(digest) is None:
+            # The size goes first, so that it is there for every file.
+            if size is not None:
+                self._write_size(digest, size)
             # There is a race condition here if someone else puts the file here
             # between checking and renaming. Put it doesn't matter in practice,
             # because rename will replace the file anyway (which should be
@@ -266,9 +492,7 @@ class FSBackend(FileCacherBackend):
         """See FileCacherBackend.describe().
 
         """
-        file_path = os.path.join(self.path, digest)
-
-        if not os.path.exists(file_path):
+        if self._find(digest) is None:
             raise KeyError("File not found.")
 
         return ""
@@ -277,29 +501,80 @@ class FSBackend(FileCacherBackend):
         """See FileCacherBackend.get_size().
 
         """
-        file_path = os.path.join(self.path, digest)
+        found = self._find(digest)
 
-        if not os.path.exists(file_path):
+        if found is None:
             raise KeyError("File not found.")
 
-        return os.stat(file_path).st_size
+        file_path, compression = found
+        if compression is None:
+            return os.stat(file_path).st_size
+        size = self._read_size(digest)
+        if size is not None:
+            return size
+        with self.get_file(digest) as fobj:
+            return _stream_size(fobj)
+
+    def _write_size(self, digest, size):
+        """Record the uncompressed size of a compressed file.
+
+        digest (unicode): the digest of the file.
+        size (int): its size in bytes.
+
+        """
+        with tempfile.NamedTemporaryFile('w', delete=False,
+                                         prefix=".tmp.",
+                                         suffix=digest + self.SIZE_EXTENSION,
+                                         dir=self.path) as temp_file:
+            temp_file.write("%d" % size)
+        os.rename(temp_file.name,
+                  os.path.join(self.path, digest + self.SIZE_EXTENSION))
+
+    def _read_size(self, digest):
+        """Return the recorded uncompressed size of a compressed file.
+
+        digest (unicode): the digest of the file.
+
+        return (int|None): its size in bytes, or None if it was not
+            recorded (e.g., the file was stored before that was done).
+
+        """
+        try:
+            with io.open(os.path.join(self.path,
+                                      digest + self.SIZE_EXTENSION)) as f:
+                return int(f.read())
+        except (IOError, OSError, ValueError):
+            return None
 
     def delete(self, digest):
         """See FileCacherBackend.delete().
 
         """
-        file_path = os.path.join(self.path, digest)
+        found = self._find(digest)
 
-        try:
-            os.unlink(file_path)
-        except OSError:
-            pass
+        if found is None:
+            return
+
+        for path in [found[0],
+                     os.path.join(self.path, digest + self.SIZE_EXTENSION)]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
 
     def list(self):
         """See FileCacherBackend.list().
 
         """
-        return list((x, "") for x in os.listdir(self.path))
+        digests = list()
+        extensions = tuple(itervalues(COMPRESSION_EXTENSIONS))
+        for name in os.listdir(self.path):
+            if name.endswith(self.SIZE_EXTENSION):
+                continue
+            if name.endswith(extensions):
+                name = os.path.splitext(name)[0]
+            digests.append((name, ""))
+        return digests
 
 
 class DBBackend(FileCacherBackend):
@@ -307,8 +582,28 @@ class DBBackend(FileCacherBackend):
     stores the files as lobjects (encapsuled in a FSObject) into a
     PostgreSQL database.
 
+    Files can be stored compressed, in which case the method is
+    recorded in the FSObject. Files stored with any method (or none)
+    can be read, regardless of the one in use.
+
     """
 
+    # Maximum number of digests looked up in a single query.
+    LOOKUP_BATCH_SIZE = 1000
+    # Maximum number of large objects read at the same time, each on
+    # its own connection.
+    CONCURRENT_READS = 4
+
+    def __init__(self, compression=None):
+        """Initialize the backend.
+
+        compression (unicode|None): the compression method for the new
+            files (one of the COMPRESSION_* constants), or None to
+            store them as they are.
+
+        """
+        self.compression = compression
+
     def get_file(self, digest):
         """See FileCacherBackend.get_file().
 
@@ -319,7 +614,7 @@ class DBBackend(FileCacherBackend):
             if fso is None:
                 raise KeyError("File not found.")
 
-            return fso.get_lobject(mode='rb')
+            return self._open_lobject(fso.loid, fso.compression)
 
     def create_file(self, digest):
         """See FileCacherBackend.create_file().
@@ -340,16 +635,28 @@ class DBBackend(FileCacherBackend):
             else:
                 # Create the large object first. This should be populated
                 # and committed before putting it into the FSObjects table.
-                return LargeObject(0, mode='wb')
+                fobj = LargeObject(0, mode='wb')
+                if self.compression is not None:
+                    fobj = CompressedFile(fobj, self.compression, 'wb')
+                return fobj
 
     def commit_file(self, fobj, digest, desc=""):
         """See FileCacherBackend.commit_file().
 
         """
-        fobj.close()
+        if isinstance(fobj, CompressedFile):
+            fobj.close()
+            size = fobj.size
+            fobj = fobj.fobj
+            compression = self.compression
+        else:
+            size = fobj.tell()
+            fobj.close()
+            compression = None
         try:
             with SessionGen() as session:
-                fso = FSObject(description=desc)
+                fso = FSObject(description=desc, compression=compression,
+                               size=size)
                 fso.digest = digest
                 fso.loid = fobj.loid
 
@@ -393,9 +700,100 @@ class DBBackend(FileCacherBackend):
             if fso is None:
                 raise KeyError("File not found.")
 
+            if fso.size is not None:
+                return fso.size
+
+            if fso.compression is not None:
+                with self.get_file(digest) as fobj:
+                    return _stream_size(fobj)
+
             with fso.get_lobject(mode='rb') as lobj:
                 return lobj.seek(0, io.SEEK_END)
 
+    def _get_fsobjects(self, digests):
+        """Look up many FSObjects using a single session.
+
+        digests ([unicode]): the digests of the files.
+
+        return ({unicode: (int, unicode|None, unicode, int|None)}): the
+            large object ID, the compression method, the description
+            and the recorded size of each file that is stored, indexed
+            by digest.
+
+        """
+        digests = list(set(digests))
+        found = dict()
+        with SessionGen() as session:
+            # Split the lookup to keep the IN clauses reasonably short.
+            for i in range(0, len(digests), self.LOOKUP_BATCH_SIZE):
+                batch = digests[i:i + self.LOOKUP_BATCH_SIZE]
+                for fso in session.query(FSObject)\
+                        .filter(FSObject.digest.in_(batch)).all():
+                    found[fso.digest] = (fso.loid, fso.compression,
+                                         fso.description, fso.size)
+        return found
+
+    @staticmethod
+    def _open_lobject(loid, compression):
+        """Open a stored large object for reading.
+
+        loid (int): the large object ID.
+        compression (unicode|None): how its content is compressed.
+
+        return (fileobj): the uncompressed content of the object.
+
+        """
+        fobj = LargeObject(loid, mode='rb')
+        if compression is not None:
+            fobj = CompressedFile(fobj, compression, 'rb')
+        return fobj
+
+    def get_files(self, digests):
+        """See FileCacherBackend.get_files().
+
+        """
+        found = self._get_fsobjects(digests)
+        for digest in digests:
+            if digest in found:
+                loid, compression, _, _ = found[digest]
+                yield digest, self._open_lobject(loid, compression)
+
+    def get_descriptions(self, digests):
+        """See FileCacherBackend.get_descriptions().
+
+        """
+        return dict((digest, description)
+                    for digest, (_, _, description, _)
+                    in iteritems(self._get_fsobjects(digests)))
+
+    def get_sizes(self, digests):
+        """See FileCacherBackend.get_sizes().
+
+        """
+        found = self._get_fsobjects(digests)
+        sizes = dict((digest, size) for digest, (_, _, _, size)
+                     in iteritems(found) if size is not None)
+
+        def measure(digest, loid, compression):
+            with self._open_lobject(loid, compression) as fobj:
+                if compression is None:
+                    sizes[digest] = fobj.seek(0, io.SEEK_END)
+                else:
+                    sizes[digest] = _stream_size(fobj)
+
+        # The objects stored before their size was recorded are
+        # measured. Each large object uses its own connection, so we
+        # can query several of them at the same time.
+        pool = gevent.pool.Pool(self.CONCURRENT_READS)
+        greenlets = [pool.spawn(measure, digest, loid, compression)
+                     for digest, (loid, compression, _, size)
+                     in iteritems(found) if size is None]
+        pool.join()
+        for greenlet in greenlets:
+            if not greenlet.successful():
+                raise greenlet.exception
+        return sizes
+
     def delete(self, digest):
         """See FileCacherBackend.delete().
 
@@ -465,6 +863,207 @@ class NullBackend(FileCacherBackend):
         return list()
 
 
+class PeerBackend(FileCacherBackend):
+    """This backend fetches files from the local caches of the other
+    shards of a service (e.g., the other Workers), falling back to
+    another backend when none of them has the file. Since files are
+    identified by their digest, the content received from the peers
+    is verified for free. All other operations are delegated to the
+    fallback backend.
+
+    The peers must expose the get_cached_digests and
+    get_cached_file_chunk RPC methods.
+
+    """
+
+    # Size of the pieces in which files are transferred. Each of them
+    # is sent in a separate RPC call.
+    CHUNK_SIZE = 2 ** 20
+    # Seconds after which an unresponsive peer is given up.
+    RPC_TIMEOUT = 10.0
+    # Maximum number of digests sent to a peer in a single RPC call
+    # to ask which files it has.
+    LOCATE_BATCH_SIZE = 1000
+    # Number of files downloaded from the peers at the same time.
+    FETCH_CONCURRENCY = 4
+
+    def __init__(self, service, fallback, temp_dir=None):
+        """Initialize the backend.
+
+        service (Service): the service we are running for, whose
+            other shards are the peers.
+        fallback (FileCacherBackend): the backend to use when the
+            peers don't have a file, and for all other operations.
+        temp_dir (string|None): where to store the files being
+            received.
+
+        """
+        self.fallback = fallback
+        self.temp_dir = temp_dir
+        self.peers = [
+            service.connect_to(ServiceCoord(service.name, shard))
+            for shard in range(get_service_shards(service.name))
+            if shard != service.shard]
+
+    def _fetch_from_peer(self, peer, digest):
+        """Download a file from a peer, verifying its content.
+
+        peer (RemoteServiceClient): the peer to ask.
+        digest (unicode): the digest of the file.
+
+        return (fileobj|None): a readable binary file-like object with
+            the content of the file, or None if the download failed.
+
+        """
+        fobj = tempfile.TemporaryFile(dir=self.temp_dir)
+        d = Digester()
+        offset = 0
+        try:
+            while True:
+                chunk = peer.get_cached_file_chunk(
+                    digest=digest, offset=offset, size=self.CHUNK_SIZE)\
+                    .get(timeout=self.RPC_TIMEOUT)
+                if chunk is None:
+                    # The peer evicted the file in the meantime.
+                    fobj.close()
+                    return None
+                chunk = b64_to_bin(chunk)
+                if len(chunk) == 0:
+                    break
+                d.update(chunk)
+                fobj.write(chunk)
+                offset += len(chunk)
+        except Exception:
+            logger.warning("Failed to fetch file %s from %s.",
+                           digest, peer.remote_service_coord, exc_info=True)
+            fobj.close()
+            return None
+
+        if d.digest() != digest:
+            logger.warning("File %s received from %s has digest %s.",
+                           digest, peer.remote_service_coord, d.digest())
+            fobj.close()
+            return None
+
+        fobj.seek(0)
+        return fobj
+
+    def _locate(self, digests):
+        """Ask all the peers at the same time which of some files
+        they have.
+
+        digests ([unicode]): the digests of the files.
+
+        return ({unicode: [RemoteServiceClient]}): for each file held
+            by some peer, these peers in random order.
+
+        """
+        requested = set(digests)
+        answers = list()
+        for peer in self.peers:
+            if not peer.connected:
+                continue
+            for start in range(0, len(digests), self.LOCATE_BATCH_SIZE):
+                answers.append((peer, peer.get_cached_digests(
+                    digests=digests[start:start + self.LOCATE_BATCH_SIZE])))
+        gevent.wait([answer for unused_peer, answer in answers],
+                    timeout=self.RPC_TIMEOUT)
+
+        located = dict()
+        for peer, answer in answers:
+            # Not successful also if the peer didn't answer in time.
+            if not answer.successful():
+                continue
+            for digest in answer.value:
+                if digest in requested:
+                    located.setdefault(digest, list()).append(peer)
+        for peers in itervalues(located):
+            random.shuffle(peers)
+        return located
+
+    def _get_from_peers(self, digest, peers):
+        """Fetch a file from the first of some peers that provides it.
+
+        digest (unicode): the digest of the file.
+        peers ([RemoteServiceClient]): the peers to try, in order.
+
+        return (fileobj|None): a readable binary file-like object with
+            the content of the file, or None if no peer provided it.
+
+        """
+        for peer in peers:
+            fobj = self._fetch_from_peer(peer, digest)
+            if fobj is not None:
+                logger.debug("File %s fetched from %s.",
+                             digest, peer.remote_service_coord)
+                return fobj
+        return None
+
+    def get_file(self, digest):
+        """See FileCacherBackend.get_file().
+
+        """
+        peers = self._locate([digest]).get(digest, [])
+        fobj = self._get_from_peers(digest, peers)
+        if fobj is not None:
+            return fobj
+        return self.fallback.get_file(digest)
+
+    def get_files(self, digests):
+        """See FileCacherBackend.get_files().
+
+        The peers are asked about all the files at once, several files
+        are downloaded from them at the same time, and the files no
+        peer provided are then retrieved all together from the
+        fallback backend.
+
+        """
+        digests = list(digests)
+        located = self._locate(digests)
+        remaining = [digest for digest in digests if digest not in located]
+
+        def fetch(digest):
+            return digest, self._get_from_peers(digest, located[digest])
+
+        pool = gevent.pool.Pool(self.FETCH_CONCURRENCY)
+        try:
+            for digest, fobj in pool.imap_unordered(
+                    fetch, [digest for digest in digests
+                            if digest in located]):
+                if fobj is None:
+                    remaining.append(digest)
+                else:
+                    yield digest, fobj
+        finally:
+            pool.kill()
+        for item in self.fallback.get_files(remaining):
+            yield item
+
+    def create_file(self, digest):
+        return self.fallback.create_file(digest)
+
+    def commit_file(self, fobj, digest, desc=""):
+        return self.fallback.commit_file(fobj, digest, desc)
+
+    def describe(self, digest):
+        return self.fallback.describe(digest)
+
+    def get_size(self, digest):
+        return self.fallback.get_size(digest)
+
+    def get_descriptions(self, digests):
+        return self.fallback.get_descriptions(digests)
+
+    def get_sizes(self, digests):
+        return self.fallback.get_sizes(digests)
+
+    def delete(self, digest):
+        self.fallback.delete(digest)
+
+    def list(self):
+        return self.fallback.list()
+
+
 class FileCacher(object):
     """This class implement a local cache for files stored as FSObject
     in the database.
@@ -485,7 +1084,14 @@ class FileCacher(object):
     # CHUNK_SIZE should be a multiple of these values.
     CHUNK_SIZE = 2 ** 14  # 16348
 
-    def __init__(self, service=None, path=None, null=False):
+    # How many files load_many copies from the backend at the same
+    # time, if not told otherwise.
+    LOAD_CONCURRENCY = 4
+
+    def __init__(self, service=None, path=None, null=False,
+                 max_size=None, max_files=None,
+                 memory_size=None, memory_max_file_size=None, peers=False,
+                 compression=None):
         """Initialize.
 
         By default the database-powered backend will be used, but this
@@ -503,16 +1109,38 @@ class FileCacher(object):
         null (bool): if True, back the FileCacher with a NullBackend,
             that just discards every file it receives. This setting
             takes priority over path.
+        max_size (int|None): maximum size in bytes of the local cache,
+            beyond which the least recently used files are evicted;
+            if None, it is taken from the configuration when running
+            for a service, and is unbounded otherwise.
+        max_files (int|None): maximum number of files in the local
+            cache, with the same semantics as max_size.
+        memory_size (int|None): size in bytes of an in-memory cache of
+            the contents of small files, in front of the local cache;
+            if None, it is taken from the configuration when running
+            for a service, and is disabled otherwise.
+        memory_max_file_size (int|None): size in bytes of the largest
+            file that can be kept in memory; if None, it is taken from
+            the configuration.
+        peers (bool): if True (and service is given), fetch files from
+            the local caches of the other shards of the service before
+            asking the backend (see PeerBackend).
+        compression (unicode|None): how the backend compresses the new
+            files (one of the COMPRESSION_* constants); if None, it is
+            taken from the configuration. The local cache is never
+            compressed.
 
         """
         self.service = service
 
+        if compression is None:
+            compression = config.storage_compression
         if null:
             self.backend = NullBackend()
         elif path is None:
-            self.backend = DBBackend()
+            self.backend = DBBackend(compression)
         else:
-            self.backend = FSBackend(path)
+            self.backend = FSBackend(path, compression)
 
         # First we create the config directories.
         self._create_directory_or_die(config.temp_dir)
@@ -536,6 +1164,46 @@ class FileCacher(object):
         # Just to make sure it was created.
         self._create_directory_or_die(self.file_dir)
 
+        if peers and service is not None:
+            self.backend = PeerBackend(service, self.backend, self.temp_dir)
+
+        # Bounds of the local cache. Temporary caches (i.e., those not
+        # tied to a service) are unbounded unless explicitly asked.
+        if service is not None:
+            if max_size is None and config.cache_max_size_mib is not None:
+                max_size = config.cache_max_size_mib * 1024 * 1024
+            if max_files is None:
+                max_files = config.cache_max_files
+        self.max_size = max_size
+        self.max_files = max_files
+
+        if service is not None and memory_size is None \
+                and config.cache_memory_size_mib is not None:
+            memory_size = config.cache_memory_size_mib * 1024 * 1024
+        if memory_max_file_size is None:
+            memory_max_file_size = \
+                config.cache_memory_max_file_size_kib * 1024
+        self.memory_size = memory_size
+        self.memory_max_file_size = memory_max_file_size
+
+        # Files in the local cache, from the least to the most recently
+        # used, mapped to their size, and their total size.
+        self._cache_index = OrderedDict()
+        self._cache_size = 0
+        # Number of active users of each file that must not be evicted.
+        self._pinned = dict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._scan_cache()
+
+        # Contents of small files, from the least to the most recently
+        # used, and their total size.
+        self._memory_index = OrderedDict()
+        self._memory_used = 0
+        self._memory_hits = 0
+        self._memory_misses = 0
+
     @staticmethod
     def _create_directory_or_die(directory):
         """Create directory and ensure it exists, or raise a RuntimeError."""
@@ -544,6 +1212,273 @@ class FileCacher(object):
             logger.error(msg)
             raise RuntimeError(msg)
 
+    def _scan_cache(self):
+        """Populate the cache index with the files already on disk.
+
+        Files are ordered by their last access (or modification, if
+        later) time, as a best-effort approximation of their usage
+        before this instance was created.
+
+        """
+        entries = []
+        for name in os.listdir(self.file_dir):
+            if name.startswith("_temp"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.file_dir, name))
+            except OSError:
+                continue
+            entries.append((max(st.st_atime, st.st_mtime), name, st.st_size))
+        for _, digest, size in sorted(entries):
+            self._cache_index[digest] = size
+            self._cache_size += size
+        self._evict()
+
+    def _cache_touch(self, digest):
+        """Record a use of a file of the local cache.
+
+        digest (unicode): the digest of the file.
+
+        """
+        if digest in self._cache_index:
+            # OrderedDict.move_to_end is not available in py2.
+            self._cache_index[digest] = self._cache_index.pop(digest)
+
+    def _cache_add(self, digest):
+        """Record that a file has been put in the local cache.
+
+        The file becomes the most recently used one, and other files
+        are evicted if the cache grew beyond its bounds.
+
+        digest (unicode): the digest of the file.
+
+        """
+        self._cache_discard(digest)
+        try:
+            size = os.stat(os.path.join(self.file_dir, digest)).st_size
+        except OSError:
+            return
+        self._cache_index[digest] = size
+        self._cache_size += size
+        self._evict()
+
+    def _cache_discard(self, digest):
+        """Forget a file of the local cache, without deleting it.
+
+        digest (unicode): the digest of the file.
+
+        """
+        size = self._cache_index.pop(digest, None)
+        if size is not None:
+            self._cache_size -= size
+
+    def _is_cache_full(self):
+        """Return whether the local cache exceeds its bounds.
+
+        return (bool): True if at least one of the bounds is exceeded.
+
+        """
+        return (self.max_size is not None
+                and self._cache_size > self.max_size) or \
+            (self.max_files is not None
+             and len(self._cache_index) > self.max_files)
+
+    def _evict(self):
+        """Delete least recently used files until the cache fits.
+
+        Pinned files are never evicted, hence the cache could remain
+        over its bounds until they are unpinned.
+
+        """
+        while self._is_cache_full():
+            victim = next((digest for digest in self._cache_index
+                           if digest not in self._pinned), None)
+            if victim is None:
+                break
+            self._cache_discard(victim)
+            try:
+                os.unlink(os.path.join(self.file_dir, victim))
+            except OSError:
+                pass
+            self._evictions += 1
+            logger.debug("File %s evicted from the cache.", victim)
+
+    def _memory_get(self, digest):
+        """Return the content of a file from the in-memory cache.
+
+        digest (unicode): the digest of the file.
+
+        return (bytes|None): the content of the file, or None if the
+            in-memory cache is disabled or doesn't hold the file.
+
+        """
+        if self.memory_size is None:
+            return None
+        content = self._memory_index.pop(digest, None)
+        if content is None:
+            self._memory_misses += 1
+            return None
+        self._memory_index[digest] = content
+        self._memory_hits += 1
+        return content
+
+    def _memory_fits(self, size):
+        """Return whether a file of the given size can be kept in memory.
+
+        size (int): the size of the file, in bytes.
+
+        return (bool): True if the in-memory cache is enabled and the
+            file is small enough.
+
+        """
+        return self.memory_size is not None \
+            and size <= min(self.memory_max_file_size, self.memory_size)
+
+    def _memory_put(self, digest, content):
+        """Store the content of a file in the in-memory cache.
+
+        The least recently used contents are discarded to make room.
+
+        digest (unicode): the digest of the file.
+        content (bytes): its content.
+
+        """
+        if not self._memory_fits(len(content)) \
+                or digest in self._memory_index:
+            return
+        self._memory_index[digest] = content
+        self._memory_used += len(content)
+        while self._memory_used > self.memory_size:
+            _, old_content = self._memory_index.popitem(last=False)
+            self._memory_used -= len(old_content)
+
+    def _memory_discard(self, digest):
+        """Remove a file from the in-memory cache, if present.
+
+        digest (unicode): the digest of the file.
+
+        """
+        content = self._memory_index.pop(digest, None)
+        if content is not None:
+            self._memory_used -= len(content)
+
+    def pin(self, digest):
+        """Prevent a file from being evicted from the local cache.
+
+        Calls can be nested, and each of them must be matched by a
+        call to unpin().
+
+        digest (unicode): the digest of the file to pin.
+
+        """
+        self._pinned[digest] = self._pinned.get(digest, 0) + 1
+
+    def unpin(self, digest):
+        """Undo a previous call to pin().
+
+        digest (unicode): the digest of the file to unpin.
+
+        """
+        count = self._pinned.pop(digest, 0) - 1
+        if count > 0:
+            self._pinned[digest] = count
+        else:
+            self._evict()
+
+    def get_cache_status(self):
+        """Return statistics on the usage of the local cache.
+
+        return (dict): the hits, misses and evictions since this
+            instance was created, the current size (in bytes) and
+            number of files of the cache, and its bounds; the same
+            information for the in-memory cache, under keys prefixed
+            by "memory_", and the hit rate of both.
+
+        """
+        def hit_rate(hits, misses):
+            return hits / (hits + misses) if hits + misses > 0 else None
+
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": hit_rate(self._hits, self._misses),
+            "evictions": self._evictions,
+            "size": self._cache_size,
+            "files": len(self._cache_index),
+            "max_size": self.max_size,
+            "max_files": self.max_files,
+            "memory_hits": self._memory_hits,
+            "memory_misses": self._memory_misses,
+            "memory_hit_rate": hit_rate(self._memory_hits,
+                                        self._memory_misses),
+            "memory_size": self._memory_used,
+            "memory_files": len(self._memory_index),
+            "memory_max_size": self.memory_size,
+            "memory_max_file_size": self.memory_max_file_size,
+        }
+
+    def is_cached(self, digest):
+        """Return whether a file is present in the local cache.
+
+        digest (unicode): the digest of the file.
+
+        return (bool): True if the file doesn't need to be fetched from
+            the backend; False also if the digest is not valid.
+
+        """
+        if not _is_file_digest(digest):
+            return False
+        return os.path.exists(os.path.join(self.file_dir, digest))
+
+    def get_file_path(self, digest):
+        """Return the path of a file in the local cache.
+
+        The file is loaded in the cache first, if needed. The file must
+        not be modified, and it may be evicted from the cache at any
+        time, thus the path is only useful to link the file elsewhere
+        right away. The in-memory cache is not used.
+
+        digest (unicode): the digest of the file.
+
+        return (str): the path of the file.
+
+        raise (KeyError): if the backend cannot find the file.
+        raise (TombstoneError): if the digest is the tombstone.
+
+        """
+        if digest == Digest.TOMBSTONE:
+            raise TombstoneError()
+        if self.is_cached(digest):
+            self._hits += 1
+            self._cache_touch(digest)
+        else:
+            self._misses += 1
+            self.load(digest)
+        return os.path.join(self.file_dir, digest)
+
+    def get_cached_file(self, digest):
+        """Retrieve a file only from the local cache.
+
+        Unlike get_file, the backend is never queried.
+
+        digest (unicode): the digest of the file to get.
+
+        return (fileobj): a readable binary file-like object from which
+            to read the contents of the file.
+
+        raise (KeyError): if the file is not in the local cache, or
+            the digest is not valid.
+
+        """
+        if not _is_file_digest(digest):
+            raise KeyError("File not found.")
+        try:
+            fobj = io.open(os.path.join(self.file_dir, digest), 'rb')
+        except (IOError, OSError):
+            raise KeyError("File not found.")
+        self._cache_touch(digest)
+        return fobj
+
     def load(self, digest, if_needed=False):
         """Load the file with the given digest into the cache.
 
@@ -562,17 +1497,87 @@ class FileCacher(object):
             raise TombstoneError()
         cache_file_path = os.path.join(self.file_dir, digest)
         if if_needed and os.path.exists(cache_file_path):
+            self._cache_touch(digest)
             return
 
+        self._store(digest, self.backend.get_file(digest))
+
+    def _store(self, digest, fobj):
+        """Copy a file obtained from the backend into the local cache.
+
+        digest (unicode): the digest of the file.
+        fobj (fileobj): the content of the file, which is closed
+            afterwards.
+
+        """
         ftmp_handle, temp_file_path = tempfile.mkstemp(dir=self.temp_dir,
                                                        text=False)
-        with io.open(ftmp_handle, 'wb') as ftmp, \
-                self.backend.get_file(digest) as fobj:
-            copyfileobj(fobj, ftmp, self.CHUNK_SIZE)
+        try:
+            with io.open(ftmp_handle, 'wb') as ftmp, fobj:
+                copyfileobj(fobj, ftmp, self.CHUNK_SIZE)
+        except BaseException:
+            # Don't leave partial files around, also when the greenlet
+            # is killed.
+            os.unlink(temp_file_path)
+            raise
 
         # Then move it to its real location (this operation is atomic
         # by POSIX requirement)
-        os.rename(temp_file_path, cache_file_path)
+        os.chmod(temp_file_path, CACHE_FILE_MODE)
+        os.rename(temp_file_path, os.path.join(self.file_dir, digest))
+        self._cache_add(digest)
+
+    def load_many(self, digests, if_needed=False, concurrency=None):
+        """Load many files into the cache.
+
+        Like load, but the backend is asked for all the files at once
+        (e.g., with a single database query) and several of them are
+        copied at the same time.
+
+        digests ([unicode]): the digests of the files to load.
+        if_needed (bool): only load the files that are not present in
+            the local cache.
+        concurrency (int|None): how many files to copy at the same
+            time; if None, LOAD_CONCURRENCY.
+
+        return ({unicode}): the digests that the backend cannot find.
+
+        raise (TombstoneError): if one of the digests is the tombstone.
+
+        """
+        if Digest.TOMBSTONE in digests:
+            raise TombstoneError()
+        if concurrency is None:
+            concurrency = self.LOAD_CONCURRENCY
+
+        to_load = list()
+        for digest in OrderedDict.fromkeys(digests):
+            if if_needed and self.is_cached(digest):
+                self._cache_touch(digest)
+            else:
+                to_load.append(digest)
+        missing = set(to_load)
+
+        def store(digest, fobj):
+            self._store(digest, fobj)
+            missing.discard(digest)
+
+        # Spawning blocks while the pool is full, which also bounds
+        # the number of files open on the backend at the same time.
+        pool = gevent.pool.Pool(concurrency)
+        greenlets = list()
+        try:
+            for digest, fobj in self.backend.get_files(to_load):
+                greenlets.append(pool.spawn(store, digest, fobj))
+            pool.join()
+        except BaseException:
+            pool.kill()
+            raise
+        for greenlet in greenlets:
+            if not greenlet.successful():
+                raise greenlet.exception
+
+        return missing
 
     def get_file(self, digest):
         """Retrieve a file from the storage.
@@ -600,21 +1605,73 @@ class FileCacher(object):
 
         logger.debug("Getting file %s.", digest)
 
-        if not os.path.exists(cache_file_path):
-            logger.debug("File %s not in cache, downloading "
-                         "from database.", digest)
+        # Make sure the file isn't evicted before we open it (once it
+        # is open, deleting it from the cache doesn't matter).
+        self.pin(digest)
+        try:
+            if not os.path.exists(cache_file_path):
+                logger.debug("File %s not in cache, downloading "
+                             "from database.", digest)
+                self._misses += 1
+
+                self.load(digest)
 
-            self.load(digest)
+                logger.debug("File %s downloaded.", digest)
+            else:
+                self._hits += 1
+                self._cache_touch(digest)
+
+            return io.open(cache_file_path, 'rb')
+        finally:
+            self.unpin(digest)
+
+    def get_files(self, digests):
+        """Retrieve many files from the storage.
 
-            logger.debug("File %s downloaded.", digest)
+        See `get_file'. The files missing from the local cache are
+        loaded all together using load_many.
 
-        return io.open(cache_file_path, 'rb')
+        digests ([unicode]): the digests of the files to get.
+
+        return ({unicode: fileobj}): a readable binary file-like object
+            for each file, indexed by digest. The caller must close
+            them.
+
+        raise (KeyError): if any of the files cannot be found.
+        raise (TombstoneError): if one of the digests is the tombstone
+
+        """
+        digests = list(OrderedDict.fromkeys(digests))
+        for digest in digests:
+            self.pin(digest)
+        try:
+            cached = sum(1 for digest in digests if self.is_cached(digest))
+            self._hits += cached
+            self._misses += len(digests) - cached
+            missing = self.load_many(digests, if_needed=True)
+            if len(missing) > 0:
+                raise KeyError("Files not found: %s." %
+                               ", ".join(sorted(missing)))
+            fobjs = dict()
+            try:
+                for digest in digests:
+                    fobjs[digest] = io.open(
+                        os.path.join(self.file_dir, digest), 'rb')
+            except BaseException:
+                for fobj in itervalues(fobjs):
+                    fobj.close()
+                raise
+            return fobjs
+        finally:
+            for digest in digests:
+                self.unpin(digest)
 
     def get_file_content(self, digest):
         """Retrieve a file from the storage.
 
         See `get_file'. This method returns the content of the file, as
-        a binary string.
+        a binary string. Small files are served from (and stored in)
+        the in-memory cache, if enabled.
 
         digest (unicode): the digest of the file to get.
 
@@ -626,14 +1683,20 @@ class FileCacher(object):
         """
         if digest == Digest.TOMBSTONE:
             raise TombstoneError()
+        content = self._memory_get(digest)
+        if content is not None:
+            return content
         with self.get_file(digest) as src:
-            return src.read()
+            content = src.read()
+        self._memory_put(digest, content)
+        return content
 
     def get_file_to_fobj(self, digest, dst):
         """Retrieve a file from the storage.
 
         See `get_file'. This method will write the content of the file
-        to the given file-object.
+        to the given file-object. Small files are served from (and
+        stored in) the in-memory cache, if enabled.
 
         digest (unicode): the digest of the file to get.
         dst (fileobj): a writable binary file-like object on which to
@@ -645,8 +1708,21 @@ class FileCacher(object):
         """
         if digest == Digest.TOMBSTONE:
             raise TombstoneError()
-        with self.get_file(digest) as src:
-            copyfileobj(src, dst, self.CHUNK_SIZE)
+        content = self._memory_get(digest)
+        if content is not None:
+            with io.BytesIO(content) as src:
+                copyfileobj(src, dst, self.CHUNK_SIZE)
+            return
+        self.pin(digest)
+        try:
+            with self.get_file(digest) as src:
+                if self._memory_fits(os.fstat(src.fileno()).st_size):
+                    content = src.read()
+                    self._memory_put(digest, content)
+                    src = io.BytesIO(content)
+                copyfileobj(src, dst, self.CHUNK_SIZE)
+        finally:
+            self.unpin(digest)
 
     def get_file_to_path(self, digest, dst_path):
         """Retrieve a file from the storage.
@@ -663,9 +1739,13 @@ class FileCacher(object):
         """
         if digest == Digest.TOMBSTONE:
             raise TombstoneError()
-        with self.get_file(digest) as src:
-            with io.open(dst_path, 'wb') as dst:
-                copyfileobj(src, dst, self.CHUNK_SIZE)
+        self.pin(digest)
+        try:
+            with self.get_file(digest) as src:
+                with io.open(dst_path, 'wb') as dst:
+                    copyfileobj(src, dst, self.CHUNK_SIZE)
+        finally:
+            self.unpin(digest)
 
     def save(self, digest, desc=""):
         """Save the file with the given digest into the backend.
@@ -742,16 +1822,24 @@ class FileCacher(object):
 
             cache_file_path = os.path.join(self.file_dir, digest)
 
+            # The cached copy is needed until it is saved below.
+            self.pin(digest)
             if not os.path.exists(cache_file_path):
+                os.chmod(dst.name, CACHE_FILE_MODE)
                 os.rename(dst.name, cache_file_path)
+                self._cache_add(digest)
             else:
                 os.unlink(dst.name)
+                self._cache_touch(digest)
 
         # Store the file in the backend. We do that even if the file
         # was already in the cache (that is, we ignore the check above)
         # because there's a (small) chance that the file got removed
         # from the backend but somehow remained in the cache.
-        self.save(digest, desc)
+        try:
+            self.save(digest, desc)
+        finally:
+            self.unpin(digest)
 
         return digest
 
@@ -818,6 +1906,80 @@ class FileCacher(object):
             raise TombstoneError()
         return self.backend.get_size(digest)
 
+    def get_descriptions(self, digests):
+        """Return the descriptions of many files given their digests.
+
+        Unlike calling describe repeatedly, the backend is asked for
+        all of them at once.
+
+        digests ([unicode]): the digests of the files to describe.
+
+        return ({unicode: unicode}): the description of each file,
+            indexed by digest.
+
+        raise (KeyError): if any of the files cannot be found.
+        raise (TombstoneError): if one of the digests is the tombstone
+
+        """
+        return self._get_many(self.backend.get_descriptions, digests)
+
+    def get_sizes(self, digests):
+        """Return the sizes of many files given their digests.
+
+        Unlike calling get_size repeatedly, the backend is asked for
+        all of them at once.
+
+        digests ([unicode]): the digests of the files to calculate the
+            size of.
+
+        return ({unicode: int}): the size in bytes of each file,
+            indexed by digest.
+
+        raise (KeyError): if any of the files cannot be found.
+        raise (TombstoneError): if one of the digests is the tombstone
+
+        """
+        return self._get_many(self.backend.get_sizes, digests)
+
+    def get_missing(self, digests):
+        """Return which of the given files are not in the backend.
+
+        As with get_descriptions, the backend is asked for all of them
+        at once.
+
+        digests ([unicode]): the digests of the files to look for.
+
+        return ({unicode}): the digests of the files that cannot be
+            found.
+
+        """
+        digests = list(digests)
+        return set(digests) - set(self.backend.get_descriptions(digests))
+
+    @staticmethod
+    def _get_many(method, digests):
+        """Call a batched method of the backend, checking the result.
+
+        method (function): the method, taking a list of digests and
+            returning a dictionary indexed by them.
+        digests ([unicode]): the digests to pass.
+
+        return ({unicode: object}): what the method returned.
+
+        raise (KeyError): if the result lacks any of the digests.
+        raise (TombstoneError): if one of the digests is the tombstone
+
+        """
+        digests = list(digests)
+        if Digest.TOMBSTONE in digests:
+            raise TombstoneError()
+        result = method(digests)
+        missing = set(digests) - set(result)
+        if len(missing) > 0:
+            raise KeyError("Files not found: %s." %
+                           ", ".join(sorted(missing)))
+        return result
+
     def delete(self, digest):
         """Delete a file from the backend and the local cache.
 
@@ -838,6 +2000,8 @@ class FileCacher(object):
         if digest == Digest.TOMBSTONE:
             return
         cache_file_path = os.path.join(self.file_dir, digest)
+        self._cache_discard(digest)
+        self._memory_discard(digest)
 
         try:
             os.unlink(cache_file_path)
@@ -861,6 +2025,10 @@ class FileCacher(object):
 
         """
         rmtree(self.file_dir)
+        self._cache_index.clear()
+        self._cache_size = 0
+        self._memory_index.clear()
+        self._memory_used = 0
 
     def list(self):
         """List the files available in the storage.
@@ -34,7 +34,7 @@ from future.builtins import *  # noqa
 import io
 
 from sqlalchemy.schema import Column
-from sqlalchemy.types import String, Unicode
+from sqlalchemy.types import BigInteger, String, Unicode
 from sqlalchemy.dialects.postgresql import OID
 
 import psycopg2
@@ -379,6 +379,20 @@ class FSObject(Base):
         Unicode,
         nullable=True)
 
+    # How the content of the large object is compressed (see the
+    # COMPRESSION_* constants in cms.db.filecacher), or None if it's
+    # stored as it is. The digest is always of the uncompressed data.
+    compression = Column(
+        Unicode,
+        nullable=True)
+
+    # Size in bytes of the uncompressed content, recorded when the
+    # file is stored so that it can be known without reading the
+    # large object; None for the files stored before it was recorded.
+    size = Column(
+        BigInteger,
+        nullable=True)
+
     def get_lobject(self, mode='rb'):
         """Return an open file bound to the represented large object.
 
@@ -485,6 +485,23 @@ class Dataset(Base):
         nullable=False,
         default=False)
 
+    # Whether ES can reuse, instead of executing again, the outcome of
+    # an evaluation of the same executables on a testcase with the same
+    # data, checker and (not tighter) limits, for example from another
+    # dataset of the task.
+    reuse_evaluations = Column(
+        Boolean,
+        nullable=False,
+        default=False)
+
+    # Whether ES skips the evaluation of the testcases that cannot
+    # change the score anymore, as decided by the score type (e.g.,
+    # for GroupMin, those of subtasks with a testcase already failed).
+    skip_failed_subtasks = Column(
+        Boolean,
+        nullable=False,
+        default=False)
+
     # Time and memory limits for every testcase.
     time_limit = Column(
         Float,
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Materialized-score-related database interface for SQLAlchemy.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+from sqlalchemy.orm import relationship
+from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.types import Boolean, DateTime, Float, Integer, String
+
+from . import Base, Participation, Task
+
+
+class ParticipationTaskScore(Base):
+    """Class to store the scores of a participation on a task, so that
+    rankings do not need to load and score all the submissions.
+
+    Rows are kept up to date by ScoringService and are only valid
+    while their fingerprint matches the one computed from the current
+    submissions (see cms.grading.scoring.task_score_fingerprints), as
+    tokens or changes of the active dataset do not go through the
+    scoring. They are not part of dumps, as they can be recomputed.
+
+    """
+    __tablename__ = 'participation_task_scores'
+
+    # Participation and task this row is about.
+    participation_id = Column(
+        Integer,
+        ForeignKey(Participation.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True)
+    participation = relationship(
+        Participation)
+
+    task_id = Column(
+        Integer,
+        ForeignKey(Task.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True)
+    task = relationship(
+        Task)
+
+    # Digest of the data the scores have been computed from.
+    fingerprint = Column(
+        String,
+        nullable=False)
+
+    # Scores, rounded to the precision of the task, and whether they
+    # are partial, as returned by task_score for the full feedback,
+    # the public feedback and the tokened submissions only.
+    score = Column(
+        Float,
+        nullable=False)
+    score_partial = Column(
+        Boolean,
+        nullable=False)
+    public_score = Column(
+        Float,
+        nullable=False)
+    public_score_partial = Column(
+        Boolean,
+        nullable=False)
+    tokened_score = Column(
+        Float,
+        nullable=False)
+    tokened_score_partial = Column(
+        Boolean,
+        nullable=False)
+
+    # Time of the first submission reaching the best score on the
+    # task, or None if the participation has no points on it.
+    last_progress = Column(
+        DateTime,
+        nullable=True)
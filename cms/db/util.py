@@ -278,10 +278,13 @@ def get_datasets_to_judge(task):
 def enumerate_files(
         session, contest=None,
         skip_submissions=False, skip_user_tests=False, skip_print_jobs=False,
-        skip_generated=False):
+        skip_generated=False, skip_inactive_datasets=False):
     """Enumerate all the files (by digest) referenced by the
     contest.
 
+    skip_inactive_datasets (bool): if True, only consider the
+        managers and testcases of the active datasets of the tasks.
+
     return (set): a set of strings, the digests of the file
                   referenced in the contest.
 
@@ -297,7 +300,10 @@ def enumerate_files(
     queries.append(task_q.join(Task.attachments)
                    .with_entities(Attachment.digest))
 
-    dataset_q = task_q.join(Task.datasets)
+    if skip_inactive_datasets:
+        dataset_q = task_q.join(Task.active_dataset)
+    else:
+        dataset_q = task_q.join(Task.datasets)
     queries.append(dataset_q.join(Dataset.managers)
                    .with_entities(Manager.digest))
     queries.append(dataset_q.join(Dataset.testcases)
@@ -33,12 +33,14 @@ import logging
 import os
 import resource
 import select
+import shutil
 import stat
 import tempfile
 from abc import ABCMeta, abstractmethod
 from functools import wraps, partial
 
 import gevent
+import gevent.queue
 from gevent import subprocess
 
 from cms import config, rmtree
@@ -225,6 +227,11 @@ class SandboxBase(with_metaclass(ABCMeta, object)):
 
         self.max_processes = 1
 
+        # Bytes of the files put in the sandbox by copying them, and by
+        # linking them (see create_file_from_path).
+        self.bytes_copied = 0
+        self.bytes_linked = 0
+
         # Set common environment variables.
         # Specifically needed by Python, that searches the home for
         # packages.
@@ -366,16 +373,111 @@ class SandboxBase(with_metaclass(ABCMeta, object)):
         os.chmod(real_path, mod)
         return file_
 
+    def _link_file(self, path, src_path, executable=False):
+        """Hard-link a file of the host in the sandbox.
+
+        The mode of a file is shared by all its links, so it is left
+        alone: the file is linked only if it is already readable and
+        not writable by everybody (and executable by everybody, if
+        requested); since the sandboxed processes are not its owner,
+        they cannot change that. This is possible only if the file is
+        on the same filesystem as the sandbox.
+
+        path (string): relative path of the file inside the sandbox.
+        src_path (string): path of the file in the host.
+        executable (bool): to set permissions.
+
+        return (bool): whether the file was linked; if not, nothing
+            was created in the sandbox.
+
+        """
+        required = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+        if executable:
+            required |= stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+        forbidden = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+        real_path = self.relative_path(path)
+        try:
+            st = os.stat(src_path)
+            mod = stat.S_IMODE(st.st_mode)
+            if mod & required != required or mod & forbidden != 0:
+                return False
+            os.link(src_path, real_path)
+        except OSError:
+            return False
+        logger.debug("Linked file %s in sandbox.", path)
+        self.bytes_linked += st.st_size
+        return True
+
+    @staticmethod
+    def _is_linked(real_path):
+        """Return whether a file of the sandbox could be linked.
+
+        real_path (string): path of the file in the host.
+
+        return (bool): whether the file is a regular file with other
+            hard links (see _link_file).
+
+        """
+        return os.path.isfile(real_path) and not os.path.islink(real_path) \
+            and os.stat(real_path).st_nlink > 1
+
+    def _detach_file(self, real_path):
+        """Replace a file linked in the sandbox by a copy of it.
+
+        To be called before making writable a file that could be
+        linked (see _link_file), so that its other links are not
+        affected.
+
+        real_path (string): path of the file in the host.
+
+        """
+        if not self._is_linked(real_path):
+            return
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(real_path))
+        os.close(fd)
+        shutil.copy2(real_path, temp_path)
+        os.rename(temp_path, real_path)
+        self.bytes_copied += os.stat(real_path).st_size
+
+    def create_file_from_path(self, path, src_path, executable=False):
+        """Put a file of the host in the sandbox.
+
+        The file is hard-linked if possible (see _link_file), copied
+        otherwise. In particular, executables are linked only if the
+        file is already executable by everybody.
+
+        path (string): relative path of the file inside the sandbox.
+        src_path (string): path of the file in the host.
+        executable (bool): to set permissions.
+
+        """
+        if self._link_file(path, src_path, executable):
+            return
+        with self.create_file(path, executable) as dest_fobj:
+            with io.open(src_path, "rb") as src_fobj:
+                shutil.copyfileobj(src_fobj, dest_fobj)
+            self.bytes_copied += dest_fobj.tell()
+
     def create_file_from_storage(self, path, digest, executable=False):
         """Write a file taken from FS in the sandbox.
 
+        The file is hard-linked from the local cache of the file
+        cacher if possible (see _link_file), copied otherwise. Since
+        linking reads no data, linked files don't go through the
+        in-memory cache of the file cacher; executables are always
+        copied, as the files of the local cache are not executable.
+
         path (string): relative path of the file inside the sandbox.
         digest (string): digest of the file in FS.
         executable (bool): to set permissions.
 
         """
+        if self._link_file(path, self.file_cacher.get_file_path(digest),
+                           executable):
+            return
         with self.create_file(path, executable) as dest_fobj:
             self.file_cacher.get_file_to_fobj(digest, dest_fobj)
+            self.bytes_copied += dest_fobj.tell()
 
     def create_file_from_string(self, path, content, executable=False):
         """Write some data to a file in the sandbox.
@@ -858,27 +960,36 @@ class IsolateSandbox(SandboxBase):
     # on the current directory.
     SECURE_COMMANDS = ["/bin/cp", "/bin/mv", "/usr/bin/zip", "/usr/bin/unzip"]
 
-    def __init__(self, file_cacher, name=None, temp_dir=None):
+    def __init__(self, file_cacher, name=None, temp_dir=None,
+                 box_id=None, initialize=True):
         """Initialization.
 
-        For arguments documentation, see SandboxBase.__init__.
+        box_id (int|None): the id of the isolate box to use; if None,
+            the next one in the range reserved to the shard.
+        initialize (bool): whether to initialize the box; False if it
+            has already been initialized (by a SandboxPool).
+
+        For the other arguments documentation, see
+        SandboxBase.__init__.
 
         """
         SandboxBase.__init__(self, file_cacher, name, temp_dir)
 
         # Isolate only accepts ids between 0 and 999 (by default). We assign
-        # the range [(shard+1)*10, (shard+2)*10) to each Worker and keep the
-        # range [0, 10) for other uses (command-line scripts like cmsMake or
+        # the range [(shard+1)*w, (shard+2)*w) to each Worker, where w is 10
+        # times the number of slots of the Workers, and keep the range
+        # [0, 10) for other uses (command-line scripts like cmsMake or
         # direct console users of isolate). Inside each range ids are assigned
         # sequentially, with a wrap-around.
         # FIXME This is the only use of FileCacher.service, and it's an
         # improper use! Avoid it!
-        if file_cacher is not None and file_cacher.service is not None:
-            box_id = ((file_cacher.service.shard + 1) * 10
-                      + (IsolateSandbox.next_id % 10)) % 1000
-        else:
-            box_id = IsolateSandbox.next_id % 10
-        IsolateSandbox.next_id += 1
+        if box_id is None:
+            if file_cacher is not None and file_cacher.service is not None:
+                box_id = IsolateSandbox.get_box_id(
+                    file_cacher.service.shard, IsolateSandbox.next_id)
+            else:
+                box_id = IsolateSandbox.next_id % 10
+            IsolateSandbox.next_id += 1
 
         # We create a directory "home" inside the outer temporary directory,
         # that will be bind-mounted to "/tmp" inside the sandbox (some
@@ -924,6 +1035,9 @@ class IsolateSandbox(SandboxBase):
         self.wallclock_timeout = None  # -w
         self.extra_timeout = None      # -x
 
+        # The CPUs the sandboxed processes can run on (None for all).
+        self.cpus = None
+
         self.add_mapped_directory(
             self._home, dest=self._home_dest, options="rw")
 
@@ -940,8 +1054,32 @@ class IsolateSandbox(SandboxBase):
         # after ourselves, but we might have missed something if a previous
         # worker was interrupted in the middle of an execution, so we issue an
         # idempotent cleanup.
-        self.cleanup()
-        self.initialize_isolate()
+        if initialize:
+            self.cleanup()
+            self.initialize_isolate()
+
+    @staticmethod
+    def get_boxes_per_shard():
+        """Return the size of the range of box ids of each shard.
+
+        return (int): the number of boxes reserved to each Worker.
+
+        """
+        return 10 * max(config.worker_slots, 1)
+
+    @staticmethod
+    def get_box_id(shard, index):
+        """Return the id of a box in the range reserved to a shard.
+
+        shard (int): the shard of the Worker.
+        index (int): the index of the box in the range (taken modulo
+            the size of the range).
+
+        return (int): the box id.
+
+        """
+        width = IsolateSandbox.get_boxes_per_shard()
+        return ((shard + 1) * width + (index % width)) % 1000
 
     def add_mapped_directory(self, src, dest=None, options=None,
                              ignore_if_not_existing=False):
@@ -972,6 +1110,7 @@ class IsolateSandbox(SandboxBase):
         """
         os.chmod(self._home, 0o777)
         for filename in os.listdir(self._home):
+            self._detach_file(os.path.join(self._home, filename))
             os.chmod(os.path.join(self._home, filename), 0o777)
 
     def allow_writing_none(self):
@@ -980,7 +1119,12 @@ class IsolateSandbox(SandboxBase):
         """
         os.chmod(self._home, 0o755)
         for filename in os.listdir(self._home):
-            os.chmod(os.path.join(self._home, filename), 0o755)
+            path = os.path.join(self._home, filename)
+            # Linked files are already read-only, and their mode is
+            # shared with their other links (see _link_file).
+            if self._is_linked(path):
+                continue
+            os.chmod(path, 0o755)
 
     def allow_writing_only(self, inner_paths):
         """Set permissions in so that the user can write only some paths.
@@ -1016,9 +1160,11 @@ class IsolateSandbox(SandboxBase):
             if not os.path.exists(path):
                 io.open(path, "wb").close()
 
-        # Close everything, then open only the specified.
+        # Close everything, then open only the specified (without
+        # touching the files they might be linked to).
         self.allow_writing_none()
         for path in outer_paths:
+            self._detach_file(path)
             os.chmod(path, 0o722)
 
     def get_root_path(self):
@@ -1335,10 +1481,13 @@ class IsolateSandbox(SandboxBase):
         with io.open(self.cmd_file, 'at') as commands:
             commands.write("%s\n" % (pretty_print_cmdline(args)))
         os.chmod(self._home, prev_permissions)
+        preexec_fn = None
+        if self.cpus is not None:
+            preexec_fn = partial(os.sched_setaffinity, 0, self.cpus)
         try:
             p = subprocess.Popen(args,
                                  stdin=stdin, stdout=stdout, stderr=stderr,
-                                 close_fds=close_fds)
+                                 close_fds=close_fds, preexec_fn=preexec_fn)
         except OSError:
             logger.critical("Failed to execute program in sandbox "
                             "with command: %s", pretty_print_cmdline(args),
@@ -1452,6 +1601,206 @@ class IsolateSandbox(SandboxBase):
                 rmtree(self._outer_dir)
 
 
+def get_available_cpus():
+    """Return the CPUs the current process can run on.
+
+    return ([int]|None): the ids of the CPUs, or None if the platform
+        does not allow to pin processes to CPUs.
+
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    return sorted(os.sched_getaffinity(0))
+
+
+class SandboxPool(object):
+    """A pool of isolate boxes kept initialized for the sandboxes.
+
+    Creating an IsolateSandbox cleans up and initializes its box, and
+    deleting it cleans up the box again, each time running isolate
+    as a subprocess. The pool instead hands out boxes that are already
+    initialized, and when a sandbox is released it cleans it up and
+    initializes its box again in a background greenlet, so that the
+    jobs only pay for creating the directories of the sandboxes.
+
+    All the boxes are taken from the range reserved to the shard (see
+    IsolateSandbox.__init__), so no other sandbox of the process must
+    be created outside the pool. Boxes are initialized the first time
+    they are needed; if the initialization of a box fails, the next
+    acquisition tries again.
+
+    If given some CPUs, the pool pins each sandbox to the one used by
+    the fewest sandboxes at the moment, so that concurrent jobs run
+    on different CPUs.
+
+    The pool remembers the greenlet that acquired each sandbox, so
+    that release_leaked can give back the boxes of a job that did not
+    release its sandboxes, for example because the task type raised.
+
+    """
+
+    def __init__(self, shard, size, cpus=None):
+        """Initialize the pool.
+
+        shard (int): the shard of the Worker owning the pool.
+        size (int): the number of boxes, at most the size of the range
+            of the shard.
+        cpus ([int]|None): the CPUs to pin the sandboxes to, or None
+            not to pin them.
+
+        """
+        self.shard = shard
+        self.size = min(size, IsolateSandbox.get_boxes_per_shard())
+
+        # Number of sandboxes in use pinned to each CPU.
+        self._cpus = None
+        if cpus is not None and len(cpus) > 0:
+            self._cpus = dict((cpu, 0) for cpu in cpus)
+
+        # Queue of pairs (box id, whether it is initialized) of the
+        # boxes not in use.
+        self._boxes = gevent.queue.Queue()
+        for index in range(self.size):
+            self._boxes.put((IsolateSandbox.get_box_id(shard, index), False))
+        # Number of boxes used by sandboxes not yet released.
+        self._in_use = 0
+        # Greenlet that acquired each sandbox not yet released.
+        self._acquired = dict()
+
+        self._stats = {
+            "acquisitions": 0,
+            "acquisitions_waiting": 0,
+            "acquire_time": 0.0,
+            "max_acquire_time": 0.0,
+            "resets": 0,
+            "failed_resets": 0,
+            "reset_time": 0.0,
+            "max_reset_time": 0.0,
+        }
+
+    def acquire(self, file_cacher, name=None, temp_dir=None):
+        """Return a new sandbox on one of the boxes of the pool.
+
+        Wait for a box to be available if all those not in use are
+        being reset.
+
+        For arguments documentation, see SandboxBase.__init__.
+
+        return (IsolateSandbox): the sandbox.
+
+        raise (OSError|IOError|SandboxInterfaceException): if the
+            sandbox cannot be created, or all the boxes are in use.
+
+        """
+        start_time = monotonic_time()
+        if self._in_use >= self.size:
+            raise SandboxInterfaceException(
+                "All the %d boxes of the pool are in use." % self.size)
+        self._in_use += 1
+        if self._boxes.empty():
+            self._stats["acquisitions_waiting"] += 1
+        box_id, initialized = self._boxes.get()
+        try:
+            sandbox = IsolateSandbox(file_cacher, name, temp_dir,
+                                     box_id=box_id, initialize=not initialized)
+        except Exception:
+            self._in_use -= 1
+            self._boxes.put((box_id, False))
+            raise
+        if self._cpus is not None:
+            cpu = min(sorted(self._cpus), key=lambda cpu: self._cpus[cpu])
+            self._cpus[cpu] += 1
+            sandbox.cpus = {cpu}
+        self._acquired[sandbox] = gevent.getcurrent()
+        elapsed = monotonic_time() - start_time
+        self._stats["acquisitions"] += 1
+        self._stats["acquire_time"] += elapsed
+        self._stats["max_acquire_time"] = max(
+            self._stats["max_acquire_time"], elapsed)
+        return sandbox
+
+    def release(self, sandbox, delete=False):
+        """Give back to the pool the box of a sandbox.
+
+        The sandbox is cleaned up and its box initialized again in the
+        background. Releasing a sandbox already released does nothing.
+
+        sandbox (IsolateSandbox): a sandbox returned by acquire.
+        delete (bool): whether to delete the directories of the
+            sandbox (see SandboxBase.cleanup).
+
+        """
+        if self._acquired.pop(sandbox, None) is None:
+            return
+        self._in_use -= 1
+        if self._cpus is not None and sandbox.cpus is not None:
+            for cpu in sandbox.cpus:
+                self._cpus[cpu] -= 1
+        gevent.spawn(self._reset, sandbox, delete)
+
+    def release_leaked(self):
+        """Give back the boxes of the sandboxes acquired by the
+        current greenlet and not released.
+
+        The directories of these sandboxes are kept, as for the jobs
+        that failed.
+
+        return (int): the number of sandboxes released.
+
+        """
+        current = gevent.getcurrent()
+        leaked = [sandbox for sandbox, greenlet in iteritems(self._acquired)
+                  if greenlet is current]
+        for sandbox in leaked:
+            logger.warning("Sandbox in %s was not released, releasing it.",
+                           sandbox.get_root_path())
+            self.release(sandbox, delete=False)
+        return len(leaked)
+
+    def _reset(self, sandbox, delete):
+        """Clean up a sandbox and put its box back in the pool.
+
+        sandbox (IsolateSandbox): the sandbox.
+        delete (bool): whether to delete the directories of the
+            sandbox.
+
+        """
+        start_time = monotonic_time()
+        initialized = False
+        try:
+            sandbox.cleanup(delete=delete)
+            sandbox.initialize_isolate()
+            initialized = True
+        except (IOError, OSError, SandboxInterfaceException):
+            self._stats["failed_resets"] += 1
+            logger.warning("Couldn't reset sandbox in %s.",
+                           sandbox.get_root_path(), exc_info=True)
+        elapsed = monotonic_time() - start_time
+        self._stats["resets"] += 1
+        self._stats["reset_time"] += elapsed
+        self._stats["max_reset_time"] = max(
+            self._stats["max_reset_time"], elapsed)
+        self._boxes.put((sandbox.box_id, initialized))
+
+    def get_stats(self):
+        """Return statistics on the use of the pool.
+
+        return ({}): the number of boxes, of those in use and of those
+            currently available; the number of sandboxes acquired, of those
+            that had to wait for a box, and the total and maximum time
+            to acquire them (that is, the setup overhead of the jobs),
+            in seconds; the number of resets, of those failed, and
+            their total and maximum time, in seconds (spent in the
+            background).
+
+        """
+        stats = dict(self._stats)
+        stats["boxes"] = self.size
+        stats["in_use"] = self._in_use
+        stats["available"] = self._boxes.qsize()
+        return stats
+
+
 Sandbox = {
     'stupid': StupidSandbox,
     'isolate': IsolateSandbox,
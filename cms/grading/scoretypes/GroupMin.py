@@ -54,3 +54,7 @@ class GroupMin(ScoreTypeGroup):
     def reduce(self, outcomes, unused_parameter):
         """See ScoreTypeGroup."""
         return min(outcomes)
+
+    def subtask_failed(self, outcomes, unused_parameter):
+        """See ScoreTypeGroup."""
+        return min(outcomes) <= 0.0
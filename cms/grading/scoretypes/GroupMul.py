@@ -56,3 +56,7 @@ class GroupMul(ScoreTypeGroup):
     def reduce(self, outcomes, unused_parameter):
         """See ScoreTypeGroup."""
         return reduce(lambda x, y: x * y, outcomes)
+
+    def subtask_failed(self, outcomes, unused_parameter):
+        """See ScoreTypeGroup."""
+        return any(outcome <= 0.0 for outcome in outcomes)
@@ -28,9 +28,12 @@ from __future__ import unicode_literals
 from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
 
+import copy
+import json
 import logging
 
 from cms import plugin_list
+from cms.util import LRUCache
 from .abc import ScoreType, ScoreTypeAlone, ScoreTypeGroup
 
 
@@ -48,6 +51,13 @@ SCORE_TYPES = dict((cls.__name__, cls)
                    for cls in plugin_list("cms.grading.scoretypes"))
 
 
+# Score types built by get_score_type, shared by the whole process:
+# they are immutable once built, and building them is expensive (their
+# maximum scores and subtasks are computed when they are created).
+_SCORE_TYPE_CACHE_SIZE = 256
+_score_type_cache = LRUCache(_SCORE_TYPE_CACHE_SIZE)
+
+
 def get_score_type_class(name):
     """Load the ScoreType class given as parameter."""
     return SCORE_TYPES[name]
@@ -65,8 +75,22 @@ def get_score_type(name, parameters, public_testcases):
     public_testcases ({str: bool}): for each testcase (identified by
         its codename) a flag telling whether it's public or not.
 
-    return (ScoreType): an instance of the correct ScoreType class.
+    return (ScoreType): an instance of the correct ScoreType class;
+        the same instance is returned for the same arguments, so it
+        must not be modified.
 
     """
-    class_ = get_score_type_class(name)
-    return class_(parameters, public_testcases)
+    try:
+        key = (name, json.dumps(parameters, sort_keys=True),
+               tuple(sorted(public_testcases.items())))
+    except TypeError:
+        # Not JSON-serializable or not sortable, cannot be cached.
+        key = None
+    score_type = _score_type_cache.get(key) if key is not None else None
+    if score_type is None:
+        class_ = get_score_type_class(name)
+        score_type = class_(copy.deepcopy(parameters),
+                            dict(public_testcases))
+        if key is not None:
+            _score_type_cache.put(key, score_type)
+    return score_type
@@ -56,6 +56,26 @@ def N_(message):
     return message
 
 
+# Compiled templates of the score types, by their source.
+_templates = dict()
+
+
+def _get_template(source):
+    """Return the compiled template for the given source.
+
+    Each score type class has a single template, so this compiles it
+    only once per process instead of once per instance.
+
+    source (str): the source of the template.
+
+    return (Template): the compiled template.
+
+    """
+    if source not in _templates:
+        _templates[source] = GLOBAL_ENVIRONMENT.from_string(source)
+    return _templates[source]
+
+
 class ScoreType(with_metaclass(ABCMeta, object)):
     """Base class for all score types, that must implement all methods
     defined here.
@@ -85,7 +105,7 @@ class ScoreType(with_metaclass(ABCMeta, object)):
                 "Unable to instantiate score type (probably due to invalid "
                 "values for the score type parameters): %s." % e)
 
-        self.template = GLOBAL_ENVIRONMENT.from_string(self.TEMPLATE)
+        self.template = _get_template(self.TEMPLATE)
 
     @staticmethod
     def format_score(score, max_score, unused_score_details,
@@ -177,6 +197,23 @@ class ScoreType(with_metaclass(ABCMeta, object)):
         """
         pass
 
+    def testcases_not_needed(self, unused_outcomes):
+        """Return the testcases whose outcome cannot change the score.
+
+        Used to skip the evaluation of those testcases, given the
+        outcomes of the testcases evaluated so far. Their evaluations
+        will then have an outcome of 0.0, and the score must be
+        computed correctly also in that case.
+
+        unused_outcomes ({str: float}): the outcomes of the testcases
+            already evaluated, by codename.
+
+        return ({str}): the codenames of the testcases (among those
+            not evaluated) that do not need an evaluation.
+
+        """
+        return set()
+
 
 class ScoreTypeAlone(ScoreType):
     """Intermediate class to manage tasks where the score of a
@@ -328,7 +365,14 @@ class ScoreTypeGroup(ScoreTypeAlone):
         return ([[unicode]]): the list of the target testcases for each task.
 
         """
-
+        # Parameters and testcases do not change after creation, so the
+        # targets are computed only the first time.
+        if getattr(self, "_target_testcases", None) is None:
+            self._target_testcases = self._compute_target_testcases()
+        return self._target_testcases
+
+    def _compute_target_testcases(self):
+        """Compute the result of retrieve_target_testcases."""
         t_params = [p[1] for p in self.parameters]
 
         if all(isinstance(t, int) for t in t_params):
@@ -477,3 +521,37 @@ class ScoreTypeGroup(ScoreTypeAlone):
 
         """
         pass
+
+    def subtask_failed(self, unused_outcomes, unused_parameter):
+        """Return whether some outcomes already fix the subtask at 0.
+
+        That is, whether the score of the subtask is 0 whatever the
+        outcomes of the other testcases of the group are. Subclasses
+        can override this to allow skipping the evaluation of the
+        other testcases (see testcases_not_needed).
+
+        unused_outcomes ([float]): the outcomes of the submission in
+            some of the testcases of the group.
+        unused_parameter (list): the parameters of the group.
+
+        return (bool): whether the subtask is failed anyway.
+
+        """
+        return False
+
+    def testcases_not_needed(self, outcomes):
+        """See ScoreType.testcases_not_needed."""
+        targets = self.retrieve_target_testcases()
+        needed = set()
+        not_needed = set()
+        for target, parameter in zip(targets, self.parameters):
+            known = [outcomes[tc_idx] for tc_idx in target
+                     if tc_idx in outcomes]
+            missing = set(tc_idx for tc_idx in target
+                          if tc_idx not in outcomes)
+            if len(known) > 0 and self.subtask_failed(known, parameter):
+                not_needed |= missing
+            else:
+                needed |= missing
+        # A testcase can belong to more than one group.
+        return not_needed - needed
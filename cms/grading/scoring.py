@@ -37,14 +37,19 @@ import datetime
 
 from collections import namedtuple, defaultdict
 
+from sqlalchemy import String, and_, bindparam, cast, func, tuple_
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 
-from cms.db import Submission
+from cms.db import Participation, ParticipationTaskScore, Submission, \
+    SubmissionResult, Task, Token
 from cmscommon.constants import SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
 
 
 __all__ = [
-    "compute_changes_for_dataset", "task_score",
+    "compute_changes_for_dataset", "task_score", "task_last_progress",
+    "task_score_fingerprints", "update_task_scores", "get_task_scores",
 ]
 
 
@@ -296,3 +301,255 @@ def participation_last_progress(participation):
     else:
         # Contestants who didn't submit at all are behind contestants who tried
         return datetime.datetime.now() + datetime.timedelta(days=365)
+
+
+def task_last_progress(participation, task):
+    """Return the time of the first submission of the user's
+    participation reaching the best score on the task, as done by
+    participation_last_progress.
+
+    participation (Participation): the user and contest.
+    task (Task): the task.
+
+    return (datetime|None): the time, or None if no submission got
+        any point.
+
+    """
+    best = None
+    for sub in participation.submissions:
+        if sub.task is not task:
+            continue
+        sub_sr = sub.get_result(task.active_dataset)
+
+        if sub_sr is not None and sub_sr.score and sub.timestamp:
+            key = (-sub_sr.score, sub.timestamp)
+            if best is None or key < best:
+                best = key
+
+    return best[1] if best is not None else None
+
+
+# Materialized scores (see ParticipationTaskScore).
+
+def task_score_fingerprints(session, contest_id=None,
+                            participation_ids=None, task_ids=None):
+    """Return fingerprints of the data the task scores depend on.
+
+    The database computes them with a single aggregate query on the
+    submissions, joined with their tokens and their results on the
+    active dataset of their task.
+
+    session (Session): the database session to use.
+    contest_id (int|None): if given, only consider this contest.
+    participation_ids ([int]|None): if given, only consider these
+        participations.
+    task_ids ([int]|None): if given, only consider these tasks.
+
+    return ({(int, int): unicode}): for each pair of participation
+        and task ids with at least one submission, a string that
+        changes whenever the scores of the participation on the task
+        (or its last progress) might change.
+
+    """
+    def details(column):
+        return func.coalesce(func.md5(cast(column, String)), "")
+
+    row = func.concat_ws(
+        ",", Submission.id, Submission.official, Submission.timestamp,
+        Token.id, SubmissionResult.score,
+        details(SubmissionResult.score_details),
+        SubmissionResult.public_score,
+        details(SubmissionResult.public_score_details))
+    fingerprint = func.md5(func.concat_ws(
+        ":", Task.active_dataset_id, Task.score_mode, Task.score_precision,
+        func.count(Submission.id),
+        func.string_agg(row, aggregate_order_by(";", Submission.id))))
+    query = session.query(Submission.participation_id, Submission.task_id,
+                          fingerprint)\
+        .join(Task, Task.id == Submission.task_id)\
+        .outerjoin(Token, Token.submission_id == Submission.id)\
+        .outerjoin(SubmissionResult, and_(
+            SubmissionResult.submission_id == Submission.id,
+            SubmissionResult.dataset_id == Task.active_dataset_id))\
+        .group_by(Submission.participation_id, Submission.task_id,
+                  Task.active_dataset_id, Task.score_mode,
+                  Task.score_precision)
+    if contest_id is not None:
+        query = query.filter(Task.contest_id == contest_id)
+    if participation_ids is not None:
+        query = query.filter(Submission.participation_id.in_(
+            list(participation_ids)))
+    if task_ids is not None:
+        query = query.filter(Submission.task_id.in_(list(task_ids)))
+    return dict(((participation_id, task_id), fingerprint)
+                for participation_id, task_id, fingerprint in query.all())
+
+
+def update_task_scores(session, pairs, fingerprints=None):
+    """Compute and store the scores of some participations on some
+    tasks (without committing).
+
+    Pairs without submissions have their stored scores removed, as
+    rankings assume a score of zero for them.
+
+    session (Session): the database session to use.
+    pairs ([(int, int)]): the ids of the participations and of the
+        tasks to update.
+    fingerprints ({(int, int): unicode}|None): the fingerprints of
+        the pairs, as returned by task_score_fingerprints, if already
+        known; they must be computed before the scores, so that a
+        change in between makes the stored scores look stale rather
+        than up to date.
+
+    """
+    pairs = set(pairs)
+    if len(pairs) == 0:
+        return
+    participation_ids = set(participation_id for participation_id, _ in pairs)
+    task_ids = set(task_id for _, task_id in pairs)
+    if fingerprints is None:
+        fingerprints = task_score_fingerprints(
+            session, participation_ids=participation_ids, task_ids=task_ids)
+
+    tasks = session.query(Task)\
+        .filter(Task.id.in_(list(task_ids)))\
+        .options(joinedload(Task.active_dataset))\
+        .all()
+    # Load all the information required to compute the scores.
+    participations = session.query(Participation)\
+        .filter(Participation.id.in_(list(participation_ids)))\
+        .options(joinedload(Participation.submissions)
+                 .joinedload(Submission.token))\
+        .options(joinedload(Participation.submissions)
+                 .joinedload(Submission.results))\
+        .all()
+
+    values = []
+    for participation in participations:
+        for task in tasks:
+            key = (participation.id, task.id)
+            if key not in pairs or key not in fingerprints:
+                continue
+            score, score_partial = task_score(
+                participation, task, rounded=True)
+            public_score, public_score_partial = task_score(
+                participation, task, public=True, rounded=True)
+            tokened_score, tokened_score_partial = task_score(
+                participation, task, only_tokened=True, rounded=True)
+            values.append({
+                "participation_id": participation.id,
+                "task_id": task.id,
+                "fingerprint": fingerprints[key],
+                "score": score,
+                "score_partial": score_partial,
+                "public_score": public_score,
+                "public_score_partial": public_score_partial,
+                "tokened_score": tokened_score,
+                "tokened_score_partial": tokened_score_partial,
+                "last_progress": task_last_progress(participation, task),
+            })
+
+    empty = [key for key in pairs if key not in fingerprints]
+    if len(empty) > 0:
+        session.query(ParticipationTaskScore)\
+            .filter(tuple_(ParticipationTaskScore.participation_id,
+                           ParticipationTaskScore.task_id).in_(empty))\
+            .delete(synchronize_session=False)
+
+    if len(values) > 0:
+        # Update the rows already there and insert the others, as
+        # INSERT ... ON CONFLICT needs PostgreSQL 9.5. Another
+        # transaction (e.g., a ranking page of AWS) might insert some
+        # of the rows after we looked for them: then we look again.
+        try:
+            with session.begin_nested():
+                _store_task_scores(session, values)
+        except IntegrityError:
+            _store_task_scores(session, values)
+
+
+def _existing_task_scores(session, keys):
+    """Return which pairs of participation and task have a stored
+    score.
+
+    session (Session): the database session to use.
+    keys ([(int, int)]): the ids of the participations and tasks.
+
+    return ({(int, int)}): the pairs among keys with a stored score.
+
+    """
+    return set(
+        session.query(ParticipationTaskScore.participation_id,
+                      ParticipationTaskScore.task_id)
+        .filter(tuple_(ParticipationTaskScore.participation_id,
+                       ParticipationTaskScore.task_id).in_(keys))
+        .all())
+
+
+def _store_task_scores(session, values):
+    """Update or insert the stored scores of some pairs of
+    participation and task.
+
+    session (Session): the database session to use.
+    values ([{}]): the values of the columns of each row.
+
+    raise (IntegrityError): if one of the rows to insert was inserted
+        in the meantime by another transaction.
+
+    """
+    table = ParticipationTaskScore.__table__
+    existing = _existing_task_scores(
+        session, [(value["participation_id"], value["task_id"])
+                  for value in values])
+    updates = []
+    inserts = []
+    for value in values:
+        if (value["participation_id"], value["task_id"]) in existing:
+            update = dict((name, item) for name, item in iteritems(value)
+                          if name not in ("participation_id", "task_id"))
+            update["_participation_id"] = value["participation_id"]
+            update["_task_id"] = value["task_id"]
+            updates.append(update)
+        else:
+            inserts.append(value)
+    if len(updates) > 0:
+        session.execute(
+            table.update().where(and_(
+                table.c.participation_id == bindparam("_participation_id"),
+                table.c.task_id == bindparam("_task_id"))),
+            updates)
+    if len(inserts) > 0:
+        session.execute(table.insert(), inserts)
+
+
+def get_task_scores(session, contest_id):
+    """Return the materialized scores of the participations of a
+    contest on its tasks, first updating (without committing) those
+    that are missing or out of date.
+
+    session (Session): the database session to use.
+    contest_id (int): the id of the contest.
+
+    return ({(int, int): ParticipationTaskScore}): the scores, for
+        each pair of participation and task ids with at least one
+        submission.
+
+    """
+    fingerprints = task_score_fingerprints(session, contest_id=contest_id)
+
+    def load():
+        query = session.query(ParticipationTaskScore)\
+            .join(ParticipationTaskScore.task)\
+            .filter(Task.contest_id == contest_id)\
+            .populate_existing()
+        return dict(((row.participation_id, row.task_id), row)
+                    for row in query.all())
+
+    rows = load()
+    stale = set(key for key in set(fingerprints) | set(rows)
+                if key not in rows
+                or rows[key].fingerprint != fingerprints.get(key))
+    if len(stale) > 0:
+        update_task_scores(session, stale, fingerprints)
+        rows = load()
+    return rows
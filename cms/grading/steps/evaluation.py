@@ -89,6 +89,11 @@ EVALUATION_MESSAGES = MessageCollection([
                  N_("Runtime error"),
                  N_("Runtime error (your submission exited with a return "
                     "code different from 0)")),
+    HumanMessage("skipped",
+                 N_("Not evaluated"),
+                 N_("Your submission was not run on this testcase, because "
+                    "it already failed another testcase of the same "
+                    "subtask, so the result would not change the score.")),
 ])
 
 
@@ -45,36 +45,43 @@ logger = logging.getLogger(__name__)
 # characters (see http://www.unicode.org/Public/6.3.0/ucd/PropList.txt) that
 # are in the ASCII range.
 _WHITES = [b' ', b'\t', b'\n', b'\x0b', b'\x0c', b'\r']
+_WHITES_STR = b''.join(_WHITES)
 
 
-def _white_diff_canonicalize(string):
-    """Convert the input string to a canonical form for the white diff
-    algorithm; that is, the strings a and b are mapped to the same
-    string by _white_diff_canonicalize() if and only if they have to be
-    considered equivalent for the purposes of the white-diff
-    algorithm.
+# Size of the pieces in which the files are read.
+_CHUNK_SIZE = 2 ** 20
 
-    More specifically, this function strips all the leading and
-    trailing whitespaces from s and collapse all the runs of
-    consecutive whitespaces into just one copy of one specific
-    whitespace.
 
-    string (str): the string to canonicalize.
-    return (str): the canonicalized string.
+def _iter_line_blocks(fobj, chunk_size=None):
+    """Read a file by large chunks, splitting it in lines.
 
-    """
-    # Replace all the whitespaces with copies of " ", making the rest
-    # of the algorithm simpler
-    for char in _WHITES[1:]:
-        string = string.replace(char, _WHITES[0])
+    By line we mean 'sequence of characters ending with \n or EOF and
+    beginning right after BOF or \n', without the \n.
+
+    fobj (file): the file to read.
+    chunk_size (int|None): how many bytes to read at a time, if not
+        _CHUNK_SIZE.
 
-    # Split the string according to " ", filter out empty tokens and
-    # join again the string using just one copy of the first
-    # whitespace; this way, runs of more than one whitespaces are
-    # collapsed into just one copy.
-    string = _WHITES[0].join([x for x in string.split(_WHITES[0])
-                              if len(x) > 0])
-    return string
+    yield ([bytes]): the lines of the file, in order, some at a time
+        (never zero); a file ending with \n has a last empty line.
+
+    """
+    if chunk_size is None:
+        chunk_size = _CHUNK_SIZE
+    pieces = []
+    while True:
+        chunk = fobj.read(chunk_size)
+        if len(chunk) == 0:
+            break
+        end = chunk.rfind(b'\n')
+        if end == -1:
+            # Still in the same line.
+            pieces.append(chunk)
+            continue
+        pieces.append(chunk[:end])
+        yield b''.join(pieces).split(b'\n')
+        pieces = [chunk[end + 1:]]
+    yield [b''.join(pieces)]
 
 
 def _white_diff(output, res):
@@ -88,34 +95,57 @@ def _white_diff(output, res):
     'sequence of characters ending with \n or EOF and beginning right
     after BOF or \n'. In particular, every line has *at most* one \n.
 
+    The files are read in large chunks, and runs of identical lines
+    are compared all together, so that the cost of splitting lines in
+    tokens is only paid for those that differ.
+
     output (file): the first file to compare.
     res (file): the second file to compare.
     return (bool): True if the two file are equal as explained above.
 
     """
+    out_blocks = _iter_line_blocks(output)
+    res_blocks = _iter_line_blocks(res)
+    out_lines, res_lines = [], []
+    out_idx, res_idx = 0, 0
 
     while True:
-        lout = output.readline()
-        lres = res.readline()
+        if out_idx == len(out_lines):
+            out_lines, out_idx = next(out_blocks, None), 0
+        if res_idx == len(res_lines):
+            res_lines, res_idx = next(res_blocks, None), 0
 
         # Both files finished: comparison succeded
-        if len(lres) == 0 and len(lout) == 0:
+        if out_lines is None and res_lines is None:
             return True
 
         # Only one file finished: ok if the other contains only blanks
-        elif len(lres) == 0 or len(lout) == 0:
-            lout = lout.strip(b''.join(_WHITES))
-            lres = lres.strip(b''.join(_WHITES))
-            if len(lout) > 0 or len(lres) > 0:
-                return False
+        elif out_lines is None or res_lines is None:
+            if out_lines is None:
+                lines, idx, blocks = res_lines, res_idx, res_blocks
+            else:
+                lines, idx, blocks = out_lines, out_idx, out_blocks
+            while lines is not None:
+                if len(b''.join(lines[idx:]).strip(_WHITES_STR)) > 0:
+                    return False
+                lines, idx = next(blocks, None), 0
+            return True
 
         # Both file still have lines to go: ok if they agree except
         # for the number of whitespaces
         else:
-            lout = _white_diff_canonicalize(lout)
-            lres = _white_diff_canonicalize(lres)
-            if lout != lres:
-                return False
+            count = min(len(out_lines) - out_idx, len(res_lines) - res_idx)
+            if out_lines[out_idx:out_idx + count] != \
+                    res_lines[res_idx:res_idx + count]:
+                for i in range(count):
+                    lout = out_lines[out_idx + i]
+                    lres = res_lines[res_idx + i]
+                    # Without arguments, split uses exactly the
+                    # whitespaces in _WHITES as separators.
+                    if lout != lres and lout.split() != lres.split():
+                        return False
+            out_idx += count
+            res_idx += count
 
 
 def white_diff_fobj_step(output_fobj, correct_output_fobj):
@@ -39,7 +39,9 @@ from cms.grading.ParameterTypes import ParameterTypeCollection, \
 from cms.db import Executable
 from . import TaskType, \
     check_executables_number, check_files_number, check_manager_present, \
-    create_sandbox, delete_sandbox, eval_output, is_manager_for_compilation
+    create_sandbox, delete_sandbox, eval_output, is_manager_for_compilation, \
+    compilation_cache_key, load_compilation_from_cache, \
+    store_compilation_in_cache
 
 
 logger = logging.getLogger(__name__)
@@ -227,6 +229,12 @@ class Batch(TaskType):
         commands = language.get_compilation_commands(
             filenames_to_compile, executable_filename)
 
+        # Reuse the outcome of an identical compilation, if any.
+        cache_key = compilation_cache_key(
+            language, filenames_and_digests_to_get, commands)
+        if load_compilation_from_cache(job, cache_key):
+            return
+
         # Create the sandbox.
         sandbox = create_sandbox(file_cacher, name="compile")
         job.sandboxes.append(sandbox.get_root_path())
@@ -251,6 +259,8 @@ class Batch(TaskType):
             job.executables[executable_filename] = \
                 Executable(executable_filename, digest)
 
+        store_compilation_in_cache(job, cache_key, language)
+
         # Cleanup.
         delete_sandbox(sandbox, job.success, job.keep_sandbox)
 
@@ -44,7 +44,9 @@ from cms.grading.ParameterTypes import ParameterTypeChoice, ParameterTypeInt
 from cms.db import Executable
 from cms.grading.tasktypes import check_files_number
 from . import TaskType, check_executables_number, check_manager_present, \
-    create_sandbox, delete_sandbox, is_manager_for_compilation
+    create_sandbox, delete_sandbox, is_manager_for_compilation, \
+    compilation_cache_key, load_compilation_from_cache, \
+    store_compilation_in_cache
 
 
 logger = logging.getLogger(__name__)
@@ -103,6 +105,9 @@ class Communication(TaskType):
 
     ALLOW_PARTIAL_SUBMISSION = False
 
+    # The outcome may depend on the scheduling of the processes.
+    DETERMINISTIC_EVALUATION = False
+
     _NUM_PROCESSES = ParameterTypeInt(
         "Number of Processes",
         "num_processes",
@@ -218,6 +223,12 @@ class Communication(TaskType):
         commands = language.get_compilation_commands(
             filenames_to_compile, executable_filename)
 
+        # Reuse the outcome of an identical compilation, if any.
+        cache_key = compilation_cache_key(
+            language, filenames_and_digests_to_get, commands)
+        if load_compilation_from_cache(job, cache_key):
+            return
+
         # Create the sandbox.
         sandbox = create_sandbox(file_cacher, name="compile")
         job.sandboxes.append(sandbox.get_root_path())
@@ -242,6 +253,8 @@ class Communication(TaskType):
             job.executables[executable_filename] = \
                 Executable(executable_filename, digest)
 
+        store_compilation_in_cache(job, cache_key, language)
+
         # Cleanup.
         delete_sandbox(sandbox, job.success, job.keep_sandbox)
 
@@ -42,7 +42,9 @@ from cms.grading.languagemanager import LANGUAGES, get_language
 from cms.db import Executable
 from . import TaskType, \
     check_executables_number, check_files_number, check_manager_present, \
-    create_sandbox, delete_sandbox, eval_output
+    create_sandbox, delete_sandbox, eval_output, \
+    compilation_cache_key, load_compilation_from_cache, \
+    store_compilation_in_cache
 
 
 logger = logging.getLogger(__name__)
@@ -192,6 +194,11 @@ class TwoSteps(TaskType):
         commands = language.get_compilation_commands(
             source_filenames, executable_filename)
 
+        # Reuse the outcome of an identical compilation, if any.
+        cache_key = compilation_cache_key(language, files_to_get, commands)
+        if load_compilation_from_cache(job, cache_key):
+            return
+
         # Create the sandbox and put the required files in it.
         sandbox = create_sandbox(file_cacher, name="compile")
         job.sandboxes.append(sandbox.get_root_path())
@@ -216,6 +223,8 @@ class TwoSteps(TaskType):
             job.executables[executable_filename] = \
                 Executable(executable_filename, digest)
 
+        store_compilation_in_cache(job, cache_key, language)
+
         # Cleanup
         delete_sandbox(sandbox, job.success, job.keep_sandbox)
 
@@ -28,14 +28,18 @@ from __future__ import unicode_literals
 from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
 
+import copy
+import json
 import logging
 
 from cms import plugin_list
+from cms.util import LRUCache
 from .abc import TaskType
 from .util import create_sandbox, delete_sandbox, \
     is_manager_for_compilation, set_configuration_error, \
     check_executables_number, check_files_number, check_manager_present, \
-    eval_output
+    eval_output, compilation_cache_key, load_compilation_from_cache, \
+    store_compilation_in_cache
 
 
 logger = logging.getLogger(__name__)
@@ -49,7 +53,8 @@ __all__ = [
     "create_sandbox", "delete_sandbox",
     "is_manager_for_compilation", "set_configuration_error",
     "check_executables_number", "check_files_number", "check_manager_present",
-    "eval_output",
+    "eval_output", "compilation_cache_key", "load_compilation_from_cache",
+    "store_compilation_in_cache",
 ]
 
 
@@ -57,6 +62,12 @@ TASK_TYPES = dict((cls.__name__, cls)
                   for cls in plugin_list("cms.grading.tasktypes"))
 
 
+# Task types built by get_task_type, shared by the whole process: they
+# are immutable once built.
+_TASK_TYPE_CACHE_SIZE = 256
+_task_type_cache = LRUCache(_TASK_TYPE_CACHE_SIZE)
+
+
 def get_task_type_class(name):
     """Load the TaskType class given as parameter."""
     return TASK_TYPES[name]
@@ -71,11 +82,23 @@ def get_task_type(name, parameters):
     name (str): the name of the TaskType class.
     parameters (object): the parameters.
 
-    return (TaskType): an instance of the correct TaskType class.
+    return (TaskType): an instance of the correct TaskType class;
+        the same instance is returned for the same arguments, so it
+        must not be modified.
 
     raise (ValueError): when the arguments are not consistent or
         cannot be parsed.
 
     """
-    class_ = get_task_type_class(name)
-    return class_(parameters)
+    try:
+        key = (name, json.dumps(parameters, sort_keys=True))
+    except TypeError:
+        # Not JSON-serializable, cannot be cached.
+        key = None
+    task_type = _task_type_cache.get(key) if key is not None else None
+    if task_type is None:
+        class_ = get_task_type_class(name)
+        task_type = class_(copy.deepcopy(parameters))
+        if key is not None:
+            _task_type_cache.put(key, task_type)
+    return task_type
@@ -66,6 +66,12 @@ class TaskType(with_metaclass(ABCMeta, object)):
     # the non-provided files with the one in the previous submission.
     ALLOW_PARTIAL_SUBMISSION = False
 
+    # If DETERMINISTIC_EVALUATION is True, evaluating the same
+    # executables on the same testcase, with the same managers and
+    # limits, always gives the same outcome; therefore ES can reuse
+    # past evaluations (see Dataset.reuse_evaluations).
+    DETERMINISTIC_EVALUATION = True
+
     # A list of all the accepted parameters for this task type.
     # Each item is an instance of TaskTypeParameter.
     ACCEPTED_PARAMETERS = []
@@ -37,17 +37,23 @@ from __future__ import unicode_literals
 from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
 
+import hashlib
 import io
+import json
 import logging
 import os
-import shutil
+
+from six import iteritems, itervalues
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 from cms import config
+from cms.db import CompilationCacheEntry, Executable, SessionGen
 from cms.grading import JobException
-from cms.grading.Sandbox import Sandbox
+from cms.grading.Sandbox import Sandbox, SandboxInterfaceException
 from cms.grading.Job import CompilationJob, EvaluationJob
 from cms.grading.steps import EVALUATION_MESSAGES, checker_step, \
     white_diff_fobj_step
+from cmscommon.datetime import make_datetime, monotonic_time
 
 
 logger = logging.getLogger(__name__)
@@ -56,6 +62,30 @@ logger = logging.getLogger(__name__)
 EVAL_USER_OUTPUT_FILENAME = "user_output.txt"
 
 
+# The pool the sandboxes are taken from, if any (see set_sandbox_pool).
+_sandbox_pool = None
+
+
+def set_sandbox_pool(pool):
+    """Set the pool from which create_sandbox takes the sandboxes.
+
+    pool (SandboxPool|None): the pool, or None to create each sandbox
+        from scratch.
+
+    """
+    global _sandbox_pool
+    _sandbox_pool = pool
+
+
+def get_sandbox_pool():
+    """Return the pool set by set_sandbox_pool.
+
+    return (SandboxPool|None): the pool, if any.
+
+    """
+    return _sandbox_pool
+
+
 def create_sandbox(file_cacher, name=None):
     """Create a sandbox, and return it.
 
@@ -67,12 +97,18 @@ def create_sandbox(file_cacher, name=None):
     raise (JobException): if the sandbox cannot be created.
 
     """
+    start_time = monotonic_time()
     try:
-        sandbox = Sandbox(file_cacher, name=name)
-    except (OSError, IOError):
+        if _sandbox_pool is not None:
+            sandbox = _sandbox_pool.acquire(file_cacher, name=name)
+        else:
+            sandbox = Sandbox(file_cacher, name=name)
+    except (OSError, IOError, SandboxInterfaceException):
         err_msg = "Couldn't create sandbox."
         logger.error(err_msg, exc_info=True)
         raise JobException(err_msg)
+    logger.debug("Sandbox %s created in %.3f seconds.",
+                 sandbox.get_root_path(), monotonic_time() - start_time)
     return sandbox
 
 
@@ -91,6 +127,9 @@ def delete_sandbox(sandbox, success=True, keep_sandbox=False):
                        sandbox.get_root_path())
 
     delete = success and not config.keep_sandbox and not keep_sandbox
+    if _sandbox_pool is not None:
+        _sandbox_pool.release(sandbox, delete=delete)
+        return
     try:
         sandbox.cleanup(delete=delete)
     except (IOError, OSError):
@@ -118,6 +157,106 @@ def is_manager_for_compilation(filename, language):
                for obj in language.object_extensions))
 
 
+def compilation_cache_key(language, files, commands):
+    """Return the key of a compilation in the compilation cache.
+
+    The key identifies everything the outcome of the compilation
+    depends on (apart from the compilers themselves): the language,
+    the files in the sandbox, the commands and the sandbox limits.
+
+    language (Language): the language of the compilation.
+    files ({str: str}): the name and digest of each file copied in
+        the sandbox.
+    commands ([[str]]): the compilation commands.
+
+    return (str): the key.
+
+    """
+    data = [language.name,
+            sorted(iteritems(files)),
+            commands,
+            config.compilation_sandbox_max_processes,
+            config.compilation_sandbox_max_time_s,
+            config.compilation_sandbox_max_memory_kib]
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_compilation_from_cache(job, key):
+    """Fill a compilation job with the outcome of a cached compilation.
+
+    job (CompilationJob): the job to fill.
+    key (str): the key of the compilation (see compilation_cache_key).
+
+    return (bool): whether the compilation was in the cache, and thus
+        the job has been filled.
+
+    """
+    if not config.use_compilation_cache:
+        return False
+    try:
+        with SessionGen() as session:
+            entry = session.query(CompilationCacheEntry).get(key)
+            if entry is None:
+                return False
+            job.success = True
+            job.compilation_success = entry.compilation_success
+            job.text = list(entry.text)
+            job.plus = dict(entry.stats)
+            if entry.executable_digest is not None:
+                job.executables[entry.executable_filename] = Executable(
+                    entry.executable_filename, entry.executable_digest)
+    except SQLAlchemyError:
+        logger.warning("Couldn't look up the compilation cache.",
+                       exc_info=True)
+        return False
+    logger.info("Compilation of %s found in the cache.", job.info)
+    return True
+
+
+def store_compilation_in_cache(job, key, language):
+    """Store the outcome of a compilation job in the cache.
+
+    Only outcomes that would be the same when compiling again are
+    stored: successes and compilation errors, not timeouts, signals
+    or sandbox failures.
+
+    job (CompilationJob): a job that has just been executed.
+    key (str): the key of the compilation (see compilation_cache_key).
+    language (Language): the language of the compilation.
+
+    """
+    if not config.use_compilation_cache or not job.success:
+        return
+    stats = job.plus if job.plus is not None else {}
+    if not job.compilation_success and \
+            stats.get("exit_status") != Sandbox.EXIT_NONZERO_RETURN:
+        return
+    executable_filename = executable_digest = None
+    for executable in itervalues(job.executables):
+        executable_filename = executable.filename
+        executable_digest = executable.digest
+    try:
+        with SessionGen() as session:
+            entry = CompilationCacheEntry(
+                language=language.name,
+                timestamp=make_datetime(),
+                compilation_success=job.compilation_success,
+                text=job.text,
+                stats=stats,
+                executable_filename=executable_filename,
+                executable_digest=executable_digest)
+            entry.key = key
+            session.add(entry)
+            session.commit()
+    except IntegrityError:
+        # Another Worker stored the same compilation in the meantime.
+        pass
+    except SQLAlchemyError:
+        logger.warning("Couldn't store the compilation in the cache.",
+                       exc_info=True)
+
+
 def set_configuration_error(job, msg, *args):
     """Log a configuration error and set the correct results in the job.
 
@@ -255,8 +394,8 @@ def eval_output(file_cacher, job, checker_codename,
 
         # Put user output in the sandbox.
         if user_output_path is not None:
-            shutil.copyfile(user_output_path,
-                            sandbox.relative_path(EVAL_USER_OUTPUT_FILENAME))
+            sandbox.create_file_from_path(EVAL_USER_OUTPUT_FILENAME,
+                                          user_output_path)
         else:
             sandbox.create_file_from_storage(EVAL_USER_OUTPUT_FILENAME,
                                              user_output_digest)
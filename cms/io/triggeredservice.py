@@ -123,13 +123,23 @@ class Executor(with_metaclass(ABCMeta, object)):  # pylint: disable=R0921
 
         """
         while True:
-            # Wait for the queue to be non-empty.
+            # Wait for the executor to be able to take operations, and
+            # then for the queue to be non-empty.
+            self.wait_for_capacity()
             to_execute = [self._operation_queue.pop(wait=True)]
             if self._batch_executions:
                 max_operations = self.max_operations_per_batch()
+                max_cost = self.max_cost_per_batch()
+                cost = self.operation_cost(to_execute[0].item)
                 while not self._operation_queue.empty() and (
                         max_operations == 0 or
                         len(to_execute) < max_operations):
+                    if max_cost > 0:
+                        next_cost = self.operation_cost(
+                            self._operation_queue.top().item)
+                        if cost + next_cost > max_cost:
+                            break
+                        cost += next_cost
                     to_execute.append(self._operation_queue.pop())
 
             assert len(to_execute) > 0, "Expected at least one element."
@@ -159,6 +169,17 @@ class Executor(with_metaclass(ABCMeta, object)):  # pylint: disable=R0921
                         "Unexpected error when executing operation `%s'.",
                         to_execute[0].item, exc_info=True)
 
+    def wait_for_capacity(self):
+        """Wait until the executor can execute more operations.
+
+        Called before extracting operations from the queue, so that
+        they stay there (and can be reprioritized or dequeued) while
+        they could not be executed anyway. By default, return
+        immediately.
+
+        """
+        pass
+
     def max_operations_per_batch(self):
         """Return the maximum number of operations in a batch.
 
@@ -172,6 +193,29 @@ class Executor(with_metaclass(ABCMeta, object)):  # pylint: disable=R0921
         """
         return 0
 
+    def max_cost_per_batch(self):
+        """Return the maximum total cost of the operations in a batch.
+
+        If the service has batch executions, operations are added to a
+        batch until the next one would make the sum of their costs (see
+        operation_cost) exceed this value. A batch always contains at
+        least one operation.
+
+        return (float): the maximum cost, or 0 to indicate no limits.
+
+        """
+        return 0
+
+    def operation_cost(self, item):
+        """Return the expected cost of executing an operation.
+
+        item (QueueItem): the operation.
+
+        return (float): its cost, in the unit of max_cost_per_batch.
+
+        """
+        return 0
+
     @abstractmethod
     def execute(self, entry):
         """Perform a single operation.
@@ -236,6 +280,15 @@ class TriggeredService(Service):
         self._sweeper_event = Event()
         self._sweeper_started = False
         self._sweeper_timeout = None
+        # Timing of the sweeps (see sweeper_status).
+        self._sweeper_stats = {
+            "sweeps": 0,
+            "total_duration": 0.0,
+            "max_duration": 0.0,
+            "last_start_time": None,
+            "last_duration": None,
+            "last_operations": None,
+        }
 
     def add_executor(self, executor):
         """Add an executor for the service.
@@ -334,8 +387,17 @@ class TriggeredService(Service):
         logger.info("Start looking for missing operations.")
         start_time = time.time()
         counter = self._missing_operations()
+        duration = time.time() - start_time
         logger.info("Found %d missed operation(s) in %d ms.",
-                    counter, (time.time() - start_time) * 1000)
+                    counter, duration * 1000)
+
+        stats = self._sweeper_stats
+        stats["sweeps"] += 1
+        stats["total_duration"] += duration
+        stats["max_duration"] = max(stats["max_duration"], duration)
+        stats["last_start_time"] = start_time
+        stats["last_duration"] = duration
+        stats["last_operations"] = counter
 
     def _missing_operations(self):
         """Enqueue missed operations, and return their number.
@@ -353,6 +415,18 @@ class TriggeredService(Service):
         """Make the sweeper loop fire the sweeper as soon as possible."""
         self._sweeper_event.set()
 
+    @rpc_method
+    def sweeper_status(self):
+        """Return statistics on the sweeps done so far.
+
+        return ({}): a dictionary with the number of sweeps, their
+            total and maximum duration, and the start time, duration
+            and number of operations found of the last one (None if
+            no sweep happened yet); times are in seconds.
+
+        """
+        return dict(self._sweeper_stats)
+
     @rpc_method
     def queue_status(self):
         """Return the status of the queues.
@@ -41,6 +41,7 @@ from werkzeug.contrib.fixers import ProxyFix
 from cms.db.filecacher import FileCacher
 from cms.server.file_middleware import FileServerMiddleware
 
+from .rpc import rpc_method
 from .service import Service
 from .web_rpc import RPCMiddleware
 
@@ -110,6 +111,15 @@ class WebService(Service):
 
         self.web_server = WSGIServer((listen_address, listen_port), self)
 
+    @rpc_method
+    def cache_status(self):
+        """Return statistics on the local file cache.
+
+        return ({}): see FileCacher.get_cache_status.
+
+        """
+        return self.file_cacher.get_cache_status()
+
     def __call__(self, environ, start_response):
         """Execute this instance as a WSGI application.
 
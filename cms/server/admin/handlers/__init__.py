@@ -86,6 +86,8 @@ from .dataset import \
     DeleteDatasetHandler, \
     ActivateDatasetHandler, \
     ToggleAutojudgeDatasetHandler, \
+    ToggleReuseEvaluationsDatasetHandler, \
+    ToggleSkipFailedSubtasksDatasetHandler, \
     AddManagerHandler, \
     DeleteManagerHandler, \
     AddTestcaseHandler, \
@@ -194,6 +196,10 @@ HANDLERS = [
     (r"/dataset/([0-9]+)/delete", DeleteDatasetHandler),
     (r"/dataset/([0-9]+)/activate", ActivateDatasetHandler),
     (r"/dataset/([0-9]+)/autojudge", ToggleAutojudgeDatasetHandler),
+    (r"/dataset/([0-9]+)/reuse_evaluations",
+     ToggleReuseEvaluationsDatasetHandler),
+    (r"/dataset/([0-9]+)/skip_failed_subtasks",
+     ToggleSkipFailedSubtasksDatasetHandler),
     (r"/dataset/([0-9]+)/managers/add", AddManagerHandler),
     (r"/dataset/([0-9]+)/manager/([0-9]+)/delete", DeleteManagerHandler),
     (r"/dataset/([0-9]+)/testcases/add", AddTestcaseHandler),
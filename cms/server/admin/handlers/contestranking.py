@@ -36,6 +36,7 @@ from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
 import six
 
+import datetime
 import time
 import csv
 import io
@@ -44,7 +45,7 @@ import logging
 from sqlalchemy.orm import joinedload
 
 from cms.db import Contest
-from cms.grading.scoring import task_score, participation_last_progress
+from cms.grading.scoring import get_task_scores
 
 from .base import BaseHandler, require_permission
 
@@ -61,14 +62,17 @@ class RankingHandler(BaseHandler):
         # This validates the contest id.
         self.safe_get_item(Contest, contest_id)
 
-        # This massive joined load gets all the information which we will need
-        # to generate the rankings.
+        # The scores are those kept up to date by ScoringService; the
+        # ones that are out of date (e.g., because of tokens or of a
+        # change of active dataset) are computed again and stored.
+        task_scores = get_task_scores(self.sql_session, contest_id)
+        self.sql_session.commit()
+
         self.contest = self.sql_session.query(Contest)\
             .filter(Contest.id == contest_id)\
             .options(joinedload('participations'))\
-            .options(joinedload('participations.submissions'))\
-            .options(joinedload('participations.submissions.token'))\
-            .options(joinedload('participations.submissions.results'))\
+            .options(joinedload('participations.user'))\
+            .options(joinedload('participations.team'))\
             .first()
 
         # Preprocess participations: get data about teams, scores
@@ -79,8 +83,15 @@ class RankingHandler(BaseHandler):
             p.scores = []
             total_score = 0.0
             partial = False
+            last_progress = []
             for task in self.contest.tasks:
-                t_score, t_partial = task_score(p, task, rounded=True)
+                row = task_scores.get((p.id, task.id))
+                if row is None:
+                    t_score, t_partial = 0.0, False
+                else:
+                    t_score, t_partial = row.score, row.score_partial
+                    if row.last_progress is not None:
+                        last_progress.append(row.last_progress)
                 p.scores.append((t_score, t_partial))
                 total_score += t_score
                 partial = partial or t_partial
@@ -89,7 +100,13 @@ class RankingHandler(BaseHandler):
 
             # Calculate the time when the score of the participation last
             # increased
-            p.last_progress = participation_last_progress(p)
+            if last_progress:
+                p.last_progress = max(last_progress)
+            else:
+                # Contestants who didn't submit at all are behind
+                # contestants who tried
+                p.last_progress = \
+                    datetime.datetime.now() + datetime.timedelta(days=365)
 
         self.r_params = self.render_params()
         contest = self.r_params["contest"]
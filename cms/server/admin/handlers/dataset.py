@@ -344,6 +344,34 @@ class ToggleAutojudgeDatasetHandler(BaseHandler):
         self.write("./%d" % dataset.task_id)
 
 
+class ToggleReuseEvaluationsDatasetHandler(BaseHandler):
+    """Toggle whether ES can reuse past evaluations for a dataset.
+
+    """
+    @require_permission(BaseHandler.PERMISSION_ALL)
+    def post(self, dataset_id):
+        dataset = self.safe_get_item(Dataset, dataset_id)
+
+        dataset.reuse_evaluations = not dataset.reuse_evaluations
+
+        self.try_commit()
+        self.write("./%d" % dataset.task_id)
+
+
+class ToggleSkipFailedSubtasksDatasetHandler(BaseHandler):
+    """Toggle whether ES skips testcases of failed subtasks for a dataset.
+
+    """
+    @require_permission(BaseHandler.PERMISSION_ALL)
+    def post(self, dataset_id):
+        dataset = self.safe_get_item(Dataset, dataset_id)
+
+        dataset.skip_failed_subtasks = not dataset.skip_failed_subtasks
+
+        self.try_commit()
+        self.write("./%d" % dataset.task_id)
+
+
 class AddManagerHandler(BaseHandler):
     """Add a manager to a dataset.
 
@@ -39,6 +39,7 @@ import json
 import logging
 from datetime import timedelta
 
+from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.orm import contains_eager, joinedload
 
 from cms import config
@@ -156,7 +157,7 @@ class AmbiguousIPAddress(Exception):
 
 
 def authenticate_request(
-        sql_session, contest, timestamp, cookie, ip_address):
+        sql_session, contest, timestamp, cookie, ip_address, snapshot=None):
     """Authenticate a user returning to the site, with a cookie.
 
     Given the information the user's browser provided (the cookie) and
@@ -189,6 +190,9 @@ def authenticate_request(
         request (if any).
     ip_address (IPv4Address|IPv6Address): the IP address the request
         came from.
+    snapshot (ContestSnapshot|None): if given, the snapshot of the
+        contest where to look up participations before querying the
+        database.
 
     return ((Participation, bytes|None)|(None, None)): if the user
         couldn't be authenticated then return None, otherwise return
@@ -201,7 +205,7 @@ def authenticate_request(
     if contest.ip_autologin:
         try:
             participation = _authenticate_request_by_ip_address(
-                sql_session, contest, ip_address)
+                sql_session, contest, ip_address, snapshot)
             # If the login is IP-based, the cookie should be cleared.
             if participation is not None:
                 cookie = None
@@ -211,7 +215,7 @@ def authenticate_request(
     if participation is None \
             and contest.allow_password_authentication:
         participation, cookie = _authenticate_request_from_cookie(
-            sql_session, contest, timestamp, cookie)
+            sql_session, contest, timestamp, cookie, snapshot)
 
     if participation is None:
         return None, None
@@ -236,7 +240,8 @@ def authenticate_request(
     return participation, cookie
 
 
-def _authenticate_request_by_ip_address(sql_session, contest, ip_address):
+def _authenticate_request_by_ip_address(
+        sql_session, contest, ip_address, snapshot=None):
     """Return the current participation based on the IP address.
 
     sql_session (Session): the SQLAlchemy database session used to
@@ -244,6 +249,8 @@ def _authenticate_request_by_ip_address(sql_session, contest, ip_address):
     contest (Contest): the contest the user is trying to access.
     ip_address (IPv4Address|IPv6Address): the IP address the request
         came from.
+    snapshot (ContestSnapshot|None): the snapshot of the contest, if
+        any.
 
     return (Participation|None): the only participation that is allowed
         to connect from the given IP address, or None if not found.
@@ -256,17 +263,29 @@ def _authenticate_request_by_ip_address(sql_session, contest, ip_address):
     # since we're comparing it for equality with other networks.
     ip_network = ipaddress.ip_network((ip_address, ip_address.max_prefixlen))
 
-    participations = sql_session.query(Participation) \
-        .options(joinedload(Participation.user)) \
-        .filter(Participation.contest == contest) \
-        .filter(Participation.ip.any(ip_network))
+    participations = []
+    if snapshot is not None:
+        participations = snapshot.participations_by_ip(
+            sql_session, ip_network)
+        # If hidden users are blocked we ignore them completely.
+        if contest.block_hidden_participations:
+            participations = [participation
+                              for participation in participations
+                              if not participation.hidden]
+
+    # Participations not in the snapshot may have been added since.
+    if len(participations) == 0:
+        participations = sql_session.query(Participation) \
+            .options(joinedload(Participation.user)) \
+            .filter(Participation.contest == contest) \
+            .filter(Participation.ip.any(ip_network))
 
-    # If hidden users are blocked we ignore them completely.
-    if contest.block_hidden_participations:
-        participations = participations \
-            .filter(Participation.hidden.is_(False))
+        # If hidden users are blocked we ignore them completely.
+        if contest.block_hidden_participations:
+            participations = participations \
+                .filter(Participation.hidden.is_(False))
 
-    participations = participations.all()
+        participations = participations.all()
 
     if len(participations) == 0:
         logger.info(
@@ -291,7 +310,8 @@ def _authenticate_request_by_ip_address(sql_session, contest, ip_address):
     return participation
 
 
-def _authenticate_request_from_cookie(sql_session, contest, timestamp, cookie):
+def _authenticate_request_from_cookie(
+        sql_session, contest, timestamp, cookie, snapshot=None):
     """Return the current participation based on the cookie.
 
     If a participation can be extracted, the cookie is refreshed.
@@ -302,6 +322,8 @@ def _authenticate_request_from_cookie(sql_session, contest, timestamp, cookie):
     timestamp (datetime): the date and the time of the request.
     cookie (bytes|None): the cookie the user's browser provided in the
         request (if any).
+    snapshot (ContestSnapshot|None): the snapshot of the contest, if
+        any.
 
     return ((Participation, bytes)|(None, None)): the participation
         extracted from the cookie and the cookie to set/refresh, or
@@ -335,13 +357,29 @@ def _authenticate_request_from_cookie(sql_session, contest, timestamp, cookie):
                            config.cookie_duration)
         return None, None
 
-    # Load participation from DB and make sure it exists.
-    participation = sql_session.query(Participation) \
-        .join(Participation.user) \
-        .options(contains_eager(Participation.user)) \
-        .filter(Participation.contest == contest) \
-        .filter(User.username == username) \
-        .first()
+    # Load participation from the snapshot or from the DB and make sure
+    # it exists.
+    participation = None
+    if snapshot is not None:
+        participation = snapshot.participation_by_username(
+            sql_session, username)
+        # The password may have changed since the snapshot was taken.
+        if participation is not None \
+                and get_password(participation) != password:
+            try:
+                sql_session.refresh(participation)
+                sql_session.refresh(participation.user)
+            except InvalidRequestError:
+                # The participation does not exist anymore.
+                sql_session.expunge(participation)
+                participation = None
+    if participation is None:
+        participation = sql_session.query(Participation) \
+            .join(Participation.user) \
+            .options(contains_eager(Participation.user)) \
+            .filter(Participation.contest == contest) \
+            .filter(User.username == username) \
+            .first()
     if participation is None:
         log_failed_attempt("user not registered to contest")
         return None, None
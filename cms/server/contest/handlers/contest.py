@@ -75,6 +75,7 @@ class ContestHandler(BaseHandler):
     def __init__(self, *args, **kwargs):
         super(ContestHandler, self).__init__(*args, **kwargs)
         self.contest_url = None
+        self.snapshot = None
 
     def prepare(self):
         self.choose_contest()
@@ -103,16 +104,23 @@ class ContestHandler(BaseHandler):
 
         If a contest was specified as argument to CWS, fill
         self.contest with that; otherwise extract it from the URL path.
+        The contest is taken from its snapshot, if available, which is
+        also stored in self.snapshot.
 
         """
+        snapshots = self.service.contest_snapshots
         if self.is_multi_contest():
             # Choose the contest found in the path argument
             # see: https://github.com/tornadoweb/tornado/issues/1673
             contest_name = self.path_args[0]
 
             # Select the correct contest or return an error
-            self.contest = self.sql_session.query(Contest)\
-                .filter(Contest.name == contest_name).first()
+            self.snapshot = snapshots.get_by_name(contest_name)
+            if self.snapshot is not None:
+                self.contest = self.snapshot.contest(self.sql_session)
+            else:
+                self.contest = self.sql_session.query(Contest)\
+                    .filter(Contest.name == contest_name).first()
             if self.contest is None:
                 self.contest = Contest(
                     name=contest_name, description=contest_name)
@@ -123,8 +131,12 @@ class ContestHandler(BaseHandler):
                 raise tornado.web.HTTPError(404)
         else:
             # Select the contest specified on the command line
-            self.contest = Contest.get_from_id(
-                self.service.contest_id, self.sql_session)
+            self.snapshot = snapshots.get(self.service.contest_id)
+            if self.snapshot is not None:
+                self.contest = self.snapshot.contest(self.sql_session)
+            else:
+                self.contest = Contest.get_from_id(
+                    self.service.contest_id, self.sql_session)
 
     def get_current_user(self):
         """Return the currently logged in participation.
@@ -163,7 +175,8 @@ class ContestHandler(BaseHandler):
             ip_address = None
 
         participation, cookie = authenticate_request(
-            self.sql_session, self.contest, self.timestamp, cookie, ip_address)
+            self.sql_session, self.contest, self.timestamp, cookie, ip_address,
+            self.snapshot)
 
         if cookie is None:
             self.clear_cookie(cookie_name)
@@ -87,6 +87,7 @@ class StartHandler(ContestHandler):
         logger.info("Starting now for user %s", participation.user.username)
         participation.starting_time = self.timestamp
         self.sql_session.commit()
+        self.service.contest_snapshots.invalidate(self.contest.id)
 
         self.redirect(self.contest_url())
 
@@ -205,17 +205,10 @@ class SubmissionStatusHandler(ContestHandler):
             "task_is_score_partial" as partial info is the same for both.
 
         """
-        # Just to preload all information required to compute the task score.
-        self.sql_session.query(Submission)\
-            .filter(Submission.participation == participation)\
-            .filter(Submission.task == task)\
-            .options(joinedload(Submission.token))\
-            .options(joinedload(Submission.results))\
-            .all()
-        data["task_public_score"], public_score_is_partial = \
-            task_score(participation, task, public=True, rounded=True)
-        data["task_tokened_score"], tokened_score_is_partial = \
-            task_score(participation, task, only_tokened=True, rounded=True)
+        (data["task_public_score"], public_score_is_partial), \
+            (data["task_tokened_score"], tokened_score_is_partial) = \
+            self.service.task_score_cache.get(
+                self.sql_session, participation, task)
         # These two should be the same, anyway.
         data["task_score_is_partial"] = \
             public_score_is_partial or tokened_score_is_partial
@@ -58,6 +58,8 @@ from cms.locale import get_translations
 from .handlers import HANDLERS
 from .handlers.base import ContestListHandler
 from .handlers.main import MainHandler
+from .snapshot import ContestSnapshotCache
+from .taskscore import TaskScoreCache
 
 
 logger = logging.getLogger(__name__)
@@ -125,6 +127,15 @@ class ContestWebServer(WebService):
         # Retrieve the available translations.
         self.translations = get_translations()
 
+        # Snapshots of the contests and of their participations, to
+        # authenticate the requests without querying the database.
+        self.contest_snapshots = ContestSnapshotCache(
+            config.contest_snapshot_ttl)
+
+        # Scores of the participations on the tasks, for the polls of
+        # the status of the submissions.
+        self.task_score_cache = TaskScoreCache()
+
         self.evaluation_service = self.connect_to(
             ServiceCoord("EvaluationService", 0))
         self.scoring_service = self.connect_to(
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""In-memory snapshots of the contests served by CWS.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import logging
+import time
+
+from sqlalchemy.orm import joinedload
+
+from cms.db import Contest, Participation, SessionGen, Task
+
+
+__all__ = [
+    "ContestSnapshot", "ContestSnapshotCache",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class ContestSnapshot(object):
+    """A copy of a contest and of its participations.
+
+    The snapshot holds detached copies of the contest, of its tasks
+    with their active datasets, and of its participations with their
+    users, indexed by username and by IP address. The objects handed
+    out are merged into the session of the caller without querying
+    the database, and can then be used (and modified) as if they had
+    been loaded from it.
+
+    """
+
+    def __init__(self, contest, participations):
+        """Create the snapshot.
+
+        contest (Contest): the contest, detached from its session and
+            with its tasks and their active datasets loaded.
+        participations ([Participation]): all the participations of
+            the contest, detached and with their users loaded.
+
+        """
+        self._contest = contest
+        self.contest_id = contest.id
+        self.contest_name = contest.name
+        self.loaded_at = time.time()
+        self._by_username = dict()
+        self._by_ip = dict()
+        for participation in participations:
+            self._by_username[participation.user.username] = participation
+            for network in participation.ip or []:
+                self._by_ip.setdefault(network, []).append(participation)
+
+    def contest(self, sql_session):
+        """Return the contest.
+
+        sql_session (Session): the session to attach the contest to.
+
+        return (Contest): the contest.
+
+        """
+        return sql_session.merge(self._contest, load=False)
+
+    def participation_by_username(self, sql_session, username):
+        """Return the participation of a user.
+
+        sql_session (Session): the session to attach the participation
+            to.
+        username (str): the username of the user.
+
+        return (Participation|None): the participation of the user in
+            the contest, or None if not in the snapshot.
+
+        """
+        participation = self._by_username.get(username)
+        if participation is None:
+            return None
+        return sql_session.merge(participation, load=False)
+
+    def participations_by_ip(self, sql_session, ip_network):
+        """Return the participations that have an IP address.
+
+        sql_session (Session): the session to attach the participations
+            to.
+        ip_network (IPv4Network|IPv6Network): one of the networks in
+            the IP restriction of the participations.
+
+        return ([Participation]): the participations in the contest
+            that have the network among their IP addresses.
+
+        """
+        return [sql_session.merge(participation, load=False)
+                for participation in self._by_ip.get(ip_network, [])]
+
+
+class ContestSnapshotCache(object):
+    """Keep the snapshots of the contests served by CWS.
+
+    Authenticating a request and computing the phase of the contest
+    need the contest and the participation, which CWS would otherwise
+    query at every request. Snapshots are loaded on first use and
+    again when older than ttl seconds, or explicitly invalidated (CWS
+    does so when it modifies a participation); hence changes made
+    elsewhere (e.g., in AWS) are seen by CWS with a delay of at most
+    ttl seconds. Users and contests missing from a snapshot are looked
+    up in the database by the callers, so new ones are seen at once.
+
+    """
+
+    def __init__(self, ttl):
+        """Create the cache.
+
+        ttl (float): maximum age of the snapshots, in seconds; if not
+            positive, snapshots are never used.
+
+        """
+        self.ttl = ttl
+        # Map from the contest ids to the snapshots.
+        self._snapshots = dict()
+        # Map from the contest names to the contest ids.
+        self._ids = dict()
+
+    @staticmethod
+    def _load(contest_filter):
+        """Load a snapshot from the database.
+
+        contest_filter (ClauseElement): the filter selecting the
+            contest.
+
+        return (ContestSnapshot|None): the snapshot of the contest, or
+            None if it does not exist.
+
+        """
+        with SessionGen() as session:
+            contest = session.query(Contest)\
+                .filter(contest_filter)\
+                .options(joinedload(Contest.tasks)
+                         .joinedload(Task.active_dataset))\
+                .first()
+            if contest is None:
+                return None
+            participations = session.query(Participation)\
+                .filter(Participation.contest_id == contest.id)\
+                .options(joinedload(Participation.user))\
+                .all()
+            # Detach the objects before the rollback expires them.
+            session.expunge_all()
+        logger.debug("Loaded snapshot of contest %s with %d participations.",
+                     contest.name, len(participations))
+        return ContestSnapshot(contest, participations)
+
+    def _fresh(self, snapshot):
+        return snapshot is not None \
+            and time.time() - snapshot.loaded_at < self.ttl
+
+    def _store(self, snapshot):
+        if snapshot is not None:
+            self._snapshots[snapshot.contest_id] = snapshot
+            self._ids[snapshot.contest_name] = snapshot.contest_id
+        return snapshot
+
+    def get(self, contest_id):
+        """Return the snapshot of a contest.
+
+        contest_id (int): the id of the contest.
+
+        return (ContestSnapshot|None): the snapshot, or None if the
+            contest does not exist or snapshots are disabled.
+
+        """
+        if self.ttl <= 0:
+            return None
+        snapshot = self._snapshots.get(contest_id)
+        if self._fresh(snapshot):
+            return snapshot
+        return self._store(self._load(Contest.id == contest_id))
+
+    def get_by_name(self, contest_name):
+        """Return the snapshot of a contest.
+
+        contest_name (str): the name of the contest.
+
+        return (ContestSnapshot|None): the snapshot, or None if the
+            contest does not exist or snapshots are disabled.
+
+        """
+        if self.ttl <= 0:
+            return None
+        snapshot = self._snapshots.get(self._ids.get(contest_name))
+        if self._fresh(snapshot) and snapshot.contest_name == contest_name:
+            return snapshot
+        return self._store(self._load(Contest.name == contest_name))
+
+    def invalidate(self, contest_id=None):
+        """Discard the snapshot of a contest.
+
+        contest_id (int|None): the id of the contest, or None to
+            discard all snapshots.
+
+        """
+        if contest_id is None:
+            self._snapshots.clear()
+            self._ids.clear()
+        else:
+            self._snapshots.pop(contest_id, None)
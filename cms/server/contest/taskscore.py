@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Cache of the scores of the participants on the tasks, for CWS.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import logging
+
+from sqlalchemy.orm import joinedload
+
+from cms.db import Submission
+from cms.grading.scoring import task_score, task_score_fingerprints
+from cms.util import LRUCache
+
+
+__all__ = [
+    "TaskScoreCache",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class TaskScoreCache(object):
+    """Remember the scores of participations on tasks.
+
+    Computing a score requires loading all the submissions of the
+    participation on the task, with their results and tokens. Instead,
+    the scores are kept in memory together with a fingerprint of the
+    data they depend on, which the database computes with a single
+    aggregate query on the submissions of the participation on the
+    task; they are computed again only when the fingerprint changes
+    (e.g., because a submission was scored or tokened).
+
+    """
+
+    # Maximum number of (participation, task) pairs remembered.
+    SIZE = 10000
+
+    def __init__(self, size=SIZE):
+        self._cache = LRUCache(size)
+        # Number of scores computed and served from the cache.
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _fingerprint(sql_session, participation, task):
+        """Return a fingerprint of the data the scores depend on.
+
+        sql_session (Session): the database session to use.
+        participation (Participation): the participation.
+        task (Task): the task.
+
+        return (unicode|None): a value that changes whenever the
+            scores of the participation on the task might change.
+
+        """
+        return task_score_fingerprints(
+            sql_session, participation_ids=[participation.id],
+            task_ids=[task.id]).get((participation.id, task.id))
+
+    def get(self, sql_session, participation, task):
+        """Return the scores of a participation on a task.
+
+        sql_session (Session): the database session to use.
+        participation (Participation): the participation.
+        task (Task): the task.
+
+        return ((float, bool), (float, bool)): the public score and
+            the score restricted to tokened submissions, rounded, each
+            with whether it is partial (see task_score).
+
+        """
+        key = (participation.id, task.id)
+        fingerprint = self._fingerprint(sql_session, participation, task)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        # Just to preload all information required to compute the
+        # task score.
+        sql_session.query(Submission)\
+            .filter(Submission.participation == participation)\
+            .filter(Submission.task == task)\
+            .options(joinedload(Submission.token))\
+            .options(joinedload(Submission.results))\
+            .all()
+        scores = (
+            task_score(participation, task, public=True, rounded=True),
+            task_score(participation, task, only_tokened=True,
+                       rounded=True))
+        self._cache.put(key, (fingerprint, scores))
+        return scores
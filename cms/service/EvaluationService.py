@@ -47,20 +47,26 @@ from functools import wraps
 
 import gevent.lock
 from sqlalchemy import func
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
-from cms import ServiceCoord, get_service_shards
+from cms import ServiceCoord, config, get_service_shards
 from cms.io import Executor, TriggeredService, rpc_method
 from cms.db import SessionGen, Digest, Dataset, Evaluation, Submission, \
     SubmissionResult, Testcase, UserTest, UserTestResult, get_submissions, \
     get_submission_results, get_datasets_to_judge
 from cms.grading.Job import JobGroup
 
-from .esoperations import ESOperation, get_relevant_operations, \
+from cmscommon.datetime import monotonic_time
+
+from .esoperations import ESOperation, get_max_submission_id, \
+    get_max_user_test_id, get_relevant_operations, \
     get_submissions_operations, get_user_tests_operations, \
     submission_get_operations, submission_to_evaluate, \
     user_test_get_operations
+from .evaluationreuse import EvaluationReuser
+from .evaluationskip import EvaluationSkipper
 from .flushingdict import FlushingDict
+from .operationcost import OperationCostEstimator
 from .workerpool import WorkerPool
 
 
@@ -108,21 +114,58 @@ class EvaluationExecutor(Executor):
             item in self._currently_executing or \
             item in self.pool
 
+    def wait_for_capacity(self):
+        """Wait for a worker to be available.
+
+        This way the next batch is sized for the worker that will
+        receive it.
+
+        """
+        self.pool.wait_for_available_worker()
+
     def max_operations_per_batch(self):
         """Return the maximum number of operations per batch.
 
         We derive the number from the length of the queue divided by
-        the number of workers, with a cap at MAX_OPERATIONS_PER_BATCH.
+        the number of slots of the workers (a worker with many slots
+        counts as many workers), with a cap at
+        MAX_OPERATIONS_PER_BATCH, and multiply it by the slots of the
+        worker that will receive the batch.
 
         """
-        # TODO: len(self.pool) is the total number of workers,
-        # included those that are disabled.
-        ratio = len(self._operation_queue) // len(self.pool) + 1
+        # TODO: get_total_slots() counts all workers, included those
+        # that are disabled.
+        slots = self.pool.get_available_slots()
+        ratio = len(self._operation_queue) // self.pool.get_total_slots() + 1
         ret = min(max(ratio, 1), EvaluationExecutor.MAX_OPERATIONS_PER_BATCH)
+        ret *= slots
         logger.info("Ratio is %d, executing %d operations together.",
                     ratio, ret)
         return ret
 
+    def max_cost_per_batch(self):
+        """Return the maximum expected duration of a batch.
+
+        This is the job_group_target_duration in the configuration
+        (times the slots of the worker that will receive the batch,
+        since it executes that many operations at once), so that a
+        worker is not kept busy for too long by a single job group
+        while others are idle.
+
+        """
+        if config.job_group_target_duration is None:
+            return 0
+        return config.job_group_target_duration * \
+            self.pool.get_available_slots()
+
+    def operation_cost(self, item):
+        """Return the expected duration of an operation.
+
+        See OperationCostEstimator.cost.
+
+        """
+        return self.evaluation_service.cost_estimator.cost(item)
+
     def execute(self, entries):
         """Execute a batch of operations in the queue.
 
@@ -143,6 +186,7 @@ class EvaluationExecutor(Executor):
                 # re-enqueue it.
                 operation.side_data = (entry.priority, entry.timestamp)
                 self._currently_executing.append(operation)
+        self._reuse_evaluations()
         while len(self._currently_executing) > 0:
             self.pool.wait_for_workers()
             with self._current_execution_lock:
@@ -153,6 +197,32 @@ class EvaluationExecutor(Executor):
                     self._currently_executing = []
                     break
 
+    def _reuse_evaluations(self):
+        """Complete the operations that can reuse past evaluations.
+
+        Their results go directly to ES, without involving the
+        workers (see EvaluationReuser).
+
+        """
+        reuser = self.evaluation_service.evaluation_reuser
+        jobs = dict()
+        try:
+            with SessionGen() as session:
+                for operation in self._currently_executing:
+                    job = reuser.find(session, operation)
+                    if job is not None:
+                        jobs[operation] = job
+        except SQLAlchemyError:
+            logger.warning("Couldn't look for evaluations to reuse.",
+                           exc_info=True)
+        with self._current_execution_lock:
+            for operation, job in iteritems(jobs):
+                # The operation might have been dequeued meanwhile.
+                if operation in self._currently_executing:
+                    self._currently_executing.remove(operation)
+                    self.evaluation_service.result_cache.add(
+                        operation, Result(job, True))
+
     def dequeue(self, operation):
         """Remove an item from the queue.
 
@@ -218,6 +288,10 @@ class EvaluationService(TriggeredService):
     # How often we check if a worker is connected.
     WORKER_CONNECTION_CHECK_TIME = timedelta(seconds=10)
 
+    # How often the sweeper looks at all submissions and user tests,
+    # instead of only at those after the watermarks.
+    FULL_SWEEP_TIME = timedelta(seconds=1200)
+
     # How many worker results we accumulate before processing them.
     RESULT_CACHE_SIZE = 100
     # The maximum time since the last result before processing.
@@ -261,6 +335,30 @@ class EvaluationService(TriggeredService):
         self.scoring_service = self.connect_to(
             ServiceCoord("ScoringService", 0))
 
+        # Expected duration of the operations, used to send to the
+        # workers job groups of similar duration.
+        self.cost_estimator = OperationCostEstimator()
+        with SessionGen() as session:
+            self.cost_estimator.load(session, self.contest_id)
+
+        # Finds past evaluations that the datasets with
+        # reuse_evaluations set can use instead of executing them.
+        self.evaluation_reuser = EvaluationReuser()
+
+        # Skips the evaluations that cannot change the score, for the
+        # datasets with skip_failed_subtasks set.
+        self.evaluation_skipper = EvaluationSkipper()
+
+        # The sweeper looks for missing operations only among the
+        # submissions and user tests with ids at least as large as
+        # these watermarks (None means to look at all of them), and
+        # periodically does a full sweep anyway.
+        self._submission_watermark = None
+        self._user_test_watermark = None
+        self._last_full_sweep = None
+        self._full_sweep_requested = False
+        self._last_sweep_full = None
+
         self.add_executor(EvaluationExecutor(self))
         self.start_sweeper(117.0)
 
@@ -327,22 +425,111 @@ class EvaluationService(TriggeredService):
         evaluated for no good reasons. Put the missing operation in
         the queue.
 
+        Submissions and user tests before the watermarks are skipped,
+        except in a full sweep. After each sweep, the watermarks move
+        to the first object that still had operations to do or, if
+        none, past the last one.
+
         """
+        now = monotonic_time()
+        full = self._full_sweep_requested \
+            or self._submission_watermark is None \
+            or self._user_test_watermark is None \
+            or now - self._last_full_sweep \
+            >= EvaluationService.FULL_SWEEP_TIME.total_seconds()
+        if full:
+            min_submission_id, min_user_test_id = None, None
+            self._full_sweep_requested = False
+        else:
+            min_submission_id = self._submission_watermark
+            min_user_test_id = self._user_test_watermark
+
         counter = 0
         with SessionGen() as session:
-
-            for operation, timestamp, priority in \
-                    get_submissions_operations(session, self.contest_id):
+            # Read these first, so that objects created while the
+            # sweep is running are left after the watermarks.
+            max_submission_id = get_max_submission_id(
+                session, self.contest_id)
+            max_user_test_id = get_max_user_test_id(
+                session, self.contest_id)
+
+            submission_operations = get_submissions_operations(
+                session, self.contest_id, min_submission_id)
+            for operation, timestamp, priority in submission_operations:
                 if self.enqueue(operation, timestamp, priority):
                     counter += 1
 
-            for operation, timestamp, priority in \
-                    get_user_tests_operations(session, self.contest_id):
+            user_test_operations = get_user_tests_operations(
+                session, self.contest_id, min_user_test_id)
+            for operation, timestamp, priority in user_test_operations:
                 if self.enqueue(operation, timestamp, priority):
                     counter += 1
 
+        self._submission_watermark = self._next_watermark(
+            submission_operations, max_submission_id)
+        self._user_test_watermark = self._next_watermark(
+            user_test_operations, max_user_test_id)
+        if full:
+            self._last_full_sweep = now
+        self._last_sweep_full = full
+
         return counter
 
+    @staticmethod
+    def _next_watermark(operations, max_id):
+        """Compute where the next incremental sweep should start.
+
+        operations ([(ESOperation, int, datetime)]): the operations
+            found by the sweep, whether enqueued or not.
+        max_id (int|None): the largest id of the objects at the time
+            of the sweep, or None if there were none.
+
+        return (int): the smallest id that the next sweep must look at.
+
+        """
+        if len(operations) > 0:
+            return min(operation.object_id
+                       for operation, _, _ in operations)
+        elif max_id is not None:
+            return max_id + 1
+        else:
+            return 0
+
+    @rpc_method
+    def search_operations_not_done(self):
+        """Make the sweeper loop fire a full sweep as soon as possible.
+
+        A full sweep is needed as the caller may have changed old
+        submissions (e.g., by making a dataset autojudge).
+
+        """
+        self._full_sweep_requested = True
+        super(EvaluationService, self).search_operations_not_done()
+
+    @rpc_method
+    def sweeper_status(self):
+        """Return statistics on the sweeps done so far.
+
+        return ({}): see TriggeredService.sweeper_status; in addition,
+            whether the last sweep was a full one and the current
+            watermarks.
+
+        """
+        status = super(EvaluationService, self).sweeper_status()
+        status["last_full"] = self._last_sweep_full
+        status["submission_watermark"] = self._submission_watermark
+        status["user_test_watermark"] = self._user_test_watermark
+        return status
+
+    @rpc_method
+    def evaluation_reuse_status(self):
+        """Return how many evaluations were reused and executed.
+
+        return ({str: int}): see EvaluationReuser.get_stats.
+
+        """
+        return self.evaluation_reuser.get_stats()
+
     @rpc_method
     def workers_status(self):
         """Returns a dictionary (indexed by shard number) whose values
@@ -443,6 +630,9 @@ class EvaluationService(TriggeredService):
                 operation = job.operation
                 if job.success:
                     logger.info("`%s' succeeded.", operation)
+                    self.cost_estimator.update(operation, job)
+                    if operation.type_ == ESOperation.EVALUATION:
+                        self.evaluation_reuser.executed += 1
                 else:
                     logger.error("`%s' failed, see worker logs and (possibly) "
                                  "sandboxes at '%s'.",
@@ -508,6 +698,12 @@ class EvaluationService(TriggeredService):
             logger.info("Committing evaluations...")
             session.commit()
 
+            self.skip_evaluations(session, [
+                (object_id, dataset_id)
+                for type_, object_id, dataset_id
+                in iterkeys(by_object_and_type)
+                if type_ == ESOperation.EVALUATION])
+
             num_testcases_per_dataset = dict()
             for type_, object_id, dataset_id in iterkeys(by_object_and_type):
                 if type_ == ESOperation.EVALUATION:
@@ -550,6 +746,37 @@ class EvaluationService(TriggeredService):
 
         logger.info("Done")
 
+    def skip_evaluations(self, session, keys):
+        """Skip the evaluations that cannot change the score anymore.
+
+        See EvaluationSkipper. The operations of the skipped
+        evaluations are removed from the queue, if they are still
+        there.
+
+        session (Session): the DB session to use.
+        keys ([(int, int)]): the submission and dataset ids of the
+            results that received new evaluations.
+
+        """
+        to_dequeue = []
+        for submission_id, dataset_id in keys:
+            submission_result = SubmissionResult.get_from_id(
+                (submission_id, dataset_id), session)
+            if submission_result is None:
+                continue
+            to_dequeue += self.evaluation_skipper.skip(submission_result)
+        if len(to_dequeue) == 0:
+            return
+
+        logger.info("Committing skipped evaluations...")
+        session.commit()
+        for operation in to_dequeue:
+            try:
+                self.dequeue(operation)
+            except KeyError:
+                # Not in the queue (e.g., already sent to a worker).
+                pass
+
     def write_results_one_object_and_type(
             self, session, object_result, operation_results):
         """Write to the DB the results for one object and type.
@@ -599,6 +826,12 @@ class EvaluationService(TriggeredService):
 
         elif operation.type_ == ESOperation.EVALUATION:
             if result.job_success:
+                if any(evaluation.codename == operation.testcase_codename
+                       for evaluation in object_result.evaluations):
+                    # The evaluation was skipped while it was running.
+                    logger.info("`%s' already has an evaluation, result "
+                                "ignored.", operation)
+                    return
                 result.job.to_submission(object_result)
             else:
                 if result.job.plus is not None and \
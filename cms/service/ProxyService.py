@@ -38,6 +38,8 @@ from future.builtins import *  # noqa
 import json
 import logging
 import string
+import time
+import zlib
 from future.moves.urllib.parse import urljoin, urlsplit
 
 import gevent
@@ -45,6 +47,7 @@ import gevent.queue
 import requests
 import requests.exceptions
 from sqlalchemy import not_
+from sqlalchemy.orm import joinedload, subqueryload
 
 from cms import config
 from cms.io import Executor, QueueItem, TriggeredService, rpc_method
@@ -76,7 +79,20 @@ def encode_id(entity_id):
     return encoded_id
 
 
-def safe_put_data(ranking, resource, data, operation):
+def gzip_compress(data):
+    """Compress data in the gzip format.
+
+    data (bytes): the data to compress.
+
+    return (bytes): the compressed data.
+
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def safe_put_data(ranking, resource, data, operation, session=None,
+                  compress=False):
     """Send some data to ranking using a PUT request.
 
     ranking (bytes): the URL of ranking server.
@@ -84,19 +100,33 @@ def safe_put_data(ranking, resource, data, operation):
     data (dict): the data to JSON-encode and send.
     operation (unicode): a human-readable description of the operation
         we're performing (to produce log messages).
+    session (requests.Session|None): the session to send the request
+        with, reusing its open connections; if None, a new connection
+        is opened.
+    compress (bool): whether to send the data gzip-compressed.
+
+    return ((int, int)): the size in bytes of the JSON-encoded data
+        and of the body of the request actually sent.
 
     raise (CannotSendError): in case of communication errors.
 
     """
+    body = json.dumps(data).encode("utf-8")
+    size = len(body)
+    headers = {'content-type': 'application/json'}
+    if compress:
+        body = gzip_compress(body)
+        headers['content-encoding'] = 'gzip'
     try:
         url = urljoin(ranking, resource)
         # XXX With requests-1.2 auth is automatically extracted from
         # the URL: there is no need for this.
         auth = urlsplit(url)
-        res = requests.put(url, json.dumps(data),
-                           auth=(auth.username, auth.password),
-                           headers={'content-type': 'application/json'},
-                           verify=config.https_certfile)
+        res = (session if session is not None else requests).put(
+            url, body,
+            auth=(auth.username, auth.password),
+            headers=headers,
+            verify=config.https_certfile)
     except requests.exceptions.RequestException as error:
         msg = "%s while %s: %s." % (type(error).__name__, operation, error)
         logger.warning(msg)
@@ -105,6 +135,7 @@ def safe_put_data(ranking, resource, data, operation):
         msg = "Status %s while %s." % (res.status_code, operation)
         logger.warning(msg)
         raise CannotSendError(msg)
+    return size, len(body)
 
 
 class ProxyOperation(QueueItem):
@@ -173,6 +204,59 @@ class ProxyExecutor(Executor):
         super(ProxyExecutor, self).__init__(batch_executions=True)
 
         self._ranking = ranking
+        # A single session keeps the connections to the ranking alive
+        # (and their TLS handshakes done) between requests.
+        self._session = requests.Session()
+
+        # Statistics on the requests sent to the ranking.
+        self._stats = {
+            "requests": 0,
+            "failures": 0,
+            "bytes": 0,
+            "bytes_sent": 0,
+            "time": 0.0,
+        }
+
+    def get_stats(self):
+        """Return statistics on the requests sent to the ranking.
+
+        return ({str: object}): the URL of the ranking (without the
+            credentials); the number of requests sent and of those
+            failed; the total size in bytes of the data sent and of
+            the (possibly compressed) request bodies; the total and
+            the average duration of the requests, in seconds.
+
+        """
+        url = urlsplit(self._ranking)
+        stats = dict(self._stats)
+        stats["ranking"] = "%s://%s%s" % (
+            url.scheme, url.netloc.rpartition("@")[2], url.path)
+        stats["average_time"] = \
+            stats["time"] / stats["requests"] \
+            if stats["requests"] > 0 else None
+        return stats
+
+    def _put_data(self, resource, data, operation):
+        """Send data to the ranking, accounting for it in the stats.
+
+        See safe_put_data for the arguments.
+
+        raise (CannotSendError): in case of communication errors.
+
+        """
+        self._stats["requests"] += 1
+        start = time.time()
+        try:
+            size, size_sent = safe_put_data(
+                self._ranking, resource, data, operation,
+                session=self._session, compress=config.rankings_gzip)
+        except CannotSendError:
+            self._stats["failures"] += 1
+            raise
+        finally:
+            self._stats["time"] += time.time() - start
+        self._stats["bytes"] += size
+        self._stats["bytes_sent"] += size_sent
 
     def execute(self, entries):
         """Consume (i.e. send) the data put in the queue, forever.
@@ -210,8 +294,7 @@ class ProxyExecutor(Executor):
                                                               self._ranking)
 
                     logger.debug(operation.capitalize())
-                    safe_put_data(
-                        self._ranking, "%s/" % name, data[i], operation)
+                    self._put_data("%s/" % name, data[i], operation)
                     data[i].clear()
 
         except CannotSendError:
@@ -449,6 +532,16 @@ class ProxyService(TriggeredService):
         logger.info("Reinitializing rankings.")
         self.initialize()
 
+    @rpc_method
+    def rankings_status(self):
+        """Return statistics on the data sent to each ranking.
+
+        return ([{str: object}]): for each ranking, see
+            ProxyExecutor.get_stats.
+
+        """
+        return [executor.get_stats() for executor in self._executors]
+
     @rpc_method
     def submission_scored(self, submission_id):
         """Notice that a submission has been scored.
@@ -469,21 +562,59 @@ class ProxyService(TriggeredService):
                              "unexistent submission id %s.", submission_id)
                 raise KeyError("Submission not found.")
 
-            if submission.participation.hidden:
-                logger.info("[submission_scored] Score for submission %d "
-                            "not sent because the participation is hidden.",
-                            submission_id)
-                return
+            self._send_score(submission)
 
-            if not submission.official:
-                logger.info("[submission_scored] Score for submission %d "
-                            "not sent because the submission is not official.",
-                            submission_id)
-                return
+    @rpc_method
+    def submissions_scored(self, submission_ids):
+        """Notice that some submissions have been scored.
 
-            # Update RWS.
-            for operation in self.operations_for_score(submission):
-                self.enqueue(operation)
+        The same as submission_scored, for many submissions at once:
+        usually called by ScoringService when it's done with a batch of
+        submission results.
+
+        submission_ids ([int]): the ids of the submissions that
+            changed.
+
+        """
+        with SessionGen() as session:
+            submissions = session.query(Submission)\
+                .filter(Submission.id.in_(submission_ids))\
+                .options(joinedload(Submission.participation)
+                         .joinedload(Participation.user))\
+                .options(joinedload(Submission.task))\
+                .options(subqueryload(Submission.results))\
+                .all()
+
+            missing = set(submission_ids) - set(s.id for s in submissions)
+            if len(missing) > 0:
+                logger.error("[submissions_scored] Received score request for "
+                             "unexistent submission ids %s.",
+                             ", ".join("%s" % i for i in sorted(missing)))
+
+            for submission in submissions:
+                self._send_score(submission)
+
+    def _send_score(self, submission):
+        """Send the score of a submission to the rankings, if needed.
+
+        submission (Submission): the submission that has been scored.
+
+        """
+        if submission.participation.hidden:
+            logger.info("[submission_scored] Score for submission %d "
+                        "not sent because the participation is hidden.",
+                        submission.id)
+            return
+
+        if not submission.official:
+            logger.info("[submission_scored] Score for submission %d "
+                        "not sent because the submission is not official.",
+                        submission.id)
+            return
+
+        # Update RWS.
+        for operation in self.operations_for_score(submission):
+            self.enqueue(operation)
 
     @rpc_method
     def submission_tokened(self, submission_id):
@@ -35,9 +35,13 @@ from future.builtins import *  # noqa
 
 import logging
 
+from sqlalchemy.orm import joinedload
+
 from cms import ServiceCoord, config
 from cms.io import Executor, TriggeredService, rpc_method
-from cms.db import SessionGen, Submission, Dataset, get_submission_results
+from cms.db import SessionGen, Submission, Dataset, SubmissionResult, \
+    Evaluation, get_submission_results
+from cms.grading.scoring import update_task_scores
 
 from cmscommon.datetime import make_datetime
 
@@ -49,77 +53,135 @@ logger = logging.getLogger(__name__)
 
 class ScoringExecutor(Executor):
     def __init__(self, proxy_service):
-        super(ScoringExecutor, self).__init__()
+        super(ScoringExecutor, self).__init__(batch_executions=True)
         self.proxy_service = proxy_service
 
-    def execute(self, entry):
-        """Assign a score to a submission result.
+    def max_operations_per_batch(self):
+        """See Executor.max_operations_per_batch."""
+        return config.scoring_batch_size
+
+    @staticmethod
+    def _load_results(session, operations):
+        """Load the submission results needed by some operations.
+
+        The results are loaded with their submissions, tasks and
+        evaluations, and the datasets with their testcases, with two
+        queries for all operations.
+
+        session (Session): the database session to use.
+        operations ([ScoringOperation]): the operations.
 
-        This is the core of ScoringService: here we retrieve the result
-        from the database, check if it is in the correct status,
-        instantiate its ScoreType, compute its score, store it back in
-        the database and tell ProxyService to update RWS if needed.
+        return ({(int, int): SubmissionResult}): the results, indexed
+            by submission and dataset id.
 
-        entry (QueueEntry): entry containing the operation to perform.
+        """
+        submission_ids = set(op.submission_id for op in operations)
+        dataset_ids = set(op.dataset_id for op in operations)
+        session.query(Dataset)\
+            .filter(Dataset.id.in_(dataset_ids))\
+            .options(joinedload(Dataset.testcases))\
+            .all()
+        submission_results = session.query(SubmissionResult)\
+            .filter(SubmissionResult.submission_id.in_(submission_ids))\
+            .filter(SubmissionResult.dataset_id.in_(dataset_ids))\
+            .options(joinedload(SubmissionResult.submission)
+                     .joinedload(Submission.task))\
+            .options(joinedload(SubmissionResult.evaluations)
+                     .joinedload(Evaluation.testcase))\
+            .all()
+        return dict(((sr.submission_id, sr.dataset_id), sr)
+                    for sr in submission_results)
+
+    def execute(self, entries):
+        """Assign a score to some submission results.
+
+        This is the core of ScoringService: here we retrieve the
+        results from the database, check if they are in the correct
+        status, instantiate their ScoreType, compute their score, store
+        them back in the database (all in one transaction) and tell
+        ProxyService to update RWS if needed. A failure with a result
+        is logged and does not prevent scoring the others.
+
+        entries ([QueueEntry]): entries containing the operations to
+            perform.
 
         """
-        operation = entry.item
+        operations = [entry.item for entry in entries]
+        scored_submission_ids = []
+        scored_pairs = set()
         with SessionGen() as session:
-            # Obtain submission.
-            submission = Submission.get_from_id(operation.submission_id,
-                                                session)
-            if submission is None:
-                raise ValueError("Submission %d not found in the database." %
-                                 operation.submission_id)
-
-            # Obtain dataset.
-            dataset = Dataset.get_from_id(operation.dataset_id, session)
-            if dataset is None:
-                raise ValueError("Dataset %d not found in the database." %
-                                 operation.dataset_id)
+            submission_results = self._load_results(session, operations)
 
-            # Obtain submission result.
-            submission_result = submission.get_result(dataset)
-
-            # It means it was not even compiled (for some reason).
-            if submission_result is None:
-                raise ValueError("Submission result %d(%d) was not found." %
-                                 (operation.submission_id,
-                                  operation.dataset_id))
-
-            # Check if it's ready to be scored.
-            if not submission_result.needs_scoring():
-                if submission_result.scored():
-                    logger.info("Submission result %d(%d) is already scored.",
-                                operation.submission_id, operation.dataset_id)
-                    return
-                else:
-                    raise ValueError("The state of the submission result "
-                                     "%d(%d) doesn't allow scoring." %
-                                     (operation.submission_id,
-                                      operation.dataset_id))
-
-            # Instantiate the score type.
-            score_type = dataset.score_type_object
-
-            # Compute score and fill it in the database.
-            submission_result.score, \
-                submission_result.score_details, \
-                submission_result.public_score, \
-                submission_result.public_score_details, \
-                submission_result.ranking_score_details = \
-                score_type.compute_score(submission_result)
-
-            # Store it.
+            for operation in operations:
+                submission_result = submission_results.get(
+                    (operation.submission_id, operation.dataset_id))
+
+                # It means it was not even compiled (for some reason).
+                if submission_result is None:
+                    logger.error("Submission result %d(%d) was not found.",
+                                 operation.submission_id,
+                                 operation.dataset_id)
+                    continue
+
+                # Check if it's ready to be scored.
+                if not submission_result.needs_scoring():
+                    if submission_result.scored():
+                        logger.info("Submission result %d(%d) is already "
+                                    "scored.", operation.submission_id,
+                                    operation.dataset_id)
+                    else:
+                        logger.error("The state of the submission result "
+                                     "%d(%d) doesn't allow scoring.",
+                                     operation.submission_id,
+                                     operation.dataset_id)
+                    continue
+
+                # Instantiate the score type and compute the score.
+                try:
+                    score_type = submission_result.dataset.score_type_object
+                    score = score_type.compute_score(submission_result)
+                except Exception:
+                    logger.error("Unexpected error when scoring submission "
+                                 "result %d(%d).", operation.submission_id,
+                                 operation.dataset_id, exc_info=True)
+                    continue
+
+                # Fill it in the database.
+                submission_result.score, \
+                    submission_result.score_details, \
+                    submission_result.public_score, \
+                    submission_result.public_score_details, \
+                    submission_result.ranking_score_details = score
+
+                # If dataset is the active one, RWS will be updated.
+                submission = submission_result.submission
+                if submission_result.dataset is submission.task.active_dataset:
+                    logger.info(
+                        "Submission scored %.1f seconds after submission",
+                        (make_datetime() -
+                         submission.timestamp).total_seconds())
+                    scored_submission_ids.append(submission.id)
+                    scored_pairs.add(
+                        (submission.participation_id, submission.task_id))
+
+            # Store them.
             session.commit()
 
-            # If dataset is the active one, update RWS.
-            if dataset is submission.task.active_dataset:
-                logger.info(
-                    "Submission scored %.1f seconds after submission",
-                    (make_datetime() - submission.timestamp).total_seconds())
-                self.proxy_service.submission_scored(
-                    submission_id=submission.id)
+            # Keep the materialized scores of the participations on the
+            # tasks up to date; they are only a cache for the rankings,
+            # so a failure here must not affect the scoring.
+            if len(scored_pairs) > 0:
+                try:
+                    update_task_scores(session, scored_pairs)
+                    session.commit()
+                except Exception:
+                    logger.error("Unexpected error when updating the task "
+                                 "scores.", exc_info=True)
+                    session.rollback()
+
+        if len(scored_submission_ids) > 0:
+            self.proxy_service.submissions_scored(
+                submission_ids=scored_submission_ids)
 
 
 class ScoringService(TriggeredService):
@@ -35,14 +35,20 @@ from future.builtins import *  # noqa
 import logging
 import time
 
+import gevent
 import gevent.lock
+import gevent.queue
 
+from cms import config
 from cms.io import Service, rpc_method
+from cmscommon.binary import bin_to_b64
 from cms.db import SessionGen, Contest, enumerate_files
 from cms.db.filecacher import FileCacher, TombstoneError
 from cms.grading import JobException
 from cms.grading.tasktypes import get_task_type
 from cms.grading.Job import CompilationJob, EvaluationJob, JobGroup
+from cms.grading.Sandbox import SandboxPool, get_available_cpus
+from cms.grading.tasktypes.util import set_sandbox_pool
 
 
 logger = logging.getLogger(__name__)
@@ -59,9 +65,17 @@ class Worker(Service):
     JOB_TYPE_COMPILATION = "compile"
     JOB_TYPE_EVALUATION = "evaluate"
 
+    # Number of files requested together to the backend by
+    # precache_files.
+    PRECACHE_BATCH_SIZE = 100
+    # Maximum number of bytes of a file sent to another Worker in a
+    # single call of get_cached_file_chunk.
+    MAX_CHUNK_SIZE = 2 ** 22
+
     def __init__(self, shard, fake_worker_time=None):
         Service.__init__(self, shard)
-        self.file_cacher = FileCacher(self)
+        self.file_cacher = FileCacher(
+            self, peers=config.fetch_files_from_peers)
 
         self.work_lock = gevent.lock.RLock()
         self._last_end_time = None
@@ -71,10 +85,47 @@ class Worker(Service):
 
         self._fake_worker_time = fake_worker_time
 
+        # The progress of the last precaching (see precache_status).
+        self._precache_status = None
+
+        # Number of jobs of a group executed at the same time, each in
+        # its own slot, and the times each slot has been busy or free
+        # (see _finalize_slot).
+        self.slots = max(config.worker_slots, 1)
+        self._slot_stats = [{"last_end_time": None,
+                             "total_busy_time": 0.0,
+                             "total_free_time": 0.0,
+                             "number_execution": 0}
+                            for _ in range(self.slots)]
+
+        # The pool of isolate boxes used by the task types (see
+        # sandbox_pool_status). With more than one slot, the sandboxes
+        # are pinned to different CPUs, so that concurrent jobs do not
+        # compete for the same one.
+        self.sandbox_pool = None
+        if config.sandbox_implementation == "isolate" \
+                and config.sandbox_pool_size > 0:
+            cpus = None
+            if self.slots > 1:
+                cpus = get_available_cpus()
+                if cpus is None:
+                    logger.warning("Cannot pin the sandboxes to CPUs.")
+                elif len(cpus) < self.slots:
+                    logger.warning("Only %d CPUs available for %d slots.",
+                                   len(cpus), self.slots)
+            self.sandbox_pool = SandboxPool(
+                shard, config.sandbox_pool_size * self.slots, cpus=cpus)
+        set_sandbox_pool(self.sandbox_pool)
+
     @rpc_method
     def precache_files(self, contest_id):
         """RPC to ask the worker to precache of files in the contest.
 
+        Only the files missing from the local cache are loaded, in
+        batches, starting from those of the active datasets. An
+        ongoing precaching is stopped, as the new one will take care
+        of the files it had not loaded yet.
+
         contest_id (int): the id of the contest
 
         """
@@ -87,20 +138,158 @@ class Worker(Service):
             contest = Contest.get_from_id(contest_id, session)
             files = enumerate_files(session, contest, skip_submissions=True,
                                     skip_user_tests=True, skip_print_jobs=True)
-        for digest in files:
+            active_files = enumerate_files(
+                session, contest, skip_submissions=True,
+                skip_user_tests=True, skip_print_jobs=True,
+                skip_inactive_datasets=True)
+        digests = [digest for digest in
+                   sorted(active_files) + sorted(files - active_files)
+                   if not self.file_cacher.is_cached(digest)]
+
+        # An ongoing precaching notices it was superseded when the
+        # status is replaced.
+        status = {
+            "contest_id": contest_id,
+            "total": len(digests),
+            "loaded": 0,
+            "missing": 0,
+            "failed": 0,
+            "start_time": time.time(),
+            "end_time": None,
+        }
+        self._precache_status = status
+
+        # Files are requested to the backend in batches, to cut the
+        # overhead of many small queries while keeping track of the
+        # progress.
+        for i in range(0, len(digests), self.PRECACHE_BATCH_SIZE):
+            if self._precache_status is not status:
+                logger.info("Precaching interrupted.")
+                return
+            batch = digests[i:i + self.PRECACHE_BATCH_SIZE]
             try:
-                self.file_cacher.load(digest, if_needed=True)
-            except KeyError:
-                # No problem (at this stage) if we cannot find the
-                # file
-                pass
-
+                missing = self.file_cacher.load_many(
+                    batch, if_needed=True,
+                    concurrency=config.precache_concurrency)
+            except Exception:
+                # No problem (at this stage) if we cannot load some
+                # files.
+                logger.warning("Failed to precache some files.",
+                               exc_info=True)
+                status["failed"] += len(batch)
+                continue
+            status["missing"] += len(missing)
+            status["loaded"] += len(batch) - len(missing)
+
+        status["end_time"] = time.time()
         logger.info("Precaching finished.")
 
+    @rpc_method
+    def precache_status(self):
+        """Return the progress of the last precaching.
+
+        return ({}|None): None if no precaching was ever requested,
+            otherwise a dictionary with the contest id, the number of
+            files to load and of those already loaded, missing from
+            the backend or failed to load, the elapsed time and the
+            estimated remaining time (None if unknown yet), both in
+            seconds.
+
+        """
+        if self._precache_status is None:
+            return None
+        status = dict(self._precache_status)
+        done = status["loaded"] + status["missing"] + status["failed"]
+        end_time = status["end_time"]
+        if end_time is None:
+            end_time = time.time()
+        status["elapsed"] = end_time - status["start_time"]
+        if status["end_time"] is not None:
+            status["eta"] = 0.0
+        elif done > 0:
+            status["eta"] = \
+                status["elapsed"] / done * (status["total"] - done)
+        else:
+            status["eta"] = None
+        return status
+
+    @rpc_method
+    def cache_status(self):
+        """Return statistics on the local file cache.
+
+        return ({}): see FileCacher.get_cache_status.
+
+        """
+        return self.file_cacher.get_cache_status()
+
+    @rpc_method
+    def get_slots(self):
+        """Return how many jobs this worker executes at the same time.
+
+        return (int): the number of slots.
+
+        """
+        return self.slots
+
+    @rpc_method
+    def sandbox_pool_status(self):
+        """Return statistics on the pool of sandboxes.
+
+        return ({}|None): see SandboxPool.get_stats, or None if the
+            pool is not used.
+
+        """
+        if self.sandbox_pool is None:
+            return None
+        return self.sandbox_pool.get_stats()
+
+    @rpc_method
+    def get_cached_digests(self, digests):
+        """Tell which files are in the local cache.
+
+        Used by the other Workers to fetch files from us instead of
+        from the database.
+
+        digests ([unicode]): the digests of some files.
+
+        return ([unicode]): the digests of those in the local cache.
+
+        """
+        return [digest for digest in digests
+                if self.file_cacher.is_cached(digest)]
+
+    @rpc_method
+    def get_cached_file_chunk(self, digest, offset, size):
+        """Return a piece of a file in the local cache.
+
+        digest (unicode): the digest of the file.
+        offset (int): the position of the first byte to return.
+        size (int): the maximum number of bytes to return, at most
+            MAX_CHUNK_SIZE.
+
+        return (unicode|None): the requested bytes, base64-encoded (an
+            empty string at the end of the file), or None if the file
+            is not in the local cache.
+
+        raise (ValueError): if offset or size are not valid.
+
+        """
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError("Invalid offset.")
+        if not isinstance(size, int) or not 0 <= size <= self.MAX_CHUNK_SIZE:
+            raise ValueError("Invalid size.")
+        try:
+            fobj = self.file_cacher.get_cached_file(digest)
+        except KeyError:
+            return None
+        with fobj:
+            fobj.seek(offset)
+            return bin_to_b64(fobj.read(size))
+
     @rpc_method
     def execute_job_group(self, job_group_dict):
-        """Receive a group of jobs in a list format and executes them one by
-        one.
+        """Receive a group of jobs in a list format and executes them,
+        at most as many at the same time as the slots of the worker.
 
         job_group_dict ({}): a JobGroup exported to dict.
 
@@ -114,26 +303,11 @@ class Worker(Service):
         if self.work_lock.acquire(False):
             try:
                 logger.info("Starting job group.")
-                for job in job_group.jobs:
-                    logger.info("Starting job.",
-                                extra={"operation": job.info})
-
-                    job.shard = self.shard
-
-                    if self._fake_worker_time is None:
-                        task_type = get_task_type(job.task_type,
-                                                  job.task_type_parameters)
-                        try:
-                            task_type.execute_job(job, self.file_cacher)
-                        except TombstoneError:
-                            job.success = False
-                            job.plus = {"tombstone": True}
-                    else:
-                        self._fake_work(job)
-
-                    logger.info("Finished job.",
-                                extra={"operation": job.info})
-
+                if self.slots == 1:
+                    for job in job_group.jobs:
+                        self._execute_job(job)
+                else:
+                    self._execute_jobs_in_slots(job_group.jobs)
                 logger.info("Finished job group.")
                 return job_group.export_to_dict()
 
@@ -155,6 +329,67 @@ class Worker(Service):
             self._finalize(start_time)
             raise JobException(err_msg)
 
+    def _execute_job(self, job):
+        """Execute a single job, filling in its results.
+
+        job (Job): the job to execute.
+
+        """
+        logger.info("Starting job.",
+                    extra={"operation": job.info})
+
+        job.shard = self.shard
+
+        if self._fake_worker_time is None:
+            task_type = get_task_type(job.task_type,
+                                      job.task_type_parameters)
+            try:
+                task_type.execute_job(job, self.file_cacher)
+            except TombstoneError:
+                job.success = False
+                job.plus = {"tombstone": True}
+            finally:
+                # Take back the boxes of the sandboxes that the task
+                # type did not delete, e.g. because it raised.
+                if self.sandbox_pool is not None:
+                    self.sandbox_pool.release_leaked()
+        else:
+            self._fake_work(job)
+
+        logger.info("Finished job.",
+                    extra={"operation": job.info})
+
+    def _execute_jobs_in_slots(self, jobs):
+        """Execute jobs concurrently, each in a free slot.
+
+        Jobs start in order as soon as a slot is free. All jobs are
+        executed even if some fail.
+
+        jobs ([Job]): the jobs to execute.
+
+        raise (Exception): the error of the first job that failed, if
+            any.
+
+        """
+        free_slots = gevent.queue.Queue()
+        for slot in range(self.slots):
+            free_slots.put(slot)
+
+        def execute_in_slot(job):
+            slot = free_slots.get()
+            start_time = time.time()
+            try:
+                self._execute_job(job)
+            finally:
+                self._finalize_slot(slot, start_time)
+                free_slots.put(slot)
+
+        greenlets = [gevent.spawn(execute_in_slot, job) for job in jobs]
+        gevent.joinall(greenlets)
+        for greenlet in greenlets:
+            if greenlet.exception is not None:
+                raise greenlet.exception
+
     def _fake_work(self, job):
         """Fill the job with fake success data after waiting for some time."""
         time.sleep(self._fake_worker_time)
@@ -192,3 +427,32 @@ class Worker(Service):
                     "busyness is %.1lf%%; avg free time is %.3lf "
                     "avg busy time is %.3lf ",
                     busy_time, free_time, ratio, avg_free_time, avg_busy_time)
+
+    def _finalize_slot(self, slot, start_time):
+        """Account for a job executed in a slot, as _finalize does
+        for the whole worker.
+
+        slot (int): the slot.
+        start_time (float): when the job started.
+
+        """
+        stats = self._slot_stats[slot]
+        end_time = time.time()
+        busy_time = end_time - start_time
+        free_time = 0.0
+        if stats["last_end_time"] is not None:
+            free_time = max(start_time - stats["last_end_time"], 0.0)
+        stats["last_end_time"] = end_time
+        stats["total_busy_time"] += busy_time
+        stats["total_free_time"] += free_time
+        total_time = stats["total_busy_time"] + stats["total_free_time"]
+        ratio = 100.0
+        if total_time > 0:
+            ratio = stats["total_busy_time"] * 100.0 / total_time
+        stats["number_execution"] += 1
+        logger.info("Slot %d executed in %.3lf after free for %.3lf; "
+                    "busyness is %.1lf%%; avg free time is %.3lf "
+                    "avg busy time is %.3lf ",
+                    slot, busy_time, free_time, ratio,
+                    stats["total_free_time"] / stats["number_execution"],
+                    stats["total_busy_time"] / stats["number_execution"])
@@ -37,7 +37,7 @@ from six import iterkeys
 
 import logging
 
-from sqlalchemy import case, literal
+from sqlalchemy import case, func, literal
 
 from cms.io import PriorityQueue, QueueItem
 from cms.db import Dataset, Evaluation, Submission, SubmissionResult, \
@@ -292,12 +292,33 @@ def get_relevant_operations(level, submissions, dataset_id=None):
     return operations
 
 
-def get_submissions_operations(session, contest_id=None):
+def get_max_submission_id(session, contest_id=None):
+    """Return the largest id of the submissions in the contest.
+
+    session (Session): the database session to use.
+    contest_id (int|None): the contest to look into. If none, look at
+        the submissions of any contest.
+
+    return (int|None): the largest id, or None if there are no
+        submissions.
+
+    """
+    query = session.query(func.max(Submission.id))
+    if contest_id is not None:
+        query = query.join(Submission.task)\
+            .filter(Task.contest_id == contest_id)
+    return query.scalar()
+
+
+def get_submissions_operations(session, contest_id=None,
+                               min_submission_id=None):
     """Return all the operations to do for submissions in the contest.
 
     session (Session): the database session to use.
     contest_id (int|None): the contest for which we want the operations.
         If none, get operations for any contest.
+    min_submission_id (int|None): if given, only look at the
+        submissions with an id at least this large.
 
     return ([ESOperation, float, int]): a list of operation, timestamp
         and priority.
@@ -309,6 +330,8 @@ def get_submissions_operations(session, contest_id=None):
         contest_filter = literal(True)
     else:
         contest_filter = Task.contest_id == contest_id
+    if min_submission_id is not None:
+        contest_filter &= Submission.id >= min_submission_id
 
     # Retrieve the compilation operations for all submissions without
     # the corresponding result for a dataset to judge. Since we have
@@ -399,12 +422,33 @@ def get_submissions_operations(session, contest_id=None):
     return operations
 
 
-def get_user_tests_operations(session, contest_id=None):
+def get_max_user_test_id(session, contest_id=None):
+    """Return the largest id of the user tests in the contest.
+
+    session (Session): the database session to use.
+    contest_id (int|None): the contest to look into. If none, look at
+        the user tests of any contest.
+
+    return (int|None): the largest id, or None if there are no user
+        tests.
+
+    """
+    query = session.query(func.max(UserTest.id))
+    if contest_id is not None:
+        query = query.join(UserTest.task)\
+            .filter(Task.contest_id == contest_id)
+    return query.scalar()
+
+
+def get_user_tests_operations(session, contest_id=None,
+                              min_user_test_id=None):
     """Return all the operations to do for user tests in the contest.
 
     session (Session): the database session to use.
     contest_id (int|None): the contest for which we want the operations.
         If none, get operations for any contest.
+    min_user_test_id (int|None): if given, only look at the user tests
+        with an id at least this large.
 
     return ([ESOperation, float, int]): a list of operation, timestamp
         and priority.
@@ -416,6 +460,8 @@ def get_user_tests_operations(session, contest_id=None):
         contest_filter = literal(True)
     else:
         contest_filter = Task.contest_id == contest_id
+    if min_user_test_id is not None:
+        contest_filter &= UserTest.id >= min_user_test_id
 
     # Retrieve the compilation operations for all user tests without
     # the corresponding result for a dataset to judge. Since we have
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Reuse of past evaluations in EvaluationService.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+from six import iteritems, itervalues
+
+import logging
+
+from cms import config
+from cms.db import Dataset, Evaluation, Executable, File, Submission, \
+    Testcase
+from cms.grading.Job import EvaluationJob
+from cms.grading.tasktypes import get_task_type_class
+
+from .esoperations import ESOperation
+from .evaluationskip import is_skipped
+
+
+logger = logging.getLogger(__name__)
+
+
+def _digests(objects):
+    """Return the digest of each file-like object in a dict.
+
+    objects ({str: File|Executable|Manager}): the objects.
+
+    return ({str: str}): the digest of each object.
+
+    """
+    return dict((filename, obj.digest) for filename, obj in iteritems(objects))
+
+
+class EvaluationReuser(object):
+    """Find past evaluations that can stand in for evaluations to do.
+
+    An evaluation of a submission on a testcase of a dataset with
+    reuse_evaluations set can reuse the outcome of an evaluation, of
+    any submission on any dataset of the same task (unless that
+    evaluation was skipped), if all the following are the same: the
+    submitted files, the executables, the language, the input and
+    output of the testcase, the task type and its parameters, and the
+    managers. Moreover, the task type must be
+    deterministic, and the limits of the past evaluation must be the
+    same, or tighter but with the past usage far enough (by
+    evaluation_reuse_margin) from them that they did not matter.
+
+    """
+
+    # Maximum number of candidates examined for each evaluation.
+    MAX_CANDIDATES = 10
+
+    def __init__(self):
+        # Number of evaluations reused and executed by the Workers.
+        self.reused = 0
+        self.executed = 0
+
+    @staticmethod
+    def _limit_allows_reuse(old_limit, new_limit, usages):
+        """Return whether a past usage under a limit holds for a new one.
+
+        old_limit (float|int|None): the limit of the past evaluation,
+            None for no limit.
+        new_limit (float|int|None): the limit of the evaluation to do.
+        usages ([float|int|None]): the resources used by the past
+            evaluation, None if unknown.
+
+        return (bool): whether the outcome is the same under both
+            limits.
+
+        """
+        if old_limit == new_limit:
+            return True
+        # Tighter limits may change the outcome.
+        if old_limit is None or \
+                (new_limit is not None and new_limit < old_limit):
+            return False
+        # Looser limits change the outcome only if the past
+        # evaluation hit the limit.
+        threshold = old_limit * (1.0 - config.evaluation_reuse_margin)
+        return all(usage is not None and usage <= threshold
+                   for usage in usages)
+
+    def _can_reuse(self, evaluation, submission, submission_result,
+                   dataset):
+        """Return whether a past evaluation can stand in for a new one.
+
+        evaluation (Evaluation): a past evaluation, on a testcase with
+            the same input and output as the new one.
+        submission (Submission): the submission to evaluate.
+        submission_result (SubmissionResult): its result on dataset.
+        dataset (Dataset): the dataset of the new evaluation.
+
+        return (bool): whether the outcome can be reused.
+
+        """
+        old_submission = evaluation.submission
+        old_dataset = evaluation.dataset
+        old_submission_result = evaluation.submission_result
+        return (
+            not is_skipped(evaluation) and
+            old_submission.language == submission.language and
+            old_dataset.task_type == dataset.task_type and
+            old_dataset.task_type_parameters ==
+            dataset.task_type_parameters and
+            _digests(old_dataset.managers) == _digests(dataset.managers) and
+            _digests(old_submission.files) == _digests(submission.files) and
+            _digests(old_submission_result.executables) ==
+            _digests(submission_result.executables) and
+            self._limit_allows_reuse(
+                old_dataset.time_limit, dataset.time_limit,
+                [evaluation.execution_time,
+                 evaluation.execution_wall_clock_time]) and
+            self._limit_allows_reuse(
+                old_dataset.memory_limit, dataset.memory_limit,
+                [evaluation.execution_memory]))
+
+    def find(self, session, operation):
+        """Return a job with the outcome of a reusable evaluation.
+
+        session (Session): the database session to use.
+        operation (ESOperation): an operation to do.
+
+        return (EvaluationJob|None): a successful job for the
+            operation, with the outcome of a past evaluation, or None
+            if the operation cannot reuse any.
+
+        """
+        if operation.type_ != ESOperation.EVALUATION:
+            return None
+        dataset = Dataset.get_from_id(operation.dataset_id, session)
+        if dataset is None or not dataset.reuse_evaluations:
+            return None
+        try:
+            task_type_class = get_task_type_class(dataset.task_type)
+        except KeyError:
+            return None
+        if not task_type_class.DETERMINISTIC_EVALUATION:
+            return None
+        submission = Submission.get_from_id(operation.object_id, session)
+        testcase = dataset.testcases.get(operation.testcase_codename)
+        if submission is None or testcase is None:
+            return None
+        submission_result = submission.get_result(dataset)
+        if submission_result is None or len(submission.files) == 0:
+            return None
+
+        # Narrow down the candidates with the database, using one
+        # executable (or file) as representative of all of them.
+        query = session.query(Evaluation)\
+            .join(Evaluation.testcase)\
+            .join(Dataset, Evaluation.dataset_id == Dataset.id)\
+            .filter(Testcase.input == testcase.input)\
+            .filter(Testcase.output == testcase.output)\
+            .filter(Dataset.task_id == dataset.task_id)\
+            .filter(Dataset.task_type == dataset.task_type)
+        if len(submission_result.executables) > 0:
+            executable = next(itervalues(submission_result.executables))
+            query = query.join(Executable, (
+                (Executable.submission_id == Evaluation.submission_id) &
+                (Executable.dataset_id == Evaluation.dataset_id)))\
+                .filter(Executable.filename == executable.filename)\
+                .filter(Executable.digest == executable.digest)
+        else:
+            file_ = next(itervalues(submission.files))
+            query = query.join(
+                File, File.submission_id == Evaluation.submission_id)\
+                .filter(File.filename == file_.filename)\
+                .filter(File.digest == file_.digest)
+        candidates = query.order_by(Evaluation.id.desc())\
+            .limit(EvaluationReuser.MAX_CANDIDATES).all()
+
+        for evaluation in candidates:
+            if self._can_reuse(evaluation, submission, submission_result,
+                               dataset):
+                logger.info("`%s' reuses the evaluation of submission %d "
+                            "on dataset %d.", operation,
+                            evaluation.submission_id, evaluation.dataset_id)
+                self.reused += 1
+                sandboxes = evaluation.evaluation_sandbox.split(":") \
+                    if evaluation.evaluation_sandbox else []
+                return EvaluationJob(
+                    operation=operation,
+                    task_type=dataset.task_type,
+                    task_type_parameters=dataset.task_type_parameters,
+                    shard=evaluation.evaluation_shard,
+                    sandboxes=sandboxes,
+                    info="evaluate submission %d on testcase %s" %
+                    (submission.id, testcase.codename),
+                    success=True,
+                    outcome=evaluation.outcome,
+                    text=list(evaluation.text),
+                    plus={
+                        "execution_time": evaluation.execution_time,
+                        "execution_wall_clock_time":
+                        evaluation.execution_wall_clock_time,
+                        "execution_memory": evaluation.execution_memory,
+                    })
+        return None
+
+    def get_stats(self):
+        """Return the number of evaluations reused and executed.
+
+        return ({str: int}): the counters.
+
+        """
+        return {"reused": self.reused, "executed": self.executed}
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Skipping of evaluations that cannot change the score in
+EvaluationService.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import logging
+
+from cms.db import Evaluation
+from cms.grading.steps import EVALUATION_MESSAGES
+
+from .esoperations import ESOperation
+
+
+logger = logging.getLogger(__name__)
+
+
+def skipped_evaluation_text():
+    """Return the text of the evaluations that were skipped.
+
+    return ([str]): the text.
+
+    """
+    return [EVALUATION_MESSAGES.get("skipped").message]
+
+
+def is_skipped(evaluation):
+    """Return whether an evaluation was skipped instead of executed.
+
+    evaluation (Evaluation): an evaluation.
+
+    return (bool): whether it was created by EvaluationSkipper.
+
+    """
+    return list(evaluation.text) == skipped_evaluation_text()
+
+
+class EvaluationSkipper(object):
+    """Create the evaluations that cannot change the score.
+
+    For a submission result on a dataset with skip_failed_subtasks
+    set, the score type decides, from the outcomes of the evaluations
+    done so far, which other testcases would not change the score (see
+    ScoreType.testcases_not_needed); for example, for GroupMin, the
+    testcases of a subtask where a testcase got 0. Instead of being
+    executed, they get an evaluation with outcome 0.0 and a text
+    telling that they were skipped, so that the result is evaluated
+    and scored as usual.
+
+    """
+
+    def __init__(self):
+        # Number of evaluations skipped.
+        self.skipped = 0
+
+    def skip(self, submission_result):
+        """Add the evaluations that can be skipped to a result.
+
+        submission_result (SubmissionResult): a result, whose
+            evaluations were just updated.
+
+        return ([ESOperation]): the operations of the evaluations
+            that were skipped, which should not be executed anymore.
+
+        """
+        dataset = submission_result.dataset
+        if not dataset.skip_failed_subtasks \
+                or not submission_result.compilation_succeeded():
+            return []
+        outcomes = dict()
+        for evaluation in submission_result.evaluations:
+            try:
+                outcomes[evaluation.codename] = float(evaluation.outcome)
+            except (TypeError, ValueError):
+                logger.warning("Invalid outcome %r for the evaluation of "
+                               "submission %d on testcase %s.",
+                               evaluation.outcome,
+                               submission_result.submission_id,
+                               evaluation.codename)
+                return []
+        if len(outcomes) == 0:
+            return []
+
+        try:
+            codenames = dataset.score_type_object.testcases_not_needed(
+                outcomes)
+        except Exception:
+            logger.error("Couldn't find the testcases to skip for "
+                         "submission %d on dataset %d.",
+                         submission_result.submission_id, dataset.id,
+                         exc_info=True)
+            return []
+
+        operations = []
+        for codename in sorted(codenames):
+            if codename in outcomes or codename not in dataset.testcases:
+                continue
+            submission_result.evaluations.append(Evaluation(
+                outcome="0.0",
+                text=skipped_evaluation_text(),
+                testcase=dataset.testcases[codename]))
+            operations.append(ESOperation(ESOperation.EVALUATION,
+                                          submission_result.submission_id,
+                                          dataset.id, codename))
+        if len(operations) > 0:
+            logger.info("Skipped the evaluation of submission %d on %d "
+                        "testcases of dataset %d.",
+                        submission_result.submission_id, len(operations),
+                        dataset.id)
+            self.skipped += len(operations)
+        return operations
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Estimation of how long the operations of EvaluationService take.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import logging
+
+from sqlalchemy import func
+
+from cms.db import Dataset, Evaluation, SubmissionResult, Task, Testcase
+
+from .esoperations import ESOperation
+
+
+logger = logging.getLogger(__name__)
+
+
+class OperationCostEstimator(object):
+    """Estimate the duration of operations from those already done.
+
+    Each kind of operation (compilations of a dataset, evaluations on
+    a testcase of a dataset, and similarly for user tests) is expected
+    to last as the average wall-clock time of the past ones, falling
+    back to the CPU time when the former is not available. Evaluations
+    on testcases never seen before are expected to last as the average
+    evaluation of the same dataset, and operations of which nothing is
+    known yet as DEFAULT_COST.
+
+    """
+
+    # Expected duration, in seconds, of unknown operations.
+    DEFAULT_COST = 1.0
+    # The averages are (approximately) over this many latest samples,
+    # so that they follow changes, e.g., to the time limits.
+    WINDOW = 100
+
+    def __init__(self):
+        # Map from the keys returned by _keys to pairs (average
+        # duration, number of samples).
+        self._averages = dict()
+
+    @staticmethod
+    def _keys(operation):
+        """Return the keys under which an operation is accounted.
+
+        operation (ESOperation): the operation.
+
+        return ([tuple]): the keys, from the most to the least
+            specific.
+
+        """
+        keys = [(operation.type_, operation.dataset_id)]
+        if operation.testcase_codename is not None:
+            keys.insert(0, (operation.type_, operation.dataset_id,
+                            operation.testcase_codename))
+        return keys
+
+    def _add(self, key, duration, count=1):
+        """Add samples to an average.
+
+        key (tuple): the key of the average.
+        duration (float): the average duration of the samples.
+        count (int): the number of samples.
+
+        """
+        average, samples = self._averages.get(key, (0.0, 0))
+        samples = min(samples + count, self.WINDOW)
+        weight = min(count, samples) / samples
+        self._averages[key] = (average + (duration - average) * weight,
+                               samples)
+
+    def load(self, session, contest_id=None):
+        """Initialize the estimates from the results in the database.
+
+        session (Session): the database session to use.
+        contest_id (int|None): only consider the results of this
+            contest, or of all contests if None.
+
+        """
+        duration = func.coalesce(Evaluation.execution_wall_clock_time,
+                                 Evaluation.execution_time)
+        query = session.query(Evaluation.dataset_id, Testcase.codename,
+                              func.avg(duration), func.count(duration))\
+            .join(Evaluation.testcase)\
+            .group_by(Evaluation.dataset_id, Testcase.codename)
+        if contest_id is not None:
+            query = query.join(Testcase.dataset).join(Dataset.task)\
+                .filter(Task.contest_id == contest_id)
+        for dataset_id, codename, average, count in query.all():
+            if count > 0:
+                operation = ESOperation(ESOperation.EVALUATION,
+                                        None, dataset_id, codename)
+                for key in self._keys(operation):
+                    self._add(key, average, count)
+
+        duration = func.coalesce(SubmissionResult.compilation_wall_clock_time,
+                                 SubmissionResult.compilation_time)
+        query = session.query(SubmissionResult.dataset_id,
+                              func.avg(duration), func.count(duration))\
+            .group_by(SubmissionResult.dataset_id)
+        if contest_id is not None:
+            query = query.join(SubmissionResult.dataset).join(Dataset.task)\
+                .filter(Task.contest_id == contest_id)
+        for dataset_id, average, count in query.all():
+            if count > 0:
+                self._add((ESOperation.COMPILATION, dataset_id),
+                          average, count)
+
+        logger.info("Loaded the duration of %d kinds of operations.",
+                    len(self._averages))
+
+    def update(self, operation, job):
+        """Account for an operation that has been executed.
+
+        operation (ESOperation): the operation.
+        job (Job): the job that executed it.
+
+        """
+        plus = job.plus if job.plus is not None else {}
+        duration = plus.get("execution_wall_clock_time")
+        if duration is None:
+            duration = plus.get("execution_time")
+        if duration is None:
+            return
+        for key in self._keys(operation):
+            self._add(key, duration)
+
+    def cost(self, operation):
+        """Return the expected duration of an operation.
+
+        operation (ESOperation): the operation.
+
+        return (float): the expected duration, in seconds.
+
+        """
+        for key in self._keys(operation):
+            if key in self._averages:
+                return self._averages[key][0]
+        return self.DEFAULT_COST
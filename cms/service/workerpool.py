@@ -32,7 +32,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
-from six import iterkeys, iteritems
+from six import iterkeys, iteritems, itervalues
 
 import logging
 import random
@@ -89,6 +89,10 @@ class WorkerPool(object):
         self._schedule_disabling = {}
         # Type: {int: bool}
         self._ignore = {}
+        # Number of jobs each worker executes at the same time, as
+        # reported by the worker when it connects.
+        # Type: {int: int}
+        self._slots = {}
 
         # TODO: given the number of pieces data associated to each
         # worker, this class could be simplified by creating a new
@@ -169,6 +173,7 @@ class WorkerPool(object):
         self._start_time[shard] = None
         self._schedule_disabling[shard] = False
         self._ignore[shard] = False
+        self._slots[shard] = 1
         self._workers_available_event.set()
         logger.debug("Worker %s added.", shard)
 
@@ -183,6 +188,7 @@ class WorkerPool(object):
         """
         shard = worker_coord.shard
         logger.info("Worker %s online again.", shard)
+        self._worker[shard].get_slots(callback=self._on_slots, plus=shard)
         if self._service.contest_id is not None:
             self._worker[shard].precache_files(
                 contest_id=self._service.contest_id
@@ -194,6 +200,64 @@ class WorkerPool(object):
         # so we wake up the consumers.
         self._workers_available_event.set()
 
+    def _on_slots(self, data, shard, error=None):
+        """Record the number of slots reported by a worker.
+
+        data (int): the number of slots.
+        shard (int): the worker.
+        error (unicode|None): the error, if the worker couldn't be
+            asked (e.g., because it is an older version).
+
+        """
+        if error is not None:
+            logger.warning("Couldn't get the number of slots of worker "
+                           "%s: %s.", shard, error)
+            return
+        self._slots[shard] = max(data, 1)
+        logger.info("Worker %s has %d slots.", shard, self._slots[shard])
+
+    def get_total_slots(self):
+        """Return the number of jobs all workers execute at once.
+
+        return (int): the total number of slots of the workers
+            (including disabled ones).
+
+        """
+        return sum(itervalues(self._slots))
+
+    def _available_workers(self):
+        """Return the workers that can accept operations now.
+
+        return ([int]): the shards of the inactive and connected
+            workers.
+
+        """
+        return [shard for shard, operations in iteritems(self._operations)
+                if operations == WorkerPool.WORKER_INACTIVE
+                and self._worker[shard].connected]
+
+    def wait_for_available_worker(self):
+        """Wait until a worker can accept operations."""
+        while True:
+            self.wait_for_workers()
+            if len(self._available_workers()) > 0:
+                return
+            self._workers_available_event.clear()
+
+    def get_available_slots(self):
+        """Return the slots of the worker that acquire_worker would
+        choose now.
+
+        return (int): the largest number of slots among the available
+            workers (those acquire_worker prefers), or 1 if none is
+            available.
+
+        """
+        shards = self._available_workers()
+        if len(shards) == 0:
+            return 1
+        return max(self._slots[shard] for shard in shards)
+
     def acquire_worker(self, operations):
         """Tries to assign an operation to an available worker. If no workers
         are available then this returns None, otherwise this returns
@@ -205,14 +269,15 @@ class WorkerPool(object):
             assigned to the operation otherwise.
 
         """
-        # We look for an available worker.
-        try:
-            shard = self.find_worker(WorkerPool.WORKER_INACTIVE,
-                                     require_connection=True,
-                                     random_worker=True)
-        except LookupError:
+        # We look for an available worker, among those with the most
+        # slots.
+        shards = self._available_workers()
+        if len(shards) == 0:
             self._workers_available_event.clear()
             return None
+        max_slots = max(self._slots[shard] for shard in shards)
+        shard = random.choice([shard for shard in shards
+                               if self._slots[shard] == max_slots])
 
         # Then we fill the info for future memory.
         self._add_operations(shard, operations)
@@ -346,7 +411,8 @@ class WorkerPool(object):
                                for operation in self._operations[shard]]
                 if isinstance(self._operations[shard], list)
                 else self._operations[shard],
-                'start_time': s_time}
+                'start_time': s_time,
+                'slots': self._slots[shard]}
         return result
 
     def check_timeouts(self):
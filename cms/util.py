@@ -37,6 +37,7 @@ import netifaces
 import os
 import sys
 import grp
+from collections import OrderedDict
 
 import gevent
 import gevent.socket
@@ -340,3 +341,59 @@ def _get_shard_from_addresses(service, addrs):
         else:
             if not ipv6_addrs.isdisjoint(res_ipv6_addrs):
                 return shard
+
+
+class LRUCache(object):
+    """A dictionary holding at most a given number of items.
+
+    When a new item would exceed the size, the least recently used one
+    is discarded.
+
+    """
+
+    def __init__(self, size):
+        """Initialize the cache.
+
+        size (int): maximum number of items held.
+
+        """
+        self.size = size
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Return the item for a key, marking it as recently used.
+
+        key (object): the key, which must be hashable.
+        default (object): what to return if the key is not present.
+
+        return (object): the item, or default.
+
+        """
+        if key not in self._items:
+            return default
+        # OrderedDict.move_to_end is not available in py2.
+        value = self._items.pop(key)
+        self._items[key] = value
+        return value
+
+    def put(self, key, value):
+        """Store an item, discarding the oldest if needed.
+
+        key (object): the key, which must be hashable.
+        value (object): the item.
+
+        """
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        """Discard all items."""
+        self._items.clear()
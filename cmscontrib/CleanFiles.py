@@ -23,6 +23,8 @@
 and removes unreferenced file objects from the file store. If required,
 it also replaces all the executable digests in the database with a
 tombstone digest, to make executables removable in the clean pass.
+Entries of the compilation cache whose executable is removed are
+deleted too.
 
 """
 
@@ -37,7 +39,10 @@ import argparse
 import logging
 import sys
 
-from cms.db import SessionGen, Digest, Executable, enumerate_files
+from six import itervalues
+
+from cms.db import SessionGen, CompilationCacheEntry, Digest, Executable, \
+    enumerate_files
 from cms.db.filecacher import FileCacher
 
 
@@ -53,6 +58,11 @@ def make_tombstone(session):
     logger.info("Replaced %d executables with the tombstone.", count)
 
 
+def clear_compilation_cache(session):
+    count = session.query(CompilationCacheEntry).delete()
+    logger.info("Deleted %d entries of the compilation cache.", count)
+
+
 def clean_files(session, dry_run):
     filecacher = FileCacher()
     files = set(file[0] for file in filecacher.list())
@@ -62,9 +72,15 @@ def clean_files(session, dry_run):
     logger.info("Found %d digests while scanning", len(found_digests))
     files -= found_digests
     logger.info("%d digests are orphan.", len(files))
-    total_size = 0
-    for orphan in files:
-        total_size += filecacher.get_size(orphan)
+    # The compilation cache does not keep executables alive.
+    stale_entries = [entry for entry in
+                     session.query(CompilationCacheEntry)
+                     .filter(CompilationCacheEntry.executable_digest
+                             .isnot(None)).all()
+                     if entry.executable_digest in files]
+    logger.info("%d entries of the compilation cache refer to orphan "
+                "executables.", len(stale_entries))
+    total_size = sum(itervalues(filecacher.get_sizes(files)))
     logger.info("Orphan files take %s bytes of disk space",
                 "{:,}".format(total_size))
     if not dry_run:
@@ -73,18 +89,24 @@ def clean_files(session, dry_run):
             if count % 100 == 0:
                 logger.info("%d files deleted from the file store", count)
         logger.info("All orphan files have been deleted")
+        for entry in stale_entries:
+            session.delete(entry)
 
 
 def main():
     parser = argparse.ArgumentParser(
         description="Remove unused file objects from the database. "
-        "If -t is specified, also replace all executables with the tombstone")
+        "If -t is specified, also replace all executables with the tombstone; "
+        "if -c is specified, also empty the compilation cache")
     parser.add_argument("-t", "--tombstone", action="store_true")
+    parser.add_argument("-c", "--compilation-cache", action="store_true")
     parser.add_argument("-n", "--dry-run", action="store_true")
     args = parser.parse_args()
     with SessionGen() as session:
         if args.tombstone:
             make_tombstone(session)
+        if args.compilation_cache:
+            clear_compilation_cache(session)
         clean_files(session, args.dry_run)
         if not args.dry_run:
             session.commit()
@@ -32,7 +32,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
-from six import PY3, itervalues, iteritems
+from six import itervalues, iteritems
 
 # We enable monkey patching to make many libraries gevent-friendly
 # (for instance, urllib3, used by requests)
@@ -47,12 +47,19 @@ import os
 import sys
 import tarfile
 import tempfile
-
+import time
+from contextlib import contextmanager
+from shutil import copyfileobj
+
+import gevent
+from sqlalchemy import MetaData, Table, Column, and_, exists, tuple_
+from sqlalchemy.orm import class_mapper, joinedload, subqueryload
+from sqlalchemy.orm.attributes import instance_state
 from sqlalchemy.types import \
     Boolean, Integer, Float, String, Unicode, DateTime, Interval, Enum
 from sqlalchemy.dialects.postgresql import ARRAY, CIDR, JSONB
 
-from cms import rmtree, utf8_decoder
+from cms import utf8_decoder
 from cms.db import version as model_version, Codename, Filename, \
     FilenameSchema, FilenameSchemaArray, Digest
 from cms.db import SessionGen, Contest, User, Task, Submission, UserTest, \
@@ -60,7 +67,7 @@ from cms.db import SessionGen, Contest, User, Task, Submission, UserTest, \
 from cms.db.filecacher import FileCacher
 
 from cmscommon.datetime import make_timestamp
-from cmscommon.digest import path_digest
+from cmscommon.digest import Digester
 
 from datetime import date
 
@@ -138,13 +145,116 @@ def encode_value(type_, value):
         raise RuntimeError("Unknown SQLAlchemy column type: %s" % type_)
 
 
+class _DirectoryWriter(object):
+    """Write the content of a dump to a directory."""
+
+    def __init__(self, path):
+        self.path = path
+        os.mkdir(self.path)
+
+    def add_directory(self, name):
+        os.mkdir(os.path.join(self.path, name))
+
+    def add_file(self, name, fobj, size):
+        with io.open(os.path.join(self.path, name), "wb") as dst:
+            copyfileobj(fobj, dst)
+
+    @contextmanager
+    def open_file(self, name):
+        with io.open(os.path.join(self.path, name), "wb") as dst:
+            yield dst
+
+    def close(self):
+        pass
+
+    def discard(self):
+        pass
+
+
+class _TarWriter(object):
+    """Write the content of a dump to a tar archive, under a root
+    directory, without creating the files on disk first.
+
+    """
+
+    def __init__(self, path, mode, root):
+        self.path = path
+        self.root = root
+        self.archive = tarfile.open(path, mode)
+        self.add_directory("")
+
+    def _info(self, name):
+        info = tarfile.TarInfo(os.path.join(self.root, name).rstrip("/"))
+        info.mtime = time.time()
+        return info
+
+    def add_directory(self, name):
+        info = self._info(name)
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        self.archive.addfile(info)
+
+    def add_file(self, name, fobj, size):
+        info = self._info(name)
+        info.size = size
+        info.mode = 0o644
+        self.archive.addfile(info, fobj)
+
+    @contextmanager
+    def open_file(self, name):
+        # Members need their size before their content, so files
+        # written incrementally are stored in a temporary file first.
+        with tempfile.TemporaryFile() as tmp:
+            yield tmp
+            size = tmp.tell()
+            tmp.seek(0)
+            self.add_file(name, tmp, size)
+
+    def close(self):
+        self.archive.close()
+
+    def discard(self):
+        self.archive.close()
+        os.remove(self.path)
+
+
+class _DigestingReader(object):
+    """Wrap a file object computing the digest of what is read."""
+
+    def __init__(self, fobj):
+        self.fobj = fobj
+        self.digester = Digester()
+
+    def read(self, size=-1):
+        data = self.fobj.read(size)
+        self.digester.update(data)
+        return data
+
+    def digest(self):
+        return self.digester.digest()
+
+
 class DumpExporter(object):
 
     """This service exports every data that CMS knows. The process of
     exporting and importing again should be idempotent.
 
+    The export does not build the whole data in memory: the objects to
+    export are first collected in temporary tables in the database
+    (by following the relationships from the contests, users and tasks
+    to export), then loaded one class and one batch at a time, and
+    written to contest.json as they are loaded. Files are fetched in
+    batches, while the previous batch is being written, and archives
+    are written directly, without creating the dump on disk first.
+
     """
 
+    # Number of files requested together to the FileCacher.
+    FILES_BATCH_SIZE = 100
+    # Number of objects of the same class loaded together from the
+    # database.
+    OBJECTS_BATCH_SIZE = 1000
+
     def __init__(self, contest_ids, export_target,
                  dump_files, dump_model, skip_generated,
                  skip_submissions, skip_user_tests, skip_print_jobs):
@@ -184,7 +294,6 @@ class DumpExporter(object):
         """Run the actual export code."""
         logger.info("Starting export.")
 
-        export_dir = self.export_target
         archive_info = get_archive_info(self.export_target)
 
         if archive_info["write_mode"] != "":
@@ -193,97 +302,256 @@ class DumpExporter(object):
                 logger.critical("The specified file already exists, "
                                 "I won't overwrite it.")
                 return False
-            export_dir = os.path.join(tempfile.mkdtemp(),
-                                      archive_info["basename"])
+            writer = _TarWriter(self.export_target,
+                                archive_info["write_mode"],
+                                archive_info["basename"])
+        else:
+            logger.info("Creating dir structure.")
+            try:
+                writer = _DirectoryWriter(self.export_target)
+            except OSError:
+                logger.critical("The specified directory already exists, "
+                                "I won't overwrite it.")
+                return False
 
-        logger.info("Creating dir structure.")
         try:
-            os.mkdir(export_dir)
-        except OSError:
-            logger.critical("The specified directory already exists, "
-                            "I won't overwrite it.")
+            success = self._export(writer)
+        except BaseException:
+            writer.discard()
+            raise
+        if not success:
+            writer.discard()
             return False
+        writer.close()
+
+        logger.info("Export finished.")
+
+        return True
+
+    def _export(self, writer):
+        """Export files and data using the given writer.
 
-        files_dir = os.path.join(export_dir, "files")
-        descr_dir = os.path.join(export_dir, "descriptions")
-        os.mkdir(files_dir)
-        os.mkdir(descr_dir)
+        writer (_DirectoryWriter|_TarWriter): where to write the dump.
+
+        return (bool): True if all ok, False if something wrong.
+
+        """
+        writer.add_directory("files")
+        writer.add_directory("descriptions")
 
         with SessionGen() as session:
             # Export files.
             logger.info("Exporting files.")
             if self.dump_files:
+                files = set()
                 for contest_id in self.contests_ids:
                     contest = Contest.get_from_id(contest_id, session)
-                    files = enumerate_files(
+                    files |= enumerate_files(
                         session, contest,
                         skip_submissions=self.skip_submissions,
                         skip_user_tests=self.skip_user_tests,
                         skip_print_jobs=self.skip_print_jobs,
                         skip_generated=self.skip_generated)
-                    for file_ in files:
-                        if not self.safe_get_file(file_,
-                                                  os.path.join(files_dir,
-                                                               file_),
-                                                  os.path.join(descr_dir,
-                                                               file_)):
-                            return False
+                if not self.export_files(sorted(files), writer):
+                    return False
 
             # Export data in JSON format.
             if self.dump_model:
                 logger.info("Exporting data to a JSON file.")
+                with writer.open_file("contest.json") as fout:
+                    self.export_data(session, fout)
 
-                # We use strings because they'll be the keys of a JSON
-                # object
-                self.ids = {}
-                self.queue = []
+        return True
 
-                data = dict()
+    def skip_class(self, cls):
+        """Return whether objects of the given class are not exported
+        because of the flags given by the user.
 
-                for cls, lst in [(Contest, self.contests_ids),
-                                 (User, self.users_ids),
-                                 (Task, self.tasks_ids)]:
-                    for i in lst:
-                        obj = cls.get_from_id(i, session)
-                        self.get_id(obj)
+        """
+        # Skip submissions if requested
+        if self.skip_submissions and cls is Submission:
+            return True
 
-                # Specify the "root" of the data graph
-                data["_objects"] = list(itervalues(self.ids))
+        # Skip user_tests if requested
+        if self.skip_user_tests and cls is UserTest:
+            return True
 
-                while len(self.queue) > 0:
-                    obj = self.queue.pop(0)
-                    data[self.ids[obj.sa_identity_key]] = \
-                        self.export_object(obj)
+        # Skip print jobs if requested
+        if self.skip_print_jobs and cls is PrintJob:
+            return True
 
-                data["_version"] = model_version
+        # Skip generated data if requested
+        if self.skip_generated and cls in (SubmissionResult, UserTestResult):
+            return True
 
-                destination = os.path.join(export_dir, "contest.json")
-                if PY3:
-                    with io.open(destination, "wt", encoding="utf-8") as fout:
-                        json.dump(data, fout, indent=4, sort_keys=True)
-                else:
-                    with io.open(destination, "wb") as fout:
-                        json.dump(data, fout, indent=4, sort_keys=True)
+        return False
 
-        # If the admin requested export to file, we do that.
-        if archive_info["write_mode"] != "":
-            with tarfile.open(self.export_target,
-                              archive_info["write_mode"]) as archive:
-                archive.add(export_dir, arcname=archive_info["basename"])
-            rmtree(export_dir)
+    def export_data(self, session, fout):
+        """Write all the objects to export as a JSON object.
 
-        logger.info("Export finished.")
+        The JSON object is written one item per line, in no particular
+        order: "_version", "_objects", and then the objects, one class
+        at a time.
 
-        return True
+        session (Session): the database session to use.
+        fout (fileobj): the binary file-like object to write to.
 
-    def get_id(self, obj):
-        obj_key = obj.sa_identity_key
-        if obj_key not in self.ids:
-            # We use strings because they'll be the keys of a JSON object
-            self.ids[obj_key] = "%d" % len(self.ids)
-            self.queue.append(obj)
+        """
+        roots = [(Contest, self.contests_ids),
+                 (User, self.users_ids),
+                 (Task, self.tasks_ids)]
+        tables = self.collect_objects(session, roots)
+
+        def write(key, value, separator=",\n"):
+            fout.write(("%s%s: %s" % (separator, json.dumps(key),
+                                      json.dumps(value, sort_keys=True)))
+                       .encode("utf-8"))
+
+        write("_version", model_version, separator="{\n")
+        # Specify the "root" of the data graph
+        write("_objects", list(self.get_id_from_key(cls, (id_,))
+                               for cls, ids in roots for id_ in ids))
+
+        for cls in sorted(tables, key=lambda cls: cls.__name__):
+            count = 0
+            for obj in self.iter_objects(session, cls, tables[cls]):
+                write(self.get_id(obj), self.export_object(obj))
+                count += 1
+            if count > 0:
+                logger.info("Exported %d objects of class %s.",
+                            count, cls.__name__)
+
+        fout.write(b"\n}\n")
+
+    def collect_objects(self, session, roots):
+        """Find the objects to export, storing their primary keys in
+        temporary tables (dropped at the end of the transaction).
+
+        Starting from the roots, the relationships of the objects
+        found so far are followed (with a query for each relationship,
+        all done by the database) until no new object is found.
+
+        session (Session): the database session to use.
+        roots ([(type, [int])]): the classes and ids of the objects
+            from which to start.
+
+        return ({type: Table}): the temporary table containing the
+            primary keys of the objects to export, for each class of
+            which some objects may have to be exported.
 
-        return self.ids[obj_key]
+        """
+        metadata = MetaData()
+        tables = dict()
+        classes = [cls for cls, _ in roots]
+        while len(classes) > 0:
+            cls = classes.pop()
+            if cls in tables:
+                continue
+            tables[cls] = Table(
+                "dump_%s" % cls.__tablename__, metadata,
+                *(Column(column.name, column.type, primary_key=True)
+                  for column in class_mapper(cls).primary_key),
+                prefixes=["TEMPORARY"], postgresql_on_commit="DROP")
+            tables[cls].create(session.connection())
+            classes.extend(prp.mapper.class_ for prp in cls._rel_props
+                           if not self.skip_class(prp.mapper.class_))
+
+        for cls, ids in roots:
+            if len(ids) > 0:
+                session.execute(tables[cls].insert(),
+                                [{"id": id_} for id_ in ids])
+
+        # The classes of which new objects have been found.
+        changed = set(cls for cls, ids in roots if len(ids) > 0)
+        while len(changed) > 0:
+            new_changed = set()
+            for cls in changed:
+                table = tables[cls]
+                for prp in cls._rel_props:
+                    other_cls = prp.mapper.class_
+                    if self.skip_class(other_cls):
+                        continue
+                    other_table = tables[other_cls]
+                    other_key = class_mapper(other_cls).primary_key
+                    # Not an INSERT ... ON CONFLICT DO NOTHING, which
+                    # needs PostgreSQL 9.5.
+                    query = session.query(*other_key)\
+                        .select_from(cls)\
+                        .join(getattr(cls, prp.key))\
+                        .join(table, and_(*(
+                            column == table.c[column.name]
+                            for column in class_mapper(cls).primary_key)))\
+                        .filter(~exists().where(and_(*(
+                            other_table.c[column.name] == column
+                            for column in other_key))))\
+                        .distinct()
+                    statement = other_table.insert()\
+                        .from_select(list(other_table.c), query)
+                    if session.execute(statement).rowcount > 0:
+                        new_changed.add(other_cls)
+            changed = new_changed
+
+        return tables
+
+    def iter_objects(self, session, cls, table):
+        """Load the objects of a class to export, in batches.
+
+        The relationships are loaded together with each batch, and the
+        objects are removed from the session after each batch, so that
+        only a batch at a time is in memory. Objects in collections are
+        only needed for their primary keys, thus (for lists) only these
+        are loaded.
+
+        session (Session): the database session to use.
+        cls (type): the class of the objects.
+        table (Table): the temporary table with their primary keys.
+
+        yield (Base): the objects, ordered by primary key.
+
+        """
+        primary_key = class_mapper(cls).primary_key
+        options = list()
+        for prp in cls._rel_props:
+            if self.skip_class(prp.mapper.class_):
+                continue
+            attr = getattr(cls, prp.key)
+            if not prp.uselist:
+                options.append(joinedload(attr))
+            elif prp.collection_class in (None, list):
+                options.append(subqueryload(attr).load_only(*(
+                    prp.mapper.get_property_by_column(column).key
+                    for column in prp.mapper.primary_key)))
+            else:
+                options.append(subqueryload(attr))
+
+        last = None
+        while True:
+            query = session.query(cls)\
+                .join(table, and_(*(column == table.c[column.name]
+                                    for column in primary_key)))\
+                .options(*options)
+            if last is not None:
+                query = query.filter(tuple_(*primary_key) > tuple_(*last))
+            objs = query.order_by(*primary_key)\
+                .limit(self.OBJECTS_BATCH_SIZE).all()
+            if len(objs) == 0:
+                break
+            for obj in objs:
+                yield obj
+            last = objs[-1].sa_primary_key
+            session.expunge_all()
+
+    @staticmethod
+    def get_id_from_key(cls, primary_key):
+        """Return the ID in the dump of the object with the given
+        class and primary key.
+
+        """
+        return "%s/%s" % (cls.__name__,
+                          "/".join("%d" % value for value in primary_key))
+
+    def get_id(self, obj):
+        return self.get_id_from_key(type(obj), instance_state(obj).identity)
 
     def export_object(self, obj):
 
@@ -295,15 +563,12 @@ class DumpExporter(object):
         and an item for each relationship property (which will be an ID
         or a collection of IDs).
 
-        The IDs used in the exported dict aren't related to the ones
-        used in the DB: they are newly generated and their scope is
-        limited to the exported file only. They are shared among all
-        classes (that is, two objects can never share the same ID, even
-        if they are of different classes).
-
-        If, when exporting the relationship, we find an object without
-        an ID we generate a new ID, assign it to the object and append
-        the object to the queue of objects to export.
+        The IDs used in the exported dict are made of the name of the
+        class and of the primary key of the object, so that they can
+        be computed without remembering the objects already exported.
+        They are only meaningful in the exported file, and are shared
+        among all classes (that is, two objects can never share the
+        same ID, even if they are of different classes).
 
         The self.skip_submissions flag controls whether we export
         submissions (and all other objects that can be reached only by
@@ -324,21 +589,7 @@ class DumpExporter(object):
         for prp in cls._rel_props:
             other_cls = prp.mapper.class_
 
-            # Skip submissions if requested
-            if self.skip_submissions and other_cls is Submission:
-                continue
-
-            # Skip user_tests if requested
-            if self.skip_user_tests and other_cls is UserTest:
-                continue
-
-            # Skip print jobs if requested
-            if self.skip_print_jobs and other_cls is PrintJob:
-                continue
-
-            # Skip generated data if requested
-            if self.skip_generated and other_cls in (SubmissionResult,
-                                                     UserTestResult):
+            if self.skip_class(other_cls):
                 continue
 
             val = getattr(obj, prp.key)
@@ -357,41 +608,100 @@ class DumpExporter(object):
 
         return data
 
-    def safe_get_file(self, digest, path, descr_path=None):
+    def _fetch_files(self, digests):
+        """Return the files and descriptions of the given digests.
 
-        """Get file from FileCacher ensuring that the digest is
-        correct.
+        digests ([unicode]): the digests of the files.
 
-        digest (string): the digest of the file to retrieve.
-        path (string): the path where to save the file.
-        descr_path (string): the path where to save the description.
+        return (({unicode: fileobj}, {unicode: unicode})|None): the
+            files (to be closed by the caller) and the descriptions,
+            or None if they could not be retrieved.
+
+        """
+        try:
+            fobjs = self.file_cacher.get_files(digests)
+        except Exception:
+            logger.error("Files could not be retrieved from file server.",
+                         exc_info=True)
+            return None
+        try:
+            descriptions = self.file_cacher.get_descriptions(digests)
+        except Exception:
+            logger.error("Files could not be retrieved from file server.",
+                         exc_info=True)
+            for fobj in itervalues(fobjs):
+                fobj.close()
+            return None
+        return fobjs, descriptions
+
+    def export_files(self, digests, writer):
+        """Export the given files with their descriptions.
+
+        Files are requested to the FileCacher in batches, to avoid
+        querying the backend for each of them, and the next batch is
+        fetched while the current one is being written. The digest of
+        each file is checked while writing it.
+
+        digests ([unicode]): the digests of the files to export.
+        writer (_DirectoryWriter|_TarWriter): where to write them.
 
         return (bool): True if all ok, False if something wrong.
 
         """
+        batches = [digests[i:i + self.FILES_BATCH_SIZE]
+                   for i in range(0, len(digests), self.FILES_BATCH_SIZE)]
+        pending = None
+        try:
+            for i, batch in enumerate(batches):
+                if pending is None:
+                    pending = gevent.spawn(self._fetch_files, batch)
+                fetched = pending.get()
+                pending = None
+                if fetched is None:
+                    return False
+                if i + 1 < len(batches):
+                    pending = gevent.spawn(self._fetch_files, batches[i + 1])
+                fobjs, descriptions = fetched
+                try:
+                    for digest in batch:
+                        if not self._write_file(writer, digest, fobjs[digest],
+                                                descriptions[digest]):
+                            return False
+                finally:
+                    for fobj in itervalues(fobjs):
+                        fobj.close()
+        finally:
+            if pending is not None:
+                pending.kill()
+                if pending.successful() and pending.value is not None:
+                    for fobj in itervalues(pending.value[0]):
+                        fobj.close()
+        return True
 
-        # TODO - Probably this method could be merged in FileCacher
+    @staticmethod
+    def _write_file(writer, digest, fobj, description):
+        """Write a file and its description, checking its digest.
 
-        # First get the file
-        try:
-            self.file_cacher.get_file_to_path(digest, path)
-        except Exception:
-            logger.error("File %s could not retrieved from file server.",
-                         digest, exc_info=True)
-            return False
+        writer (_DirectoryWriter|_TarWriter): where to write them.
+        digest (unicode): the digest of the file.
+        fobj (fileobj): the content of the file.
+        description (unicode): the description of the file.
 
-        # Then check the digest
-        calc_digest = path_digest(path)
+        return (bool): True if all ok, False if something wrong.
+
+        """
+        reader = _DigestingReader(fobj)
+        writer.add_file(os.path.join("files", digest), reader,
+                        os.fstat(fobj.fileno()).st_size)
+        calc_digest = reader.digest()
         if digest != calc_digest:
             logger.critical("File %s has wrong hash %s.",
                             digest, calc_digest)
             return False
 
-        # If applicable, retrieve also the description
-        if descr_path is not None:
-            with io.open(descr_path, 'wt', encoding='utf-8') as fout:
-                fout.write(self.file_cacher.describe(digest))
-
+        description = description.encode("utf-8")
+        writer.add_file(os.path.join("descriptions", digest),
+                        io.BytesIO(description), len(description))
         return True
 
 
@@ -27,6 +27,11 @@
 target of a DumpExport. The process of exporting and importing
 again should be idempotent.
 
+The objects are not created through the ORM: contest.json is decoded
+an item at a time, and the rows are inserted a table at a time (in
+dependency order), in batches. The files are then uploaded
+concurrently, skipping those already stored.
+
 """
 
 from __future__ import absolute_import
@@ -48,10 +53,17 @@ import ipaddress
 import json
 import logging
 import os
+import re
 import sys
+import time
 
+from collections import defaultdict
 from datetime import datetime, timedelta
 
+import gevent.pool
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.orderinglist import OrderingList
+from sqlalchemy.orm.interfaces import MANYTOONE, ONETOMANY
 from sqlalchemy.types import \
     Boolean, Integer, Float, String, Unicode, DateTime, Interval, Enum
 from sqlalchemy.dialects.postgresql import ARRAY, CIDR, JSONB
@@ -61,13 +73,12 @@ import cms.db as class_hook
 from cms import utf8_decoder
 from cms.db import version as model_version, Codename, Filename, \
     FilenameSchema, FilenameSchemaArray, Digest
-from cms.db import SessionGen, Contest, Submission, SubmissionResult, \
-    UserTest, UserTestResult, PrintJob, init_db, drop_db, enumerate_files
+from cms.db import SessionGen, Contest, init_db, drop_db, enumerate_files, \
+    metadata
 from cms.db.filecacher import FileCacher
 
 from cmscommon.archive import Archive
 from cmscommon.datetime import make_datetime
-from cmscommon.digest import path_digest
 
 
 logger = logging.getLogger(__name__)
@@ -96,6 +107,148 @@ def find_root_of_archive(file_names):
     return current_root
 
 
+_WHITESPACE = re.compile(r"\s*")
+
+
+class _JSONReader(object):
+    """A text file that is read a chunk at a time, to decode the JSON
+    values it contains one by one.
+
+    """
+
+    def __init__(self, fin, chunk_size):
+        """Create a reader.
+
+        fin (fileobj): the text file to read.
+        chunk_size (int): how many characters to read at a time.
+
+        """
+        self.fin = fin
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        # The text read and not consumed yet starts at pos.
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read(self):
+        """Read another chunk of the file."""
+        # Reading at least as much as the text still to consume keeps
+        # linear the time to decode a value spanning many chunks.
+        chunk = self.fin.read(max(self.chunk_size,
+                                  len(self.text) - self.pos))
+        if len(chunk) == 0:
+            self.eof = True
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """Skip the whitespace and return the next character.
+
+        return (unicode): the next character, or an empty string at
+            the end of the file.
+
+        """
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if self.eof:
+                return ""
+            self._read()
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of chars.
+
+        chars (unicode): the allowed characters.
+
+        return (unicode): the character consumed.
+
+        raise (ValueError): if the next character is not allowed.
+
+        """
+        char = self.peek()
+        if len(char) == 0 or char not in chars:
+            raise ValueError("Expecting one of %r, found %r." % (chars, char))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """Consume and decode the next JSON value.
+
+        return (object): the decoded value.
+
+        raise (ValueError): if the next text is not a JSON value.
+
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.text, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # A number at the end of the text read so far might
+                # continue in the next chunk.
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            self._read()
+
+
+def iter_json_items(fin, chunk_size=2 ** 20):
+    """Decode the JSON object in a file, an item at a time.
+
+    Unlike json.load, the text of the file is never kept in memory
+    as a whole.
+
+    fin (fileobj): the text file containing the object.
+    chunk_size (int): how many characters to read at a time.
+
+    yield ((unicode, object)): the key and the decoded value of each
+        item, in the order they appear in the file.
+
+    raise (ValueError): if the file does not contain a JSON object.
+
+    """
+    reader = _JSONReader(fin, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}")
+    else:
+        while True:
+            key = reader.decode()
+            reader.expect(":")
+            yield key, reader.decode()
+            if reader.expect(",}") == "}":
+                break
+    if reader.peek() != "":
+        raise ValueError("Extra data after the JSON object.")
+
+
+def referenced_ids(value):
+    """Return the identifiers in the value of a relationship.
+
+    value (unicode|[unicode]|{unicode: unicode}|None): the value of a
+        relationship property in the dump.
+
+    return ([unicode]): the identifiers of the referenced objects.
+
+    """
+    if value is None:
+        return []
+    elif isinstance(value, str):
+        return [value]
+    elif isinstance(value, list):
+        return value
+    elif isinstance(value, dict):
+        return list(value.values())
+    else:
+        raise RuntimeError(
+            "Unknown RelationshipProperty value: %s" % type(value))
+
+
 def decode_value(type_, value):
     """Decode a given value in a JSON-compatible form to a given type.
 
@@ -139,6 +292,11 @@ class DumpImporter(object):
 
     """
 
+    # Number of rows inserted by each execution of a statement.
+    INSERT_BATCH_SIZE = 1000
+    # Number of files uploaded at the same time.
+    CONCURRENT_UPLOADS = 4
+
     def __init__(self, drop, import_source,
                  load_files, load_model, skip_generated,
                  skip_submissions, skip_user_tests, skip_print_jobs):
@@ -191,13 +349,13 @@ class DumpImporter(object):
             if self.load_model:
                 logger.info("Importing the contest from a JSON file.")
 
-                with io.open(os.path.join(self.import_dir,
-                                          "contest.json"), "rb") as fin:
+                with io.open(os.path.join(self.import_dir, "contest.json"),
+                             "rt", encoding="utf-8") as fin:
                     # TODO - Throughout all the code we'll assume the
                     # input is correct without actually doing any
                     # validations.  Thus, for example, we're not
                     # checking that the decoded object is a dict...
-                    self.datas = json.load(fin)
+                    self.datas = dict(iter_json_items(fin))
 
                 # If the dump has been exported using a data model
                 # different than the current one (that is, a previous
@@ -242,51 +400,24 @@ class DumpImporter(object):
 
                 assert self.datas["_version"] == model_version
 
-                self.objs = dict()
-                for id_, data in iteritems(self.datas):
-                    if not id_.startswith("_"):
-                        self.objs[id_] = self.import_object(data)
-                for id_, data in iteritems(self.datas):
-                    if not id_.startswith("_"):
-                        self.add_relationships(data, self.objs[id_])
-
-                for k, v in list(iteritems(self.objs)):
-
-                    # Skip submissions if requested
-                    if self.skip_submissions and isinstance(v, Submission):
-                        del self.objs[k]
-
-                    # Skip user_tests if requested
-                    if self.skip_user_tests and isinstance(v, UserTest):
-                        del self.objs[k]
-
-                    # Skip print jobs if requested
-                    if self.skip_print_jobs and isinstance(v, PrintJob):
-                        del self.objs[k]
-
-                    # Skip generated data if requested
-                    if self.skip_generated and \
-                            isinstance(v, (SubmissionResult, UserTestResult)):
-                        del self.objs[k]
+                # We import only the top-level objects (contests, and
+                # tasks and users not contained in any contest) and
+                # those depending on them, as the ORM would do adding
+                # the former to the session.
+                ids = self.find_reachable()
+                self.complete_relationships(ids)
+                keys = self.insert_objects(session, ids)
 
                 contest_id = list()
                 contest_files = set()
 
-                # We add explicitly only the top-level objects:
-                # contests, and tasks and users not contained in any
-                # contest. This will add on cascade all dependent
-                # objects, and not add orphaned objects (like those
-                # that depended on submissions or user tests that we
-                # might have removed above).
                 for id_ in self.datas["_objects"]:
-                    obj = self.objs[id_]
-                    session.add(obj)
-                    session.flush()
-
-                    if isinstance(obj, Contest):
-                        contest_id += [obj.id]
+                    if self.datas[id_]["_class"] == "Contest":
+                        contest = session.query(Contest)\
+                            .get(keys[id_][Contest.id.key])
+                        contest_id += [contest.id]
                         contest_files |= enumerate_files(
-                            session, obj,
+                            session, contest,
                             skip_submissions=self.skip_submissions,
                             skip_user_tests=self.skip_user_tests,
                             skip_print_jobs=self.skip_print_jobs,
@@ -329,15 +460,12 @@ class DumpImporter(object):
                 if contest_files is not None:
                     files &= contest_files
 
-                for digest in files:
-                    file_ = os.path.join(files_dir, digest)
-                    desc = os.path.join(descr_dir, digest)
-                    if not self.safe_put_file(file_, desc):
-                        logger.critical("Unable to put file `%s' in the DB. "
-                                        "Aborting. Please remove the contest "
-                                        "from the database.", file_)
-                        # TODO: remove contest from the database.
-                        return False
+                if not self.import_files(files):
+                    logger.critical("Unable to put the files in the DB. "
+                                    "Aborting. Please remove the contest "
+                                    "from the database.")
+                    # TODO: remove contest from the database.
+                    return False
 
         # Clean up, if an archive was used
         if archive is not None:
@@ -351,96 +479,238 @@ class DumpImporter(object):
 
         return True
 
-    def import_object(self, data):
-
-        """Import objects from the given data (without relationships).
+    def find_reachable(self):
+        """Return the objects to import.
 
-        The given data is assumed to be a dict in the format produced by
-        DumpExporter. This method reads the "_class" item and tries
-        to find the corresponding class. Then it loads all column
-        properties of that class (those that are present in the data)
-        and uses them as keyword arguments in a call to the class
-        constructor (if a required property is missing this call will
-        raise an error).
+        These are the top-level objects, and those reachable from them
+        through the relationships, where those having a reverse one
+        (i.e., a back_populates) can be traversed in both directions:
+        exactly the objects that the ORM would save in cascade adding
+        the top-level ones to a session.
 
-        Relationships are not handled by this method, since we may not
-        have all referenced objects available yet. Thus we prefer to add
-        relationships in a later moment, using the add_relationships
-        method.
+        return ({unicode}): the identifiers of the objects.
 
-        Note that both this method and add_relationships don't check if
-        the given data has more items than the ones we understand and
-        use.
+        """
+        neighbours = defaultdict(list)
+        for id_, data in iteritems(self.datas):
+            if id_.startswith("_"):
+                continue
+            cls = getattr(class_hook, data["_class"])
+            for prp in cls._rel_props:
+                for other_id in referenced_ids(data.get(prp.key)):
+                    neighbours[id_].append(other_id)
+                    if prp.back_populates is not None:
+                        neighbours[other_id].append(id_)
+
+        reachable = set(self.datas["_objects"])
+        to_visit = list(reachable)
+        while len(to_visit) > 0:
+            for other_id in neighbours[to_visit.pop()]:
+                if other_id not in reachable:
+                    reachable.add(other_id)
+                    to_visit.append(other_id)
+        return reachable
+
+    def complete_relationships(self, ids):
+        """Add to the data what the ORM would infer from it.
+
+        That is, the many-to-one side of the relationships given only
+        by the one-to-many side, and the position of the objects in an
+        ordering list that lack it.
+
+        ids ({unicode}): the identifiers of the objects to import.
 
         """
+        for id_ in ids:
+            data = self.datas[id_]
+            cls = getattr(class_hook, data["_class"])
+            for prp in cls._rel_props:
+                if prp.direction is not ONETOMANY or prp.key not in data:
+                    continue
+                children = referenced_ids(data[prp.key])
+
+                if prp.back_populates is not None:
+                    for child_id in children:
+                        self.datas[child_id].setdefault(
+                            prp.back_populates, id_)
+
+                collection = prp.collection_class() \
+                    if prp.collection_class is not None else None
+                if isinstance(collection, OrderingList):
+                    for index, child_id in enumerate(children):
+                        child = self.datas[child_id]
+                        if child.get(collection.ordering_attr) is None:
+                            child[collection.ordering_attr] = \
+                                collection.ordering_func(index, collection)
+
+    def insert_objects(self, session, ids):
+        """Insert the rows of the given objects in the database.
+
+        The tables are filled in dependency order, many rows at a
+        time. The primary keys are taken from the sequences in advance,
+        so that the foreign keys can be set on insertion, except those
+        to tables filled later (e.g., to the active dataset of a task),
+        which are updated at the end.
+
+        session (Session): the session to use.
+        ids ({unicode}): the identifiers of the objects to insert.
+
+        return ({unicode: {unicode: object}}): the values of the
+            primary key of each inserted object, indexed by column.
 
-        cls = getattr(class_hook, data["_class"])
+        """
+        start = time.time()
+
+        # Keep the order of the dump, to be deterministic.
+        table_ids = defaultdict(list)
+        for id_ in self.datas:
+            if id_ in ids:
+                cls = getattr(class_hook, self.datas[id_]["_class"])
+                table_ids[cls.__table__].append(id_)
+
+        keys = dict()
+        for table, table_ids_ in iteritems(table_ids):
+            columns = list(table.primary_key.columns)
+            if len(columns) == 1 and isinstance(columns[0].type, Integer):
+                for id_, value in zip(table_ids_, self.allocate_ids(
+                        session, columns[0], len(table_ids_))):
+                    keys[id_] = {columns[0].key: value}
+
+        position = dict((table, i)
+                        for i, table in enumerate(metadata.sorted_tables))
+        # Foreign keys to set later, for each object.
+        deferred = defaultdict(dict)
+
+        for table in metadata.sorted_tables:
+            rows = list()
+            for id_ in table_ids[table]:
+                data = self.datas[id_]
+                cls = getattr(class_hook, data["_class"])
+                row = dict(keys.get(id_, {}))
+
+                for prp in cls._col_props:
+                    if prp.key in data:
+                        col = prp.columns[0]
+                        row[col.key] = decode_value(col.type, data[prp.key])
+
+                for prp in cls._rel_props:
+                    if prp.direction is not MANYTOONE or prp.viewonly \
+                            or prp.key not in data:
+                        continue
+                    other_id = data[prp.key]
+                    later = position[prp.target] >= position[table]
+                    for local, remote in prp.local_remote_pairs:
+                        if other_id is None:
+                            row[local.key] = None
+                        elif later:
+                            row[local.key] = None
+                            deferred[id_][local.key] = (other_id, remote.key)
+                        else:
+                            row[local.key] = keys[other_id][remote.key]
+
+                # Primary keys made of foreign keys.
+                keys[id_] = dict((col.key, row.get(col.key))
+                                 for col in table.primary_key.columns)
+                rows.append(row)
+
+            self.insert_rows(session, table, rows)
+
+        for id_, values in iteritems(deferred):
+            table = getattr(class_hook, self.datas[id_]["_class"]).__table__
+            session.execute(
+                table.update()
+                .where(and_(*(col == keys[id_][col.key]
+                              for col in table.primary_key.columns)))
+                .values(dict((key, keys[other_id][remote_key])
+                             for key, (other_id, remote_key)
+                             in iteritems(values))))
+
+        elapsed = time.time() - start
+        logger.info("Imported %d objects in %.1f seconds (%.0f objects/s).",
+                    len(ids), elapsed, len(ids) / max(elapsed, 0.001))
+
+        return keys
+
+    def insert_rows(self, session, table, rows):
+        """Insert rows in a table, many at a time.
+
+        session (Session): the session to use.
+        table (Table): the table.
+        rows ([{unicode: object}]): the values of the rows, indexed by
+            column; the missing columns take their default value.
 
-        args = dict()
+        """
+        # An executemany needs the same columns in all rows.
+        groups = defaultdict(list)
+        for row in rows:
+            groups[tuple(sorted(row))].append(row)
+        for group in groups.values():
+            for i in range(0, len(group), self.INSERT_BATCH_SIZE):
+                session.execute(table.insert(),
+                                group[i:i + self.INSERT_BATCH_SIZE])
 
-        for prp in cls._col_props:
-            if prp.key not in data:
-                # We will let the __init__ of the class check if any
-                # argument is missing, so it's safe to just skip here.
-                continue
+    @staticmethod
+    def allocate_ids(session, column, count):
+        """Take values for a serial column from its sequence.
 
-            col = prp.columns[0]
+        session (Session): the session to use.
+        column (Column): the column.
+        count (int): how many values to take.
 
-            val = data[prp.key]
-            args[prp.key] = decode_value(col.type, val)
+        return ([int]): the values, in increasing order.
 
-        return cls(**args)
+        """
+        sequence = func.pg_get_serial_sequence(column.table.name, column.name)
+        return sorted(
+            value for value, in session.execute(
+                select([func.nextval(sequence)])
+                .select_from(func.generate_series(1, count))))
 
-    def add_relationships(self, data, obj):
+    def import_files(self, digests):
+        """Store the given files of the dump with FileCacher.
 
-        """Add the relationships to the given object, using the given data.
+        The files already stored are skipped, the others are uploaded
+        concurrently.
 
-        Do what we didn't in import_objects: importing relationships.
-        We already now the class of the object so we simply iterate over
-        its relationship properties trying to load them from the data (if
-        present), checking wheter they are IDs or collection of IDs,
-        dereferencing them (i.e. getting the corresponding object) and
-        reflecting all on the given object.
+        digests ({unicode}): the digests of the files to store.
 
-        Note that both this method and import_object don't check if the
-        given data has more items than the ones we understand and use.
+        return (bool): True if all ok, False if something wrong.
 
         """
+        start = time.time()
 
-        cls = type(obj)
+        missing = self.file_cacher.get_missing(digests)
+        logger.info("%d files are already stored, storing the other %d.",
+                    len(digests) - len(missing), len(missing))
 
-        for prp in cls._rel_props:
-            if prp.key not in data:
-                # Relationships are always optional
-                continue
+        total_size = 0
+        pool = gevent.pool.Pool(self.CONCURRENT_UPLOADS)
+        for size in pool.imap_unordered(self.safe_put_file, sorted(missing)):
+            if size is None:
+                pool.kill()
+                return False
+            total_size += size
 
-            val = data[prp.key]
-            if val is None:
-                setattr(obj, prp.key, None)
-            elif isinstance(val, str):
-                setattr(obj, prp.key, self.objs[val])
-            elif isinstance(val, list):
-                setattr(obj, prp.key, list(self.objs[i] for i in val))
-            elif isinstance(val, dict):
-                setattr(obj, prp.key,
-                        dict((k, self.objs[v]) for k, v in iteritems(val)))
-            else:
-                raise RuntimeError(
-                    "Unknown RelationshipProperty value: %s" % type(val))
+        elapsed = time.time() - start
+        logger.info("Stored %d files (%.1f MiB) in %.1f seconds (%.1f "
+                    "MiB/s).", len(missing), total_size / 2 ** 20, elapsed,
+                    total_size / 2 ** 20 / max(elapsed, 0.001))
+        return True
 
-    def safe_put_file(self, path, descr_path):
+    def safe_put_file(self, digest):
 
-        """Put a file to FileCacher signaling every error (including
-        digest mismatch).
+        """Put a file of the dump to FileCacher signaling every error
+        (including digest mismatch).
 
-        path (string): the path from which to load the file.
-        descr_path (string): same for description.
+        digest (unicode): the digest of the file, i.e., its name in
+            the dump.
 
-        return (bool): True if all ok, False if something wrong.
+        return (int|None): the size of the file, or None if something
+            wrong.
 
         """
-
-        # TODO - Probably this method could be merged in FileCacher
+        path = os.path.join(self.import_dir, "files", digest)
+        descr_path = os.path.join(self.import_dir, "descriptions", digest)
 
         # First read the description.
         try:
@@ -451,20 +721,21 @@ class DumpImporter(object):
 
         # Put the file.
         try:
-            digest = self.file_cacher.put_file_from_path(path, description)
+            calc_digest = self.file_cacher.put_file_from_path(
+                path, description)
+            size = os.path.getsize(path)
         except Exception as error:
             logger.critical("File %s could not be put to file server (%r), "
                             "aborting.", path, error)
-            return False
+            return None
 
         # Then check the digest.
-        calc_digest = path_digest(path)
         if digest != calc_digest:
-            logger.critical("File %s has hash %s, but the server returned %s, "
-                            "aborting.", path, calc_digest, digest)
-            return False
+            logger.critical("File %s has hash %s, aborting.",
+                            path, calc_digest)
+            return None
 
-        return True
+        return size
 
 
 def main():
@@ -27,6 +27,7 @@ from six import iterkeys, itervalues, iteritems
 
 import argparse
 import functools
+import gzip
 import io
 import json
 import logging
@@ -35,6 +36,7 @@ import pprint
 import re
 import shutil
 import time
+import zlib
 from datetime import datetime
 
 import gevent
@@ -140,6 +142,39 @@ class StoreHandler(object):
             request.authorization.username == self.username and \
             request.authorization.password == self.password
 
+    @staticmethod
+    def load_json(request):
+        """Decode the JSON body of a request.
+
+        The body may be compressed, as declared by its Content-Encoding
+        header (only gzip is supported).
+
+        request (Request): the request.
+
+        return (object): the decoded body.
+
+        raise (HTTPException): if the encoding is not supported or the
+            body is not valid.
+
+        """
+        encoding = request.headers.get("Content-Encoding", "identity")
+        if encoding == "identity":
+            stream = request.stream
+        elif encoding == "gzip":
+            stream = gzip.GzipFile(fileobj=request.stream, mode="rb")
+        else:
+            logger.warning("Unsupported content encoding.",
+                           extra={'location': request.url,
+                                  'details': encoding})
+            raise UnsupportedMediaType()
+
+        try:
+            return json.loads(stream.read().decode("utf-8"))
+        except (TypeError, ValueError, IOError, EOFError, zlib.error):
+            logger.warning("Wrong JSON.",
+                           extra={'location': request.url})
+            raise BadRequest()
+
     def get(self, request, response, key):
         # Limit charset of keys.
         if re.match("^[A-Za-z0-9_]+$", key) is None:
@@ -173,12 +208,7 @@ class StoreHandler(object):
                                   'details': request.mimetype})
             raise UnsupportedMediaType()
 
-        try:
-            data = json.load(request.stream)
-        except (TypeError, ValueError):
-            logger.warning("Wrong JSON.",
-                           extra={'location': request.url})
-            raise BadRequest()
+        data = self.load_json(request)
 
         try:
             if key not in self.store:
@@ -205,12 +235,7 @@ class StoreHandler(object):
                                   'details': request.mimetype})
             raise UnsupportedMediaType()
 
-        try:
-            data = json.load(request.stream)
-        except (TypeError, ValueError):
-            logger.warning("Wrong JSON.",
-                           extra={'location': request.url})
-            raise BadRequest()
+        data = self.load_json(request)
 
         try:
             self.store.merge_list(data)
@@ -506,6 +531,9 @@ def main():
                         help="override config file")
     parser.add_argument("-d", "--drop", action="store_true",
                         help="drop the data already stored")
+    parser.add_argument("--migrate", action="store_true",
+                        help="only migrate the data stored in the old "
+                        "format (one file per entity) and exit")
     args = parser.parse_args()
 
     config = Config()
@@ -548,6 +576,10 @@ def main():
     stores["submission"].load_from_disk()
     stores["subchange"].load_from_disk()
 
+    if args.migrate:
+        # Loading the stores migrated them.
+        return 0
+
     stores["scoring"] = ScoringStore(stores)
     stores["scoring"].init_store()
 
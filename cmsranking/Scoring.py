@@ -26,7 +26,6 @@ from __future__ import unicode_literals
 from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
 from six import itervalues, iteritems
-from six.moves import zip_longest
 
 import heapq
 import logging
@@ -48,24 +47,66 @@ class NumberSet(object):
 
     It can hold the same value multiple times.
 
-    This data structure could be implemented with a binary tree, but
-    at the moment we're actually using a standard python list.
+    It is implemented as a binary heap with lazy deletion: a value is
+    pushed on the heap only when it isn't already there, and removing
+    it only decreases its multiplicity; values whose multiplicity
+    dropped to zero are popped when they reach the top of the heap
+    (or all together, when they become the majority of the heap).
+    Hence all operations take amortized logarithmic time.
 
     """
     def __init__(self):
-        self._impl = list()
+        # The heap of the (distinct) values, negated to have the
+        # maximum on top.
+        self._heap = list()
+        # The multiplicity of each value in the heap (possibly zero).
+        self._counts = dict()
+        # The number of values in the heap with zero multiplicity.
+        self._stale = 0
 
     def insert(self, val):
-        self._impl.append(val)
+        count = self._counts.get(val)
+        if count is None:
+            self._counts[val] = 1
+            heapq.heappush(self._heap, -val)
+        else:
+            if count == 0:
+                self._stale -= 1
+            self._counts[val] = count + 1
 
     def remove(self, val):
-        self._impl.remove(val)
+        count = self._counts.get(val, 0)
+        if count == 0:
+            raise ValueError("NumberSet.remove(x): x not in NumberSet")
+        self._counts[val] = count - 1
+        if count == 1:
+            self._stale += 1
+            if 2 * self._stale > len(self._heap):
+                self._compact()
 
     def query(self):
-        return max(self._impl + [0.0])
+        while len(self._heap) > 0 and self._counts[-self._heap[0]] == 0:
+            del self._counts[-heapq.heappop(self._heap)]
+            self._stale -= 1
+        if len(self._heap) == 0:
+            return 0.0
+        return max(-self._heap[0], 0.0)
 
     def clear(self):
-        del self._impl[:]
+        del self._heap[:]
+        self._counts.clear()
+        self._stale = 0
+
+    def _compact(self):
+        """Drop from the heap all the values that have been removed.
+
+        """
+        self._counts = dict((val, count)
+                            for val, count in iteritems(self._counts)
+                            if count > 0)
+        self._heap = [-val for val in self._counts]
+        heapq.heapify(self._heap)
+        self._stale = 0
 
 
 class Score(object):
@@ -90,9 +131,18 @@ class Score(object):
         # The list of changes of the submissions.
         self._changes = list()
 
+        # The set of the scores of all the submissions (only in score
+        # mode max).
+        self._scores = NumberSet()
+
         # The set of the scores of the currently released submissions.
         self._released = NumberSet()
 
+        # For each subtask, the set of the scores of all the
+        # submissions on it, as given by their extra (only in score
+        # mode max_subtask).
+        self._subtask_scores = list()
+
         # The last submitted submission (with at least one subchange).
         self._last = None
 
@@ -103,36 +153,28 @@ class Score(object):
         self._score_mode = score_mode
 
     def append_change(self, change):
-        # Remove from released submission (if needed), apply changes,
-        # add back to released submissions (if needed) and check if
-        # it's the last. Compute the new score and, if it changed,
-        # append it to the history.
-        s_id = change.submission
-        if self._submissions[s_id].token:
-            self._released.remove(self._submissions[s_id].score)
+        # Remove the submission from the sets of scores, apply changes,
+        # add it back and check if it's the last. Compute the new score
+        # and, if it changed, append it to the history. Each step only
+        # looks at the changed submission.
+        submission = self._submissions[change.submission]
+        self._remove_from_sets(submission)
         if change.score is not None:
-            self._submissions[s_id].score = change.score
+            submission.score = change.score
         if change.token is not None:
-            self._submissions[s_id].token = change.token
+            submission.token = change.token
         if change.extra is not None:
-            self._submissions[s_id].extra = change.extra
-        if self._submissions[s_id].token:
-            self._released.insert(self._submissions[s_id].score)
+            submission.extra = change.extra
+        self._add_to_sets(submission)
         if change.score is not None and \
-                (self._last is None or
-                 self._submissions[s_id].time > self._last.time):
-            self._last = self._submissions[s_id]
+                (self._last is None or submission.time > self._last.time):
+            self._last = submission
 
         if self._score_mode == SCORE_MODE_MAX:
-            score = max([0.0] +
-                        [submission.score
-                         for submission in itervalues(self._submissions)])
+            score = self._scores.query()
         elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
-            scores_by_submission = (map(float, s.extra or [])
-                                    for s in itervalues(self._submissions))
-            scores_by_subtask = zip_longest(*scores_by_submission,
-                                            fillvalue=0.0)
-            score = float(sum(max(s) for s in scores_by_subtask))
+            score = float(sum(scores.query()
+                              for scores in self._subtask_scores))
         elif self._score_mode == SCORE_MODE_MAX_TOKENED_LAST:
             score = max(self._released.query(),
                         self._last.score if self._last is not None else 0.0)
@@ -142,13 +184,54 @@ class Score(object):
         if score != self.get_score():
             self._history.append((change.time, score))
 
+    def _add_to_sets(self, submission):
+        """Add the scores of a submission to the sets that need them.
+
+        Only the sets used by the current score mode are kept.
+
+        submission (Submission): the submission.
+
+        """
+        if self._score_mode == SCORE_MODE_MAX:
+            self._scores.insert(submission.score)
+        elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
+            for _ in range(len(self._subtask_scores), len(submission.extra)):
+                self._subtask_scores.append(NumberSet())
+            for scores, value in zip(self._subtask_scores, submission.extra):
+                scores.insert(float(value))
+        if submission.token:
+            self._released.insert(submission.score)
+
+    def _remove_from_sets(self, submission):
+        """Remove the scores of a submission from the sets.
+
+        submission (Submission): the submission.
+
+        """
+        if self._score_mode == SCORE_MODE_MAX:
+            self._scores.remove(submission.score)
+        elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
+            for scores, value in zip(self._subtask_scores, submission.extra):
+                scores.remove(float(value))
+        if submission.token:
+            self._released.remove(submission.score)
+
+    def _rebuild_sets(self):
+        """Fill the sets of scores from the current submissions.
+
+        """
+        self._scores.clear()
+        self._released.clear()
+        del self._subtask_scores[:]
+        for submission in itervalues(self._submissions):
+            self._add_to_sets(submission)
+
     def get_score(self):
         return self._history[-1][1] if len(self._history) > 0 else 0.0
 
     def reset_history(self):
         # Delete everything except the submissions and the subchanges.
         self._last = None
-        self._released.clear()
         del self._history[:]
 
         # Reset the submissions at their default value.
@@ -156,6 +239,7 @@ class Score(object):
             sub.score = 0.0
             sub.token = False
             sub.extra = list()
+        self._rebuild_sets()
 
         # Append each change, one at a time.
         for change in self._changes:
@@ -211,6 +295,7 @@ class Score(object):
         submission.token = False
         submission.extra = list()
         self._submissions[key] = submission
+        self._add_to_sets(submission)
 
     def update_submission(self, key, submission):
         # An updated submission may cause an update in history because
@@ -230,7 +315,9 @@ class Score(object):
             self.reset_history()
 
     def update_score_mode(self, score_mode):
-        self._score_mode = score_mode
+        if score_mode != self._score_mode:
+            self._score_mode = score_mode
+            self._rebuild_sets()
 
 
 class ScoringStore(object):
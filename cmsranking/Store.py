@@ -23,7 +23,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
-from six import PY3, iterkeys, iteritems
+from six import iterkeys, iteritems
 
 import io
 import json
@@ -43,6 +43,168 @@ logger = logging.getLogger(__name__)
 LOCK = RLock()
 
 
+class Journal(object):
+    """The persistent storage of the entities of a store.
+
+    The state of the store is kept in a directory, in two files with
+    the same format, one JSON-encoded [key, data] pair per line (data
+    is null for deleted entities): a snapshot, with all the entities
+    at some point in time, and a journal, where the changes made after
+    the snapshot are appended. Loading the state means reading the
+    snapshot and replaying the journal, and when the journal becomes
+    longer than the snapshot it is compacted into a new snapshot.
+
+    The names of the files contain a dot, which is not allowed in the
+    keys, so they do not clash with the files of the previous layout
+    (one <key>.json file per entity), from which the entities are
+    migrated when the journal does not exist yet.
+
+    """
+
+    SNAPSHOT = "store.snapshot"
+    JOURNAL = "store.journal"
+
+    # The journal is never compacted before having this many lines.
+    MIN_COMPACTION = 1000
+
+    def __init__(self, path):
+        """Create the storage in the given directory.
+
+        path (str): the directory holding the files.
+
+        """
+        self._path = path
+        self._snapshot_path = os.path.join(path, self.SNAPSHOT)
+        self._journal_path = os.path.join(path, self.JOURNAL)
+        self._journal_fobj = None
+        # Number of lines in the journal.
+        self._journal_size = 0
+
+    def exists(self):
+        """Return whether the files of the journal exist.
+
+        return (bool): whether they exist.
+
+        """
+        return os.path.exists(self._snapshot_path) \
+            or os.path.exists(self._journal_path)
+
+    @staticmethod
+    def _read(path):
+        """Read the pairs in a file.
+
+        A last line without newline (as written by a crash) is ignored
+        and cut from the file, so that appending can continue.
+
+        path (str): the path of the file.
+
+        return ([(unicode, dict|None)]): the pairs.
+
+        """
+        pairs = []
+        if not os.path.exists(path):
+            return pairs
+        valid_size = 0
+        with io.open(path, 'rb') as fobj:
+            for line in fobj:
+                if not line.endswith(b"\n"):
+                    logger.warning("Truncated line ignored.",
+                                   extra={'location': path})
+                    break
+                try:
+                    key, data = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    logger.error("Invalid JSON", exc_info=False,
+                                 extra={'location': path})
+                else:
+                    pairs.append((key, data))
+                valid_size += len(line)
+        if valid_size < os.path.getsize(path):
+            with io.open(path, 'r+b') as fobj:
+                fobj.truncate(valid_size)
+        return pairs
+
+    @staticmethod
+    def _encode(pairs):
+        return b"".join(json.dumps([key, data]).encode("utf-8") + b"\n"
+                        for key, data in pairs)
+
+    def load(self):
+        """Return the entities stored.
+
+        return ({unicode: dict}): the data of the entities by key.
+
+        """
+        entities = dict()
+        for key, data in self._read(self._snapshot_path):
+            entities[key] = data
+        journal = self._read(self._journal_path)
+        for key, data in journal:
+            if data is None:
+                entities.pop(key, None)
+            else:
+                entities[key] = data
+        self._journal_size = len(journal)
+        return entities
+
+    def write(self, pairs):
+        """Append changes to the journal.
+
+        pairs ([(unicode, dict|None)]): the changed entities, with
+            their new data or None if deleted.
+
+        raise (IOError): if the changes could not be written.
+
+        """
+        if len(pairs) == 0:
+            return
+        if self._journal_fobj is None:
+            self._journal_fobj = io.open(self._journal_path, 'ab')
+        self._journal_fobj.write(self._encode(pairs))
+        self._journal_fobj.flush()
+        os.fsync(self._journal_fobj.fileno())
+        self._journal_size += len(pairs)
+
+    def needs_compaction(self, entities_count):
+        """Return whether the journal should be compacted.
+
+        entities_count (int): the number of entities in the store.
+
+        return (bool): whether compact should be called.
+
+        """
+        return self._journal_size >= max(self.MIN_COMPACTION,
+                                         entities_count)
+
+    def compact(self, entities):
+        """Replace the snapshot and the journal with a new snapshot.
+
+        entities ({unicode: dict}): the data of all the entities.
+
+        raise (IOError): if the snapshot could not be written.
+
+        """
+        temp_path = self._snapshot_path + ".tmp"
+        with io.open(temp_path, 'wb') as fobj:
+            fobj.write(self._encode(iteritems(entities)))
+            fobj.flush()
+            os.fsync(fobj.fileno())
+        # Renaming is atomic; if we crash before the journal is
+        # emptied, replaying it on the new snapshot gives the same
+        # state.
+        os.rename(temp_path, self._snapshot_path)
+        if self._journal_fobj is not None:
+            self._journal_fobj.close()
+        self._journal_fobj = io.open(self._journal_path, 'wb')
+        self._journal_size = 0
+
+    def close(self):
+        """Close the journal file, if open."""
+        if self._journal_fobj is not None:
+            self._journal_fobj.close()
+            self._journal_fobj = None
+
+
 class Store(object):
     """A store for entities.
 
@@ -72,13 +234,52 @@ class Store(object):
         self._all_stores = all_stores
         self._depends = depends if depends is not None else []
         self._store = dict()
+        self._journal = Journal(path)
         self._create_callbacks = list()
         self._update_callbacks = list()
         self._delete_callbacks = list()
 
+    def _load_files(self):
+        """Load the entities stored one per file, as done previously.
+
+        return ({unicode: dict}): the data of the entities by key.
+
+        """
+        entities = dict()
+        for name in os.listdir(self._path):
+            # TODO check that the key is '[A-Za-z0-9_]+'
+            if name[-5:] == '.json' and name[:-5] != '':
+                try:
+                    with io.open(os.path.join(self._path, name), 'rb') as rec:
+                        entities[name[:-5]] = json.loads(
+                            rec.read().decode("utf-8"))
+                except ValueError:
+                    logger.error("Invalid JSON", exc_info=False,
+                                 extra={'location':
+                                        os.path.join(self._path, name)})
+        return entities
+
+    def _migrate_files(self):
+        """Move the entities stored one per file into the journal.
+
+        return ({unicode: dict}): the data of the entities by key.
+
+        """
+        entities = self._load_files()
+        if len(entities) > 0:
+            logger.info("Migrating %d entities in %s to a journal.",
+                        len(entities), self._path)
+            self._journal.compact(entities)
+            for key in iterkeys(entities):
+                os.remove(os.path.join(self._path, key + '.json'))
+        return entities
+
     def load_from_disk(self):
         """Load the initial data for this store from the disk.
 
+        Entities stored in the previous format (one file per entity)
+        are migrated to the journal.
+
         """
         try:
             os.mkdir(self._path)
@@ -87,26 +288,45 @@ class Store(object):
             pass
 
         try:
-            for name in os.listdir(self._path):
-                # TODO check that the key is '[A-Za-z0-9_]+'
-                if name[-5:] == '.json' and name[:-5] != '':
-                    with io.open(os.path.join(self._path, name), 'rb') as rec:
-                        item = self._entity()
-                        item.set(json.load(rec))
-                        item.key = name[:-5]
-                        self._store[name[:-5]] = item
+            if self._journal.exists():
+                entities = self._journal.load()
+            else:
+                entities = self._migrate_files()
         except OSError:
             # the path isn't a directory or is inaccessible
             logger.error("Path is not a directory or is not accessible",
                          exc_info=True)
+            return
         except IOError:
             logger.error("I/O error occured", exc_info=True)
-        except ValueError:
-            logger.error("Invalid JSON", exc_info=False,
-                         extra={'location': os.path.join(self._path, name)})
-        except InvalidData as exc:
-            logger.error(exc.message, exc_info=False,
-                         extra={'location': os.path.join(self._path, name)})
+            return
+
+        for key, data in iteritems(entities):
+            try:
+                item = self._entity()
+                item.set(data)
+                item.key = key
+                self._store[key] = item
+            except InvalidData as exc:
+                logger.error("%s", exc, exc_info=False,
+                             extra={'location': self._path,
+                                    'details': key})
+
+    def _write(self, pairs, operation):
+        """Reflect changes on the persistent storage.
+
+        pairs ([(unicode, dict|None)]): the changed entities, with
+            their new data or None if deleted.
+        operation (unicode): description of the change, for logging.
+
+        """
+        try:
+            self._journal.write(pairs)
+            if self._journal.needs_compaction(len(self._store)):
+                self._journal.compact(self.retrieve_list())
+        except (IOError, OSError):
+            logger.error("I/O error occured while %s", operation,
+                         exc_info=True)
 
     def add_create_callback(self, callback):
         """Add a callback to be called when entities are created.
@@ -165,17 +385,7 @@ class Store(object):
             for callback in self._create_callbacks:
                 callback(key, item)
             # reflect changes on the persistent storage
-            try:
-                path = os.path.join(self._path, key + '.json')
-                if PY3:
-                    with io.open(path, 'wt', encoding="utf-8") as rec:
-                        json.dump(self._store[key].get(), rec)
-                else:
-                    with io.open(path, 'wb') as rec:
-                        json.dump(self._store[key].get(), rec)
-            except IOError:
-                logger.error("I/O error occured while creating entity",
-                             exc_info=True)
+            self._write([(key, item.get())], "creating entity")
 
     def update(self, key, data):
         """Update an entity.
@@ -208,17 +418,7 @@ class Store(object):
             for callback in self._update_callbacks:
                 callback(key, old_item, item)
             # reflect changes on the persistent storage
-            try:
-                path = os.path.join(self._path, key + '.json')
-                if PY3:
-                    with io.open(path, 'wt', encoding="utf-8") as rec:
-                        json.dump(self._store[key].get(), rec)
-                else:
-                    with io.open(path, 'wb') as rec:
-                        json.dump(self._store[key].get(), rec)
-            except IOError:
-                logger.error("I/O error occured while updating entity",
-                             exc_info=True)
+            self._write([(key, item.get())], "updating entity")
 
     def merge_list(self, data_dict):
         """Merge a list of entities.
@@ -267,19 +467,11 @@ class Store(object):
                 else:
                     for callback in self._update_callbacks:
                         callback(key, old_value, value)
-                # reflect changes on the persistent storage
-                try:
-                    path = os.path.join(self._path, key + '.json')
-                    if PY3:
-                        with io.open(path, 'wt', encoding="utf-8") as rec:
-                            json.dump(value.get(), rec)
-                    else:
-                        with io.open(path, 'wb') as rec:
-                            json.dump(value.get(), rec)
-                except IOError:
-                    logger.error(
-                        "I/O error occured while merging entity lists",
-                        exc_info=True)
+
+            # reflect changes on the persistent storage, all at once
+            self._write([(key, value.get())
+                         for key, value in iteritems(item_dict)],
+                        "merging entity lists")
 
     def delete(self, key):
         """Delete an entity.
@@ -308,10 +500,7 @@ class Store(object):
             for callback in self._delete_callbacks:
                 callback(key, old_value)
             # reflect changes on the persistent storage
-            try:
-                os.remove(os.path.join(self._path, key + '.json'))
-            except OSError:
-                logger.error("Unable to delete entity", exc_info=True)
+            self._write([(key, None)], "deleting entity")
 
     def delete_list(self):
         """Delete all entities.
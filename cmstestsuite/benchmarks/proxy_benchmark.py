@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Benchmark of sending data from ProxyService to a ranking, with a
+new connection and uncompressed data for each request (as before) and
+with a persistent session and compressed data.
+
+By default the ranking is a stub, running in another process and
+listening on localhost, that decodes the data of the requests and
+discards it. On localhost connections are cheap: to see the savings
+of a real deployment let the stub use HTTPS with a self-signed
+certificate, created for example with
+
+    openssl req -x509 -newkey rsa:2048 -nodes -keyout key.pem \
+        -out cert.pem -subj /CN=127.0.0.1 -addext subjectAltName=IP:127.0.0.1
+
+or give the URL of an actual RWS over the network.
+
+Run with: python -m cmstestsuite.benchmarks.proxy_benchmark
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+# requests needs to be cooperative to talk to the server in the same
+# process.
+import gevent.monkey
+gevent.monkey.patch_all()  # noqa
+
+import argparse
+import gzip
+import io
+import json
+import multiprocessing
+import sys
+import time
+
+import requests
+from gevent.pywsgi import WSGIServer
+
+from cms import config
+from cms.service.ProxyService import safe_put_data
+
+
+def stub_ranking(environ, start_response):
+    """A WSGI application accepting data as RWS does."""
+    body = environ["wsgi.input"].read()
+    if environ.get("HTTP_CONTENT_ENCODING") == "gzip":
+        body = gzip.GzipFile(fileobj=io.BytesIO(body), mode="rb").read()
+    json.loads(body.decode("utf-8"))
+    start_response(str("204 No Content"), [])
+    return [b""]
+
+
+def serve_stub_ranking(port_queue, certfile=None, keyfile=None):
+    """Run the stub ranking, putting its port in port_queue.
+
+    port_queue (multiprocessing.Queue): where to put the port.
+    certfile (str|None): the certificate to use HTTPS with.
+    keyfile (str|None): the private key of the certificate.
+
+    """
+    ssl_args = dict()
+    if certfile is not None:
+        ssl_args = {"certfile": certfile, "keyfile": keyfile}
+    server = WSGIServer(("127.0.0.1", 0), stub_ranking, log=None,
+                        **ssl_args)
+    server.start()
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def make_batches(batches, size):
+    """Generate the subchanges sent to the ranking during a contest.
+
+    batches (int): number of batches.
+    size (int): number of subchanges in each batch.
+
+    return ([{str: {str: object}}]): the batches.
+
+    """
+    result = []
+    for batch in range(batches):
+        data = dict()
+        for i in range(size):
+            submission_id = "%d" % (batch * size + i)
+            data["1500000000%ss" % submission_id] = {
+                "submission": submission_id,
+                "time": 1500000000,
+                "score": 42.5,
+                "extra": ["10", "0", "32.5", "0"],
+            }
+        result.append(data)
+    return result
+
+
+def run(url, batches, session, compress):
+    """Send the batches, returning the total time and bytes sent.
+
+    url (str): the URL of the ranking.
+    batches ([dict]): the data to send.
+    session (requests.Session|None): see safe_put_data.
+    compress (bool): see safe_put_data.
+
+    return ((float, int)): the time, in seconds, and the bytes sent.
+
+    """
+    sent = 0
+    start = time.time()
+    for data in batches:
+        _, size = safe_put_data(url, "subchanges/", data, "benchmark",
+                                session=session, compress=compress)
+        sent += size
+    return time.time() - start, sent
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark sending data to a ranking.")
+    parser.add_argument(
+        "-b", "--batches", action="store", type=int, default=500,
+        help="number of requests sent (default 500)")
+    parser.add_argument(
+        "-s", "--size", action="store", type=int, default=50,
+        help="number of subchanges in each request (default 50)")
+    parser.add_argument(
+        "-u", "--url", action="store", type=str,
+        help="URL of the ranking (default a local stub); note that the "
+             "data is actually stored there")
+    parser.add_argument(
+        "-c", "--certfile", action="store", type=str,
+        help="certificate for the stub ranking to use HTTPS with")
+    parser.add_argument(
+        "-k", "--keyfile", action="store", type=str,
+        help="private key of the certificate of the stub ranking")
+    args = parser.parse_args()
+
+    server = None
+    if args.url is None:
+        port_queue = multiprocessing.Queue()
+        server = multiprocessing.Process(
+            target=serve_stub_ranking,
+            args=(port_queue, args.certfile, args.keyfile))
+        server.start()
+        args.url = "%s://usern4me:passw0rd@127.0.0.1:%d/" % (
+            "https" if args.certfile is not None else "http",
+            port_queue.get())
+        if args.certfile is not None:
+            config.https_certfile = args.certfile
+    try:
+        url = args.url
+        batches = make_batches(args.batches, args.size)
+
+        print("%-26s %12s %14s" % ("method", "time (s)", "sent/req (B)"))
+        for name, session, compress in [
+                ("new connections", None, False),
+                ("session", requests.Session(), False),
+                ("session and compression", requests.Session(), True)]:
+            elapsed, sent = run(url, batches, session, compress)
+            print("%-26s %12.3f %14d" % (name, elapsed,
+                                         sent // args.batches))
+    finally:
+        if server is not None:
+            server.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
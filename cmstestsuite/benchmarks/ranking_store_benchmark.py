@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Benchmark of the persistent stores of RWS, storing each entity in a
+file (as before) and in a journal.
+
+The stores receive subchanges in batches, as sent by ProxyService,
+and are then loaded again, as when RWS restarts.
+
+Run with: python -m cmstestsuite.benchmarks.ranking_store_benchmark
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from cmsranking.Store import Store
+from cmsranking.Subchange import Subchange
+
+
+class _FileStore(Store):
+    """A store writing one file per entity, as previously done."""
+
+    def _write(self, pairs, operation):
+        for key, data in pairs:
+            path = os.path.join(self._path, key + '.json')
+            if data is None:
+                os.remove(path)
+            else:
+                with io.open(path, 'wt', encoding="utf-8") as rec:
+                    json.dump(data, rec)
+
+    def load_from_disk(self):
+        if not os.path.exists(self._path):
+            os.mkdir(self._path)
+        for key, data in self._load_files().items():
+            item = self._entity()
+            item.set(data)
+            item.key = key
+            self._store[key] = item
+
+
+def make_batches(count, size):
+    """Generate the subchanges, in batches.
+
+    count (int): the number of subchanges.
+    size (int): the number of subchanges per batch.
+
+    return ([{str: {str: object}}]): the batches.
+
+    """
+    batches = []
+    for start in range(0, count, size):
+        batch = dict()
+        for i in range(start, min(start + size, count)):
+            batch["1500000000%ds" % i] = {
+                "submission": "%d" % i,
+                "time": 1500000000,
+                "score": 42.5,
+                "extra": ["10", "0", "32.5", "0"],
+            }
+        batches.append(batch)
+    return batches
+
+
+def run(store_class, path, batches):
+    """Store the batches and load them again.
+
+    store_class (type): the class of the store.
+    path (str): the directory of the store.
+    batches ([dict]): the subchanges to store.
+
+    return ((float, float)): the time, in seconds, to store the
+        batches and to load them.
+
+    """
+    store = store_class(Subchange, path, {})
+    store.load_from_disk()
+    start = time.time()
+    for batch in batches:
+        store.merge_list(batch)
+    write_time = time.time() - start
+
+    start = time.time()
+    store = store_class(Subchange, path, {})
+    store.load_from_disk()
+    load_time = time.time() - start
+    assert len(store.retrieve_list()) == sum(len(b) for b in batches)
+    return write_time, load_time
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the persistent stores of RWS.")
+    parser.add_argument(
+        "-n", "--subchanges", action="store", type=int, default=100000,
+        help="number of subchanges (default 100000)")
+    parser.add_argument(
+        "-b", "--batch", action="store", type=int, default=100,
+        help="number of subchanges per batch (default 100)")
+    args = parser.parse_args()
+
+    batches = make_batches(args.subchanges, args.batch)
+    print("%-8s %12s %12s" % ("storage", "write (s)", "load (s)"))
+    for name, store_class in [("files", _FileStore), ("journal", Store)]:
+        base_dir = tempfile.mkdtemp()
+        try:
+            write_time, load_time = run(
+                store_class, os.path.join(base_dir, "subchanges"), batches)
+        finally:
+            shutil.rmtree(base_dir)
+        print("%-8s %12.3f %12.3f" % (name, write_time, load_time))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of putting files from the storage into sandboxes, by
+copying them (as before) and by linking them.
+
+Each "job" creates a sandbox and puts in it an executable and a
+testcase input, as an evaluation does. Only plain files are linked:
+the files of the local cache are not executable, so the executable is
+copied with both methods.
+
+Run with: python -m cmstestsuite.benchmarks.sandbox_files_benchmark
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from cms.db.filecacher import FileCacher
+from cms.grading.Sandbox import StupidSandbox
+
+
+def _copy_from_storage(sandbox, path, digest, executable=False):
+    """The previous implementation of create_file_from_storage."""
+    with sandbox.create_file(path, executable) as dest_fobj:
+        sandbox.file_cacher.get_file_to_fobj(digest, dest_fobj)
+        sandbox.bytes_copied += dest_fobj.tell()
+
+
+def _link_from_storage(sandbox, path, digest, executable=False):
+    sandbox.create_file_from_storage(path, digest, executable)
+
+
+def run_jobs(file_cacher, function, jobs, files):
+    """Run the jobs, returning the total time and bytes copied.
+
+    file_cacher (FileCacher): the file cacher holding the files.
+    function (function): how to put a file in the sandbox.
+    jobs (int): number of jobs.
+    files ([(unicode, unicode, bool)]): path, digest and whether it
+        is executable of the files of each job.
+
+    return ((float, int, int)): the time, in seconds, and the bytes
+        copied and linked.
+
+    """
+    elapsed = 0.0
+    copied = linked = 0
+    for _ in range(jobs):
+        sandbox = StupidSandbox(file_cacher)
+        start = time.time()
+        for path, digest, executable in files:
+            function(sandbox, path, digest, executable)
+        elapsed += time.time() - start
+        copied += sandbox.bytes_copied
+        linked += sandbox.bytes_linked
+        sandbox.cleanup(delete=True)
+    return elapsed, copied, linked
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark putting files into sandboxes.")
+    parser.add_argument(
+        "-s", "--size", action="store", type=float, default=50.0,
+        help="size of the testcase input, in MB (default 50)")
+    parser.add_argument(
+        "-j", "--jobs", action="store", type=int, default=20,
+        help="number of jobs (default 20)")
+    args = parser.parse_args()
+
+    storage_dir = tempfile.mkdtemp()
+    try:
+        file_cacher = FileCacher(path=storage_dir)
+        files = [
+            ("input.txt", file_cacher.put_file_content(
+                os.urandom(int(args.size * 10 ** 6))), False),
+            ("solution", file_cacher.put_file_content(
+                os.urandom(2 * 10 ** 6)), True),
+        ]
+
+        print("%-8s %12s %14s %14s" % ("method", "time (s)",
+                                       "copied/job (B)", "linked/job (B)"))
+        for name, function in [("copy", _copy_from_storage),
+                               ("link", _link_from_storage)]:
+            elapsed, copied, linked = run_jobs(
+                file_cacher, function, args.jobs, files)
+            print("%-8s %12.3f %14d %14d" % (name, elapsed,
+                                             copied // args.jobs,
+                                             linked // args.jobs))
+    finally:
+        shutil.rmtree(storage_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
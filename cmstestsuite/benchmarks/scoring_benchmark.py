@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the score computation of the ranking against the
+implementation it replaced, which rescanned all the submissions of a
+user on a task at each change.
+
+The benchmark replays a synthetic contest history, as RWS does when it
+starts.
+
+Run with: python -m cmstestsuite.benchmarks.scoring_benchmark
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+from six import itervalues
+from six.moves import zip_longest
+
+import argparse
+import random
+import sys
+import time
+
+from cmscommon.constants import \
+    SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
+from cmsranking.Scoring import Score
+from cmsranking.Subchange import Subchange
+from cmsranking.Submission import Submission
+
+
+class _ListNumberSet(object):
+    """The previous implementation of NumberSet, as a reference."""
+
+    def __init__(self):
+        self._impl = list()
+
+    def insert(self, val):
+        self._impl.append(val)
+
+    def remove(self, val):
+        self._impl.remove(val)
+
+    def query(self):
+        return max(self._impl + [0.0])
+
+    def clear(self):
+        del self._impl[:]
+
+
+class _RescanScore(Score):
+    """The previous implementation of Score, as a reference."""
+
+    def __init__(self, score_mode):
+        super(_RescanScore, self).__init__(score_mode)
+        self._released = _ListNumberSet()
+
+    def append_change(self, change):
+        s_id = change.submission
+        if self._submissions[s_id].token:
+            self._released.remove(self._submissions[s_id].score)
+        if change.score is not None:
+            self._submissions[s_id].score = change.score
+        if change.token is not None:
+            self._submissions[s_id].token = change.token
+        if change.extra is not None:
+            self._submissions[s_id].extra = change.extra
+        if self._submissions[s_id].token:
+            self._released.insert(self._submissions[s_id].score)
+        if change.score is not None and \
+                (self._last is None or
+                 self._submissions[s_id].time > self._last.time):
+            self._last = self._submissions[s_id]
+
+        if self._score_mode == SCORE_MODE_MAX:
+            score = max([0.0] +
+                        [submission.score
+                         for submission in itervalues(self._submissions)])
+        elif self._score_mode == SCORE_MODE_MAX_SUBTASK:
+            scores_by_submission = (map(float, s.extra or [])
+                                    for s in itervalues(self._submissions))
+            scores_by_subtask = zip_longest(*scores_by_submission,
+                                            fillvalue=0.0)
+            score = float(sum(max(s) for s in scores_by_subtask))
+        else:
+            score = max(self._released.query(),
+                        self._last.score if self._last is not None else 0.0)
+
+        if score != self.get_score():
+            self._history.append((change.time, score))
+
+
+def make_history(users, tasks, submissions, subtasks, seed=0):
+    """Generate the events of a synthetic contest.
+
+    Each submission is followed by a subchange with its score and, for
+    some of them, by another one playing a token on it.
+
+    users (int): number of users.
+    tasks (int): number of tasks.
+    submissions (int): number of submissions of each user on each task.
+    subtasks (int): number of subtasks of each task.
+    seed (int): seed for the random generator.
+
+    return ([(int, unicode, unicode, unicode, Entity)]): the events,
+        sorted by time, as tuples (time, user, task, key, entity), where
+        the entity is either a Submission or a Subchange.
+
+    """
+    rnd = random.Random(seed)
+    events = list()
+    for user in range(users):
+        for task in range(tasks):
+            times = sorted(rnd.sample(range(10 * submissions * tasks),
+                                      submissions))
+            for index, sub_time in enumerate(times):
+                submission = Submission()
+                submission.user = "u%d" % user
+                submission.task = "t%d" % task
+                submission.time = sub_time
+                sub_key = "%d-%d-%d" % (user, task, index)
+                events.append((sub_time, submission.user, submission.task,
+                               sub_key, submission))
+
+                extra = [rnd.choice([0.0, 0.0, 10.0, 20.0, 25.0])
+                         for _ in range(subtasks)]
+                change = Subchange()
+                change.key = sub_key + "s"
+                change.submission = sub_key
+                change.time = sub_time + 1
+                change.score = float(sum(extra))
+                change.extra = ["%g" % x for x in extra]
+                events.append((change.time, submission.user, submission.task,
+                               change.key, change))
+
+                if rnd.random() < 0.2:
+                    change = Subchange()
+                    change.key = sub_key + "t"
+                    change.submission = sub_key
+                    change.time = sub_time + 2
+                    change.token = True
+                    events.append((change.time, submission.user,
+                                   submission.task, change.key, change))
+    events.sort(key=lambda event: event[:4])
+    return events
+
+
+def replay(score_class, score_mode, events):
+    """Feed the events to a fresh set of scores.
+
+    return (({(unicode, unicode): Score}, float)): the scores of each
+        user on each task, and the time it took, in seconds.
+
+    """
+    scores = dict()
+    start = time.time()
+    for _, user, task, key, entity in events:
+        if isinstance(entity, Submission):
+            if (user, task) not in scores:
+                scores[(user, task)] = score_class(score_mode)
+            scores[(user, task)].create_submission(key, entity)
+        else:
+            scores[(user, task)].create_subchange(key, entity)
+    return scores, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the score computation of the ranking.")
+    parser.add_argument(
+        "-u", "--users", action="store", type=int, default=100,
+        help="number of users (default 100)")
+    parser.add_argument(
+        "-t", "--tasks", action="store", type=int, default=3,
+        help="number of tasks (default 3)")
+    parser.add_argument(
+        "-s", "--submissions", action="store", type=int, default=100,
+        help="number of submissions of each user on each task "
+             "(default 100)")
+    parser.add_argument(
+        "-k", "--subtasks", action="store", type=int, default=5,
+        help="number of subtasks of each task (default 5)")
+    args = parser.parse_args()
+
+    events = make_history(args.users, args.tasks, args.submissions,
+                          args.subtasks)
+    print("Replaying %d events." % len(events))
+
+    print("%-20s %12s %12s %8s" % ("score mode", "old (s)", "new (s)",
+                                   "speedup"))
+    for score_mode in [SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK,
+                       SCORE_MODE_MAX_TOKENED_LAST]:
+        # Submissions and subchanges store the state of the replay, so
+        # each replay needs its own copy of the events.
+        old_scores, old = replay(_RescanScore, score_mode, make_history(
+            args.users, args.tasks, args.submissions, args.subtasks))
+        new_scores, new = replay(Score, score_mode, events)
+        for key, score in new_scores.items():
+            if score._history != old_scores[key]._history:
+                print("Different histories for %s with score mode %s." %
+                      (key, score_mode))
+                return 1
+        events = make_history(args.users, args.tasks, args.submissions,
+                              args.subtasks)
+        print("%-20s %12.3f %12.3f %7.1fx" % (score_mode, old, new,
+                                              old / new))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the white-diff comparator against the line-by-line
+implementation it replaced.
+
+Run with: python -m cmstestsuite.benchmarks.whitediff_benchmark
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import argparse
+import random
+import sys
+import time
+from io import BytesIO
+
+from cms.grading.steps import _WHITES, _white_diff
+
+
+def _readline_canonicalize(string):
+    """Canonicalize a line as the previous implementation did."""
+    for char in _WHITES[1:]:
+        string = string.replace(char, _WHITES[0])
+    string = _WHITES[0].join([x for x in string.split(_WHITES[0])
+                              if len(x) > 0])
+    return string
+
+
+def _readline_white_diff(output, res):
+    """The previous implementation of _white_diff, as a reference."""
+    while True:
+        lout = output.readline()
+        lres = res.readline()
+        if len(lres) == 0 and len(lout) == 0:
+            return True
+        elif len(lres) == 0 or len(lout) == 0:
+            lout = lout.strip(b''.join(_WHITES))
+            lres = lres.strip(b''.join(_WHITES))
+            if len(lout) > 0 or len(lres) > 0:
+                return False
+        else:
+            lout = _readline_canonicalize(lout)
+            lres = _readline_canonicalize(lres)
+            if lout != lres:
+                return False
+
+
+def _numbers(rnd, count):
+    return [str(rnd.randint(-10 ** 9, 10 ** 9)).encode('ascii')
+            for _ in range(count)]
+
+
+def make_cases(size_mb, seed=0):
+    """Generate pairs of outputs to compare.
+
+    size_mb (float): the approximate size of each output, in MB.
+    seed (int): seed for the random generator.
+
+    return ([(unicode, bytes, bytes, bool)]): the name of each case,
+        the two outputs, and whether they are equivalent.
+
+    """
+    rnd = random.Random(seed)
+    count = int(size_mb * 10 ** 6 / 11)
+    numbers = _numbers(rnd, count)
+    one_line = b" ".join(numbers) + b"\n"
+    many_lines = b"\n".join(numbers) + b"\n"
+    matrix = b"\n".join(b" ".join(numbers[i:i + 100])
+                        for i in range(0, count, 100)) + b"\n"
+    spaced = b"\r\n".join(b"  " + b"\t".join(numbers[i:i + 100]) + b" "
+                          for i in range(0, count, 100)) + b"\n\n\n"
+    wrong = numbers[:]
+    wrong[-1] = b"x"
+    wrong_matrix = b"\n".join(b" ".join(wrong[i:i + 100])
+                              for i in range(0, count, 100)) + b"\n"
+    return [
+        ("identical, one line", one_line, one_line, True),
+        ("identical, one number per line", many_lines, many_lines, True),
+        ("identical, 100 numbers per line", matrix, matrix, True),
+        ("different whitespaces", spaced, matrix, True),
+        ("wrong last number", wrong_matrix, matrix, False),
+    ]
+
+
+def measure(function, output, res, repetitions):
+    """Return the best time of some runs of a comparator, in seconds."""
+    best = None
+    for _ in range(repetitions):
+        output_fobj, res_fobj = BytesIO(output), BytesIO(res)
+        start = time.time()
+        function(output_fobj, res_fobj)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the white-diff output comparator.")
+    parser.add_argument(
+        "-s", "--size", action="store", type=float, default=20.0,
+        help="approximate size of the outputs, in MB (default 20)")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=3,
+        help="number of runs for each case, of which the best is "
+             "reported (default 3)")
+    args = parser.parse_args()
+
+    print("%-35s %12s %12s %8s" % ("case", "old (s)", "new (s)", "speedup"))
+    for name, output, res, expected in make_cases(args.size):
+        for function in [_readline_white_diff, _white_diff]:
+            if function(BytesIO(output), BytesIO(res)) != expected:
+                print("Wrong result of %s for case %s." %
+                      (function.__name__, name))
+                return 1
+        old = measure(_readline_white_diff, output, res, args.repetitions)
+        new = measure(_white_diff, output, res, args.repetitions)
+        print("%-35s %12.3f %12.3f %7.1fx" % (name, old, new, old / new))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
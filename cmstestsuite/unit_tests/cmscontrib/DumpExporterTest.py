@@ -30,6 +30,7 @@ from six import assertCountEqual, iteritems, itervalues
 import json
 import io
 import os
+import tarfile
 import unittest
 
 # Needs to be first to allow for monkey patching the DB connection string.
@@ -97,9 +98,9 @@ class TestDumpExporter(DatabaseMixin, FileSystemMixin, unittest.TestCase):
         super(TestDumpExporter, self).tearDown()
 
     def do_export(self, contest_ids, dump_files=True, skip_generated=False,
-                  skip_submissions=False):
+                  skip_submissions=False, exporter_class=DumpExporter):
         """Create an exporter and call do_export in a convenient way"""
-        r = DumpExporter(
+        r = exporter_class(
             contest_ids,
             self.target,
             dump_files=dump_files,
@@ -281,6 +282,66 @@ class TestDumpExporter(DatabaseMixin, FileSystemMixin, unittest.TestCase):
         self.assertNotInDump(SubmissionResult)
         self.assertFileNotInDump(self.exe_digest)
 
+    def test_export_archive(self):
+        """Test exporting to an archive, written without a temporary
+        directory.
+
+        """
+        self.target = self.get_path("target.tar.gz")
+        self.assertTrue(self.do_export(None))
+        self.assertFalse(os.path.exists(self.get_path("target")))
+
+        with tarfile.open(self.target) as archive:
+            archive.extractall(self.get_path("extracted"))
+        self.assertEqual(os.listdir(self.get_path("extracted")), ["target"])
+        self.target = os.path.join(self.get_path("extracted"), "target")
+        with io.open(os.path.join(self.target, "contest.json"), "rt",
+                     encoding="utf-8") as f:
+            self.dump = json.load(f)
+
+        contest_key = self.assertInDump(Contest, name=self.contest.name)
+        self.assertInDump(Task, name=self.task.name, contest=contest_key)
+        self.assertInDump(Submission)
+        self.assertFileInDump(self.st_digest, self.st_content)
+        self.assertFileInDump(self.exe_digest, self.exe_content)
+        self.assertFileInDump(self.file_digest, self.file_content)
+
+    def test_small_batches(self):
+        """Test exporting when objects and files span many batches."""
+        for _ in range(5):
+            submission = self.add_submission(self.task, self.participation)
+            self.add_file(submission=submission, digest=self.file_digest)
+        self.session.commit()
+
+        class SmallBatchesExporter(DumpExporter):
+            FILES_BATCH_SIZE = 1
+            OBJECTS_BATCH_SIZE = 2
+
+        self.assertTrue(self.do_export(
+            None, exporter_class=SmallBatchesExporter))
+
+        task_key = self.assertInDump(Task, name=self.task.name)
+        submission_keys = self.dump[task_key]["submissions"]
+        self.assertEqual(len(submission_keys), 6)
+        for key in submission_keys:
+            self.assertEqual(self.dump[key]["task"], task_key)
+        self.assertFileInDump(self.st_digest, self.st_content)
+        self.assertFileInDump(self.exe_digest, self.exe_content)
+        self.assertFileInDump(self.file_digest, self.file_content)
+
+    def test_wrong_digest(self):
+        """Test that files with the wrong content abort the export, and
+        no partial archive is left.
+
+        """
+        wrong_digest = bytes_digest(b"right")
+        self.add_fsobject(wrong_digest, b"wrong")
+        self.add_statement(task=self.task, digest=wrong_digest, language="it")
+        self.session.commit()
+        self.target = self.get_path("target.tar.gz")
+        self.assertFalse(self.do_export(None))
+        self.assertFalse(os.path.exists(self.target))
+
 
 if __name__ == "__main__":
     unittest.main()
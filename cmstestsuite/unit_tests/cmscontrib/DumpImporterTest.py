@@ -36,11 +36,44 @@ import unittest
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
 
-from cms.db import Contest, FSObject, Session, version
+from cms.db import Contest, FSObject, Session, User, version
 
 from cmscommon.digest import bytes_digest
 
-from cmscontrib.DumpImporter import DumpImporter
+from cmscontrib.DumpImporter import DumpImporter, iter_json_items
+
+
+class TestIterJsonItems(unittest.TestCase):
+
+    TEXT = """ {"a": 1, "b" : [1.5, -2e3, true, null],
+        "c": {"d": "x\\"}\\u4f60", "e": {}}, "f": 1234567890,
+        "": "你好" }
+    """
+
+    def items(self, text, chunk_size):
+        return list(iter_json_items(io.StringIO(text), chunk_size))
+
+    def test_chunks(self):
+        """The items are the same whatever the size of the chunks."""
+        expected = list(iteritems(json.loads(TestIterJsonItems.TEXT)))
+        for chunk_size in [1, 2, 3, 7, 1000]:
+            assertCountEqual(
+                self, self.items(TestIterJsonItems.TEXT, chunk_size),
+                expected)
+
+    def test_order(self):
+        """The items are yielded in the order of the file."""
+        self.assertEqual(self.items('{"z": 1, "a": 2, "m": 3}', 2),
+                         [("z", 1), ("a", 2), ("m", 3)])
+
+    def test_empty(self):
+        self.assertEqual(self.items(" {\n} ", 1), [])
+
+    def test_invalid(self):
+        for text in ['', '[1, 2]', '{"a": 1', '{"a": 1,}', '{"a" 1}',
+                     '{"a": 1} 2', '{"a": 12']:
+            with self.assertRaises(ValueError):
+                self.items(text, 2)
 
 
 class TestDumpImporter(DatabaseMixin, FileSystemMixin, unittest.TestCase):
@@ -288,6 +321,90 @@ class TestDumpImporter(DatabaseMixin, FileSystemMixin, unittest.TestCase):
         self.assertFileNotInDb(TestDumpImporter.GENERATED_FILE_DIGEST)
         self.assertFileNotInDb(TestDumpImporter.NON_GENERATED_FILE_DIGEST)
 
+    def test_import_relationships(self):
+        """Test importing objects given only by the other side of their
+        relationships, and the relationships set after insertion.
+
+        """
+        dump = json.loads(json.dumps(TestDumpImporter.DUMP))
+        dump["contest_key"]["tasks"] = ["task_key", "task2_key"]
+        del dump["task_key"]["num"]
+        dump["task2_key"] = {
+            "_class": "Task",
+            "name": "task2name",
+            "title": "task 2 title",
+            "datasets": ["dataset2_key"],
+            "active_dataset": "dataset2_key",
+        }
+        dump["dataset2_key"] = dict(dump["dataset_key"],
+                                    description="dataset 2 description")
+        del dump["dataset2_key"]["task"]
+        self.write_dump(dump)
+        self.write_files(TestDumpImporter.FILES)
+        self.assertTrue(self.do_import())
+
+        contest = self.session.query(Contest)\
+            .filter(Contest.name == "contestname").one()
+        self.assertEqual([(t.name, t.num, t.active_dataset.description)
+                          for t in contest.tasks],
+                         [("taskname", 0, "dataset description"),
+                          ("task2name", 1, "dataset 2 description")])
+        submission = contest.tasks[0].submissions[0]
+        self.assertEqual(submission.participation.user.username, "username")
+        self.assertEqual(submission.files["source"].digest,
+                         TestDumpImporter.NON_GENERATED_FILE_DIGEST)
+        self.assertEqual(
+            submission.results[0].executables["exe"].digest,
+            TestDumpImporter.GENERATED_FILE_DIGEST)
+
+    def test_import_unreachable(self):
+        """Test that objects not reachable from the top-level ones are
+        not imported.
+
+        """
+        dump = json.loads(json.dumps(TestDumpImporter.DUMP))
+        dump["_objects"] = ["contest_key"]
+        dump["user2_key"] = dict(dump["user_key"], username="username2")
+        self.write_dump(dump)
+        self.write_files(TestDumpImporter.FILES)
+        self.assertTrue(self.do_import())
+
+        # The first user is reachable through its participation.
+        self.assertContestInDb("contestname", "contest description 你好",
+                               [("taskname", "task title")],
+                               [("username", "Last Name")])
+        self.assertEqual(self.session.query(User)
+                         .filter(User.username == "username2").count(), 0)
+
+    def test_import_existing_files(self):
+        """Test that the files already stored are left untouched."""
+        digest = TestDumpImporter.GENERATED_FILE_DIGEST
+        self.add_fsobject(digest, TestDumpImporter.GENERATED_FILE_CONTENT)
+        self.session.query(FSObject).filter(FSObject.digest == digest)\
+            .update({"description": "old desc"})
+        self.session.commit()
+
+        self.write_dump(TestDumpImporter.DUMP)
+        self.write_files(TestDumpImporter.FILES)
+        self.assertTrue(self.do_import())
+
+        self.assertFileInDb(digest, "old desc", b"content")
+        self.assertFileInDb(
+            TestDumpImporter.NON_GENERATED_FILE_DIGEST, "subsource", b"source")
+
+    def test_import_wrong_digest(self):
+        """Test that a file whose content doesn't match its digest fails
+        the import.
+
+        """
+        self.write_dump(TestDumpImporter.DUMP)
+        self.write_files({
+            TestDumpImporter.GENERATED_FILE_DIGEST: ("desc", b"wrong"),
+            TestDumpImporter.NON_GENERATED_FILE_DIGEST:
+                ("subsource", TestDumpImporter.NON_GENERATED_FILE_CONTENT),
+        })
+        self.assertFalse(self.do_import())
+
     def test_import_old(self):
         """Test importing an old dump.
 
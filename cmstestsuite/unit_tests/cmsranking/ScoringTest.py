@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the computation of the scores in the ranking.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+from six import itervalues
+from six.moves import zip_longest
+
+import random
+import unittest
+
+from cmscommon.constants import \
+    SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
+from cmsranking.Scoring import NumberSet, Score
+from cmsranking.Subchange import Subchange
+from cmsranking.Submission import Submission
+
+
+class TestNumberSet(unittest.TestCase):
+
+    def setUp(self):
+        super(TestNumberSet, self).setUp()
+        self.set = NumberSet()
+
+    def test_empty(self):
+        self.assertEqual(self.set.query(), 0.0)
+
+    def test_insert_remove(self):
+        self.set.insert(3.0)
+        self.set.insert(5.0)
+        self.set.insert(5.0)
+        self.set.insert(1.0)
+        self.assertEqual(self.set.query(), 5.0)
+        self.set.remove(5.0)
+        self.assertEqual(self.set.query(), 5.0)
+        self.set.remove(5.0)
+        self.assertEqual(self.set.query(), 3.0)
+        self.set.insert(5.0)
+        self.assertEqual(self.set.query(), 5.0)
+        self.set.clear()
+        self.assertEqual(self.set.query(), 0.0)
+
+    def test_negative(self):
+        self.set.insert(-1.0)
+        self.assertEqual(self.set.query(), 0.0)
+
+    def test_remove_missing(self):
+        self.set.insert(1.0)
+        self.set.remove(1.0)
+        with self.assertRaises(ValueError):
+            self.set.remove(1.0)
+        with self.assertRaises(ValueError):
+            self.set.remove(2.0)
+
+    def test_random(self):
+        rnd = random.Random(0)
+        reference = list()
+        for _ in range(2000):
+            if len(reference) > 0 and rnd.random() < 0.5:
+                val = rnd.choice(reference)
+                reference.remove(val)
+                self.set.remove(val)
+            else:
+                val = float(rnd.randint(0, 50))
+                reference.append(val)
+                self.set.insert(val)
+            self.assertEqual(self.set.query(), max(reference + [0.0]))
+        # Removed values do not pile up.
+        self.assertLessEqual(len(self.set._heap), 2 * len(reference) + 1)
+
+
+class TestScore(unittest.TestCase):
+
+    @staticmethod
+    def expected_score(score_mode, submissions, last):
+        """Compute the score from scratch, as a reference."""
+        if score_mode == SCORE_MODE_MAX:
+            return max([0.0] + [s.score for s in itervalues(submissions)])
+        elif score_mode == SCORE_MODE_MAX_SUBTASK:
+            scores_by_subtask = zip_longest(
+                *(map(float, s.extra) for s in itervalues(submissions)),
+                fillvalue=0.0)
+            return float(sum(max(s) for s in scores_by_subtask))
+        else:
+            return max([0.0] + [s.score for s in itervalues(submissions)
+                                if s.token] +
+                       [last.score if last is not None else 0.0])
+
+    def replay(self, score_mode, seed):
+        rnd = random.Random(seed)
+        score = Score(score_mode)
+        submissions = list()
+        last = None
+        for time in range(300):
+            if len(submissions) == 0 or rnd.random() < 0.3:
+                submission = Submission()
+                submission.user = "user"
+                submission.task = "task"
+                submission.time = time
+                key = "%d" % len(submissions)
+                score.create_submission(key, submission)
+                submissions.append(key)
+                continue
+            change = Subchange()
+            change.key = "c%d" % time
+            change.submission = rnd.choice(submissions)
+            change.time = time
+            if rnd.random() < 0.7:
+                extra = [float(rnd.randint(0, 10))
+                         for _ in range(rnd.randint(0, 4))]
+                change.score = float(sum(extra))
+                change.extra = ["%g" % x for x in extra]
+            if rnd.random() < 0.3:
+                change.token = rnd.random() < 0.7
+            score.create_subchange(change.key, change)
+            if change.score is not None and (
+                    last is None or
+                    score._submissions[change.submission].time > last.time):
+                last = score._submissions[change.submission]
+            self.assertEqual(score.get_score(), self.expected_score(
+                score_mode, score._submissions, last))
+        return score
+
+    def test_max(self):
+        self.replay(SCORE_MODE_MAX, 0)
+
+    def test_max_subtask(self):
+        self.replay(SCORE_MODE_MAX_SUBTASK, 1)
+
+    def test_max_tokened_last(self):
+        self.replay(SCORE_MODE_MAX_TOKENED_LAST, 2)
+
+    def test_reset_history(self):
+        """Replaying the changes from scratch gives the same history."""
+        for score_mode in [SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK,
+                           SCORE_MODE_MAX_TOKENED_LAST]:
+            score = self.replay(score_mode, 3)
+            history = list(score._history)
+            score.reset_history()
+            self.assertEqual(score._history, history)
+
+    def test_update_score_mode(self):
+        """Changes after a switch of score mode use the new one."""
+        score = self.replay(SCORE_MODE_MAX_TOKENED_LAST, 5)
+        score.update_score_mode(SCORE_MODE_MAX_SUBTASK)
+        change = Subchange()
+        change.key = "last"
+        change.submission = "0"
+        change.time = 1000
+        change.token = True
+        score.create_subchange(change.key, change)
+        self.assertEqual(score.get_score(), self.expected_score(
+            SCORE_MODE_MAX_SUBTASK, score._submissions, None))
+
+    def test_delete_submission(self):
+        score = self.replay(SCORE_MODE_MAX, 4)
+        for key in list(score._submissions):
+            score.delete_submission(key)
+            self.assertEqual(score.get_score(), self.expected_score(
+                SCORE_MODE_MAX, score._submissions, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
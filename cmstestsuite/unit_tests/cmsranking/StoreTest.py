@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests for the persistent stores of the ranking.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import io
+import json
+import os
+import unittest
+
+from mock import patch
+
+from cmsranking.Store import Journal, Store
+from cmsranking.Team import Team
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+
+class TestStore(FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(TestStore, self).setUp()
+        self.path = self.get_path("teams")
+        self.store = self.new_store()
+
+    def tearDown(self):
+        self.store._journal.close()
+        super(TestStore, self).tearDown()
+
+    def new_store(self):
+        store = Store(Team, self.path, {})
+        store.load_from_disk()
+        return store
+
+    def assertReloaded(self, expected):
+        """Check that a store loaded from disk has the given data."""
+        self.store._journal.close()
+        self.store = self.new_store()
+        self.assertEqual(self.store.retrieve_list(), expected)
+
+    def test_persistence(self):
+        self.store.create("t1", {"name": "One"})
+        self.store.create("t2", {"name": "Two"})
+        self.store.update("t1", {"name": "Uno"})
+        self.store.merge_list({"t2": {"name": "Due"},
+                               "t3": {"name": "Tre"}})
+        self.store.delete("t3")
+        self.assertReloaded({"t1": {"name": "Uno"}, "t2": {"name": "Due"}})
+
+    def test_empty(self):
+        self.assertReloaded({})
+        self.store.delete_list()
+        self.assertReloaded({})
+
+    @patch.object(Journal, "MIN_COMPACTION", 5)
+    def test_compaction(self):
+        for i in range(23):
+            self.store.merge_list({"t%d" % (i % 3): {"name": "%d" % i}})
+        # The journal was compacted at least once, and is not longer
+        # than the minimum length.
+        self.assertTrue(os.path.exists(
+            os.path.join(self.path, Journal.SNAPSHOT)))
+        self.assertLess(self.store._journal._journal_size, 5)
+        self.assertReloaded({"t0": {"name": "21"}, "t1": {"name": "22"},
+                             "t2": {"name": "20"}})
+
+    def test_truncated_journal(self):
+        """A partially written change is ignored."""
+        self.store.create("t1", {"name": "One"})
+        self.store._journal.close()
+        with io.open(os.path.join(self.path, Journal.JOURNAL), "ab") as f:
+            f.write(b'["t2", {"na')
+        self.assertReloaded({"t1": {"name": "One"}})
+        # The journal can be written to after the last full line.
+        self.store.create("t2", {"name": "Two"})
+        self.assertReloaded({"t1": {"name": "One"}, "t2": {"name": "Two"}})
+
+    def test_migration(self):
+        """Entities stored one per file are moved to the journal."""
+        self.store._journal.close()
+        self.path = self.makedirs("old_teams")
+        for key, name in [("t1", "One"), ("t2", "Two")]:
+            self.write_file(os.path.join("old_teams", key + ".json"),
+                            json.dumps({"name": name}).encode("utf-8"))
+
+        self.store = self.new_store()
+        self.assertEqual(self.store.retrieve_list(),
+                         {"t1": {"name": "One"}, "t2": {"name": "Two"}})
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         [Journal.JOURNAL, Journal.SNAPSHOT])
+
+        self.store.delete("t2")
+        self.assertReloaded({"t1": {"name": "One"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -36,14 +36,21 @@ import io
 import os
 import random
 import shutil
+import stat
 import unittest
 from io import BytesIO
 
+from gevent.event import AsyncResult
+from mock import Mock, patch
+
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
+from cmscommon.binary import bin_to_b64
 from cmscommon.digest import Digester, bytes_digest
-from cms.db.filecacher import FileCacher
+from cms.db import Digest, FSObject, SessionGen
+from cms.db.filecacher import COMPRESSION_GZIP, FileCacher, PeerBackend, \
+    TombstoneError
 
 
 class RandomFile(object):
@@ -254,6 +261,48 @@ class TestFileCacherBase(object):
             with self.assertRaises(Exception):
                 self.file_cacher.get_file(self.digest)
 
+    def test_many_files(self):
+        """Store some files, then retrieve them all together.
+
+        """
+        contents = [b"", b"a", b"some content", os.urandom(100000)]
+        digests = [self.file_cacher.put_file_content(content, "Test #%d" % i)
+                   for i, content in enumerate(contents)]
+        for digest in digests:
+            self.file_cacher.drop(digest)
+        missing_digest = bytes_digest(b"missing")
+
+        self.assertEqual(
+            self.file_cacher.load_many(digests + [missing_digest]),
+            {missing_digest})
+        for digest in digests:
+            self.assertTrue(self.file_cacher.is_cached(digest))
+
+        self.file_cacher.drop(digests[0])
+        fobjs = self.file_cacher.get_files(digests)
+        self.assertEqual(set(fobjs), set(digests))
+        for digest, content in zip(digests, contents):
+            with fobjs[digest] as fobj:
+                self.assertEqual(fobj.read(), content)
+
+        self.assertEqual(self.file_cacher.get_sizes(digests),
+                         dict((digest, len(content)) for digest, content
+                              in zip(digests, contents)))
+        self.assertEqual(set(self.file_cacher.get_descriptions(digests)),
+                         set(digests))
+        self.assertEqual(
+            self.file_cacher.get_missing(digests + [missing_digest]),
+            {missing_digest})
+
+        with self.assertRaises(KeyError):
+            self.file_cacher.get_files(digests + [missing_digest])
+        with self.assertRaises(KeyError):
+            self.file_cacher.get_sizes(digests + [missing_digest])
+        with self.assertRaises(KeyError):
+            self.file_cacher.get_descriptions([missing_digest])
+        with self.assertRaises(TombstoneError):
+            self.file_cacher.load_many([Digest.TOMBSTONE])
+
     def test_fetch_missing_file(self):
         """Get unexisting file from FileCacher.
 
@@ -401,5 +450,416 @@ class TestFileCacherFS(TestFileCacherBase, unittest.TestCase):
         shutil.rmtree("fs-storage", ignore_errors=True)
 
 
+class TestFileCacherDBCompressed(TestFileCacherBase, DatabaseMixin,
+                                 unittest.TestCase):
+    """Tests for the FileCacher service with a database backend storing
+    compressed files.
+
+    """
+
+    def setUp(self):
+        super(TestFileCacherDBCompressed, self).setUp()
+        file_cacher = FileCacher(compression=COMPRESSION_GZIP)
+        self._setUp(file_cacher)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_base_path, ignore_errors=True)
+
+    def test_size_recorded(self):
+        """The size is known without decompressing the file."""
+        content = b"0123456789" * 1000
+        digest = self.file_cacher.put_file_content(content)
+        with SessionGen() as session:
+            self.assertEqual(
+                FSObject.get_from_digest(digest, session).size, len(content))
+
+        with patch("cms.db.filecacher._stream_size") as stream_size:
+            self.assertEqual(self.file_cacher.get_size(digest), len(content))
+            self.assertEqual(self.file_cacher.get_sizes([digest]),
+                             {digest: len(content)})
+        stream_size.assert_not_called()
+
+        # Files stored before the size was recorded are measured.
+        with SessionGen() as session:
+            FSObject.get_from_digest(digest, session).size = None
+            session.commit()
+        self.assertEqual(self.file_cacher.get_size(digest), len(content))
+        self.assertEqual(self.file_cacher.get_sizes([digest]),
+                         {digest: len(content)})
+
+
+class TestFileCacherFSCompressed(TestFileCacherBase, unittest.TestCase):
+    """Tests for the FileCacher service with a filesystem backend
+    storing compressed files.
+
+    """
+
+    def setUp(self):
+        super(TestFileCacherFSCompressed, self).setUp()
+        file_cacher = FileCacher(path="fs-storage",
+                                 compression=COMPRESSION_GZIP)
+        self._setUp(file_cacher)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_base_path, ignore_errors=True)
+        shutil.rmtree("fs-storage", ignore_errors=True)
+
+    def test_stored_compressed(self):
+        """Files are stored compressed, and old ones remain readable."""
+        content = b"0123456789" * 1000
+        digest = self.file_cacher.put_file_content(content)
+        path = os.path.join("fs-storage", digest)
+        self.assertFalse(os.path.exists(path))
+        self.assertLess(os.stat(path + ".gz").st_size, len(content))
+        self.assertEqual(self.file_cacher.list(), [(digest, "")])
+
+        # Files stored without compression are still found.
+        self.file_cacher.backend.compression = None
+        raw_digest = self.file_cacher.put_file_content(b"raw")
+        self.assertTrue(os.path.exists(os.path.join("fs-storage",
+                                                    raw_digest)))
+        self.file_cacher.drop(digest)
+        self.file_cacher.drop(raw_digest)
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+        self.assertEqual(self.file_cacher.get_file_content(raw_digest),
+                         b"raw")
+        self.assertEqual(self.file_cacher.get_size(digest), len(content))
+        self.assertTrue(self.file_cacher.check_backend_integrity())
+
+        self.file_cacher.delete(digest)
+        self.assertFalse(os.path.exists(path + ".gz"))
+        self.assertFalse(os.path.exists(path + ".size"))
+
+    def test_size_recorded(self):
+        """The size is known without decompressing the file."""
+        content = b"0123456789" * 1000
+        digest = self.file_cacher.put_file_content(content)
+        path = os.path.join("fs-storage", digest)
+        self.assertTrue(os.path.exists(path + ".size"))
+
+        with patch("cms.db.filecacher._stream_size") as stream_size:
+            self.assertEqual(self.file_cacher.get_size(digest), len(content))
+        stream_size.assert_not_called()
+
+        # Files stored before the size was recorded are measured.
+        os.unlink(path + ".size")
+        self.assertEqual(self.file_cacher.get_size(digest), len(content))
+
+
+class TestFileCacherEviction(unittest.TestCase):
+    """Tests for the bounds on the local cache of FileCacher."""
+
+    def setUp(self):
+        super(TestFileCacherEviction, self).setUp()
+        self.file_cacher = FileCacher(path="fs-storage", max_size=250)
+        self.cache_base_path = self.file_cacher.file_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_base_path, ignore_errors=True)
+        shutil.rmtree("fs-storage", ignore_errors=True)
+
+    def is_cached(self, digest):
+        return os.path.exists(os.path.join(self.cache_base_path, digest))
+
+    def test_lru_eviction(self):
+        """The least recently used file is evicted first."""
+        first = self.file_cacher.put_file_content(os.urandom(100))
+        second = self.file_cacher.put_file_content(os.urandom(100))
+        # Use the first file again, so that the second becomes the LRU.
+        self.file_cacher.get_file_content(first)
+        third = self.file_cacher.put_file_content(os.urandom(100))
+
+        self.assertTrue(self.is_cached(first))
+        self.assertFalse(self.is_cached(second))
+        self.assertTrue(self.is_cached(third))
+        status = self.file_cacher.get_cache_status()
+        self.assertEqual(status["evictions"], 1)
+        self.assertEqual(status["files"], 2)
+        self.assertEqual(status["size"], 200)
+
+        # The evicted file is fetched again from the backend.
+        self.file_cacher.get_file_content(second)
+        self.assertTrue(self.is_cached(second))
+        status = self.file_cacher.get_cache_status()
+        self.assertEqual(status["hits"], 1)
+        self.assertEqual(status["misses"], 1)
+        self.assertEqual(status["evictions"], 2)
+
+    def test_file_path(self):
+        """Getting the path of a file counts as a use of the cache."""
+        first = self.file_cacher.put_file_content(os.urandom(100))
+        second = self.file_cacher.put_file_content(os.urandom(100))
+
+        path = self.file_cacher.get_file_path(first)
+        self.assertEqual(path, os.path.join(self.cache_base_path, first))
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o444)
+        # The second file is now the one evicted.
+        self.file_cacher.put_file_content(os.urandom(100))
+        self.assertFalse(self.is_cached(second))
+        self.file_cacher.get_file_path(second)
+        self.assertTrue(self.is_cached(second))
+        status = self.file_cacher.get_cache_status()
+        self.assertEqual(status["hits"], 1)
+        self.assertEqual(status["misses"], 1)
+        with self.assertRaises(TombstoneError):
+            self.file_cacher.get_file_path(Digest.TOMBSTONE)
+
+    def test_max_files(self):
+        """The bound on the number of files is respected too."""
+        self.file_cacher.max_files = 1
+        first = self.file_cacher.put_file_content(os.urandom(10))
+        second = self.file_cacher.put_file_content(os.urandom(10))
+        self.assertFalse(self.is_cached(first))
+        self.assertTrue(self.is_cached(second))
+
+    def test_pinned_not_evicted(self):
+        """Pinned files are kept until they are unpinned."""
+        first = self.file_cacher.put_file_content(os.urandom(100))
+        self.file_cacher.pin(first)
+        second = self.file_cacher.put_file_content(os.urandom(100))
+        third = self.file_cacher.put_file_content(os.urandom(100))
+
+        self.assertTrue(self.is_cached(first))
+        self.assertFalse(self.is_cached(second))
+        self.assertTrue(self.is_cached(third))
+
+        # When all other files are pinned, the new one cannot stay.
+        self.file_cacher.pin(third)
+        fourth = self.file_cacher.put_file_content(os.urandom(100))
+        self.assertFalse(self.is_cached(fourth))
+        self.assertEqual(self.file_cacher.get_cache_status()["size"], 200)
+
+        self.file_cacher.unpin(first)
+        self.file_cacher.unpin(third)
+        self.file_cacher.get_file_content(fourth)
+        self.assertFalse(self.is_cached(first))
+        self.assertTrue(self.is_cached(third))
+        self.assertTrue(self.is_cached(fourth))
+
+
+class TestFileCacherMemory(unittest.TestCase):
+    """Tests for the in-memory cache of FileCacher."""
+
+    def setUp(self):
+        super(TestFileCacherMemory, self).setUp()
+        self.file_cacher = FileCacher(path="fs-storage", memory_size=250,
+                                      memory_max_file_size=100)
+        self.cache_base_path = self.file_cacher.file_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_base_path, ignore_errors=True)
+        shutil.rmtree("fs-storage", ignore_errors=True)
+
+    def test_small_file_from_memory(self):
+        """Small files are served without reading the disk cache."""
+        content = os.urandom(100)
+        digest = self.file_cacher.put_file_content(content)
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+
+        # Once in memory, the content on disk is not read anymore.
+        with io.open(os.path.join(self.cache_base_path, digest), "wb") as f:
+            f.write(b"Fake content.\n")
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+        dst = BytesIO()
+        self.file_cacher.get_file_to_fobj(digest, dst)
+        self.assertEqual(dst.getvalue(), content)
+
+        status = self.file_cacher.get_cache_status()
+        self.assertEqual(status["memory_hits"], 2)
+        self.assertEqual(status["memory_misses"], 1)
+        self.assertEqual(status["memory_files"], 1)
+        self.assertEqual(status["memory_size"], 100)
+
+        # Dropping the file forgets its content too.
+        self.file_cacher.drop(digest)
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+        self.assertEqual(
+            self.file_cacher.get_cache_status()["memory_misses"], 2)
+
+    def test_large_file_not_in_memory(self):
+        """Files larger than the threshold are not kept in memory."""
+        content = os.urandom(101)
+        digest = self.file_cacher.put_file_content(content)
+        dst = BytesIO()
+        self.file_cacher.get_file_to_fobj(digest, dst)
+        self.assertEqual(dst.getvalue(), content)
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+        self.assertEqual(self.file_cacher.get_cache_status()["memory_files"],
+                         0)
+
+    def test_memory_eviction(self):
+        """The least recently used contents are discarded first."""
+        digests = [self.file_cacher.put_file_content(os.urandom(100))
+                   for _ in range(3)]
+        self.file_cacher.get_file_content(digests[0])
+        self.file_cacher.get_file_content(digests[1])
+        self.file_cacher.get_file_content(digests[0])
+        self.file_cacher.get_file_content(digests[2])
+
+        status = self.file_cacher.get_cache_status()
+        self.assertEqual(status["memory_files"], 2)
+        self.assertEqual(status["memory_size"], 200)
+        self.file_cacher.get_file_content(digests[0])
+        self.assertEqual(self.file_cacher.get_cache_status()["memory_hits"],
+                         2)
+
+
+class FakePeer(object):
+    """A peer serving the local cache of a FileCacher, like a Worker."""
+
+    def __init__(self, file_cacher, corrupt=False):
+        self.file_cacher = file_cacher
+        self.corrupt = corrupt
+        self.connected = True
+        self.remote_service_coord = "FakePeer"
+        self.chunks_sent = 0
+        self.locate_calls = 0
+
+    @staticmethod
+    def _result(value):
+        result = AsyncResult()
+        result.set(value)
+        return result
+
+    def get_cached_digests(self, digests):
+        self.locate_calls += 1
+        return self._result([digest for digest in digests
+                             if self.file_cacher.is_cached(digest)])
+
+    def get_cached_file_chunk(self, digest, offset, size):
+        with self.file_cacher.get_cached_file(digest) as fobj:
+            fobj.seek(offset)
+            chunk = fobj.read(size)
+        if self.corrupt and len(chunk) > 0:
+            chunk = b"x" + chunk[1:]
+        self.chunks_sent += 1
+        return self._result(bin_to_b64(chunk))
+
+
+class TestPeerBackend(unittest.TestCase):
+    """Tests for fetching files from the caches of peers."""
+
+    def setUp(self):
+        super(TestPeerBackend, self).setUp()
+        self.storage = FileCacher(path="fs-storage")
+        self.peer_cacher = FileCacher(null=True)
+        self.file_cacher = FileCacher(path="fs-storage")
+
+        # Shard 0 of a service with three shards.
+        service = Mock()
+        service.name = "Worker"
+        service.shard = 0
+        service.connect_to.side_effect = lambda coord: coord
+        with patch("cms.db.filecacher.get_service_shards",
+                   Mock(return_value=3)):
+            self.backend = PeerBackend(
+                service, Mock(wraps=self.file_cacher.backend),
+                self.file_cacher.temp_dir)
+        self.assertEqual([coord.shard for coord in self.backend.peers],
+                         [1, 2])
+        self.backend.CHUNK_SIZE = 1000
+        self.file_cacher.backend = self.backend
+
+    def tearDown(self):
+        for file_cacher in [self.storage, self.peer_cacher, self.file_cacher]:
+            shutil.rmtree(file_cacher.file_dir, ignore_errors=True)
+        shutil.rmtree("fs-storage", ignore_errors=True)
+
+    def test_fetch_from_peer(self):
+        """Files held by a peer are not requested to the fallback."""
+        content = os.urandom(2500)
+        digest = self.peer_cacher.put_file_content(content)
+        peer = FakePeer(self.peer_cacher)
+        self.backend.peers = [FakePeer(self.storage), peer]
+
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+        self.assertEqual(peer.chunks_sent, 4)
+        self.backend.fallback.get_file.assert_not_called()
+
+    def test_fallback(self):
+        """Files not held by connected peers come from the fallback."""
+        content = os.urandom(100)
+        digest = self.storage.put_file_content(content)
+        self.peer_cacher.put_file_content(content)
+        peer = FakePeer(self.peer_cacher)
+        peer.connected = False
+        self.backend.peers = [peer]
+
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+        self.assertEqual(peer.chunks_sent, 0)
+        self.backend.fallback.get_file.assert_called_once_with(digest)
+
+    def test_corrupted_content(self):
+        """Content not matching the digest is discarded."""
+        content = os.urandom(100)
+        digest = self.storage.put_file_content(content)
+        self.peer_cacher.put_file_content(content)
+        self.backend.peers = [FakePeer(self.peer_cacher, corrupt=True)]
+
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+        self.backend.fallback.get_file.assert_called_once_with(digest)
+
+    def test_many_files(self):
+        """Only files not held by peers are requested to the fallback."""
+        peer_content = os.urandom(100)
+        peer_digest = self.peer_cacher.put_file_content(peer_content)
+        self.storage.put_file_content(peer_content)
+        content = os.urandom(100)
+        digest = self.storage.put_file_content(content)
+        self.backend.peers = [FakePeer(self.peer_cacher)]
+
+        self.assertEqual(
+            self.file_cacher.load_many([peer_digest, digest]), set())
+        self.backend.fallback.get_files.assert_called_once_with([digest])
+        self.assertEqual(self.file_cacher.get_file_content(peer_digest),
+                         peer_content)
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+
+    def test_many_files_batched(self):
+        """Each peer is asked about all the files in a single call."""
+        contents = [os.urandom(100) for unused_i in range(5)]
+        digests = [self.peer_cacher.put_file_content(content)
+                   for content in contents]
+        peers = [FakePeer(self.peer_cacher), FakePeer(self.peer_cacher)]
+        self.backend.peers = peers
+
+        self.assertEqual(self.file_cacher.load_many(digests), set())
+        self.assertEqual([peer.locate_calls for peer in peers], [1, 1])
+        self.assertEqual(sum(peer.chunks_sent for peer in peers), 10)
+        self.backend.fallback.get_files.assert_called_once_with([])
+        for digest, content in zip(digests, contents):
+            self.assertEqual(self.file_cacher.get_file_content(digest),
+                             content)
+
+    def test_unresponsive_peer(self):
+        """Peers not answering in time are ignored."""
+        content = os.urandom(100)
+        digest = self.storage.put_file_content(content)
+        self.peer_cacher.put_file_content(content)
+        peer = FakePeer(self.peer_cacher)
+        peer.get_cached_digests = Mock(return_value=AsyncResult())
+        self.backend.peers = [peer]
+        self.backend.RPC_TIMEOUT = 0.01
+
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+        self.assertEqual(peer.chunks_sent, 0)
+        self.backend.fallback.get_file.assert_called_once_with(digest)
+
+    def test_invalid_digest(self):
+        """Only digests of files reach the file system of the cache."""
+        content = os.urandom(100)
+        digest = self.storage.put_file_content(content)
+        path = os.path.relpath(os.path.join("fs-storage", digest),
+                               self.peer_cacher.file_dir)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.peer_cacher.file_dir, path)))
+
+        for invalid in [path, digest.upper(), digest + "\n",
+                        Digest.TOMBSTONE, None]:
+            self.assertFalse(self.peer_cacher.is_cached(invalid))
+            with self.assertRaises(KeyError):
+                self.peer_cacher.get_cached_file(invalid)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -29,8 +29,17 @@ from future.builtins import *  # noqa
 
 import unittest
 import io
+import os
+import shutil
+import stat
+import tempfile
 
-from cms.grading.Sandbox import Truncator
+import gevent
+from mock import MagicMock, patch
+
+from cms.db.filecacher import FileCacher
+from cms.grading.Sandbox import IsolateSandbox, SandboxInterfaceException, \
+    SandboxPool, StupidSandbox, Truncator
 
 
 class TestTruncator(unittest.TestCase):
@@ -70,5 +79,247 @@ class TestTruncator(unittest.TestCase):
         self.perform_truncator_test(100, 40, 7)
 
 
+class TestSandboxPool(unittest.TestCase):
+    """Test the class SandboxPool."""
+    def setUp(self):
+        self.pool = SandboxPool(2, 2)
+        self.cpus_pool = SandboxPool(2, 3, cpus=[4, 5])
+        patcher = patch("cms.grading.Sandbox.IsolateSandbox",
+                        MagicMock(side_effect=self._new_sandbox))
+        self.addCleanup(patcher.stop)
+        self.IsolateSandbox = patcher.start()
+        self.sandboxes = []
+
+    def _new_sandbox(self, file_cacher, name, temp_dir, box_id, initialize):
+        sandbox = MagicMock()
+        sandbox.box_id = box_id
+        self.sandboxes.append(sandbox)
+        return sandbox
+
+    def release(self, sandbox, delete=True):
+        self.pool.release(sandbox, delete=delete)
+        # Let the reset run.
+        gevent.sleep(0)
+
+    def test_reuse(self):
+        file_cacher = MagicMock()
+        sandbox = self.pool.acquire(file_cacher, name="compile")
+        self.IsolateSandbox.assert_called_once_with(
+            file_cacher, "compile", None, box_id=30, initialize=True)
+        self.release(sandbox)
+        sandbox.cleanup.assert_called_once_with(delete=True)
+        sandbox.initialize_isolate.assert_called_once_with()
+
+        # The other box is still to initialize, then the first one
+        # comes back already initialized.
+        self.pool.acquire(file_cacher, name="evaluate")
+        self.IsolateSandbox.assert_called_with(
+            file_cacher, "evaluate", None, box_id=31, initialize=True)
+        self.pool.acquire(file_cacher, name="evaluate")
+        self.IsolateSandbox.assert_called_with(
+            file_cacher, "evaluate", None, box_id=30, initialize=False)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(stats["acquisitions"], 3)
+        self.assertEqual(stats["resets"], 1)
+        self.assertEqual(stats["in_use"], 2)
+        self.assertEqual(stats["available"], 0)
+
+    def test_all_in_use(self):
+        self.pool.acquire(None)
+        self.pool.acquire(None)
+        with self.assertRaises(SandboxInterfaceException):
+            self.pool.acquire(None)
+
+    def test_wait_for_reset(self):
+        sandbox = self.pool.acquire(None)
+        self.pool.acquire(None)
+        # The box is back as soon as the reset is done.
+        self.pool.release(sandbox)
+        self.pool.acquire(None)
+        self.assertEqual(self.pool.get_stats()["acquisitions_waiting"], 1)
+        self.IsolateSandbox.assert_called_with(
+            None, None, None, box_id=30, initialize=False)
+
+    def test_failed_reset(self):
+        sandbox = self.pool.acquire(None)
+        sandbox.initialize_isolate.side_effect = SandboxInterfaceException
+        self.release(sandbox, delete=False)
+        sandbox.cleanup.assert_called_once_with(delete=False)
+        self.assertEqual(self.pool.get_stats()["failed_resets"], 1)
+
+        # The box is initialized again when used.
+        self.pool.acquire(None)
+        self.pool.acquire(None)
+        self.IsolateSandbox.assert_called_with(
+            None, None, None, box_id=30, initialize=True)
+
+    def test_cpus(self):
+        """Sandboxes in use at the same time run on different CPUs."""
+        pool = self.cpus_pool
+        first = pool.acquire(None)
+        second = pool.acquire(None)
+        self.assertEqual(first.cpus, {4})
+        self.assertEqual(second.cpus, {5})
+        pool.release(second)
+        self.assertEqual(pool.acquire(None).cpus, {5})
+        self.assertEqual(pool.acquire(None).cpus, {4})
+
+    def test_failed_creation(self):
+        self.IsolateSandbox.side_effect = OSError
+        with self.assertRaises(OSError):
+            self.pool.acquire(None)
+        self.assertEqual(self.pool.get_stats()["in_use"], 0)
+        self.assertEqual(self.pool.get_stats()["available"], 2)
+
+    def test_release_twice(self):
+        sandbox = self.pool.acquire(None)
+        self.release(sandbox)
+        self.release(sandbox)
+        self.assertEqual(self.pool.get_stats()["in_use"], 0)
+        self.assertEqual(self.pool.get_stats()["resets"], 1)
+
+    def test_release_leaked(self):
+        """Only the sandboxes of the current greenlet are released."""
+        other = gevent.spawn(self.pool.acquire, None).get()
+        released = self.pool.acquire(None)
+        self.release(released)
+        leaked = self.pool.acquire(None)
+
+        self.assertEqual(self.pool.release_leaked(), 1)
+        gevent.sleep(0)
+        leaked.cleanup.assert_called_once_with(delete=False)
+        other.cleanup.assert_not_called()
+        self.assertEqual(self.pool.get_stats()["in_use"], 1)
+        self.assertEqual(self.pool.release_leaked(), 0)
+
+
+class TestFilePlacement(unittest.TestCase):
+    """Test how files are put in the sandbox."""
+
+    CONTENT = b"some content\n" * 100
+
+    def setUp(self):
+        super(TestFilePlacement, self).setUp()
+        self.storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage_dir)
+        self.file_cacher = FileCacher(path=self.storage_dir)
+        self.digest = self.file_cacher.put_file_content(self.CONTENT)
+        self.sandbox = StupidSandbox(self.file_cacher)
+        self.addCleanup(self.sandbox.cleanup, delete=True)
+
+    def assertFileContent(self, path):
+        with self.sandbox.get_file(path) as f:
+            self.assertEqual(f.read(), self.CONTENT)
+
+    def assertLinked(self, path, src_path, linked=True):
+        same_inode = os.stat(self.sandbox.relative_path(path)).st_ino == \
+            os.stat(src_path).st_ino
+        self.assertEqual(same_inode, linked)
+
+    def test_link_from_storage(self):
+        self.sandbox.create_file_from_storage("input.txt", self.digest)
+
+        self.assertFileContent("input.txt")
+        self.assertLinked("input.txt",
+                          self.file_cacher.get_file_path(self.digest))
+        self.assertEqual(self.sandbox.bytes_linked, len(self.CONTENT))
+        self.assertEqual(self.sandbox.bytes_copied, 0)
+        # Nobody can write the file of the cache through the sandbox.
+        mode = self.sandbox.stat_file("input.txt").st_mode
+        self.assertEqual(mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH),
+                         0)
+
+    def test_executable_copied(self):
+        cache_path = self.file_cacher.get_file_path(self.digest)
+        self.sandbox.create_file_from_storage("exe", self.digest,
+                                              executable=True)
+        self.sandbox.create_file_from_storage("other", self.digest)
+
+        # The file of the cache is not executable, and its mode is
+        # shared by all its links, so it is copied instead.
+        self.assertTrue(self.sandbox.stat_file("exe").st_mode & stat.S_IXUSR)
+        self.assertLinked("exe", cache_path, linked=False)
+        self.assertLinked("other", cache_path)
+        self.assertEqual(stat.S_IMODE(os.stat(cache_path).st_mode), 0o444)
+
+    def test_copy_fallback(self):
+        # E.g., the sandbox is on another filesystem.
+        with patch("cms.grading.Sandbox.os.link",
+                   side_effect=OSError("Invalid cross-device link")):
+            self.sandbox.create_file_from_storage("input.txt", self.digest)
+
+        self.assertFileContent("input.txt")
+        self.assertLinked("input.txt",
+                          self.file_cacher.get_file_path(self.digest),
+                          linked=False)
+        self.assertEqual(self.sandbox.bytes_linked, 0)
+        self.assertEqual(self.sandbox.bytes_copied, len(self.CONTENT))
+
+    def test_existing_file(self):
+        self.sandbox.create_file_from_string("input.txt", b"")
+        with self.assertRaises(OSError):
+            self.sandbox.create_file_from_storage("input.txt", self.digest)
+
+    def test_from_path(self):
+        src_path = os.path.join(self.storage_dir, "output.txt")
+        with io.open(src_path, "wb") as f:
+            f.write(self.CONTENT)
+        os.chmod(src_path, 0o444)
+
+        self.sandbox.create_file_from_path("output.txt", src_path)
+
+        self.assertFileContent("output.txt")
+        self.assertLinked("output.txt", src_path)
+
+    def test_from_writable_path(self):
+        src_path = os.path.join(self.storage_dir, "output.txt")
+        with io.open(src_path, "wb") as f:
+            f.write(self.CONTENT)
+        os.chmod(src_path, 0o644)
+
+        self.sandbox.create_file_from_path("output.txt", src_path)
+
+        # Making it read-only would change the mode of the source too.
+        self.assertFileContent("output.txt")
+        self.assertLinked("output.txt", src_path, linked=False)
+        self.assertEqual(stat.S_IMODE(os.stat(src_path).st_mode), 0o644)
+
+    def test_allow_writing_keeps_linked(self):
+        """Restricting the writes doesn't change the mode of the files
+        linked from the cache, which can still be linked later.
+
+        """
+        with patch.object(IsolateSandbox, "detect_box_executable",
+                          return_value="isolate"):
+            sandbox = IsolateSandbox(self.file_cacher, initialize=False)
+        self.addCleanup(shutil.rmtree, sandbox.get_root_path())
+        cache_path = self.file_cacher.get_file_path(self.digest)
+
+        sandbox.create_file_from_storage("input.txt", self.digest)
+        sandbox.create_file_from_string("output.txt", b"")
+        sandbox.allow_writing_only(["output.txt"])
+
+        self.assertEqual(
+            os.stat(sandbox.relative_path("input.txt")).st_ino,
+            os.stat(cache_path).st_ino)
+        self.assertEqual(stat.S_IMODE(os.stat(cache_path).st_mode), 0o444)
+        self.assertEqual(stat.S_IMODE(os.stat(
+            sandbox.relative_path("output.txt")).st_mode), 0o722)
+        self.sandbox.create_file_from_storage("input.txt", self.digest)
+        self.assertLinked("input.txt", cache_path)
+
+    def test_detach(self):
+        self.sandbox.create_file_from_storage("output.txt", self.digest)
+        real_path = self.sandbox.relative_path("output.txt")
+
+        self.sandbox._detach_file(real_path)
+
+        self.assertFileContent("output.txt")
+        self.assertLinked("output.txt",
+                          self.file_cacher.get_file_path(self.digest),
+                          linked=False)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -167,6 +167,46 @@ class TestGroupMin(ScoreTypeTestMixin, unittest.TestCase):
         self.assertComputeScore(gmin.compute_score(sr),
                                 s2 + s3 * 0.1, 0.0, [0, s2, s3 * 0.1])
 
+    def test_testcases_not_needed(self):
+        parameters = [[10, "1_*"], [30, "2_*"], [60, "3_*"]]
+        gmin = GroupMin(parameters, self._public_testcases)
+
+        self.assertEqual(gmin.testcases_not_needed({}), set())
+        self.assertEqual(gmin.testcases_not_needed({"1_0": 0.5}), set())
+        self.assertEqual(
+            gmin.testcases_not_needed({"1_0": 1.0, "2_1": 0.0}), {"2_0"})
+        # Nothing to skip in a subtask already evaluated.
+        self.assertEqual(gmin.testcases_not_needed(
+            {"2_0": 0.0, "2_1": 0.0, "3_0": 0.0}), {"3_1"})
+
+    def test_testcases_not_needed_overlapping(self):
+        """Testcases still needed by another subtask are not skipped."""
+        parameters = [[10, "1_*"], [30, "(1|2)_*"]]
+        gmin = GroupMin(parameters, {"1_0": True, "1_1": True,
+                                     "2_0": True, "2_1": False})
+
+        self.assertEqual(gmin.testcases_not_needed({"2_0": 0.0}),
+                         {"2_1"})
+        self.assertEqual(gmin.testcases_not_needed({"1_0": 0.0}),
+                         {"1_1", "2_0", "2_1"})
+
+    def test_skipped_do_not_change_score(self):
+        """Scoring with the skipped testcases at 0.0 gives the score
+        that evaluating them would give.
+
+        """
+        parameters = [[10, "1_*"], [30, "2_*"], [60, "3_*"]]
+        gmin = GroupMin(parameters, self._public_testcases)
+        sr = self.get_submission_result(self._public_testcases)
+        self.set_outcome(sr, "2_0", 0.0)
+        self.set_outcome(sr, "3_1", 0.5)
+        expected = gmin.compute_score(sr)
+
+        outcomes = {"1_0": 1.0, "1_1": 1.0, "2_0": 0.0, "3_0": 1.0}
+        for codename in gmin.testcases_not_needed(outcomes):
+            self.set_outcome(sr, codename, 0.0)
+        self.assertEqual(gmin.compute_score(sr)[0], expected[0])
+
 
 if __name__ == "__main__":
     unittest.main()
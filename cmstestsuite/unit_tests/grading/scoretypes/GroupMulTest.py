@@ -167,6 +167,15 @@ class TestGroupMul(ScoreTypeTestMixin, unittest.TestCase):
                                 s2 + s3 * 0.5 * 0.1, 0.0,
                                 [0, s2, s3 * 0.5 * 0.1])
 
+    def test_testcases_not_needed(self):
+        parameters = [[10, "1_*"], [30, "2_*"], [60, "3_*"]]
+        gmul = GroupMul(parameters, self._public_testcases)
+
+        # A partial outcome can still be multiplied by a zero.
+        self.assertEqual(gmul.testcases_not_needed({"1_0": 0.5}), set())
+        self.assertEqual(
+            gmul.testcases_not_needed({"1_0": 0.5, "3_0": 0.0}), {"3_1"})
+
 
 if __name__ == "__main__":
     unittest.main()
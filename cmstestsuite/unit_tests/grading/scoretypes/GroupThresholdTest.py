@@ -183,6 +183,16 @@ class TestGroupThreshold(ScoreTypeTestMixin, unittest.TestCase):
         self.assertComputeScore(st.compute_score(sr),
                                 s2, 0.0, [0, s2, 0])
 
+    def test_testcases_not_needed(self):
+        parameters = [[10, "1_*", 10], [30, "2_*", 20], [60, "3_*", 30]]
+        st = GroupThreshold(parameters, self._public_testcases)
+
+        self.assertEqual(st.testcases_not_needed({"1_0": 5.5}), set())
+        # Both above the threshold and zero fail the subtask.
+        self.assertEqual(
+            st.testcases_not_needed({"1_0": 10.5, "2_1": 0.0}),
+            {"1_1", "2_0"})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -87,6 +87,11 @@ class TestSum(ScoreTypeTestMixin, unittest.TestCase):
         self.assertComputeScore(st.compute_score(sr),
                                 testcase_score * 2.2, testcase_score * 0.2, [])
 
+    def test_testcases_not_needed(self):
+        st = Sum(100, self._public_testcases)
+        self.assertEqual(st.testcases_not_needed({"0": 0.0, "1": 0.0}),
+                         set())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests for the creation of score types."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import unittest
+
+from mock import patch
+
+from cms.grading.scoretypes import get_score_type, _score_type_cache
+from cms.grading.scoretypes.GroupMin import GroupMin
+from cms.grading.scoretypes.Sum import Sum
+
+
+class TestGetScoreType(unittest.TestCase):
+
+    def setUp(self):
+        super(TestGetScoreType, self).setUp()
+        _score_type_cache.clear()
+        patcher = patch("cms.grading.scoretypes.get_score_type_class",
+                        {"GroupMin": GroupMin, "Sum": Sum}.__getitem__)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.public_testcases = {"1_0": True, "1_1": False, "2_0": True}
+
+    def test_reused(self):
+        """The same arguments give the same instance."""
+        score_type = get_score_type("GroupMin", [[40, "1_*"], [60, "2_*"]],
+                                    self.public_testcases)
+        self.assertIsInstance(score_type, GroupMin)
+        self.assertIs(score_type, get_score_type(
+            "GroupMin", [[40, "1_*"], [60, "2_*"]],
+            dict(self.public_testcases)))
+
+    def test_different_arguments(self):
+        """Different arguments give different instances."""
+        score_type = get_score_type("GroupMin", [[40, "1_*"], [60, "2_*"]],
+                                    self.public_testcases)
+        self.assertIsNot(score_type, get_score_type(
+            "GroupMin", [[50, "1_*"], [50, "2_*"]], self.public_testcases))
+        public_testcases = dict(self.public_testcases)
+        public_testcases["1_1"] = True
+        other = get_score_type("GroupMin", [[40, "1_*"], [60, "2_*"]],
+                               public_testcases)
+        self.assertIsNot(score_type, other)
+        self.assertEqual(other.max_public_score, 100)
+        self.assertEqual(score_type.max_public_score, 60)
+
+    def test_not_shared_with_caller(self):
+        """Changing the arguments later does not change the instance."""
+        parameters = [[40, "1_*"], [60, "2_*"]]
+        score_type = get_score_type("GroupMin", parameters,
+                                    self.public_testcases)
+        parameters[0][0] = 10
+        self.public_testcases["1_1"] = True
+        self.assertEqual(score_type.parameters, [[40, "1_*"], [60, "2_*"]])
+        self.assertFalse(score_type.public_testcases["1_1"])
+
+    def test_invalid_not_cached(self):
+        """Invalid parameters raise every time."""
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                get_score_type("GroupMin", [[40, "3_*"]],
+                               self.public_testcases)
+        self.assertEqual(len(_score_type_cache), 0)
+
+    def test_shared_template_and_targets(self):
+        """Templates are compiled once per class and targets once per
+        instance.
+
+        """
+        score_type = get_score_type("GroupMin", [[40, "1_*"], [60, "2_*"]],
+                                    self.public_testcases)
+        other = get_score_type("GroupMin", [[100, 3]], self.public_testcases)
+        self.assertIs(score_type.template, other.template)
+        with patch.object(GroupMin, "_compute_target_testcases") as compute:
+            self.assertEqual(score_type.retrieve_target_testcases(),
+                             [["1_0", "1_1"], ["2_0"]])
+            compute.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -30,11 +30,15 @@ from future.builtins import *  # noqa
 
 import unittest
 from datetime import timedelta
+from mock import patch
 
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.grading.scoring import task_score
+import cms.grading.scoring
+from cms.db import ParticipationTaskScore, Session
+from cms.grading.scoring import get_task_scores, task_last_progress, \
+    task_score, task_score_fingerprints, update_task_scores
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
 from cmscommon.datetime import make_datetime
@@ -390,5 +394,181 @@ class TestTaskScoreMax(TaskScoreMixin, unittest.TestCase):
         self.assertEqual(self.call(rounded=True), (44.44, False))
 
 
+
+class TestTaskLastProgress(TaskScoreMixin, unittest.TestCase):
+    """Tests for task_last_progress()."""
+
+    def test_no_submissions(self):
+        self.assertIsNone(task_last_progress(self.participation, self.task))
+
+    def test_no_points(self):
+        self.add_result(self.at(1), 0.0)
+        self.session.flush()
+        self.assertIsNone(task_last_progress(self.participation, self.task))
+
+    def test_first_best(self):
+        self.add_result(self.at(1), 10.0)
+        self.add_result(self.at(2), 50.0)
+        self.add_result(self.at(3), 50.0)
+        self.add_result(self.at(4), 20.0)
+        self.session.flush()
+        self.assertEqual(task_last_progress(self.participation, self.task),
+                         self.at(2))
+
+    def test_unscored(self):
+        self.add_result(self.at(1), 10.0)
+        self.add_submission(participation=self.participation,
+                            task=self.task, timestamp=self.at(2))
+        self.session.flush()
+        self.assertEqual(task_last_progress(self.participation, self.task),
+                         self.at(1))
+
+
+class TestMaterializedTaskScores(TaskScoreMixin, unittest.TestCase):
+    """Tests for the functions maintaining ParticipationTaskScore."""
+
+    def setUp(self):
+        super(TestMaterializedTaskScores, self).setUp()
+        self.task.score_mode = SCORE_MODE_MAX
+        self.session.flush()
+        self.key = (self.participation.id, self.task.id)
+
+    def fingerprint(self):
+        return task_score_fingerprints(
+            self.session, contest_id=self.task.contest_id).get(self.key)
+
+    def stored(self):
+        return self.session.query(ParticipationTaskScore)\
+            .filter(ParticipationTaskScore.participation_id ==
+                    self.participation.id)\
+            .filter(ParticipationTaskScore.task_id == self.task.id)\
+            .populate_existing()\
+            .first()
+
+    def test_fingerprint(self):
+        self.assertIsNone(self.fingerprint())
+
+        self.add_result(self.at(1), 10.0)
+        self.session.flush()
+        fingerprint = self.fingerprint()
+        self.assertIsNotNone(fingerprint)
+        self.assertEqual(self.fingerprint(), fingerprint)
+        # Filters by participation and task give the same fingerprint.
+        self.assertEqual(task_score_fingerprints(
+            self.session, participation_ids=[self.participation.id],
+            task_ids=[self.task.id]), {self.key: fingerprint})
+        self.assertEqual(task_score_fingerprints(
+            self.session, task_ids=[self.task.id + 1]), {})
+
+        # Changes that can affect the scores change the fingerprint.
+        fingerprints = set([fingerprint])
+        self.add_token(timestamp=self.at(2),
+                       submission=self.participation.submissions[0])
+        self.session.flush()
+        fingerprints.add(self.fingerprint())
+        self.add_result(self.at(3), 20.0)
+        self.session.flush()
+        fingerprints.add(self.fingerprint())
+        self.task.score_precision = 1
+        self.session.flush()
+        fingerprints.add(self.fingerprint())
+        self.task.active_dataset = self.add_dataset(task=self.task)
+        self.session.flush()
+        fingerprints.add(self.fingerprint())
+        self.assertEqual(len(fingerprints), 5)
+
+    def test_update(self):
+        self.add_result(self.at(1), 10.0, public_score=5.0)
+        self.add_result(self.at(2), 30.123, public_score=1.0, tokened=True)
+        self.add_result(self.at(3), 20.0, public_score=7.0)
+        self.session.flush()
+
+        update_task_scores(self.session, [self.key])
+        row = self.stored()
+        self.assertEqual(row.fingerprint, self.fingerprint())
+        self.assertEqual((row.score, row.score_partial), (30.12, False))
+        self.assertEqual((row.public_score, row.public_score_partial),
+                         (7.0, False))
+        self.assertEqual((row.tokened_score, row.tokened_score_partial),
+                         (30.12, False))
+        self.assertEqual(row.last_progress, self.at(2))
+
+        # Updating again overwrites the row.
+        self.add_submission(participation=self.participation,
+                            task=self.task, timestamp=self.at(4))
+        self.session.flush()
+        update_task_scores(self.session, [self.key])
+        row = self.stored()
+        self.assertEqual(row.fingerprint, self.fingerprint())
+        self.assertEqual((row.score, row.score_partial), (30.12, True))
+
+    def test_update_concurrent_insert(self):
+        """A row inserted by another transaction after looking for the
+        existing rows is overwritten.
+
+        """
+        self.add_result(self.at(1), 10.0)
+        self.session.commit()
+        self.addCleanup(self.delete_data)
+
+        def insert_row():
+            session = Session()
+            try:
+                session.execute(ParticipationTaskScore.__table__.insert(), {
+                    "participation_id": self.participation.id,
+                    "task_id": self.task.id, "fingerprint": "old",
+                    "score": 0.0, "score_partial": False,
+                    "public_score": 0.0, "public_score_partial": False,
+                    "tokened_score": 0.0, "tokened_score_partial": False})
+                session.commit()
+            finally:
+                session.close()
+
+        existing = cms.grading.scoring._existing_task_scores
+        calls = []
+
+        def existing_then_insert(session, keys):
+            result = existing(session, keys)
+            calls.append(result)
+            if len(calls) == 1:
+                insert_row()
+            return result
+
+        with patch("cms.grading.scoring._existing_task_scores",
+                   side_effect=existing_then_insert):
+            update_task_scores(self.session, [self.key])
+        self.assertEqual(calls, [set(), set([self.key])])
+        self.session.commit()
+
+        row = self.stored()
+        self.assertEqual(row.fingerprint, self.fingerprint())
+        self.assertEqual(row.score, 10.0)
+
+    def test_get_task_scores(self):
+        self.assertEqual(get_task_scores(self.session,
+                                         self.task.contest_id), {})
+
+        self.add_result(self.at(1), 10.0)
+        self.session.flush()
+        rows = get_task_scores(self.session, self.task.contest_id)
+        self.assertEqual(list(rows), [self.key])
+        self.assertEqual(rows[self.key].tokened_score, 0.0)
+
+        # Tokens do not go through ScoringService, but are noticed.
+        self.add_token(timestamp=self.at(2),
+                       submission=self.participation.submissions[0])
+        self.session.flush()
+        rows = get_task_scores(self.session, self.task.contest_id)
+        self.assertEqual(rows[self.key].tokened_score, 10.0)
+
+        # Rows without submissions are removed.
+        for submission in self.participation.submissions:
+            self.session.delete(submission)
+        self.session.flush()
+        self.assertEqual(get_task_scores(self.session,
+                                         self.task.contest_id), {})
+        self.assertIsNone(self.stored())
+
+
 if __name__ == "__main__":
     unittest.main()
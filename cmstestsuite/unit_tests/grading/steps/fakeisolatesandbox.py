@@ -39,7 +39,8 @@ class FakeIsolateSandbox(IsolateSandbox):
 
     This fake redefines execute_without_std to skip running the command and
     just create a fake log file; it also allows to generate fake files to
-    answer get_file or get_file_to_string.
+    answer get_file or get_file_to_string. Files are never linked in the
+    sandbox, so that they are always read through the file cacher.
 
     """
     def __init__(self, file_cacher, name=None, temp_dir=None):
@@ -140,6 +141,9 @@ class FakeIsolateSandbox(IsolateSandbox):
 
         return data["success"]
 
+    def _link_file(self, path, src_path, executable=False):
+        return False
+
     def initialize_isolate(self):
         pass
 
@@ -26,9 +26,12 @@ from __future__ import unicode_literals
 from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
 
+import random
 import unittest
 from io import BytesIO
 
+from mock import patch
+
 from cms.grading.steps import _WHITES, _white_diff
 
 
@@ -76,5 +79,41 @@ class TestWhiteDiff(unittest.TestCase):
         self.assertFalse(self._diff("1\n\n2", "1\n2"))
 
 
+class TestWhiteDiffChunks(TestWhiteDiff):
+    """Same tests, with chunks so small that lines span many of them."""
+
+    def setUp(self):
+        patcher = patch("cms.grading.steps.whitediff._CHUNK_SIZE", 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _reference(s1, s2):
+        """Straightforward implementation of the white diff."""
+        lines1 = s1.split(b"\n")
+        lines2 = s2.split(b"\n")
+        length = max(len(lines1), len(lines2))
+        lines1 += [b""] * (length - len(lines1))
+        lines2 += [b""] * (length - len(lines2))
+        return all(line1.split() == line2.split()
+                   for line1, line2 in zip(lines1, lines2))
+
+    def test_random(self):
+        rnd = random.Random(42)
+        alphabet = [b"1", b"2"] + _WHITES
+        for _ in range(2000):
+            s1 = b"".join(rnd.choice(alphabet)
+                          for _ in range(rnd.randint(0, 12)))
+            # Make the second string similar to the first, so that
+            # they are often equivalent.
+            s2 = b"".join(rnd.choice(_WHITES) if c in _WHITES else c
+                          for c in (s1[i:i + 1] for i in range(len(s1))))
+            if rnd.random() < 0.5:
+                s2 += rnd.choice(alphabet)
+            self.assertEqual(
+                _white_diff(BytesIO(s1), BytesIO(s2)),
+                self._reference(s1, s2), (s1, s2))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -166,6 +166,26 @@ class TestCompile(TaskTypeTestMixin, unittest.TestCase):
         self.assertResultsInJob(job)
         sandbox.get_file_to_storage.assert_called_once_with("foo", ANY)
         sandbox.cleanup.assert_called_once_with(delete=True)
+        # The outcome is stored in the compilation cache.
+        self.compilation_cache_key.assert_called_once_with(
+            ANY, {"foo.l1": "digest of foo.l1"},
+            fake_compilation_commands(
+                COMPILATION_COMMAND_1, ["foo.l1"], "foo"))
+        self.store_compilation_in_cache.assert_called_once_with(
+            job, "key", ANY)
+
+    def test_alone_cached(self):
+        # An identical compilation is in the cache: no sandbox is needed.
+        tt, job = self.prepare(["alone", ["", ""], "diff"],
+                               {"foo.%l": FILE_FOO_L1})
+        self.load_compilation_from_cache.return_value = True
+
+        tt.compile(job, self.file_cacher)
+
+        self.load_compilation_from_cache.assert_called_once_with(job, "key")
+        self.Sandbox.assert_not_called()
+        self.compilation_step.assert_not_called()
+        self.store_compilation_in_cache.assert_not_called()
 
     def test_alone_failure_missing_file(self):
         # For some reason the user submission is missing. This should not
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests for the creation of task types."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import unittest
+
+from mock import patch
+
+from cms.grading.tasktypes import get_task_type, _task_type_cache
+from cms.grading.tasktypes.Batch import Batch
+
+
+class TestGetTaskType(unittest.TestCase):
+
+    def setUp(self):
+        super(TestGetTaskType, self).setUp()
+        _task_type_cache.clear()
+        patcher = patch("cms.grading.tasktypes.get_task_type_class",
+                        {"Batch": Batch}.__getitem__)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reused(self):
+        """The same arguments give the same instance."""
+        task_type = get_task_type("Batch", ["alone", ["", ""], "diff"])
+        self.assertIsInstance(task_type, Batch)
+        self.assertIs(task_type,
+                      get_task_type("Batch", ["alone", ["", ""], "diff"]))
+        self.assertIsNot(task_type, get_task_type(
+            "Batch", ["alone", ["", ""], "comparator"]))
+
+    def test_not_shared_with_caller(self):
+        """Changing the arguments later does not change the instance."""
+        parameters = ["alone", ["", ""], "diff"]
+        task_type = get_task_type("Batch", parameters)
+        parameters[1][0] = "input.txt"
+        self.assertEqual(task_type.input_filename, "")
+        self.assertEqual(task_type.parameters, ["alone", ["", ""], "diff"])
+
+
+if __name__ == "__main__":
+    unittest.main()
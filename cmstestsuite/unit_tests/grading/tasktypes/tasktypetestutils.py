@@ -137,6 +137,14 @@ class TaskTypeTestMixin(object):
         self.extract_outcome_and_text = self._maybe_patch(
             "extract_outcome_and_text")
 
+        # Mock the compilation cache, by default always missing.
+        self.compilation_cache_key = self._maybe_patch(
+            "compilation_cache_key", return_value="key")
+        self.load_compilation_from_cache = self._maybe_patch(
+            "load_compilation_from_cache", return_value=False)
+        self.store_compilation_in_cache = self._maybe_patch(
+            "store_compilation_in_cache")
+
     def _maybe_patch(self, name, *args, **kwargs):
         """Patch name inside the task type if it exists.
 
@@ -28,8 +28,20 @@ from future.builtins import *  # noqa
 
 import unittest
 
-from cms.grading import Language
+from mock import MagicMock, patch
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+from cmstestsuite.unit_tests.testidgenerator import unique_digest
+
+from cms import config
+from cms.db import CompilationCacheEntry, Executable
+from cms.grading import JobException, Language
+from cms.grading.Job import CompilationJob
+from cms.grading.Sandbox import Sandbox, SandboxInterfaceException
 from cms.grading.tasktypes import is_manager_for_compilation
+from cms.grading.tasktypes.util import compilation_cache_key, \
+    create_sandbox, delete_sandbox, load_compilation_from_cache, \
+    set_sandbox_pool, store_compilation_in_cache
 
 
 class TestLanguage(Language):
@@ -99,5 +111,147 @@ class TestIsManagerForCompilation(unittest.TestCase):
         self.assertIsNotForCompilation("test.srcext1.")
 
 
+class TestSandboxPoolUse(unittest.TestCase):
+    """Test create_sandbox and delete_sandbox with a pool."""
+
+    def setUp(self):
+        super(TestSandboxPoolUse, self).setUp()
+        self.pool = MagicMock()
+        set_sandbox_pool(self.pool)
+        self.addCleanup(set_sandbox_pool, None)
+        patcher = patch.object(config, "keep_sandbox", False)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+    def test_create_delete(self):
+        file_cacher = MagicMock()
+        sandbox = create_sandbox(file_cacher, name="compile")
+        self.pool.acquire.assert_called_once_with(file_cacher, name="compile")
+        self.assertIs(sandbox, self.pool.acquire.return_value)
+
+        delete_sandbox(sandbox, success=True)
+        self.pool.release.assert_called_once_with(sandbox, delete=True)
+        sandbox.cleanup.assert_not_called()
+
+    def test_keep_failed(self):
+        sandbox = create_sandbox(MagicMock())
+        delete_sandbox(sandbox, success=False)
+        self.pool.release.assert_called_once_with(sandbox, delete=False)
+
+    def test_create_failure(self):
+        self.pool.acquire.side_effect = SandboxInterfaceException
+        with self.assertRaises(JobException):
+            create_sandbox(MagicMock())
+
+
+class TestCompilationCache(DatabaseMixin, unittest.TestCase):
+    """Test the functions handling the compilation cache."""
+
+    def setUp(self):
+        super(TestCompilationCache, self).setUp()
+        self.lang = TestLanguage()
+        self.key = unique_digest()
+        patcher = patch.object(config, "use_compilation_cache", True)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+    def tearDown(self):
+        self.session.close()
+        super(TestCompilationCache, self).tearDown()
+
+    @staticmethod
+    def compiled_job(success=True, compilation_success=True,
+                     exit_status=Sandbox.EXIT_OK):
+        job = CompilationJob(language="TestLanguage", info="test")
+        job.success = success
+        job.compilation_success = compilation_success
+        job.text = ["Compilation succeeded"] if compilation_success \
+            else ["Compilation failed"]
+        job.plus = {"exit_status": exit_status, "execution_time": 0.5,
+                    "stdout": "out", "stderr": "err"}
+        if compilation_success:
+            job.executables["foo"] = Executable("foo", unique_digest())
+        return job
+
+    def assertStored(self, stored):
+        self.session.expire_all()
+        entry = self.session.query(CompilationCacheEntry).get(self.key)
+        self.assertEqual(entry is not None, stored)
+
+    def test_key(self):
+        files = {"foo.c": "digest1", "bar.c": "digest2"}
+        commands = [["gcc", "foo.c", "bar.c", "-o", "foo"]]
+        key = compilation_cache_key(self.lang, files, commands)
+        # Same files in a different order.
+        self.assertEqual(key, compilation_cache_key(
+            self.lang, dict(reversed(list(files.items()))), commands))
+        # A different content, command or limit.
+        self.assertNotEqual(key, compilation_cache_key(
+            self.lang, {"foo.c": "digest3", "bar.c": "digest2"}, commands))
+        self.assertNotEqual(key, compilation_cache_key(
+            self.lang, files, [["gcc", "-O2", "foo.c", "bar.c"]]))
+        with patch.object(config, "compilation_sandbox_max_time_s", 1.0):
+            self.assertNotEqual(
+                key, compilation_cache_key(self.lang, files, commands))
+
+    def test_miss(self):
+        job = CompilationJob(language="TestLanguage")
+        self.assertFalse(load_compilation_from_cache(job, self.key))
+        self.assertIsNone(job.success)
+        self.assertEqual(job.executables, {})
+
+    def test_success(self):
+        job = self.compiled_job()
+        store_compilation_in_cache(job, self.key, self.lang)
+        self.assertStored(True)
+
+        cached_job = CompilationJob(language="TestLanguage")
+        self.assertTrue(load_compilation_from_cache(cached_job, self.key))
+        self.assertTrue(cached_job.success)
+        self.assertTrue(cached_job.compilation_success)
+        self.assertEqual(cached_job.text, job.text)
+        self.assertEqual(cached_job.plus, job.plus)
+        self.assertEqual(cached_job.executables["foo"].digest,
+                         job.executables["foo"].digest)
+
+    def test_compilation_failure(self):
+        job = self.compiled_job(compilation_success=False,
+                                exit_status=Sandbox.EXIT_NONZERO_RETURN)
+        store_compilation_in_cache(job, self.key, self.lang)
+        self.assertStored(True)
+
+        cached_job = CompilationJob(language="TestLanguage")
+        self.assertTrue(load_compilation_from_cache(cached_job, self.key))
+        self.assertTrue(cached_job.success)
+        self.assertFalse(cached_job.compilation_success)
+        self.assertEqual(cached_job.executables, {})
+
+    def test_not_stored(self):
+        # Timeouts may not happen again, and sandbox failures are not
+        # the outcome of the compilation.
+        store_compilation_in_cache(
+            self.compiled_job(compilation_success=False,
+                              exit_status=Sandbox.EXIT_TIMEOUT),
+            self.key, self.lang)
+        store_compilation_in_cache(
+            self.compiled_job(success=False), self.key, self.lang)
+        self.assertStored(False)
+
+    def test_store_twice(self):
+        store_compilation_in_cache(self.compiled_job(), self.key, self.lang)
+        store_compilation_in_cache(self.compiled_job(), self.key, self.lang)
+        self.assertStored(True)
+
+    def test_disabled(self):
+        with patch.object(config, "use_compilation_cache", False):
+            store_compilation_in_cache(
+                self.compiled_job(), self.key, self.lang)
+            self.assertStored(False)
+        store_compilation_in_cache(self.compiled_job(), self.key, self.lang)
+        with patch.object(config, "use_compilation_cache", False):
+            self.assertFalse(load_compilation_from_cache(
+                CompilationJob(language="TestLanguage"), self.key))
+
+
 if __name__ == "__main__":
     unittest.main()
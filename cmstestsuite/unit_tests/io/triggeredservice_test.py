@@ -77,6 +77,24 @@ class FakeBatchExecutor(FakeExecutor):
         super(FakeBatchExecutor, self).execute(operations[0])
 
 
+class FakeCostBatchExecutor(FakeBatchExecutor):
+    """Batch executor of items whose cost is written in their title."""
+    def __init__(self, notifier, max_cost):
+        super(FakeCostBatchExecutor, self).__init__(notifier)
+        self._max_cost = max_cost
+        self.batches = []
+
+    def max_cost_per_batch(self):
+        return self._max_cost
+
+    def operation_cost(self, item):
+        return float(str(item).split()[0])
+
+    def execute(self, operations):
+        self.batches.append([str(entry.item) for entry in operations])
+        super(FakeCostBatchExecutor, self).execute(operations)
+
+
 class FakeTriggeredService(TriggeredService):
     def __init__(self, shard, timeout):
         super(FakeTriggeredService, self).__init__(shard)
@@ -141,6 +159,20 @@ class TestTriggeredService(unittest.TestCase):
         for notifier in self.notifiers:
             self.assertEqual(notifier.get_notifications(), 2)
 
+    def test_sweeper_status(self):
+        """Test that the sweeps are timed."""
+        self.setUpService(0.1)
+        self.service.add_missing_operation(FakeQueueItem('op 0'))
+        gevent.sleep(0.15)
+        status = self.service.sweeper_status()
+        self.assertEqual(status["sweeps"], 2)
+        self.assertEqual(status["last_operations"], 0)
+        self.assertIsNotNone(status["last_start_time"])
+        self.assertGreaterEqual(status["max_duration"],
+                                status["last_duration"])
+        self.assertGreaterEqual(status["total_duration"],
+                                status["max_duration"])
+
     def test_bad_executor(self):
         """Test that a slow executor does not block the others."""
         self.setUpService()
@@ -179,6 +211,20 @@ class TestTriggeredService(unittest.TestCase):
         # Just one call to the batch executor.
         self.assertEqual(batch_notifier.get_notifications(), 1)
 
+    def test_batch_cost(self):
+        """Test that batches are limited by the cost of their items."""
+        self.setUpService()
+        batch_executor = FakeCostBatchExecutor(Notifier(), 8.0)
+        self.service.add_executor(batch_executor)
+        for i, cost in enumerate([4, 4, 4, 1, 10, 1]):
+            self.service.enqueue(FakeQueueItem('%d op %d' % (cost, i)))
+        gevent.sleep(0.01)
+        self.assertEqual(batch_executor.batches,
+                         [['4 op 0', '4 op 1'],
+                          ['4 op 2', '1 op 3'],
+                          ['10 op 4'],
+                          ['1 op 5']])
+
 
 if __name__ == "__main__":
     unittest.main()
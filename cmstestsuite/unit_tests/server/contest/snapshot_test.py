@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests for the snapshots of the contests of CWS.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import ipaddress
+import unittest
+
+from sqlalchemy import event
+
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.db import Session, engine
+from cms.server.contest.authentication import authenticate_request, \
+    validate_login
+from cms.server.contest.snapshot import ContestSnapshotCache
+from cmscommon.crypto import build_password
+from cmscommon.datetime import make_datetime
+
+
+class TestContestSnapshotCache(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(TestContestSnapshotCache, self).setUp()
+        self.timestamp = make_datetime()
+        self.contest = self.add_contest(allow_password_authentication=True)
+        self.task = self.add_task(contest=self.contest)
+        self.task.active_dataset = self.add_dataset(task=self.task)
+        self.user = self.add_user(password=build_password("mypass"))
+        self.participation = self.add_participation(
+            contest=self.contest, user=self.user,
+            ip=[ipaddress.ip_network("10.0.0.1/32")])
+        self.session.commit()
+
+        self.cache = ContestSnapshotCache(10)
+        # The session of a request handled by CWS.
+        self.request_session = Session()
+
+        self.queries = 0
+        event.listen(engine, "before_cursor_execute", self.count_query)
+
+    def tearDown(self):
+        event.remove(engine, "before_cursor_execute", self.count_query)
+        self.request_session.close()
+        self.delete_data()
+        super(TestContestSnapshotCache, self).tearDown()
+
+    def count_query(self, *args, **kwargs):
+        self.queries += 1
+
+    def assertNoQueries(self, function, *args):
+        """Call function and check it does not query the database."""
+        queries = self.queries
+        result = function(*args)
+        self.assertEqual(self.queries, queries)
+        return result
+
+    def test_contest(self):
+        snapshot = self.cache.get(self.contest.id)
+
+        def use_contest():
+            contest = snapshot.contest(self.request_session)
+            return contest, contest.name, contest.tasks[0].name, \
+                contest.tasks[0].active_dataset.description
+        contest, name, task_name, dataset_description = \
+            self.assertNoQueries(use_contest)
+        self.assertIn(contest, self.request_session)
+        self.assertEqual(contest.id, self.contest.id)
+        self.assertEqual(name, self.contest.name)
+        self.assertEqual(task_name, self.task.name)
+        self.assertEqual(dataset_description,
+                         self.task.active_dataset.description)
+
+        # Not loaded in the snapshot, but available as usual.
+        self.assertEqual(len(contest.participations), 1)
+
+    def test_get(self):
+        snapshot = self.cache.get(self.contest.id)
+        self.assertIsNotNone(snapshot)
+        self.assertIs(self.assertNoQueries(self.cache.get, self.contest.id),
+                      snapshot)
+        self.assertIs(self.assertNoQueries(self.cache.get_by_name,
+                                           self.contest.name),
+                      snapshot)
+
+        # Expired snapshots are loaded again.
+        snapshot.loaded_at -= 10
+        other_snapshot = self.cache.get(self.contest.id)
+        self.assertIsNot(other_snapshot, snapshot)
+        self.assertIs(self.cache.get(self.contest.id), other_snapshot)
+
+        # And so are the invalidated ones.
+        self.cache.invalidate(self.contest.id)
+        self.assertIsNot(self.cache.get_by_name(self.contest.name),
+                         other_snapshot)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.cache.get(self.contest.id + 1))
+        self.assertIsNone(self.cache.get_by_name("nonexisting"))
+
+    def test_disabled(self):
+        cache = ContestSnapshotCache(0)
+        self.assertIsNone(cache.get(self.contest.id))
+        self.assertIsNone(cache.get_by_name(self.contest.name))
+
+    def test_participations(self):
+        snapshot = self.cache.get(self.contest.id)
+
+        participation = self.assertNoQueries(
+            snapshot.participation_by_username, self.request_session,
+            self.user.username)
+        self.assertEqual(participation.id, self.participation.id)
+        self.assertIsNone(snapshot.participation_by_username(
+            self.request_session, "nonexisting"))
+
+        participations = self.assertNoQueries(
+            snapshot.participations_by_ip, self.request_session,
+            ipaddress.ip_network("10.0.0.1/32"))
+        self.assertEqual([participation], participations)
+        self.assertEqual(snapshot.participations_by_ip(
+            self.request_session, ipaddress.ip_network("10.0.0.2/32")), [])
+
+    def authenticate(self, cookie=None, ip_address="10.0.0.1"):
+        snapshot = self.cache.get(self.contest.id)
+        contest = snapshot.contest(self.request_session)
+        return authenticate_request(
+            self.request_session, contest, self.timestamp, cookie,
+            ipaddress.ip_address(ip_address), snapshot)
+
+    def login(self, password="mypass"):
+        _, cookie = validate_login(
+            self.session, self.contest, self.timestamp, self.user.username,
+            password, ipaddress.ip_address("10.0.0.1"))
+        return cookie
+
+    def test_authenticate_cookie(self):
+        cookie = self.login()
+        self.cache.get(self.contest.id)
+        participation, new_cookie = self.assertNoQueries(
+            self.authenticate, cookie)
+        self.assertEqual(participation.id, self.participation.id)
+        self.assertIsNotNone(new_cookie)
+
+    def test_authenticate_ip(self):
+        self.contest.ip_autologin = True
+        self.session.commit()
+        self.cache.get(self.contest.id)
+        participation, cookie = self.assertNoQueries(
+            self.authenticate, None, "10.0.0.1")
+        self.assertEqual(participation.id, self.participation.id)
+        self.assertIsNone(cookie)
+
+    def test_authenticate_new_participation(self):
+        """Participations added after the snapshot are found."""
+        self.cache.get(self.contest.id)
+        self.user = self.add_user(password=build_password("mypass"))
+        self.participation = self.add_participation(
+            contest=self.contest, user=self.user, ip=None)
+        self.session.commit()
+        participation, _ = self.authenticate(self.login())
+        self.assertEqual(participation.id, self.participation.id)
+
+    def test_authenticate_new_password(self):
+        """Passwords changed after the snapshot are used."""
+        self.cache.get(self.contest.id)
+        self.user.password = build_password("newpass")
+        self.session.commit()
+        participation, _ = self.authenticate(self.login("newpass"))
+        self.assertEqual(participation.id, self.participation.id)
+
+
+if __name__ == "__main__":
+    unittest.main()
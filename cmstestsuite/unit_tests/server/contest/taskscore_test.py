@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests for the cache of task scores of CWS.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import unittest
+
+# Needs to be first to allow for monkey patching the DB connection string.
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.server.contest.taskscore import TaskScoreCache
+from cmscommon.constants import SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK
+
+
+class TestTaskScoreCache(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(TestTaskScoreCache, self).setUp()
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest,
+                                  score_mode=SCORE_MODE_MAX,
+                                  score_precision=2)
+        self.dataset = self.add_dataset(task=self.task)
+        self.task.active_dataset = self.dataset
+        self.session.flush()
+
+        self.cache = TaskScoreCache()
+
+    def tearDown(self):
+        self.session.close()
+        super(TestTaskScoreCache, self).tearDown()
+
+    def add_scored(self, score, public_score, dataset=None,
+                   score_details=None):
+        submission = self.add_submission(self.task, self.participation)
+        result = self.add_submission_result(
+            submission, dataset if dataset is not None else self.dataset,
+            compilation_outcome="ok", evaluation_outcome="ok")
+        result.score = score
+        result.score_details = \
+            score_details if score_details is not None else []
+        result.public_score = public_score
+        result.public_score_details = []
+        result.ranking_score_details = []
+        self.session.flush()
+        return result
+
+    def get(self):
+        self.session.flush()
+        return self.cache.get(self.session, self.participation, self.task)
+
+    def assertScores(self, public, tokened, partial=False):
+        self.assertEqual(self.get(),
+                         ((public, partial), (tokened, partial)))
+
+    def test_no_submissions(self):
+        self.assertScores(0.0, 0.0)
+        self.assertScores(0.0, 0.0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_hit(self):
+        self.add_scored(50.0, 20.0)
+        self.assertScores(20.0, 0.0)
+        self.assertScores(20.0, 0.0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_new_submission(self):
+        self.add_scored(50.0, 20.0)
+        self.assertScores(20.0, 0.0)
+        submission = self.add_submission(self.task, self.participation)
+        self.add_submission_result(submission, self.dataset)
+        self.assertScores(20.0, 0.0, partial=True)
+
+    def test_scored(self):
+        result = self.add_scored(50.0, 20.0)
+        result.score = result.public_score = None
+        self.assertScores(0.0, 0.0, partial=True)
+        result.score = 70.0
+        result.public_score = 30.0
+        self.assertScores(30.0, 0.0)
+
+    def test_tokened(self):
+        result = self.add_scored(50.0, 20.0)
+        self.assertScores(20.0, 0.0)
+        self.add_token(submission=result.submission)
+        self.assertScores(20.0, 50.0)
+
+    def test_details(self):
+        """Changes of the details only are noticed."""
+        self.task.score_mode = SCORE_MODE_MAX_SUBTASK
+        first = [{"idx": 1, "score_fraction": 1.0, "max_score": 40.0},
+                 {"idx": 2, "score_fraction": 0.0, "max_score": 60.0}]
+        second = [{"idx": 1, "score_fraction": 0.0, "max_score": 40.0},
+                  {"idx": 2, "score_fraction": 1.0, "max_score": 60.0}]
+        result = self.add_scored(40.0, 40.0, score_details=first)
+        self.add_token(submission=result.submission)
+        other = self.add_scored(40.0, 40.0, score_details=first)
+        self.add_token(submission=other.submission)
+        self.assertScores(40.0, 40.0)
+        other.score_details = second
+        self.assertScores(40.0, 100.0)
+
+    def test_active_dataset(self):
+        self.add_scored(50.0, 20.0)
+        self.assertScores(20.0, 0.0)
+        other_dataset = self.add_dataset(task=self.task)
+        self.task.active_dataset = other_dataset
+        self.assertScores(0.0, 0.0, partial=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -27,13 +27,16 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
+import six
 
 # We enable monkey patching to make many libraries gevent-friendly
 # (for instance, urllib3, used by requests)
 import gevent.monkey
 gevent.monkey.patch_all()  # noqa
 
+import json
 import unittest
+import zlib
 
 import gevent
 from mock import patch, PropertyMock
@@ -41,7 +44,9 @@ from mock import patch, PropertyMock
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
+from cms import config
 from cms.service.ProxyService import ProxyService
+from cmstestsuite.unit_tests.testidgenerator import unique_long_id
 from cmscommon.constants import SCORE_MODE_MAX
 
 
@@ -57,7 +62,7 @@ class TestProxyService(DatabaseMixin, unittest.TestCase):
         self.score_type.max_score = 100
         self.score_type.ranking_headers = ["100"]
 
-        patcher = patch("requests.put")
+        patcher = patch("requests.Session.put")
         self.requests_put = patcher.start()
         self.addCleanup(patcher.stop)
         self.requests_put.return_value.status_code = 200
@@ -78,9 +83,10 @@ class TestProxyService(DatabaseMixin, unittest.TestCase):
                                                     team=self.team)
 
         self.new_sr_unscored()
-        self.new_sr_scored()
+        self.scored_sr = self.new_sr_scored()
         result = self.new_sr_scored()
         self.add_token(submission=result.submission)
+        self.tokened_sr = result
 
         self.session.commit()
 
@@ -117,6 +123,72 @@ class TestProxyService(DatabaseMixin, unittest.TestCase):
         self.assertTrue(urls[4].endswith("submissions/"))
         self.assertTrue(urls[5].endswith("subchanges/"))
 
+    def test_submissions_scored(self):
+        """Many submissions are sent as if notified one at a time."""
+        service = ProxyService(0, self.contest.id)
+        gevent.sleep(0.1)
+        submission_ids = [self.scored_sr.submission_id,
+                          self.tokened_sr.submission_id]
+
+        with patch.object(service, "enqueue") as enqueue:
+            for submission_id in submission_ids:
+                service.submission_scored(submission_id)
+            one_at_a_time = [args[0].to_dict()
+                               for args, _ in enqueue.call_args_list]
+        with patch.object(service, "enqueue") as enqueue:
+            service.submissions_scored(submission_ids)
+            together = [args[0].to_dict()
+                          for args, _ in enqueue.call_args_list]
+
+        self.assertGreater(len(together), 0)
+        six.assertCountEqual(self, together, one_at_a_time)
+
+    def test_submissions_scored_hidden(self):
+        """Nothing is sent for hidden participations or missing
+        submissions.
+
+        """
+        service = ProxyService(0, self.contest.id)
+        gevent.sleep(0.1)
+        self.participation.hidden = True
+        self.session.commit()
+
+        with patch.object(service, "enqueue") as enqueue:
+            service.submissions_scored([self.scored_sr.submission_id,
+                                        unique_long_id()])
+            enqueue.assert_not_called()
+
+    @patch.object(config, "rankings_gzip", True)
+    def test_compressed(self):
+        """Data is sent gzip-compressed if enabled, and accounted for."""
+        service = ProxyService(0, self.contest.id)
+        gevent.sleep(0.1)
+
+        args, kwargs = self.requests_put.call_args_list[0]
+        self.assertEqual(kwargs["headers"]["content-encoding"], "gzip")
+        data = json.loads(zlib.decompress(
+            args[1], 16 + zlib.MAX_WBITS).decode("utf-8"))
+        self.assertEqual(list(data), [self.contest.name])
+
+        stats, = service.rankings_status()
+        self.assertGreaterEqual(stats["requests"], 6)
+        self.assertEqual(stats["failures"], 0)
+        self.assertGreater(stats["bytes_sent"], 0)
+        self.assertNotIn("passw0rd", stats["ranking"])
+
+    @patch.object(config, "rankings_gzip", False)
+    def test_uncompressed(self):
+        service = ProxyService(0, self.contest.id)
+        gevent.sleep(0.1)
+
+        args, kwargs = self.requests_put.call_args_list[0]
+        self.assertNotIn("content-encoding", kwargs["headers"])
+        data = json.loads(args[1].decode("utf-8"))
+        self.assertEqual(list(data), [self.contest.name])
+
+        stats, = service.rankings_status()
+        self.assertEqual(stats["bytes"], stats["bytes_sent"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -38,12 +38,14 @@ gevent.monkey.patch_all()  # noqa
 import unittest
 
 import gevent
-from mock import patch, PropertyMock
+from mock import Mock, patch, PropertyMock
 
 # Needs to be first to allow for monkey patching the DB connection string.
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.service.ScoringService import ScoringService
+from cms.db import ParticipationTaskScore
+from cms.service.ScoringService import ScoringExecutor, ScoringService
+from cms.service.scoringoperations import ScoringOperation
 from cmstestsuite.unit_tests.testidgenerator import unique_long_id, \
     unique_unicode_id
 
@@ -100,7 +102,7 @@ class TestScoringService(DatabaseMixin, unittest.TestCase):
         service = ScoringService(0)
         service.new_evaluation(sr.submission_id, sr.dataset_id)
 
-        gevent.sleep(0.1)  # Needed to trigger the score loop.
+        gevent.sleep(0.5)  # Needed to trigger the score loop.
 
         # Asserts that compute_score was called.
         six.assertCountEqual(self, self.call_args,
@@ -123,7 +125,7 @@ class TestScoringService(DatabaseMixin, unittest.TestCase):
         service.new_evaluation(sr_a.submission_id, sr_a.dataset_id)
         service.new_evaluation(sr_b.submission_id, sr_b.dataset_id)
 
-        gevent.sleep(0.1)  # Needed to trigger the score loop.
+        gevent.sleep(0.5)  # Needed to trigger the score loop.
 
         # Asserts that compute_score was called.
         six.assertCountEqual(self, self.call_args,
@@ -140,11 +142,149 @@ class TestScoringService(DatabaseMixin, unittest.TestCase):
         service = ScoringService(0)
         service.new_evaluation(sr.submission_id, sr.dataset_id)
 
-        gevent.sleep(0.1)  # Needed to trigger the score loop.
+        gevent.sleep(0.5)  # Needed to trigger the score loop.
 
         # Asserts that compute_score was called.
         self.score_type.compute_score.assert_not_called()
 
 
+class TestScoringExecutor(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(TestScoringExecutor, self).setUp()
+
+        patcher = patch("cms.db.Dataset.score_type_object",
+                        new_callable=PropertyMock)
+        self.score_type = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.score_type.compute_score.side_effect = self.compute_score
+        self.call_args = list()
+        self.fail_on = set()
+
+        self.proxy_service = Mock()
+        self.executor = ScoringExecutor(self.proxy_service)
+
+        self.contest = self.add_contest()
+        self.task = self.add_task(contest=self.contest)
+        self.dataset = self.add_dataset(task=self.task)
+        self.task.active_dataset = self.dataset
+        self.other_dataset = self.add_dataset(task=self.task)
+
+    def compute_score(self, sr):
+        self.call_args.append((sr.submission_id, sr.dataset_id))
+        if sr.submission_id in self.fail_on:
+            raise ValueError("Cannot score.")
+        return 100.0, {}, 50.0, {}, ["100"]
+
+    def new_sr(self, dataset, scored=False):
+        submission = self.add_submission(task=self.task)
+        result = self.add_submission_result(
+            compilation_outcome="ok", evaluation_outcome="ok",
+            submission=submission, dataset=dataset)
+        if scored:
+            result.score = 100.0
+            result.score_details = {}
+            result.public_score = 50.0
+            result.public_score_details = {}
+            result.ranking_score_details = ["100"]
+        return result
+
+    def execute(self, submission_results, missing=()):
+        operations = [ScoringOperation(sr.submission_id, sr.dataset_id)
+                      for sr in submission_results]
+        operations += [ScoringOperation(submission_id, self.dataset.id)
+                       for submission_id in missing]
+        self.executor.execute([Mock(item=op) for op in operations])
+
+    def test_batch(self):
+        """Many results are scored, with a single call to PS."""
+        srs = [self.new_sr(self.dataset) for _ in range(3)]
+        other_sr = self.new_sr(self.other_dataset)
+        self.session.commit()
+
+        self.execute(srs + [other_sr])
+
+        six.assertCountEqual(self, self.call_args,
+                             [(sr.submission_id, sr.dataset_id)
+                              for sr in srs + [other_sr]])
+        for sr in srs + [other_sr]:
+            self.session.expire(sr)
+            self.assertTrue(sr.scored())
+            self.assertEqual(sr.score, 100.0)
+        # Only results of the active dataset go to the rankings.
+        self.proxy_service.submissions_scored.assert_called_once_with(
+            submission_ids=[sr.submission_id for sr in srs])
+
+    def test_failures_do_not_stop_batch(self):
+        """Missing, unscorable or scored results do not affect the
+        others.
+
+        """
+        good_sr = self.new_sr(self.dataset)
+        failing_sr = self.new_sr(self.dataset)
+        scored_sr = self.new_sr(self.dataset, scored=True)
+        self.session.commit()
+        self.fail_on.add(failing_sr.submission_id)
+
+        self.execute([failing_sr, scored_sr, good_sr],
+                     missing=[unique_long_id()])
+
+        six.assertCountEqual(self, self.call_args,
+                             [(good_sr.submission_id, good_sr.dataset_id),
+                              (failing_sr.submission_id,
+                               failing_sr.dataset_id)])
+        self.session.expire_all()
+        self.assertTrue(good_sr.scored())
+        self.assertFalse(failing_sr.scored())
+        self.proxy_service.submissions_scored.assert_called_once_with(
+            submission_ids=[good_sr.submission_id])
+
+    def test_task_scores(self):
+        """The materialized task scores of the results of the active
+        dataset are updated.
+
+        """
+        sr = self.new_sr(self.dataset)
+        other_sr = self.new_sr(self.other_dataset)
+        self.session.commit()
+
+        self.execute([sr, other_sr])
+
+        rows = self.session.query(ParticipationTaskScore)\
+            .filter(ParticipationTaskScore.task_id == self.task.id).all()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0].participation_id,
+                         sr.submission.participation_id)
+        self.assertEqual((rows[0].score, rows[0].public_score),
+                         (100.0, 50.0))
+
+    def test_task_scores_failure(self):
+        """A failure updating the task scores does not affect the
+        scoring.
+
+        """
+        sr = self.new_sr(self.dataset)
+        self.session.commit()
+
+        with patch("cms.service.ScoringService.update_task_scores",
+                   side_effect=ValueError("Cannot update.")):
+            self.execute([sr])
+
+        self.session.expire(sr)
+        self.assertTrue(sr.scored())
+        self.proxy_service.submissions_scored.assert_called_once_with(
+            submission_ids=[sr.submission_id])
+
+    def test_nothing_scored(self):
+        """PS is not called if nothing was scored."""
+        sr = self.new_sr(self.dataset, scored=True)
+        self.session.commit()
+
+        self.execute([sr])
+
+        self.score_type.compute_score.assert_not_called()
+        self.proxy_service.submissions_scored.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -30,15 +30,22 @@ from future.builtins.disabled import *  # noqa
 from future.builtins import *  # noqa
 
 import gevent
+import shutil
 import unittest
-from mock import Mock, call
+from mock import MagicMock, Mock, call, patch
 
 from cmstestsuite.unit_tests.testidgenerator import \
     unique_long_id, unique_unicode_id
 
 import cms.service.Worker
+from cmscommon.binary import b64_to_bin
+from cms import config
+from cms.db.filecacher import FileCacher, TombstoneError
 from cms.grading import JobException
 from cms.grading.Job import JobGroup, EvaluationJob
+from cms.grading.Sandbox import SandboxPool
+from cms.grading.tasktypes.util import create_sandbox, delete_sandbox, \
+    set_sandbox_pool
 from cms.service.Worker import Worker
 from cms.service.esoperations import ESOperation
 
@@ -257,6 +264,204 @@ class TestWorker(unittest.TestCase):
             JobGroup.import_from_dict(
                 self.service.execute_job_group(job_groups[0].export_to_dict()))
 
+    # Testing execution in slots.
+
+    def test_execute_job_group_slots(self):
+        """Executes the jobs of a group concurrently in three slots.
+
+        """
+        with patch.object(config, "worker_slots", 3):
+            self.service = Worker(0)
+        self.assertEqual(self.service.get_slots(), 3)
+
+        task_type = ConcurrencyTaskType()
+        cms.service.Worker.get_task_type = Mock(return_value=task_type)
+
+        job_groups, unused_calls = TestWorker.new_job_groups([7])
+        result = JobGroup.import_from_dict(
+            self.service.execute_job_group(job_groups[0].export_to_dict()))
+
+        self.assertTrue(all(job.success for job in result.jobs))
+        self.assertEqual(task_type.call_count, 7)
+        self.assertEqual(task_type.max_running, 3)
+        self.assertEqual(sum(stats["number_execution"]
+                             for stats in self.service._slot_stats), 7)
+
+    def test_execute_job_group_slots_exception(self):
+        """All jobs are executed even if one in another slot fails.
+
+        """
+        with patch.object(config, "worker_slots", 2):
+            self.service = Worker(0)
+
+        task_type = FakeTaskType([0.01, Exception(), 0.01, 0.01])
+        cms.service.Worker.get_task_type = Mock(return_value=task_type)
+
+        job_groups, unused_calls = TestWorker.new_job_groups([4])
+        with self.assertRaises(JobException):
+            self.service.execute_job_group(job_groups[0].export_to_dict())
+        self.assertEqual(task_type.call_count, 4)
+
+        # The lock has been released.
+        task_type.set_results([True])
+        task_type.index = 0
+        job_groups, unused_calls = TestWorker.new_job_groups([1])
+        self.service.execute_job_group(job_groups[0].export_to_dict())
+
+    def test_execute_job_sandbox_leaked(self):
+        """The boxes of a task type raising after acquiring a sandbox
+        are given back to the pool.
+
+        """
+        pool = SandboxPool(0, 1)
+        self.service.sandbox_pool = pool
+        set_sandbox_pool(pool)
+        self.addCleanup(set_sandbox_pool, None)
+        patcher = patch("cms.grading.Sandbox.IsolateSandbox",
+                        MagicMock(side_effect=lambda *args, **kwargs:
+                                  MagicMock()))
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        task_type = SandboxTaskType([TombstoneError(), Exception(), True])
+        cms.service.Worker.get_task_type = Mock(return_value=task_type)
+
+        jobs, unused_calls = TestWorker.new_jobs(3)
+        result = JobGroup.import_from_dict(
+            self.service.execute_job_group(
+                JobGroup([jobs[0]]).export_to_dict()))
+        self.assertFalse(result.jobs[0].success)
+        self.assertEqual(pool.get_stats()["in_use"], 0)
+
+        with self.assertRaises(JobException):
+            self.service.execute_job_group(
+                JobGroup([jobs[1]]).export_to_dict())
+        self.assertEqual(pool.get_stats()["in_use"], 0)
+
+        # The only box of the pool is available again.
+        result = JobGroup.import_from_dict(
+            self.service.execute_job_group(
+                JobGroup([jobs[2]]).export_to_dict()))
+        self.assertTrue(result.jobs[0].success)
+        self.assertEqual(task_type.call_count, 3)
+
+    # Testing the serving of the local cache to the other Workers.
+
+    def test_get_cached_file_chunk(self):
+        file_cacher = FileCacher(null=True)
+        self.addCleanup(shutil.rmtree, file_cacher.file_dir)
+        self.service.file_cacher = file_cacher
+        content = b"0123456789" * 10
+        digest = file_cacher.put_file_content(content)
+
+        self.assertEqual(self.service.get_cached_digests(
+            [digest, "0" * 40, "../" + digest]), [digest])
+        self.assertEqual(b64_to_bin(
+            self.service.get_cached_file_chunk(digest, 95, 10)), b"56789")
+        self.assertEqual(
+            self.service.get_cached_file_chunk(digest, 100, 10), "")
+        self.assertIsNone(
+            self.service.get_cached_file_chunk("../" + digest, 0, 10))
+        for offset, size in [(-1, 10), (0, -1),
+                             (0, Worker.MAX_CHUNK_SIZE + 1)]:
+            with self.assertRaises(ValueError):
+                self.service.get_cached_file_chunk(digest, offset, size)
+
+    # Testing precache_files.
+
+    def precache(self, files, active_files, cached_files, missing_files=()):
+        """Precache files with a mocked database and file cacher.
+
+        files ([unicode]): the digests of the files of the contest.
+        active_files ([unicode]): those of the active datasets.
+        cached_files ([unicode]): those already in the local cache.
+        missing_files ([unicode]): those not available in the backend.
+
+        return (Mock): the mocked file cacher.
+
+        """
+        file_cacher = Mock()
+        file_cacher.is_cached.side_effect = lambda d: d in cached_files
+        file_cacher.load_many.side_effect = \
+            lambda digests, if_needed=False, concurrency=None: \
+            set(digests) & set(missing_files)
+        self.service.file_cacher = file_cacher
+
+        with patch("cms.service.Worker.SessionGen", MagicMock()), \
+                patch("cms.service.Worker.Contest"), \
+                patch("cms.service.Worker.enumerate_files",
+                      Mock(side_effect=[set(files), set(active_files)])):
+            self.service.precache_files(contest_id=1)
+        return file_cacher
+
+    def test_precache_files(self):
+        """Loads the missing files, those of active datasets first.
+
+        """
+        self.assertIsNone(self.service.precache_status())
+        file_cacher = self.precache(
+            ["a", "b", "c", "d", "e"], ["b", "d"], ["d"], ["e"])
+
+        file_cacher.load_many.assert_called_once_with(
+            ["b", "a", "c", "e"], if_needed=True,
+            concurrency=config.precache_concurrency)
+        status = self.service.precache_status()
+        self.assertEqual(status["contest_id"], 1)
+        self.assertEqual(status["total"], 4)
+        self.assertEqual(status["loaded"], 3)
+        self.assertEqual(status["missing"], 1)
+        self.assertEqual(status["eta"], 0.0)
+        self.assertIsNotNone(status["end_time"])
+
+    def test_precache_files_incremental(self):
+        """Precaching again only loads the new files.
+
+        """
+        self.precache(["a", "b"], [], [])
+        file_cacher = self.precache(["a", "b", "c"], [], ["a", "b"])
+        file_cacher.load_many.assert_called_once_with(
+            ["c"], if_needed=True, concurrency=config.precache_concurrency)
+        self.assertEqual(self.service.precache_status()["total"], 1)
+
+    def test_precache_files_batches(self):
+        """Files are requested to the file cacher in batches.
+
+        """
+        files = ["%03d" % i for i in range(250)]
+        with patch.object(Worker, "PRECACHE_BATCH_SIZE", 100):
+            file_cacher = self.precache(files, [], [], ["042", "222"])
+        self.assertEqual(
+            [args[0] for args, _ in file_cacher.load_many.call_args_list],
+            [files[:100], files[100:200], files[200:]])
+        status = self.service.precache_status()
+        self.assertEqual(status["loaded"], 248)
+        self.assertEqual(status["missing"], 2)
+
+    def test_precache_files_failed_batch(self):
+        """The files of a batch that failed count as done.
+
+        """
+        files = ["%03d" % i for i in range(250)]
+        file_cacher = Mock()
+        file_cacher.is_cached.return_value = False
+        file_cacher.load_many.side_effect = [set(), IOError(), set()]
+        self.service.file_cacher = file_cacher
+        with patch.object(Worker, "PRECACHE_BATCH_SIZE", 100), \
+                patch("cms.service.Worker.SessionGen", MagicMock()), \
+                patch("cms.service.Worker.Contest"), \
+                patch("cms.service.Worker.enumerate_files",
+                      Mock(side_effect=[set(files), set()])):
+            self.service.precache_files(contest_id=1)
+
+        self.assertEqual(file_cacher.load_many.call_count, 3)
+        status = self.service.precache_status()
+        self.assertEqual(status["loaded"], 150)
+        self.assertEqual(status["missing"], 0)
+        self.assertEqual(status["failed"], 100)
+        self.assertEqual(status["loaded"] + status["missing"] +
+                         status["failed"], status["total"])
+        self.assertEqual(status["eta"], 0.0)
+
     @staticmethod
     def new_jobs(number_of_jobs, prefix=None):
         prefix = prefix if prefix is not None else ""
@@ -316,5 +521,30 @@ class FakeTaskType(object):
         self.execute_results = results
 
 
+class SandboxTaskType(FakeTaskType):
+    """Fake task type acquiring a sandbox before each result, and
+    deleting it only if the job does not raise."""
+    def execute_job(self, job, file_cacher):
+        sandbox = create_sandbox(file_cacher)
+        super(SandboxTaskType, self).execute_job(job, file_cacher)
+        delete_sandbox(sandbox, job.success)
+
+
+class ConcurrencyTaskType(object):
+    """Fake task type recording how many jobs run at the same time."""
+    def __init__(self):
+        self.call_count = 0
+        self.running = 0
+        self.max_running = 0
+
+    def execute_job(self, job, file_cacher):
+        self.call_count += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        gevent.sleep(0.01)
+        self.running -= 1
+        job.success = True
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -35,7 +35,8 @@ import unittest
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
 from cms.io.priorityqueue import PriorityQueue
-from cms.service.esoperations import ESOperation, get_submissions_operations, \
+from cms.service.esoperations import ESOperation, get_max_submission_id, \
+    get_max_user_test_id, get_submissions_operations, \
     get_user_tests_operations
 
 
@@ -248,6 +249,31 @@ class TestESOperations(DatabaseMixin, unittest.TestCase):
             set(get_submissions_operations(self.session, self.contest.id)),
             expected_operations)
 
+    def test_get_submissions_operations_min_submission_id(self):
+        """Test that submissions before the given id are skipped."""
+        old_submission = self.add_submission(
+            self.tasks[0], self.participation)
+        self.session.flush()
+        self.assertEqual(get_max_submission_id(self.session, self.contest.id),
+                         old_submission.id)
+
+        submission = self.add_submission(self.tasks[0], self.participation)
+        self.session.flush()
+        self.assertEqual(get_max_submission_id(self.session, self.contest.id),
+                         submission.id)
+
+        expected_operations = set(
+            self.submission_compilation_operation(submission, dataset)
+            for dataset in submission.task.datasets if self.to_judge(dataset))
+        self.assertEqual(
+            set(get_submissions_operations(self.session, self.contest.id,
+                                           submission.id)),
+            expected_operations)
+        self.assertEqual(
+            set(get_submissions_operations(self.session, self.contest.id,
+                                           submission.id + 1)),
+            set())
+
     def submission_compilation_operation(
             self, submission, dataset, result=None):
         active_priority = PriorityQueue.PRIORITY_HIGH \
@@ -403,6 +429,24 @@ class TestESOperations(DatabaseMixin, unittest.TestCase):
             set(get_user_tests_operations(self.session, self.contest.id)),
             expected_operations)
 
+    def test_get_user_tests_operations_min_user_test_id(self):
+        """Test that user tests before the given id are skipped."""
+        self.assertIsNone(get_max_user_test_id(self.session, self.contest.id))
+        self.add_user_test(self.tasks[0], self.participation)
+        self.session.flush()
+        user_test = self.add_user_test(self.tasks[0], self.participation)
+        self.session.flush()
+        self.assertEqual(get_max_user_test_id(self.session, self.contest.id),
+                         user_test.id)
+
+        expected_operations = set(
+            self.user_test_compilation_operation(user_test, dataset)
+            for dataset in user_test.task.datasets if self.to_judge(dataset))
+        self.assertEqual(
+            set(get_user_tests_operations(self.session, self.contest.id,
+                                          user_test.id)),
+            expected_operations)
+
     def user_test_compilation_operation(self, user_test, dataset, result=None):
         active_priority = PriorityQueue.PRIORITY_HIGH \
             if result is None or result.compilation_tries == 0 \
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the reuse of past evaluations.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import unittest
+
+from mock import patch
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.grading.tasktypes.Batch import Batch
+from cms.grading.tasktypes.Communication import Communication
+from cms.service.esoperations import ESOperation
+from cms.service.evaluationreuse import EvaluationReuser
+from cms.service.evaluationskip import skipped_evaluation_text
+
+
+class TestEvaluationReuser(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(TestEvaluationReuser, self).setUp()
+        # Do not depend on the task types installed as plugins.
+        patcher = patch(
+            "cms.service.evaluationreuse.get_task_type_class",
+            {"Batch": Batch, "Communication": Communication}.__getitem__)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.submission = self.add_submission(self.task, self.participation)
+        self.file = self.add_file(self.submission, filename="foo.%l")
+
+        # A dataset with an evaluation of the submission...
+        self.old_dataset = self.add_dataset(
+            task=self.task, task_type="Batch",
+            task_type_parameters=["alone", ["", ""], "diff"],
+            time_limit=1.0, memory_limit=256 * 1024 * 1024)
+        self.old_testcase = self.add_testcase(self.old_dataset)
+        old_result = self.add_submission_result(
+            self.submission, self.old_dataset)
+        self.old_executable = self.add_executable(old_result,
+                                                  filename="foo")
+        self.old_evaluation = self.add_evaluation(
+            old_result, self.old_testcase, outcome="1.0",
+            text=["Output is correct"], execution_time=0.5,
+            execution_wall_clock_time=0.6,
+            execution_memory=100 * 1024 * 1024, evaluation_shard=3)
+
+        # ...and a clone of it, where the submission is compiled but
+        # not evaluated.
+        self.dataset = self.add_dataset(
+            task=self.task, task_type="Batch",
+            task_type_parameters=["alone", ["", ""], "diff"],
+            time_limit=1.0, memory_limit=256 * 1024 * 1024,
+            reuse_evaluations=True)
+        self.testcase = self.add_testcase(
+            self.dataset, codename=self.old_testcase.codename,
+            input=self.old_testcase.input, output=self.old_testcase.output)
+        result = self.add_submission_result(self.submission, self.dataset)
+        self.executable = self.add_executable(
+            result, filename="foo", digest=self.old_executable.digest)
+        self.session.flush()
+
+        self.operation = ESOperation(ESOperation.EVALUATION,
+                                     self.submission.id, self.dataset.id,
+                                     self.testcase.codename)
+        self.reuser = EvaluationReuser()
+
+    def tearDown(self):
+        self.session.close()
+        super(TestEvaluationReuser, self).tearDown()
+
+    def find(self):
+        self.session.flush()
+        return self.reuser.find(self.session, self.operation)
+
+    def test_reuse(self):
+        job = self.find()
+        self.assertIsNotNone(job)
+        self.assertTrue(job.success)
+        self.assertEqual(job.operation, self.operation)
+        self.assertEqual(job.outcome, "1.0")
+        self.assertEqual(job.text, ["Output is correct"])
+        self.assertEqual(job.shard, 3)
+        self.assertEqual(job.plus["execution_time"], 0.5)
+        self.assertEqual(job.plus["execution_memory"], 100 * 1024 * 1024)
+        self.assertEqual(self.reuser.get_stats(),
+                         {"reused": 1, "executed": 0})
+
+    def test_disabled(self):
+        self.dataset.reuse_evaluations = False
+        self.assertIsNone(self.find())
+        self.assertEqual(self.reuser.get_stats()["reused"], 0)
+
+    def test_not_evaluation(self):
+        self.operation = ESOperation(ESOperation.COMPILATION,
+                                     self.submission.id, self.dataset.id)
+        self.assertIsNone(self.find())
+
+    def test_nondeterministic_task_type(self):
+        for dataset in [self.old_dataset, self.dataset]:
+            dataset.task_type = "Communication"
+            dataset.task_type_parameters = [1, "alone", "std_io"]
+        self.assertIsNone(self.find())
+
+    def test_different_executable(self):
+        self.executable.digest = self.file.digest
+        self.assertIsNone(self.find())
+
+    def test_different_testcase(self):
+        self.testcase.output = self.file.digest
+        self.assertIsNone(self.find())
+
+    def test_different_parameters(self):
+        self.dataset.task_type_parameters = ["alone", ["", ""], "comparator"]
+        self.assertIsNone(self.find())
+
+    def test_different_managers(self):
+        self.add_manager(self.dataset)
+        self.assertIsNone(self.find())
+
+    def test_tighter_limits(self):
+        self.dataset.time_limit = 0.8
+        self.assertIsNone(self.find())
+
+    def test_looser_limits(self):
+        self.dataset.time_limit = 2.0
+        self.dataset.memory_limit = None
+        self.assertIsNotNone(self.find())
+
+    def test_looser_limits_near_usage(self):
+        # The old evaluation could have been stopped by the limit.
+        self.old_evaluation.execution_time = 0.95
+        self.dataset.time_limit = 2.0
+        self.assertIsNone(self.find())
+
+    def test_skipped_not_reused(self):
+        """Evaluations that were skipped have no real outcome."""
+        self.old_evaluation.text = skipped_evaluation_text()
+        self.assertIsNone(self.find())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""Tests for the skipping of evaluations that cannot change the score.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import unittest
+
+from mock import patch
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.grading.scoretypes.GroupMin import GroupMin
+from cms.service.esoperations import ESOperation
+from cms.service.evaluationskip import EvaluationSkipper, is_skipped
+
+
+class TestEvaluationSkipper(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(TestEvaluationSkipper, self).setUp()
+        # Do not depend on the score types installed as plugins.
+        patcher = patch("cms.grading.scoretypes.get_score_type_class",
+                        {"GroupMin": GroupMin}.__getitem__)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.dataset = self.add_dataset(
+            task=self.task, score_type="GroupMin",
+            score_type_parameters=[[40, "a.*"], [60, "b.*"]],
+            skip_failed_subtasks=True)
+        self.testcases = dict(
+            (codename, self.add_testcase(self.dataset, codename=codename))
+            for codename in ["a0", "a1", "a2", "b0", "b1"])
+        self.submission = self.add_submission(self.task, self.participation)
+        self.submission_result = self.add_submission_result(
+            self.submission, self.dataset, compilation_outcome="ok")
+        self.session.flush()
+
+        self.skipper = EvaluationSkipper()
+
+    def tearDown(self):
+        self.session.close()
+        super(TestEvaluationSkipper, self).tearDown()
+
+    def evaluate(self, codename, outcome):
+        self.add_evaluation(self.submission_result, self.testcases[codename],
+                            outcome=outcome, text=["Some text"])
+        self.session.flush()
+
+    def operation(self, codename):
+        return ESOperation(ESOperation.EVALUATION, self.submission.id,
+                           self.dataset.id, codename)
+
+    def evaluations(self):
+        self.session.flush()
+        self.session.expire(self.submission_result)
+        return dict((evaluation.codename, evaluation)
+                    for evaluation in self.submission_result.evaluations)
+
+    def test_skip(self):
+        self.evaluate("a0", "1.0")
+        self.evaluate("a1", "0.0")
+        self.evaluate("b0", "1.0")
+
+        operations = self.skipper.skip(self.submission_result)
+
+        self.assertEqual(operations, [self.operation("a2")])
+        evaluations = self.evaluations()
+        self.assertEqual(sorted(evaluations), ["a0", "a1", "a2", "b0"])
+        self.assertTrue(is_skipped(evaluations["a2"]))
+        self.assertEqual(evaluations["a2"].outcome, "0.0")
+        self.assertFalse(is_skipped(evaluations["a1"]))
+        self.assertEqual(self.skipper.skipped, 1)
+
+        # Nothing more to skip.
+        self.assertEqual(self.skipper.skip(self.submission_result), [])
+
+    def test_nothing_failed(self):
+        self.evaluate("a0", "1.0")
+        self.evaluate("b0", "0.5")
+
+        self.assertEqual(self.skipper.skip(self.submission_result), [])
+        self.assertEqual(len(self.evaluations()), 2)
+
+    def test_disabled(self):
+        self.dataset.skip_failed_subtasks = False
+        self.evaluate("a0", "0.0")
+
+        self.assertEqual(self.skipper.skip(self.submission_result), [])
+        self.assertEqual(len(self.evaluations()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the estimation of the duration of ES operations.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import unittest
+
+from mock import Mock
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.service.esoperations import ESOperation
+from cms.service.operationcost import OperationCostEstimator
+
+
+class TestOperationCostEstimator(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(TestOperationCostEstimator, self).setUp()
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.dataset = self.add_dataset(task=self.task)
+        self.testcases = [self.add_testcase(self.dataset),
+                          self.add_testcase(self.dataset)]
+        self.session.flush()
+
+        self.estimator = OperationCostEstimator()
+
+    def tearDown(self):
+        self.session.close()
+        super(TestOperationCostEstimator, self).tearDown()
+
+    def evaluation(self, testcase):
+        return ESOperation(ESOperation.EVALUATION, 1, self.dataset.id,
+                           testcase.codename)
+
+    def test_unknown(self):
+        """Operations never seen have the default cost."""
+        self.assertEqual(self.estimator.cost(self.evaluation(
+            self.testcases[0])), OperationCostEstimator.DEFAULT_COST)
+        self.assertEqual(self.estimator.cost(ESOperation(
+            ESOperation.COMPILATION, 1, self.dataset.id)),
+            OperationCostEstimator.DEFAULT_COST)
+
+    def test_load(self):
+        """Averages are loaded from the database."""
+        for wall_clock_time, time in [(2.0, 1.0), (4.0, 1.0), (None, 3.0)]:
+            _, results = self.add_submission_with_results(
+                self.task, self.participation, True)
+            results[0].compilation_wall_clock_time = wall_clock_time
+            results[0].compilation_time = time
+            self.add_evaluation(results[0], self.testcases[0],
+                                execution_wall_clock_time=wall_clock_time,
+                                execution_time=time)
+        self.session.flush()
+
+        self.estimator.load(self.session, self.contest.id)
+        self.assertAlmostEqual(
+            self.estimator.cost(self.evaluation(self.testcases[0])), 3.0)
+        self.assertAlmostEqual(self.estimator.cost(ESOperation(
+            ESOperation.COMPILATION, 1, self.dataset.id)), 3.0)
+        # Another testcase of the same dataset.
+        self.assertAlmostEqual(
+            self.estimator.cost(self.evaluation(self.testcases[1])), 3.0)
+
+        # Nothing from other contests.
+        other_contest = self.add_contest()
+        self.session.flush()
+        other_estimator = OperationCostEstimator()
+        other_estimator.load(self.session, other_contest.id)
+        self.assertEqual(
+            other_estimator.cost(self.evaluation(self.testcases[0])),
+            OperationCostEstimator.DEFAULT_COST)
+
+    def test_update(self):
+        """Averages follow the jobs executed."""
+        operation = self.evaluation(self.testcases[0])
+        self.estimator.update(operation, Mock(plus={
+            "execution_time": 1.0, "execution_wall_clock_time": 2.0}))
+        self.estimator.update(operation, Mock(plus={"execution_time": 5.0}))
+        self.estimator.update(operation, Mock(plus={}))
+        self.assertAlmostEqual(self.estimator.cost(operation), 3.5)
+
+    def test_window(self):
+        """Old samples weigh less and less."""
+        operation = self.evaluation(self.testcases[0])
+        for _ in range(OperationCostEstimator.WINDOW):
+            self.estimator.update(
+                operation, Mock(plus={"execution_time": 1.0}))
+        for _ in range(10 * OperationCostEstimator.WINDOW):
+            self.estimator.update(
+                operation, Mock(plus={"execution_time": 10.0}))
+        self.assertAlmostEqual(self.estimator.cost(operation), 10.0,
+                               places=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Contest Management System - http://cms-dev.github.io/
+# Copyright © 2018 CMS development group
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the pool of workers of ES.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from future.builtins.disabled import *  # noqa
+from future.builtins import *  # noqa
+
+import unittest
+
+from mock import MagicMock, Mock, patch
+
+from cms import ServiceCoord
+from cms.service.workerpool import WorkerPool
+
+
+class TestWorkerPoolSlots(unittest.TestCase):
+
+    def setUp(self):
+        self.service = Mock(contest_id=None)
+        self.service.connect_to.side_effect = \
+            lambda coord, on_connect: Mock(connected=True)
+        self.pool = WorkerPool(self.service)
+        for shard in range(3):
+            self.pool.add_worker(ServiceCoord("Worker", shard))
+
+        patcher = patch("cms.service.workerpool.SessionGen", MagicMock())
+        self.addCleanup(patcher.stop)
+        patcher.start()
+        patcher = patch("cms.service.workerpool.JobGroup")
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+    def test_default(self):
+        """Workers that did not report their slots have one."""
+        self.assertEqual(self.pool.get_total_slots(), 3)
+        self.assertEqual(self.pool.get_available_slots(), 1)
+
+    def test_on_connect(self):
+        """Workers are asked for their slots when they connect."""
+        self.pool.on_worker_connected(ServiceCoord("Worker", 1))
+        self.pool._worker[1].get_slots.assert_called_once_with(
+            callback=self.pool._on_slots, plus=1)
+        self.pool._on_slots(8, 1)
+        self.assertEqual(self.pool.get_total_slots(), 10)
+        self.assertEqual(self.pool.get_status()["1"]["slots"], 8)
+
+        # Errors leave the previous value.
+        self.pool._on_slots(None, 1, error="No such method.")
+        self.assertEqual(self.pool.get_total_slots(), 10)
+
+    def test_acquire_most_slots(self):
+        """The available worker with most slots is chosen."""
+        self.pool._on_slots(4, 0)
+        self.pool._on_slots(8, 2)
+        self.assertEqual(self.pool.get_available_slots(), 8)
+        self.assertEqual(self.pool.acquire_worker([Mock()]), 2)
+        self.assertEqual(self.pool.get_available_slots(), 4)
+        self.assertEqual(self.pool.acquire_worker([Mock()]), 0)
+        self.assertEqual(self.pool.get_available_slots(), 1)
+        self.assertEqual(self.pool.acquire_worker([Mock()]), 1)
+        self.assertIsNone(self.pool.acquire_worker([Mock()]))
+        self.assertEqual(self.pool.get_available_slots(), 1)
+
+    def test_disconnected(self):
+        """Disconnected workers are not available."""
+        self.pool._on_slots(8, 2)
+        self.pool._worker[2].connected = False
+        self.assertEqual(self.pool.get_available_slots(), 1)
+        self.assertNotEqual(self.pool.acquire_worker([Mock()]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -161,5 +161,31 @@ class TestGetServiceShards(unittest.TestCase):
         self.assertEqual(get_service_shards("ServiceNotPresent"), 0)
 
 
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_put(self):
+        cache = cms.util.LRUCache(2)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("a", 0), 0)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_eviction(self):
+        cache = cms.util.LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        # Now "b" is the least recently used.
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
 if __name__ == "__main__":
     unittest.main()